@@ -19,10 +19,14 @@ import traceback
 from dotenv import load_dotenv
 
 import firebase_admin
-from firebase_admin import credentials, messaging
+from firebase_admin import credentials
 
 from utils import db, UserAuth, BackEndProcess, parse_to_langchain_message_str
-from neo4j_modules.care_kg_db import CareKgDB
+from utils import SocketAuthSessions, UserCache, get_user_cache_config, get_message_store, SessionRegistry
+from utils import get_redis_url, get_state_store
+from planning_modules.lending_ear_modules.uot_modules.llm_concurrency import get_llm_concurrency_stats
+# langchain / 各社の SDK / neo4j / firebase_admin.messaging は起動時に読み込まず、使うハンドラの中で import する
+# (dyno の再起動や `flask db upgrade` の度に払うコストを減らす。python -m utils.import_profile app で確認できる)
 
 # Load environment variables
 load_dotenv()
@@ -56,10 +60,13 @@ db.init_app(app)
 migrate = Migrate(app, db)
 
 # Initialize SocketIO with more detailed logging
+# 複数のワーカー・ノードで動かす場合は REDIS_URL (または SOCKETIO_MESSAGE_QUEUE) を設定し、
+# 他のワーカーからの emit もメッセージキュー経由でクライアントに届くようにする
 socketio = SocketIO(
     app,
     cors_allowed_origins="*",
     async_mode='eventlet',
+    message_queue=get_redis_url(),
     logger=True,
     engineio_logger=True,
     ping_timeout=60,
@@ -84,8 +91,10 @@ logging.getLogger('socketio').addHandler(handler)
 logging.getLogger('engineio').addHandler(handler)
 logging.getLogger('werkzeug').addHandler(handler)
 
-# Dictionary to store backend instances keyed by room ID
-backend_instances = {}
+# Backend instances keyed by user ID
+# アイドル状態のセッションはリーパーが追い出し、上限を超えたら LRU で追い出す
+backend_instances = SessionRegistry.from_env()
+backend_instances.start_reaper()
 
 def sign_in_with_email_and_password(email: str, password: str, api_key=FIREBASE_API_KEY):
     """
@@ -124,29 +133,26 @@ def sign_in_with_email_and_password(email: str, password: str, api_key=FIREBASE_
     return None, error_message
 
 
-def check_token(token):
-    """
-    Check if the JWT token is valid.
+def decode_token(token):
+    """JWTをデコード (不正・期限切れの場合は例外)"""
+    return jwt.decode(token, os.environ.get('SECRET_KEY_JWT'), algorithms=['HS256'])
 
-    Args:
-    token (str): JWT token.
 
-    Returns:
-    tuple: (is_valid (bool), current_user (UserAuth), error_message (str))
-    """
-    current_user = None
+# UserAuth の TTL キャッシュと、ソケット接続 (sid) ごとの認証済みセッション
+user_cache = UserCache(lambda user_id: UserAuth.query.filter_by(id=user_id).first(), **get_user_cache_config())
+socket_auth_sessions = SocketAuthSessions(decode_token, user_cache)
 
-    if not token:
-        return (False, None, 'Token is missing!')
 
-    try:
-        data = jwt.decode(token, os.environ.get('SECRET_KEY_JWT'), algorithms=['HS256'])
-        current_user = UserAuth.query.filter_by(id=data['user_id']).first()
-    except:
-        return (False, None, 'Token is invalid!')
+def check_socket_token(token):
+    """
+    ソケットイベント用の認証
+    connect 時に作った認証済みセッション (request.sid) を使い、イベントごとの JWT デコードと DB 参照を省く
+
+    Returns:
+    tuple: (is_valid (bool), current_user (CachedUser), error_message (str))
+    """
+    return socket_auth_sessions.check(request.sid, token)
 
-    print(f"current user : {current_user}, is : {current_user.id}")
-    return (True, current_user, None)
 
 @app.route('/')
 def index():
@@ -202,6 +208,8 @@ def fcm_console():
     sent_json = ""
     
     if request.method == 'POST':
+        from firebase_admin import messaging
+
         registration_token = request.form.get('registration_token')
         notifyDisplayInfo = request.form.get('notifyDisplayInfo')
         notifyDetail = request.form.get('notifyDetail')
@@ -311,15 +319,95 @@ def register_fcm_token():
     # Update FCM token
     user.fcm_token = fcm_token
     db.session.commit()
+    user_cache.invalidate(user.id)
 
     return jsonify({'message': 'FCM token registered successfully!'})
     
+@app.route('/api/messages', methods=['GET'])
+def get_message_history():
+    """
+    Get message history (newest first) with keyset pagination.
+    Pass the returned next_cursor as `before` to get the next page.
+    """
+    api_key = request.headers.get('API-Key')
+    user = UserAuth.query.filter_by(api_key=api_key).first()
+    if not user:
+        return jsonify({'message': 'Invalid API Key'}), 401
+
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    try:
+        messages, next_cursor = get_message_store(db).get_history(
+            user.id,
+            dialogue_id=request.args.get('dialogue_id'),
+            limit=limit,
+            before=request.args.get('before')
+        )
+    except ValueError:
+        return jsonify({'message': 'Invalid cursor'}), 400
+
+    return jsonify({
+        'messages': [
+            {'id': m.id, 'dialogue_id': m.dialogue_id, 'content': m.content, 'timestamp': m.timestamp.isoformat()}
+            for m in messages
+        ],
+        'next_cursor': next_cursor
+    })
+
 @app.route('/get_reminders', methods=['GET'])
 def get_reminders():
 
 
     return jsonify([{"time": 1708595280, "tellmessage": "テスト", "detail": "開発テスト用です"}])
 
+@app.route('/admin/neo4j', methods=['GET'])
+def neo4j_pool_status():
+    """
+    Return the shared Neo4j connection pool metrics. Add ?check=1 to run a liveness check.
+    """
+    usr = session.get('usr')
+    if usr is None:
+        return redirect(url_for('login'))
+
+    from neo4j_modules.care_kg_db import CareKgDB, get_pool_metrics
+
+    status = get_pool_metrics()
+    if request.args.get('check'):
+        kg_db = CareKgDB(
+            uri=f"neo4j+s://{os.environ.get('NEO4J_URI')}",
+            user=os.environ.get('NEO4J_USERNAME'),
+            password=os.environ.get('NEO4J_PASSWORD')
+        )
+        status['is_alive'] = kg_db.is_alive()
+    return jsonify(status)
+
+@app.route('/admin/sessions', methods=['GET'])
+def backend_sessions_status():
+    """
+    Return per-session memory accounting of the backend processes and the process-wide cache sizes.
+    """
+    usr = session.get('usr')
+    if usr is None:
+        return redirect(url_for('login'))
+
+    from planning_modules.llm_cache import get_llm_cache
+    from planning_modules.llm_registry import get_llm_registry
+    from planning_modules.lending_ear_modules.uot_modules.uot_node import UoTNode
+    from planning_modules.state_machine_modules.sort_utils import get_ordering_cache
+
+    status = backend_instances.memory_stats()
+    llm_cache = get_llm_cache()
+    status['caches'] = {
+        'llm': llm_cache.stats() if llm_cache else None,
+        'child_orders': get_ordering_cache().stats(),
+        'users': user_cache.stats(),
+        'socket_auth_sessions': len(socket_auth_sessions),
+        'pending_messages': get_message_store(db).pending_count(),
+    }
+    status['llm_concurrency'] = get_llm_concurrency_stats()
+    status['llm_clients'] = get_llm_registry().stats()
+    status['uot_rewards'] = UoTNode.get_reward_stats()
+    return jsonify(status)
+
 def log_socket_event(event_name: str):
     """ソケットイベントのログを整形して出力"""
     print(f"\n{'#' * 5} >>> [SOCKET EVENT] {event_name}\n")
@@ -335,7 +423,8 @@ def handle_connect(auth=None):
     if not token:
         token = request.args.get('token')
 
-    is_valid, current_user, error_message = check_token(token)
+    socket_auth_sessions.purge_expired()
+    is_valid, current_user, error_message = socket_auth_sessions.establish(request.sid, token)
 
     if not is_valid:
         print("valid handshake")
@@ -348,6 +437,7 @@ def handle_connect(auth=None):
     join_room(room)
 
     # Initialize the knowledge graph database
+    from neo4j_modules.care_kg_db import CareKgDB
     uri = f"neo4j+s://{os.environ.get('NEO4J_URI')}"
     try:
         kg_db = CareKgDB(
@@ -366,6 +456,8 @@ def handle_connect(auth=None):
     if current_user.id not in backend_instances:
         try:
             bp = BackEndProcess(socketio, room, current_user, db, kg_db)
+            # 別のワーカー・ノードで動いていたセッションの状態を引き継ぐ
+            bp.restore_state(get_state_store().load(current_user.id))
             backend_instances[current_user.id] = bp
             print(f"Created new backend process for user {current_user.name}")
         except Exception as e:
@@ -384,17 +476,21 @@ def handle_websocket_ready():
     print("🔌 WebSocket Ready Event Received")
     
     try:
-        # 最後に作成されたbackend_instanceを使用
-        if backend_instances:
-            last_user_id = list(backend_instances.keys())[-1]
-            bp = backend_instances[last_user_id]
-            print(f"👤 Using last created backend process")
+        # この接続 (request.sid) のユーザーの backend_instance を使用
+        is_valid, current_user, error_message = check_socket_token(request.args.get('token'))
+        if not is_valid:
+            print(f"❌ Invalid token: {error_message}")
+            return False
+
+        bp = backend_instances.get(current_user.id)
+        if bp is not None:
+            print(f"👤 Using backend process of {current_user.name}")
             print("-"*40)
             bp.on_client_connect(request.sid)
             print("✅ Successfully notified backend process")
             return True
         else:
-            print("⚠️ No backend processes available")
+            print("⚠️ No backend process for this connection")
             return False
             
     except Exception as e:
@@ -412,7 +508,8 @@ def handle_disconnect():
     Leave room and stop backend process.
     """
     token = request.args.get('token')
-    is_valid, current_user, error_message = check_token(token)
+    is_valid, current_user, error_message = check_socket_token(token)
+    socket_auth_sessions.discard(request.sid)
     if not is_valid:
         print("Invalid token during disconnect")
         return
@@ -430,7 +527,7 @@ def handle_disconnect():
             # タイムアウトチェック
             if bp.is_expired():
                 bp.force_stop()
-                del backend_instances[current_user.id]
+                backend_instances.pop(current_user.id)  # リーパーが先に追い出している場合もある
 
 @socketio.on('chat_message')
 def handle_message(data):
@@ -440,7 +537,7 @@ def handle_message(data):
     # get token from headers or query parameters
     token = request.args.get('token')
 
-    is_valid, current_user, error_message = check_token(token)
+    is_valid, current_user, error_message = check_socket_token(token)
     
     if not is_valid:
         return jsonify({'message': error_message}), 403
@@ -470,7 +567,7 @@ def handle_go_next_state():
         
         print(f"##### >>> [DEBUG:APP] Token: {token}")
         
-        is_valid, current_user, error_message = check_token(token)
+        is_valid, current_user, error_message = check_socket_token(token)
         if not is_valid:
             print(f"##### >>> [DEBUG:APP] Token validation failed: {error_message}")
             return jsonify({'message': error_message}), 403
@@ -498,7 +595,7 @@ def handle_start_lending_ear():
     print("start lending ear")
     token = request.args.get('token')
     
-    is_valid, current_user, error_message = check_token(token)
+    is_valid, current_user, error_message = check_socket_token(token)
     if not is_valid:
         return jsonify({'message': error_message}), 403
 
@@ -516,7 +613,7 @@ def handle_start_instruction(data=None):
     print("start instruction")
     token = request.args.get('token')
     
-    is_valid, current_user, error_message = check_token(token)
+    is_valid, current_user, error_message = check_socket_token(token)
     if not is_valid:
         return jsonify({'message': error_message}), 403
 
@@ -543,7 +640,7 @@ def handle_go_detail():
     log_socket_event('GO_DETAIL')
     token = request.args.get('token')
     
-    is_valid, current_user, error_message = check_token(token)
+    is_valid, current_user, error_message = check_socket_token(token)
     if not is_valid:
         return jsonify({'message': error_message}), 403
 
@@ -570,7 +667,7 @@ def handle_back_to_start():
     log_socket_event('BACK_TO_START')
     token = request.args.get('token')
     
-    is_valid, current_user, error_message = check_token(token)
+    is_valid, current_user, error_message = check_socket_token(token)
     if not is_valid:
         return jsonify({'message': error_message}), 403
 
@@ -589,7 +686,7 @@ def handle_get_candidates():
     
     try:
         token = request.args.get('token')
-        is_valid, current_user, error_message = check_token(token)
+        is_valid, current_user, error_message = check_socket_token(token)
         if not is_valid:
             print("❌ Invalid token")
             return False
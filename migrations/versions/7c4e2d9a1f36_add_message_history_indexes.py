@@ -0,0 +1,29 @@
+"""add message history indexes
+
+Revision ID: 7c4e2d9a1f36
+Revises: 2b7a1f772e5b
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4e2d9a1f36'
+down_revision = '2b7a1f772e5b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 履歴の取得 (user_id / dialogue_id ごとに timestamp 降順) をインデックスで行う
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_message_user_id_dialogue_id_timestamp', ['user_id', 'dialogue_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_user_id_dialogue_id_timestamp')
+        batch_op.drop_index('ix_message_user_id_timestamp')
@@ -4,11 +4,179 @@ import asyncio
 import traceback
 import sys
 import eventlet
+import hashlib
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from neo4j import GraphDatabase  # AsyncGraphDatabaseではなく通常のドライバーを使用
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 
 from dotenv import load_dotenv
 
+from neo4j_modules.ontology_cache import OntologySnapshot, get_ontology_cache, is_ontology_cache_enabled
+
+# ノードに保存する拡充情報のプロパティ (enriched_<key>)
+ENRICHMENT_KEYS = ("detail_instruction", "call_to_action", "jp_title")
+
+# 名前検索用のインデックス (ensure_indexes で作成)
+NAME_FULLTEXT_INDEX = "instance_name_fulltext"
+NAME_INDEXES = {
+    "instance_name": "CREATE INDEX instance_name IF NOT EXISTS FOR (n:instance) ON (n.name)",
+    "instance_name_lower": "CREATE INDEX instance_name_lower IF NOT EXISTS FOR (n:instance) ON (n.name_lower)",
+    NAME_FULLTEXT_INDEX: f"CREATE FULLTEXT INDEX {NAME_FULLTEXT_INDEX} IF NOT EXISTS FOR (n:instance) ON EACH [n.name, n.name_jp]",
+}
+_LUCENE_SPECIAL_CHARS = set('+-&|!(){}[]^"~*?:\\/')
+
+
+# ---------------------------------------------------------------------
+# プロセス共通のドライバー (接続プール)
+# ---------------------------------------------------------------------
+def get_pool_config() -> Dict[str, Any]:
+    """接続プールの設定 (環境変数で調整可能)"""
+    return {
+        "max_connection_pool_size": int(os.getenv("NEO4J_MAX_POOL_SIZE", 50)),
+        "connection_acquisition_timeout": float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", 30)),
+        # Aura はアイドル接続を切るので、寿命とアイドル時の生存確認を短めにする
+        "max_connection_lifetime": float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", 300)),
+        "liveness_check_timeout": float(os.getenv("NEO4J_LIVENESS_CHECK_TIMEOUT", 30)),
+        "keep_alive": True,
+    }
+
+
+_drivers: Dict[Tuple[str, str, str], Any] = {}
+_drivers_lock = threading.Lock()
+_indexed_drivers = set()  # ensure_indexes 済みのドライバー
+_pool_metrics = {
+    "drivers_created": 0,
+    "drivers_closed": 0,
+    "views_created": 0,
+    "sessions_opened": 0,
+    "session_errors": 0,
+    "session_time_total": 0.0,
+    "connectivity_checks": 0,
+    "connectivity_failures": 0,
+}
+
+
+def get_shared_driver(uri: str, user: str, password: str):
+    """(uri, user, password) ごとに1つのドライバーを共有する"""
+    key = (uri, user or "", hashlib.sha256((password or "").encode("utf-8")).hexdigest())
+    with _drivers_lock:
+        driver = _drivers.get(key)
+        if driver is None:
+            driver = GraphDatabase.driver(uri, auth=(user, password), **get_pool_config())
+            _drivers[key] = driver
+            _pool_metrics["drivers_created"] += 1
+        return driver
+
+
+def close_all_drivers() -> None:
+    """全ての共有ドライバーを閉じる (プロセス終了時)"""
+    with _drivers_lock:
+        drivers = list(_drivers.values())
+        _drivers.clear()
+        _indexed_drivers.clear()
+    for driver in drivers:
+        try:
+            driver.close()
+            _pool_metrics["drivers_closed"] += 1
+        except Exception as e:
+            print(f"[CareKgDB] Error closing driver: {e}")
+
+
+def get_pool_metrics() -> Dict[str, Any]:
+    """接続プールのメトリクス"""
+    with _drivers_lock:
+        metrics = dict(_pool_metrics)
+        metrics["active_drivers"] = len(_drivers)
+    metrics["pool_config"] = get_pool_config()
+    sessions = metrics["sessions_opened"]
+    metrics["avg_session_time"] = metrics["session_time_total"] / sessions if sessions else 0.0
+    return metrics
+
+
+atexit.register(close_all_drivers)
+
+
+def load_ontology_nodes(driver) -> Dict[str, Dict[str, Any]]:
+    """OntologySnapshot 用に全 instance ノードと INCLUDES / FOLLOWS 関係を1回のクエリで読み込む"""
+    query = """
+    MATCH (n:instance)
+    RETURN n.name as name,
+           n.description as raw_description,
+           n.detail_description as detail_description,
+           COALESCE(n.detail_description, n.description) as description,
+           n.time_to_achieve as time_to_achieve,
+           n.name_jp as name_jp,
+           labels(n) as labels,
+           n.enriched_detail_instruction as enriched_detail_instruction,
+           n.enriched_call_to_action as enriched_call_to_action,
+           n.enriched_jp_title as enriched_jp_title,
+           n.enriched_source_hash as enriched_source_hash,
+           n.child_order as child_order,
+           n.child_order_key as child_order_key,
+           [(n)-[:INCLUDES]->(child) | child.name] as children,
+           [(n)-[:FOLLOWS]->(follower) | follower.name] as followers
+    """
+    nodes = {}
+    with driver.session() as session:
+        for record in session.run(query):
+            if not record['name']:
+                continue
+            nodes[record['name']] = {
+                'name': record['name'],
+                'description': record['raw_description'],
+                'detail_description': record['detail_description'],
+                'time_to_achieve': record['time_to_achieve'],
+                'name_jp': record['name_jp'],
+                'labels': list(record['labels']),
+                'enrichment': enrichment_from_record(record),
+                'child_order': child_order_from_record(record),
+                'children': [c for c in record['children'] if c],
+                'followers': [f for f in record['followers'] if f]
+            }
+    return nodes
+
+
+def relation_type(name: str) -> str:
+    """オントロジー定義の関係名 (camelCase) を Neo4j の関係タイプ (UPPER_SNAKE) に変換 例: usesObject -> USES_OBJECT"""
+    return "".join(f"_{c}" if c.isupper() and i > 0 else c for i, c in enumerate(name)).upper()
+
+
+def lucene_query(text: str) -> str:
+    """全文検索用のクエリ (特殊文字をエスケープし、語ごとに 完全一致 > 前方一致 > 編集距離 の順で重み付け)"""
+    terms = []
+    for word in text.split():
+        escaped = "".join(f"\\{c}" if c in _LUCENE_SPECIAL_CHARS else c for c in word)
+        terms.append(f"({escaped}^3 OR {escaped}*^2 OR {escaped}~)")
+    return " AND ".join(terms)
+
+
+def enrichment_source_hash(description: Optional[str]) -> str:
+    """拡充情報の生成元 description のハッシュ (description が変わったら再生成するため)"""
+    return hashlib.sha256((description or "").encode("utf-8")).hexdigest()[:16]
+
+
+def child_order_from_record(record) -> Optional[Dict[str, Any]]:
+    """レコードの child_order / child_order_key から保存済みの子ノードの並び順を作る (無ければ None)"""
+    if not record["child_order"] or not record["child_order_key"]:
+        return None
+    return {"key": record["child_order_key"], "order": list(record["child_order"])}
+
+
+def enrichment_from_record(record) -> Optional[Dict[str, str]]:
+    """レコードの enriched_* から拡充情報を作る。欠けている・description と一致しない場合は None"""
+    enrichment = {key: record[f"enriched_{key}"] for key in ENRICHMENT_KEYS}
+    if any(value is None for value in enrichment.values()):
+        return None
+    source_hash = record["enriched_source_hash"]
+    if source_hash and source_hash != enrichment_source_hash(record["description"]):
+        return None
+    return enrichment
+
+
 class CareKgDB:
     def __init__(self, uri, user, password, user_uuid=None):
         # URIのバリデーション
@@ -17,17 +185,61 @@ class CareKgDB:
         
         self.debug_print(f"Connecting to Neo4j at: {uri}")
         
-        # 同期版ドライバーを使用
-        self.driver = GraphDatabase.driver(
-            uri,
-            auth=(user, password)
-        )
+        # プロセス共通のドライバー (接続プール) を使い、CareKgDB はユーザーごとのビューとする
+        self.driver = get_shared_driver(uri, user, password)
         self.user_uuid = user_uuid
+        _pool_metrics["views_created"] += 1
+
+        # オントロジー (instanceノードとINCLUDES/FOLLOWS) はプロセス共通のスナップショットから読む
+        driver = self.driver
+        self.ontology_cache = get_ontology_cache((uri, user), lambda: load_ontology_nodes(driver)) if is_ontology_cache_enabled() else None
         
         self.debug_print("Neo4j driver initialized successfully")
 
+    @contextmanager
+    def _session(self):
+        """共有プールからセッションを取得 (メトリクス計測付き)"""
+        start = time.monotonic()
+        _pool_metrics["sessions_opened"] += 1
+        try:
+            with self.driver.session() as session:
+                yield session
+        except Exception:
+            _pool_metrics["session_errors"] += 1
+            raise
+        finally:
+            _pool_metrics["session_time_total"] += time.monotonic() - start
+
+    def is_alive(self) -> bool:
+        """Neo4j への疎通確認"""
+        _pool_metrics["connectivity_checks"] += 1
+        try:
+            self.driver.verify_connectivity()
+            return True
+        except Exception as e:
+            _pool_metrics["connectivity_failures"] += 1
+            self.debug_print(f"Connectivity check failed: {e}")
+            return False
+
+    @staticmethod
+    def pool_metrics() -> Dict[str, Any]:
+        return get_pool_metrics()
+
+    def _snapshot(self) -> Optional[OntologySnapshot]:
+        """オントロジーのスナップショット (無効・読み込み失敗時は None => Neo4j に問い合わせる)"""
+        return self.ontology_cache.get() if self.ontology_cache else None
+
+    def invalidate_ontology(self) -> None:
+        """KGを更新した後に呼ぶ。次回アクセス時にスナップショットを再読み込みする"""
+        if self.ontology_cache:
+            self.ontology_cache.invalidate()
+
     def get_all_top_nodes(self):
         """トップノードを取得"""
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            return list(snapshot.top_names)
+
         self.debug_print("Starting get_all_top_nodes")
         query = """
         MATCH (n:instance)
@@ -37,7 +249,7 @@ class CareKgDB:
         """
         
         try:
-            with self.driver.session() as session:
+            with self._session() as session:
                 result = session.run(query)
                 nodes = [record for record in result]
                 self.debug_print(f"Found {len(nodes)} top nodes")
@@ -48,20 +260,26 @@ class CareKgDB:
             return []
 
     def close(self):
-        """クローズ処理"""
-        if self.driver:
-            self.driver.close()
+        """
+        クローズ処理
+        ドライバーはプロセス共通なのでここでは閉じない (終了時に close_all_drivers で閉じる)
+        """
+        self.driver = None
 
     def debug_print(self, msg: str):
         print(f"[CareKgDB] {msg}")
 
     def get_uot_nodes(self):
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            return snapshot.uot_nodes()
+
         query = """
         MATCH (n:instance)
         WHERE n:Trouble OR n:Activity OR n:Action OR n:Task OR n:Condition OR n:Mood
         RETURN n.name AS name, n.detail_description AS description
         """
-        with self.driver.session() as session:
+        with self._session() as session:
             result = session.run(query)
             return [{"name": record["name"], "description": record["description"]} for record in result]
     
@@ -70,21 +288,29 @@ class CareKgDB:
         MATCH (n)
         RETURN n
         """
-        with self.driver.session() as session:
+        with self._session() as session:
             result = session.run(query)
             print([record for record in result])
 
     def get_item_full_info(self, item_name: str) -> Optional[Dict[str, Any]]:
         """アイテムの全情報を取得（同期版）"""
+        snapshot = self._snapshot()
+        if snapshot is not None and item_name in snapshot:
+            return snapshot.full_info(item_name)
+
         try:
             query = """
             MATCH (n:instance {name: $name})
             RETURN n.name as name, 
                    COALESCE(n.detail_description, n.description) as description,
                    n.time_to_achieve as time_to_achieve, 
-                   n.name_jp as name_jp
+                   n.name_jp as name_jp,
+                   n.enriched_detail_instruction as enriched_detail_instruction,
+                   n.enriched_call_to_action as enriched_call_to_action,
+                   n.enriched_jp_title as enriched_jp_title,
+                   n.enriched_source_hash as enriched_source_hash
             """
-            with self.driver.session() as session:
+            with self._session() as session:
                 result = session.run(query, name=item_name)
                 record = result.single()
                 if record:
@@ -92,7 +318,8 @@ class CareKgDB:
                         'name': record['name'],
                         'description': record['description'] or "No description available",
                         'time_to_achieve': record['time_to_achieve'],
-                        'name_jp': record['name_jp']
+                        'name_jp': record['name_jp'],
+                        'enrichment': self._enrichment_from_record(record)
                     }
                 self.debug_print(f"No record found for item: {item_name}")
                 return None
@@ -102,13 +329,17 @@ class CareKgDB:
             return None
         
     def get_item_time_to_achieve(self, item_name):
+        snapshot = self._snapshot()
+        if snapshot is not None and item_name in snapshot:
+            return snapshot.get(item_name)["time_to_achieve"]
+
         query = """
         MATCH (n:instance)
         WHERE n.name = $item_name
         RETURN n.time_to_achieve AS time_to_achieve
         """
         try:
-            with self.driver.session() as session:
+            with self._session() as session:
                 result = session.run(query, {"item_name": item_name})
                 record = result.single()
                 return record["time_to_achieve"] if record else None
@@ -118,13 +349,17 @@ class CareKgDB:
             return None
         
     def get_item_name_jp(self, item_name):
+        snapshot = self._snapshot()
+        if snapshot is not None and item_name in snapshot:
+            return snapshot.get(item_name)["name_jp"]
+
         query = """
         MATCH (n:instance)
         WHERE n.name = $item_name
         RETURN n.name_jp AS name_jp
         """
         try:
-            with self.driver.session() as session:
+            with self._session() as session:
                 result = session.run(query, {"item_name": item_name})
                 record = result.single()
                 return record["name_jp"] if record else None
@@ -134,6 +369,10 @@ class CareKgDB:
             return None
         
     def get_children(self, item_name):
+        snapshot = self._snapshot()
+        if snapshot is not None and item_name in snapshot:
+            return snapshot.children(item_name)
+
         query = """
         MATCH (n:instance)
         WHERE n.name = $item_name
@@ -141,7 +380,7 @@ class CareKgDB:
         RETURN child.name AS child_name
         """
         try:
-            with self.driver.session() as session:
+            with self._session() as session:
                 result = session.run(query, {"item_name": item_name})
                 records = result.data()
                 return [record["child_name"] for record in records] if records else []
@@ -150,10 +389,144 @@ class CareKgDB:
             self.debug_print(traceback.format_exc())
             return []
 
-    def get_related_nodes(self, item_name):
+    def get_subtree(self, root_name: str, max_depth: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        root_name 以下の INCLUDES サブツリーを1回のクエリで取得する
+        max_depth を指定すると root から max_depth 段下までに限る (各ノードの "children" は常に全件)
+
+        Returns:
+            Optional[Dict[str, Any]]: {
+                "root": str,
+                "nodes": {
+                    name: {
+                        "name", "description", "time_to_achieve", "name_jp", "enrichment",
+                        "children": [子ノード名 (INCLUDES)],
+                        "followers": [フォロワー名 (FOLLOWS)]
+                    }
+                }
+            }
+            root が存在しない場合・エラー時は None
+        """
+        snapshot = self._snapshot()
+        if snapshot is not None and root_name in snapshot:
+            return snapshot.subtree(root_name, max_depth=max_depth)
+
+        # 可変長パターンの上限はパラメータにできないので整数として埋め込む
+        depth = "" if max_depth is None else str(max(0, int(max_depth)))
+        query = f"""
+        MATCH (root:instance {{name: $name}})
+        MATCH (root)-[:INCLUDES*0..{depth}]->(n:instance)
+        WITH DISTINCT n
+        RETURN n.name as name,
+               COALESCE(n.detail_description, n.description) as description,
+               n.time_to_achieve as time_to_achieve,
+               n.name_jp as name_jp,
+               n.enriched_detail_instruction as enriched_detail_instruction,
+               n.enriched_call_to_action as enriched_call_to_action,
+               n.enriched_jp_title as enriched_jp_title,
+               n.enriched_source_hash as enriched_source_hash,
+               n.child_order as child_order,
+               n.child_order_key as child_order_key,
+               [(n)-[:INCLUDES]->(child) | child.name] as children,
+               [(n)-[:FOLLOWS]->(follower) | follower.name] as followers
+        """
+        try:
+            with self._session() as session:
+                result = session.run(query, name=root_name)
+                nodes = {}
+                for record in result:
+                    nodes[record['name']] = {
+                        'name': record['name'],
+                        'description': record['description'] or "No description available",
+                        'time_to_achieve': record['time_to_achieve'],
+                        'name_jp': record['name_jp'],
+                        'enrichment': self._enrichment_from_record(record),
+                        'child_order': child_order_from_record(record),
+                        'children': [c for c in record['children'] if c],
+                        'followers': [f for f in record['followers'] if f]
+                    }
+            if root_name not in nodes:
+                self.debug_print(f"No record found for subtree root: {root_name}")
+                return None
+            self.debug_print(f"Fetched subtree of {root_name}: {len(nodes)} nodes")
+            return {'root': root_name, 'nodes': nodes}
+        except Exception as e:
+            self.debug_print(f"Error in get_subtree: {e}")
+            traceback.print_exc()
+            return None
+
+    def ensure_indexes(self) -> bool:
+        """
+        名前検索用のインデックスを作成し、name_lower (大文字小文字を無視した完全一致用) を埋める
+        何度呼んでもよい (IF NOT EXISTS)。プロセス内では接続先ごとに1回だけ実行する
+        """
+        if self.driver in _indexed_drivers:
+            return True
+        try:
+            with self._session() as session:
+                for index_name, statement in NAME_INDEXES.items():
+                    session.run(statement).consume()
+                summary = session.run("""
+                MATCH (n:instance)
+                WHERE n.name IS NOT NULL AND (n.name_lower IS NULL OR n.name_lower <> toLower(n.name))
+                SET n.name_lower = toLower(n.name)
+                """).consume()
+                self.debug_print(f"Ensured name indexes ({summary.counters.properties_set} name_lower backfilled)")
+            _indexed_drivers.add(self.driver)
+            return True
+        except Exception as e:
+            self.debug_print(f"Error in ensure_indexes: {e}")
+            return False
+
+    def find_nodes(self, item_name: str, fuzzy: bool = False, limit: int = 5) -> List[str]:
+        """
+        名前でinstanceノードを検索し、ノード名をランキング順に返す
+        - 完全一致 (name インデックス) → 大文字小文字を無視した一致 (name_lower インデックス)
+        - fuzzy=True の場合は全文検索インデックスで部分一致・表記ゆれも拾い、スコア順に並べる
+        """
+        if not item_name or not item_name.strip():
+            return []
+
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            return snapshot.find(item_name, fuzzy=fuzzy, limit=limit)
+
+        self.ensure_indexes()
+        exact_query = """
+        MATCH (n:instance)
+        WHERE n.name = $name OR n.name_lower = toLower($name)
+        RETURN n.name as name
+        ORDER BY CASE WHEN n.name = $name THEN 0 ELSE 1 END, n.name
+        LIMIT $limit
+        """
+        fuzzy_query = """
+        CALL db.index.fulltext.queryNodes($index, $query, {limit: $limit}) YIELD node, score
+        WHERE node:instance
+        RETURN node.name as name, score
+        ORDER BY score DESC
+        """
+        try:
+            with self._session() as session:
+                names = [record["name"] for record in session.run(exact_query, name=item_name, limit=limit)]
+                if fuzzy and len(names) < limit:
+                    result = session.run(fuzzy_query, index=NAME_FULLTEXT_INDEX, query=lucene_query(item_name), limit=limit)
+                    names += [record["name"] for record in result if record["name"] not in names]
+                return names[:limit]
+        except Exception as e:
+            self.debug_print(f"Error in find_nodes: {e}")
+            traceback.print_exc()
+            return []
+
+    def get_related_nodes(self, item_name, fuzzy: bool = False, limit: int = 5):
+        """
+        ノードの周辺情報 (global_context / local_context) を取得
+        ノードの特定は find_nodes (インデックス検索) で行う。fuzzy=True で部分一致・表記ゆれも対象にする
+        """
+        names = self.find_nodes(item_name, fuzzy=fuzzy, limit=limit)
+
         query = """
         MATCH (n:instance)
-        WHERE n.name =~ $search_pattern
+        WHERE n.name IN $names
         MATCH (n)-[r1]->(m)
         OPTIONAL MATCH (m)-[r2]->(n)
         WITH n, m, 
@@ -170,15 +543,14 @@ class CareKgDB:
                  {type: type(gc), context_name: context.name, context_type: labels(context)[0]}
                ELSE null END AS global_context
         """
-        search_pattern = f'(?i).*{item_name}.*'
-        
-        with self.driver.session() as session:
-            result = session.run(query, {"search_pattern": search_pattern})
-            records = result.data()
-            
-            global_context = {}
-            local_context = []
-            
+        local_context_types = {relation_type(r) for r in self.get_ontology_info()['relations']['local_context']}
+
+        global_context = {}
+        local_context = []
+        if names:
+            with self._session() as session:
+                records = session.run(query, {"names": names}).data()
+
             for record in records:
                 context_info = {
                     'source_name': record['source_name'],
@@ -195,29 +567,35 @@ class CareKgDB:
                         'type': gc['context_type']
                     }
                 
-                if record['relationship']['type'] in self.ontology_info['relations']['local_context']:
+                if record['relationship']['type'] in local_context_types:
                     local_context.append(context_info)
+        else:
+            self.debug_print(f"No node matched: {item_name}")
             
-            # Convert global_context and local_context to JSON strings
-            global_context_str = json.dumps(global_context, ensure_ascii=False, indent=2)
-            local_context_str = json.dumps(local_context, ensure_ascii=False, indent=2)
+        # Convert global_context and local_context to JSON strings
+        global_context_str = json.dumps(global_context, ensure_ascii=False, indent=2)
+        local_context_str = json.dumps(local_context, ensure_ascii=False, indent=2)
 
-            print(f"global_context: {global_context_str}")
-            print(f"local_context: {local_context_str}")
-            
-            return {
-                'global_context': global_context_str,
-                'local_context': local_context_str
-            }
+        print(f"global_context: {global_context_str}")
+        print(f"local_context: {local_context_str}")
+        
+        return {
+            'global_context': global_context_str,
+            'local_context': local_context_str
+        }
         
     def get_followers(self, item_name):
+        snapshot = self._snapshot()
+        if snapshot is not None and item_name in snapshot:
+            return snapshot.followers(item_name)
+
         query = """
         MATCH (n:instance)-[:FOLLOWS]->(follower)
         WHERE n.name = $item_name
         RETURN follower.name AS follower_name
         """
         try:
-            with self.driver.session() as session:
+            with self._session() as session:
                 result = session.run(query, {"item_name": item_name})
                 records = result.data()
                 return [record["follower_name"] for record in records] if records else []
@@ -227,6 +605,10 @@ class CareKgDB:
             return []
         
     def get_top_node(self, item_name):
+        snapshot = self._snapshot()
+        if snapshot is not None and item_name in snapshot:
+            return snapshot.top_node(item_name)
+
         query = """
         MATCH (center:instance {name: $item_name})
         MATCH path = (top:instance)-[:INCLUDES*]->(center)
@@ -235,7 +617,7 @@ class CareKgDB:
         LIMIT 1
         """
         try:
-            with self.driver.session() as session:
+            with self._session() as session:
                 result = session.run(query, {"item_name": item_name})
                 record = result.single()
                 return record["top_name"] if record else None
@@ -295,12 +677,16 @@ class CareKgDB:
 
     def get_item_description(self, item_name):
         """アイテムの説明を取得（互換性のため）"""
+        snapshot = self._snapshot()
+        if snapshot is not None and item_name in snapshot:
+            return snapshot.description(item_name)
+
         query = """
         MATCH (n:instance {name: $name})
         RETURN COALESCE(n.detail_description, n.description) as description
         """
         try:
-            with self.driver.session() as session:
+            with self._session() as session:
                 result = session.run(query, name=item_name)
                 record = result.single()
                 return record["description"] if record else None
@@ -308,6 +694,138 @@ class CareKgDB:
             self.debug_print(f"Error in get_item_description_: {e}")
             return None
 
+    # ---------------------------------------------------------------------
+    # 拡充情報 (detail_instruction / call_to_action / jp_title) の永続化
+    # ---------------------------------------------------------------------
+    enrichment_source_hash = staticmethod(enrichment_source_hash)
+
+    def _enrichment_from_record(self, record) -> Optional[Dict[str, str]]:
+        return enrichment_from_record(record)
+
+    def get_all_instance_nodes(self, only_missing_enrichment: bool = False) -> List[Dict[str, Any]]:
+        """全instanceノードの name / description (と拡充情報) を取得"""
+        query = """
+        MATCH (n:instance)
+        RETURN n.name as name,
+               COALESCE(n.detail_description, n.description) as description,
+               n.enriched_detail_instruction as enriched_detail_instruction,
+               n.enriched_call_to_action as enriched_call_to_action,
+               n.enriched_jp_title as enriched_jp_title,
+               n.enriched_source_hash as enriched_source_hash
+        ORDER BY n.name
+        """
+        try:
+            with self._session() as session:
+                result = session.run(query)
+                nodes = [{
+                    'name': record['name'],
+                    'description': record['description'] or "",
+                    'enrichment': self._enrichment_from_record(record)
+                } for record in result if record['name']]
+            if only_missing_enrichment:
+                nodes = [node for node in nodes if node['enrichment'] is None]
+            self.debug_print(f"Found {len(nodes)} instance nodes")
+            return nodes
+        except Exception as e:
+            self.debug_print(f"Error in get_all_instance_nodes: {e}")
+            traceback.print_exc()
+            return []
+
+    def get_node_enrichment(self, item_name: str) -> Optional[Dict[str, str]]:
+        """保存済みの拡充情報を取得 (無ければ None)"""
+        snapshot = self._snapshot()
+        if snapshot is not None and item_name in snapshot:
+            return snapshot.get(item_name)["enrichment"]
+
+        query = """
+        MATCH (n:instance {name: $name})
+        RETURN COALESCE(n.detail_description, n.description) as description,
+               n.enriched_detail_instruction as enriched_detail_instruction,
+               n.enriched_call_to_action as enriched_call_to_action,
+               n.enriched_jp_title as enriched_jp_title,
+               n.enriched_source_hash as enriched_source_hash
+        """
+        try:
+            with self._session() as session:
+                record = session.run(query, name=item_name).single()
+                return self._enrichment_from_record(record) if record else None
+        except Exception as e:
+            self.debug_print(f"Error in get_node_enrichment: {e}")
+            return None
+
+    def save_node_enrichment(self, item_name: str, enrichment: Dict[str, Any], description: Optional[str] = None) -> bool:
+        """拡充情報をノードのプロパティ (enriched_*) として保存"""
+        query = """
+        MATCH (n:instance {name: $name})
+        SET n.enriched_detail_instruction = $detail_instruction,
+            n.enriched_call_to_action = $call_to_action,
+            n.enriched_jp_title = $jp_title,
+            n.enriched_source_hash = CASE WHEN $source_hash IS NULL THEN n.enriched_source_hash ELSE $source_hash END,
+            n.enriched_at = $enriched_at
+        RETURN count(n) as updated
+        """
+        try:
+            params = {key: enrichment.get(key, "") for key in ENRICHMENT_KEYS}
+            with self._session() as session:
+                record = session.run(
+                    query,
+                    name=item_name,
+                    source_hash=self.enrichment_source_hash(description) if description is not None else None,
+                    enriched_at=datetime.now(timezone.utc).isoformat(),
+                    **params
+                ).single()
+            updated = bool(record and record["updated"])
+            snapshot = self.ontology_cache.current if self.ontology_cache else None
+            if updated and snapshot is not None:
+                snapshot.set_enrichment(item_name, {key: params[key] for key in ENRICHMENT_KEYS})
+            return updated
+        except Exception as e:
+            self.debug_print(f"Error in save_node_enrichment: {e}")
+            return False
+
+    def get_parent_names(self) -> List[str]:
+        """INCLUDES で子ノードを持つ instance ノードの名前 (並び順の一括生成用)"""
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            return snapshot.parent_names()
+
+        query = """
+        MATCH (n:instance)-[:INCLUDES]->(:instance)
+        RETURN DISTINCT n.name as name
+        ORDER BY name
+        """
+        try:
+            with self._session() as session:
+                return [record['name'] for record in session.run(query) if record['name']]
+        except Exception as e:
+            self.debug_print(f"Error in get_parent_names: {e}")
+            traceback.print_exc()
+            return []
+
+    def save_child_order(self, item_name: str, key: str, order: List[str]) -> bool:
+        """意味的に並べ替えた子ノードの順序を親ノードのプロパティ (child_order / child_order_key) として保存"""
+        query = """
+        MATCH (n:instance {name: $name})
+        SET n.child_order = $order,
+            n.child_order_key = $key,
+            n.child_order_at = $sorted_at
+        RETURN count(n) as updated
+        """
+        try:
+            with self._session() as session:
+                record = session.run(
+                    query, name=item_name, order=list(order), key=key,
+                    sorted_at=datetime.now(timezone.utc).isoformat()
+                ).single()
+            updated = bool(record and record["updated"])
+            snapshot = self.ontology_cache.current if self.ontology_cache else None
+            if updated and snapshot is not None:
+                snapshot.set_child_order(item_name, {"key": key, "order": list(order)})
+            return updated
+        except Exception as e:
+            self.debug_print(f"Error in save_child_order: {e}")
+            return False
+
     # エイリアスの設定
     get_item_full_info_sync = get_item_full_info
     get_children_sync = get_children
@@ -316,6 +834,10 @@ class CareKgDB:
 
     def get_activity_top_nodes(self) -> List[Dict[str, Any]]:
         """Activityクラスのトップノードを取得"""
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            return snapshot.top_nodes_with_label("Activity")
+
         self.debug_print("Starting get_activity_top_nodes")
         query = """
         MATCH (n:instance:Activity)
@@ -327,7 +849,7 @@ class CareKgDB:
         """
         
         try:
-            with self.driver.session() as session:
+            with self._session() as session:
                 result = session.run(query)
                 nodes = [record for record in result]
                 self.debug_print(f"Found {len(nodes)} Activity top nodes")
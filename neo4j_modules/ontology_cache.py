@@ -0,0 +1,294 @@
+import difflib
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, List, Optional, Any, Callable
+
+import eventlet
+
+
+# get_uot_nodes の対象となるラベル
+UOT_LABELS = ("Trouble", "Activity", "Action", "Task", "Condition", "Mood")
+
+
+class OntologySnapshot:
+    """
+    ケアKGの instance ノードと INCLUDES / FOLLOWS 関係のスナップショット (拡充情報以外は読み込み後に変更しない)。
+    ユーザー固有のデータは含めない (全ユーザーで共有するため)。
+
+    nodes: {name: {"name", "description", "detail_description", "time_to_achieve", "name_jp",
+                   "labels", "enrichment", "child_order", "children", "followers"}}
+    """
+
+    def __init__(self, nodes: Dict[str, Dict[str, Any]], version: int):
+        self.nodes = nodes
+        self.version = version
+        self.loaded_at = time.time()
+
+        # 親 (INCLUDES の逆向き) を作っておく
+        self.parents: Dict[str, List[str]] = {}
+        for name, node in nodes.items():
+            for child in node["children"]:
+                self.parents.setdefault(child, []).append(name)
+        self.top_names = [name for name in nodes if name not in self.parents]
+
+        # 大文字小文字を無視した名前の索引 (name_lower -> [name])
+        self.names_by_lower: Dict[str, List[str]] = {}
+        for name in nodes:
+            self.names_by_lower.setdefault(name.lower(), []).append(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.nodes
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self.nodes.get(name)
+
+    def description(self, name: str) -> Optional[str]:
+        """COALESCE(detail_description, description) 相当"""
+        node = self.nodes.get(name)
+        if node is None:
+            return None
+        return node["detail_description"] or node["description"]
+
+    def full_info(self, name: str) -> Optional[Dict[str, Any]]:
+        node = self.nodes.get(name)
+        if node is None:
+            return None
+        return {
+            'name': node['name'],
+            'description': self.description(name) or "No description available",
+            'time_to_achieve': node['time_to_achieve'],
+            'name_jp': node['name_jp'],
+            'enrichment': node['enrichment']
+        }
+
+    def children(self, name: str) -> List[str]:
+        node = self.nodes.get(name)
+        return list(node["children"]) if node else []
+
+    def followers(self, name: str) -> List[str]:
+        node = self.nodes.get(name)
+        return list(node["followers"]) if node else []
+
+    def top_node(self, name: str) -> Optional[str]:
+        """INCLUDES を遡ったトップノード (自身がトップの場合は None、Cypher版と同じ)"""
+        if name not in self.nodes or name not in self.parents:
+            return None
+        visited = {name}
+        frontier = [name]
+        while frontier:
+            current = frontier.pop(0)
+            for parent in self.parents.get(current, []):
+                if parent in visited:
+                    continue
+                if parent not in self.parents:
+                    return parent
+                visited.add(parent)
+                frontier.append(parent)
+        return None
+
+    def subtree(self, root_name: str, max_depth: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """CareKgDB.get_subtree と同じ形式のサブツリー (max_depth 段下まで)"""
+        if root_name not in self.nodes:
+            return None
+        nodes = {}
+        # 幅優先で、各ノードを最も浅い段で数える
+        queue = deque([(root_name, 0)])
+        while queue:
+            name, depth = queue.popleft()
+            if name in nodes or name not in self.nodes:
+                continue
+            info = self.full_info(name)
+            info['child_order'] = self.nodes[name].get('child_order')
+            info['children'] = self.children(name)
+            info['followers'] = self.followers(name)
+            nodes[name] = info
+            if max_depth is None or depth < max_depth:
+                queue.extend((child, depth + 1) for child in info['children'])
+        return {'root': root_name, 'nodes': nodes}
+
+    def uot_nodes(self) -> List[Dict[str, Any]]:
+        return [
+            {"name": node["name"], "description": node["detail_description"]}
+            for node in self.nodes.values()
+            if any(label in node["labels"] for label in UOT_LABELS)
+        ]
+
+    def top_nodes_with_label(self, label: str) -> List[Dict[str, Any]]:
+        return [
+            {
+                'name': name,
+                'description': self.description(name) or "No description available",
+                'time_to_achieve': self.nodes[name]['time_to_achieve'],
+                'name_jp': self.nodes[name]['name_jp']
+            }
+            for name in self.top_names if label in self.nodes[name]["labels"]
+        ]
+
+    def find(self, item_name: str, fuzzy: bool = False, limit: int = 5) -> List[str]:
+        """
+        名前でノードを検索 (CareKgDB.find_nodes と同じ順序)
+        完全一致 → 大文字小文字を無視した一致 → (fuzzy の場合) 部分一致・類似度の高い順
+        """
+        if item_name in self.nodes:
+            matches = [item_name]
+        else:
+            matches = list(self.names_by_lower.get(item_name.lower(), []))
+        if not fuzzy or len(matches) >= limit:
+            return matches[:limit]
+
+        query = item_name.lower()
+        scored = []
+        for lower, names in self.names_by_lower.items():
+            score = difflib.SequenceMatcher(None, query, lower).ratio()
+            if query in lower:
+                score += 1.0
+            if score >= 0.6:
+                scored.extend((score, name) for name in names if name not in matches)
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return (matches + [name for _, name in scored])[:limit]
+
+    def parent_names(self) -> List[str]:
+        return sorted(name for name, node in self.nodes.items() if node["children"])
+
+    def set_enrichment(self, name: str, enrichment: Dict[str, Any]) -> None:
+        """拡充情報だけはその場で更新する (再読み込みせずに書き込み結果を反映)"""
+        node = self.nodes.get(name)
+        if node is not None:
+            self.nodes[name] = {**node, "enrichment": enrichment}
+
+    def set_child_order(self, name: str, child_order: Dict[str, Any]) -> None:
+        """保存した子ノードの並び順も同様にその場で反映する"""
+        node = self.nodes.get(name)
+        if node is not None:
+            self.nodes[name] = {**node, "child_order": child_order}
+
+
+class OntologyCache:
+    """
+    OntologySnapshot の読み込みと更新を管理する read-through キャッシュ。
+
+    - 初回アクセス時に loader で読み込む
+    - refresh_interval 秒を過ぎたら、古いスナップショットを返しつつバックグラウンドで再読み込み
+    - invalidate() で次回アクセス時に再読み込み
+    - 読み込みに失敗した場合は古いスナップショットを使い続ける (無ければ None => 呼び出し側は Neo4j に問い合わせる)
+    """
+
+    def __init__(self, loader: Callable[[], Dict[str, Dict[str, Any]]], refresh_interval: float = 600, poll_interval: float = 0.05):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.poll_interval = poll_interval
+        self._snapshot: Optional[OntologySnapshot] = None
+        self._version = 0
+        self._is_stale = False
+        # 状態の確認と更新だけに使う (loader の実行中は持たない)
+        self._lock = threading.Lock()
+        self._loading = False
+        self._refreshing = False
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def current(self) -> Optional[OntologySnapshot]:
+        """読み込み済みのスナップショット (読み込みは行わない)"""
+        return self._snapshot
+
+    def get(self) -> Optional[OntologySnapshot]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.refresh()
+        if self._is_stale or time.time() - snapshot.loaded_at > self.refresh_interval:
+            self._refresh_in_background()
+        return snapshot
+
+    def _is_fresh(self) -> bool:
+        return self._snapshot is not None and not self._is_stale and time.time() - self._snapshot.loaded_at <= self.refresh_interval
+
+    def refresh(self) -> Optional[OntologySnapshot]:
+        """
+        同期的に再読み込み (同時に呼ばれた場合は1回だけ読み込む)。
+        loader はロックの外で呼ぶ。threading は monkey patch していないので、ロックを持ったまま Neo4j を待つと
+        eventlet のハブごと止まる。他の呼び出しが読み込み中なら古いスナップショットを返し、無ければ読み込みを待つ。
+        """
+        with self._lock:
+            if self._is_fresh():
+                return self._snapshot
+            loading_elsewhere = self._loading
+            if not loading_elsewhere:
+                self._loading = True
+                # 読み込み中に invalidate() されたら、読み込み後も古いままとして扱う
+                was_stale, self._is_stale = self._is_stale, False
+        if loading_elsewhere:
+            return self._wait_for_load()
+
+        nodes = None
+        try:
+            nodes = self.loader()
+        except Exception as e:
+            print(f"[OntologyCache] Failed to load snapshot: {e}")
+            traceback.print_exc()
+        with self._lock:
+            if nodes is not None:
+                self._version += 1
+                self._snapshot = OntologySnapshot(nodes, self._version)
+                print(f"[OntologyCache] Loaded snapshot v{self._version}: {len(nodes)} nodes")
+            else:
+                self._is_stale = self._is_stale or was_stale
+            self._loading = False
+            return self._snapshot
+
+    def _wait_for_load(self) -> Optional[OntologySnapshot]:
+        """他の呼び出しの読み込みを待つ (Web プロセスのグリーンレットと UoT のスレッドの両方から呼ばれるのでポーリングで待つ)"""
+        if self._snapshot is not None:
+            return self._snapshot
+        while self._loading:
+            eventlet.sleep(self.poll_interval)
+        return self._snapshot
+
+    def invalidate(self) -> None:
+        """次回アクセス時に再読み込みさせる"""
+        self._is_stale = True
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing or self._loading:
+                return
+            self._refreshing = True
+
+        def _run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=_run, name="ontology-refresh", daemon=True).start()
+
+
+_caches: Dict[Any, OntologyCache] = {}
+_caches_lock = threading.Lock()
+
+
+def is_ontology_cache_enabled() -> bool:
+    return os.getenv("ONTOLOGY_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+
+
+def get_ontology_cache(key: Any, loader: Callable[[], Dict[str, Dict[str, Any]]]) -> OntologyCache:
+    """key (接続先) ごとのプロセス共通の OntologyCache"""
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = OntologyCache(loader, refresh_interval=float(os.getenv("ONTOLOGY_CACHE_TTL", 600)))
+            _caches[key] = cache
+        return cache
+
+
+def invalidate_ontology_caches() -> None:
+    """全ての OntologyCache を無効化する (KG を更新した後のフック)"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.invalidate()
@@ -0,0 +1,207 @@
+import os
+import threading
+import traceback
+from collections import deque
+from typing import Callable, Deque, Iterator, List, Optional, Tuple
+
+from planning_modules.lending_ear_modules.uot_modules.token_utils import count_tokens
+
+SUMMARY_PREFIX = "(これまでの会話の要約) "
+
+
+class ConversationWindow:
+    """
+    トークン数で上限を決めた会話履歴のリングバッファ
+
+    - 直近の発話 (turns) は max_tokens / max_turns を超えないように古いものから追い出す
+    - 追い出した発話は要約 (summary) に畳み込む
+        1. すぐに要約の末尾へそのまま追加する (summary_max_tokens を超えた分は古い方から捨てる)
+        2. summarizer があれば、未要約の発話が summarize_min_tokens 以上溜まったところで
+           バックグラウンドで LLM に要約させ、結果で置き換える
+    - プロンプトに入るのは summary + turns なので、会話が長くなってもサイズは
+      max_tokens + summary_max_tokens で頭打ちになる
+
+    summarizer: (これまでの要約, 追い出した発話のリスト) -> 新しい要約
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 3000,
+        max_turns: int = 100,
+        summary_max_tokens: int = 500,
+        summarize_min_tokens: int = 200,
+        summarizer: Optional[Callable[[str, List[str]], str]] = None,
+        summarize_in_background: bool = True
+    ):
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.summary_max_tokens = summary_max_tokens
+        self.summarize_min_tokens = summarize_min_tokens
+        self.summarizer = summarizer
+        self.summarize_in_background = summarize_in_background
+
+        self._turns: Deque[Tuple[str, int]] = deque()  # (発話, トークン数)
+        self._turn_tokens = 0
+        self._compressed = ""  # LLM による要約
+        self._compressed_tokens = 0
+        self._pending: Deque[Tuple[int, str, int]] = deque()  # まだ LLM で要約していない発話 (seq, 発話, トークン数)
+        self._pending_tokens = 0
+        self._seq = 0
+        self._summarizing = False
+        self._lock = threading.RLock()
+        self.stats = {"appended": 0, "evicted": 0, "dropped": 0, "summaries": 0, "summary_errors": 0}
+
+    @classmethod
+    def from_env(cls, summarizer: Optional[Callable[[str, List[str]], str]] = None) -> "ConversationWindow":
+        """環境変数 CONVERSATION_WINDOW_MAX_TOKENS / CONVERSATION_WINDOW_MAX_TURNS / CONVERSATION_SUMMARY_MAX_TOKENS で調整"""
+        return cls(
+            max_tokens=int(os.getenv("CONVERSATION_WINDOW_MAX_TOKENS", 3000)),
+            max_turns=int(os.getenv("CONVERSATION_WINDOW_MAX_TURNS", 100)),
+            summary_max_tokens=int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", 500)),
+            summarizer=summarizer
+        )
+
+    # ------------------------------------------------------------------
+    # 追加
+    # ------------------------------------------------------------------
+    def append(self, message: str) -> None:
+        tokens = count_tokens(message)
+        with self._lock:
+            self._turns.append((message, tokens))
+            self._turn_tokens += tokens
+            self.stats["appended"] += 1
+            evicted = self._evict_locked()
+            if evicted:
+                self._fold_into_summary_locked(evicted)
+                start_summarizer = self._should_summarize_locked()
+            else:
+                start_summarizer = False
+        if start_summarizer:
+            self._start_summarizer()
+
+    def extend(self, messages: List[str]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._turns.clear()
+            self._turn_tokens = 0
+            self._set_compressed_locked("")
+            self._pending.clear()
+            self._pending_tokens = 0
+
+    def _evict_locked(self) -> List[Tuple[str, int]]:
+        """上限を超えた古い発話を追い出す (最新の発話は必ず残す)"""
+        evicted = []
+        while len(self._turns) > 1 and (len(self._turns) > self.max_turns or self._turn_tokens > self.max_tokens):
+            message, tokens = self._turns.popleft()
+            self._turn_tokens -= tokens
+            evicted.append((message, tokens))
+        self.stats["evicted"] += len(evicted)
+        return evicted
+
+    def _fold_into_summary_locked(self, evicted: List[Tuple[str, int]]) -> None:
+        """追い出した発話を要約の末尾に追加し、要約も上限内に収める"""
+        for message, tokens in evicted:
+            self._seq += 1
+            self._pending.append((self._seq, message, tokens))
+            self._pending_tokens += tokens
+        # 上限を超えたら、まだ要約していない古い発話から捨てる (最後は LLM の要約も捨てる)
+        while self._pending and self._compressed_tokens + self._pending_tokens > self.summary_max_tokens:
+            if len(self._pending) > 1:
+                _, _, tokens = self._pending.popleft()
+                self._pending_tokens -= tokens
+                self.stats["dropped"] += 1
+            elif self._compressed:
+                self._set_compressed_locked("")
+            else:
+                break
+
+    def _set_compressed_locked(self, summary: str) -> None:
+        self._compressed = summary
+        self._compressed_tokens = count_tokens(summary)
+
+    # ------------------------------------------------------------------
+    # LLM による要約
+    # ------------------------------------------------------------------
+    def _should_summarize_locked(self) -> bool:
+        return (
+            self.summarizer is not None
+            and not self._summarizing
+            and self._pending_tokens >= self.summarize_min_tokens
+        )
+
+    def _start_summarizer(self) -> None:
+        with self._lock:
+            if self._summarizing:
+                return
+            self._summarizing = True
+        if self.summarize_in_background:
+            threading.Thread(target=self._run_summarizer, name="conversation-summarizer", daemon=True).start()
+        else:
+            self._run_summarizer()
+
+    def _run_summarizer(self) -> None:
+        try:
+            while True:
+                with self._lock:
+                    if not self._pending or self._pending_tokens < self.summarize_min_tokens:
+                        return
+                    base = self._compressed
+                    batch = list(self._pending)
+                try:
+                    summary = self.summarizer(base, [message for _, message, _ in batch])
+                except Exception as e:
+                    print(f"[ConversationWindow] Error in summarizer: {e}")
+                    traceback.print_exc()
+                    self.stats["summary_errors"] += 1
+                    return
+                with self._lock:
+                    # 要約中に追加された発話は残し、要約済みの発話だけを取り除く
+                    last_seq = batch[-1][0]
+                    while self._pending and self._pending[0][0] <= last_seq:
+                        _, _, tokens = self._pending.popleft()
+                        self._pending_tokens -= tokens
+                    self._set_compressed_locked(summary or "")
+                    self.stats["summaries"] += 1
+        finally:
+            with self._lock:
+                self._summarizing = False
+
+    # ------------------------------------------------------------------
+    # 参照
+    # ------------------------------------------------------------------
+    @property
+    def summary(self) -> str:
+        with self._lock:
+            parts = [self._compressed] if self._compressed else []
+            parts.extend(message for _, message, _ in self._pending)
+            return "\n".join(parts)
+
+    @property
+    def turns(self) -> List[str]:
+        with self._lock:
+            return [message for message, _ in self._turns]
+
+    @property
+    def token_count(self) -> int:
+        """プロンプトに入るトークン数 (要約 + 直近の発話)"""
+        with self._lock:
+            return self._compressed_tokens + self._pending_tokens + self._turn_tokens
+
+    def as_list(self) -> List[str]:
+        """要約 (あれば先頭) + 直近の発話"""
+        with self._lock:
+            summary = self.summary
+            turns = self.turns
+        return [SUMMARY_PREFIX + summary] + turns if summary else turns
+
+    def as_str(self) -> str:
+        return "\n".join(self.as_list())
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.as_list())
@@ -3,6 +3,7 @@ import os
 
 
 from planning_modules.lending_ear_modules.uot_modules.uot_controller.controller import UoTController
+from planning_modules.llm_registry import close_loop_llm_clients
 
 from neo4j_modules.care_kg_db import CareKgDB
 import asyncio
@@ -10,10 +11,12 @@ import threading
 import traceback
 
 class LendingEarController:
-    def __init__(self, db: CareKgDB):
+    def __init__(self, db: CareKgDB, conversation=None):
+        """conversation: BackEndProcess の ConversationWindow (渡すと UoT の質問生成も同じ会話履歴を使う)"""
         self.db = db
-        self.uot_controller = UoTController(db)
+        self.uot_controller = UoTController(db, contexts=conversation)
         self.thread = None
+        self.loop = None
         self.is_waiting_for_answer = False  # 質問待ち状態を管理
 
     def main(self, send_socket, get_messages):
@@ -23,12 +26,31 @@ class LendingEarController:
 
         # 別スレッドでUoTControllerを実行
         loop = asyncio.new_event_loop()
+        self.loop = loop
         self.thread = threading.Thread(target=self.run_controller, args=(loop, self.uot_controller))
         self.thread.start()
 
     def run_controller(self, loop, controller):
         asyncio.set_event_loop(loop)
-        loop.run_until_complete(controller.run(is_debug=True))
+        try:
+            loop.run_until_complete(controller.run(is_debug=True))
+        finally:
+            # このループ用に作った LLM の非同期クライアントを閉じてからループを閉じる
+            # (httpx の接続は作ったループでしか使えないので、次のセッションは新しく作る)
+            try:
+                loop.run_until_complete(close_loop_llm_clients())
+            finally:
+                loop.close()
+
+    def post_message(self, message):
+        """
+        別スレッド (eventlet のグリーンレットなど) から呼ぶ用
+        UoT の木と LLM 呼び出しは UoTController のイベントループ上にあるので、そこで set_message を実行する
+        """
+        if self.loop is None or self.loop.is_closed():
+            print("Lending ear loop is not running, message dropped")
+            return None
+        return asyncio.run_coroutine_threadsafe(self.set_message(message), self.loop)
 
     async def set_message(self, message):
         """
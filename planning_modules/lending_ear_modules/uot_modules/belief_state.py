@@ -0,0 +1,195 @@
+import numpy as np
+
+from typing import List, Dict, Tuple, Optional, Sequence, Iterable
+
+from planning_modules.lending_ear_modules.uot_modules.item import Item
+
+
+def entropy_of(probs: np.ndarray) -> float:
+    """
+    Shannon entropy (bits) of a probability vector. Zero entries are ignored.
+
+    Args:
+        probs (np.ndarray): Probability vector.
+
+    Returns:
+        float: Entropy in bits.
+    """
+    positive = probs[probs > 0]
+    if positive.size == 0:
+        return 0.0
+    return float(-np.dot(positive, np.log2(positive)))
+
+
+class ItemIndex:
+    """
+    Item table shared by every node of a UoT tree.
+
+    Holds the immutable part of the items (name, description) once, so that each
+    node only has to keep a float64 probability vector aligned with this index.
+    """
+    __slots__ = ("names", "descriptions", "_positions")
+
+    def __init__(self, names: Sequence[str], descriptions: Sequence[str]):
+        self.names = tuple(names)
+        self.descriptions = tuple(descriptions)
+        self._positions = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def from_items(cls, items: Iterable[Item]) -> 'ItemIndex':
+        items = list(items)
+        return cls([item.get_name() for item in items], [item.description for item in items])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def position(self, name: str) -> Optional[int]:
+        return self._positions.get(name)
+
+    def extended(self, name: str, description: str) -> 'ItemIndex':
+        """Returns a new index with one more item appended (the original index is left untouched)."""
+        return ItemIndex(self.names + (name,), self.descriptions + (description,))
+
+    def likelihoods(self, evaluated_items: List[Dict], key: str = "p_yes_given_item", default: float = 0.5) -> np.ndarray:
+        """
+        Builds a likelihood vector aligned with this index from LLM evaluation results.
+
+        Results are matched by item name. Items the LLM skipped fall back to `default`
+        (0.5 means "not related" in the evaluation prompt). Unknown names are ignored.
+
+        Args:
+            evaluated_items (List[Dict]): Evaluated items, e.g. [{"name": str, "p_yes_given_item": float}, ...]
+            key (str, optional): Key of the probability to read. Defaults to "p_yes_given_item".
+            default (float, optional): Value for items without an evaluation. Defaults to 0.5.
+
+        Returns:
+            np.ndarray: float64 vector of len(self).
+        """
+        likelihood = np.full(len(self.names), default, dtype=np.float64)
+        for position, evaluated_item in enumerate(evaluated_items):
+            i = self._positions.get(evaluated_item.get("name"))
+            if i is None:
+                # Fall back to the position when the LLM rewrote the name
+                if "name" in evaluated_item or position >= len(self.names):
+                    continue
+                i = position
+            likelihood[i] = evaluated_item[key]
+        return np.clip(likelihood, 0.0, 1.0)
+
+
+class BeliefState:
+    """
+    Probability distribution over the items of an ItemIndex.
+
+    A BeliefState is treated as immutable: every Bayesian operation returns a new
+    state, so states can safely be shared between nodes and the entropy is
+    computed at most once per state.
+    """
+    __slots__ = ("index", "probs", "_entropy")
+
+    def __init__(self, index: ItemIndex, probs: Iterable[float]):
+        self.index = index
+        self.probs = np.asarray(probs, dtype=np.float64)
+        self._entropy = None
+
+    @classmethod
+    def from_items(cls, items: Iterable[Item]) -> 'BeliefState':
+        items = list(items)
+        return cls(ItemIndex.from_items(items), [item.p_s for item in items])
+
+    def __len__(self) -> int:
+        return self.probs.shape[0]
+
+    @property
+    def entropy(self) -> float:
+        if self._entropy is None:
+            self._entropy = entropy_of(self.probs)
+        return self._entropy
+
+    def with_probs(self, probs: np.ndarray) -> 'BeliefState':
+        return BeliefState(self.index, probs)
+
+    def normalized(self) -> 'BeliefState':
+        total = self.probs.sum()
+        if total <= 0:
+            return self
+        return self.with_probs(self.probs / total)
+
+    def p_yes(self, likelihood: np.ndarray) -> float:
+        """P(yes) = sum_s P(yes|s) * P(s)"""
+        return float(np.dot(likelihood, self.probs))
+
+    def posterior(self, likelihood: np.ndarray, p_yes: float, p_no: float) -> Tuple['BeliefState', 'BeliefState']:
+        """
+        Bayes posterior for both replies.
+
+        Returns:
+            Tuple[BeliefState, BeliefState]: (P(s|yes), P(s|no))
+        """
+        omega_yes = likelihood * self.probs / p_yes if p_yes > 0 else np.zeros_like(self.probs)
+        omega_no = (1 - likelihood) * self.probs / p_no if p_no > 0 else np.zeros_like(self.probs)
+        return self.with_probs(omega_yes), self.with_probs(omega_no)
+
+    def information_gain(self, omega_yes: 'BeliefState', omega_no: 'BeliefState', p_yes: float, p_no: float) -> float:
+        return self.entropy - (p_yes * omega_yes.entropy + p_no * omega_no.entropy)
+
+    def custom_bayesian_update(self, p_y_given_s: np.ndarray, p_prime_y: float, lambda_: float) -> 'BeliefState':
+        """
+        Soft Bayesian update with an uncertain observation p_prime_y, damped by the
+        consistency term r_s = 1 / (1 + lambda * (P(yes|s) - p_prime_y)^2).
+        """
+        p_s = self.probs
+        p_n_given_s = 1 - p_y_given_s
+        p_prime_n = 1 - p_prime_y
+
+        p_y = float(np.dot(p_y_given_s, p_s))
+        p_n = 1 - p_y
+
+        p_s_given_y = p_y_given_s * p_s / p_y if p_y > 0 else np.zeros_like(p_s)
+        p_s_given_n = p_n_given_s * p_s / p_n if p_n > 0 else np.zeros_like(p_s)
+
+        e_p_s = p_prime_y * p_s_given_y + p_prime_n * p_s_given_n
+        r_s = 1 / (1 + lambda_ * (p_y_given_s - p_prime_y) ** 2)
+        e_prime_p_s = r_s * e_p_s
+
+        return self.with_probs(e_prime_p_s / e_prime_p_s.sum())
+
+    def merged(self, other: 'BeliefState') -> 'BeliefState':
+        """Average of two states over their common items."""
+        n = min(len(self), len(other))
+        index = self.index if len(self.index) == n else ItemIndex(self.index.names[:n], self.index.descriptions[:n])
+        return BeliefState(index, (self.probs[:n] + other.probs[:n]) / 2)
+
+    def with_item(self, name: str, description: str, p_s: float) -> 'BeliefState':
+        return BeliefState(self.index.extended(name, description), np.append(self.probs, p_s))
+
+    def probability_of(self, name: str) -> Optional[float]:
+        i = self.index.position(name)
+        return None if i is None or i >= len(self) else float(self.probs[i])
+
+    def with_probability_of(self, name: str, p_s: float) -> 'BeliefState':
+        probs = self.probs.copy()
+        probs[self.index.position(name)] = p_s
+        return self.with_probs(probs)
+
+    def top_items(self, k: int = 5) -> Dict[str, float]:
+        """
+        Top-k items by probability. Items tied with the k-th probability are all
+        included, even if that exceeds k items.
+        """
+        order = np.argsort(-self.probs, kind="stable")
+        if len(order) > k:
+            threshold = self.probs[order[k - 1]]
+            order = np.concatenate([order[:k], [i for i in order[k:] if self.probs[i] == threshold]]).astype(int)
+        return {self.index.names[i]: float(self.probs[i]) for i in order}
+
+    def best_item(self) -> Item:
+        i = int(np.argmax(self.probs))
+        return Item(self.index.names[i], self.index.descriptions[i], float(self.probs[i]))
+
+    def to_items(self) -> List[Item]:
+        """Materializes Item objects (only needed at API boundaries, e.g. LLM prompts)."""
+        return [Item(name, description, float(p_s)) for name, description, p_s in zip(self.index.names, self.index.descriptions, self.probs)]
+
+    def as_pairs(self) -> List[Tuple[str, float]]:
+        return [(name, float(p_s)) for name, p_s in zip(self.index.names, self.probs)]
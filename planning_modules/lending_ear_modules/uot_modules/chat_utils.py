@@ -1,21 +1,45 @@
 import copy
 import importlib
 import json
-import concurrent.futures
-import concurrent.futures
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 from collections import defaultdict
+from dataclasses import dataclass
 import sys
 import asyncio
 import random
 
 from planning_modules.lending_ear_modules.uot_modules.llm_utils import get_response_util
 from planning_modules.lending_ear_modules.uot_modules.item import Item
+from planning_modules.lending_ear_modules.uot_modules.token_utils import count_tokens
+from planning_modules.lending_ear_modules.uot_modules.llm_concurrency import llm_slot
 
 
-async def generate_questions_and_estimate_probability(items : list[Item], ques_num : int, historys=None, additional_context=None, max_item_size_at_once=10, top_5_items : dict = None, use_fast_mode: bool = False):
+@dataclass(frozen=True)
+class EstimationPackingPolicy:
+   """
+   Packing policy of the batched probability estimation.
+
+   One LLM call scores up to `questions_per_call` questions against up to `items_per_call`
+   items (a question x item matrix). Batches whose estimated prompt + output tokens exceed
+   `max_tokens_per_call` are split before being sent.
+
+   Attributes:
+       items_per_call (int): Maximum number of items in one call.
+       questions_per_call (int): Maximum number of questions in one call.
+       max_tokens_per_call (int): Token budget of one call (prompt + expected output).
+       output_tokens_per_cell (int): Expected output tokens for one (question, item) cell.
+   """
+   items_per_call: int = 30
+   questions_per_call: int = 4
+   max_tokens_per_call: int = 6000
+   output_tokens_per_cell: int = 16
+
+
+async def generate_questions_and_estimate_probability(items : list[Item], ques_num : int, historys=None, additional_context=None, max_item_size_at_once=10, top_5_items : dict = None, use_fast_mode: bool = False, estimation_policy: Optional[EstimationPackingPolicy] = None):
    """
    Generates questions and estimates the probability of the given items being true.
+   Every LLM call is awaited with ainvoke under llm_slot (global + per-session concurrency limit),
+   and the estimation calls of all questions / chunks run concurrently.
 
    Args:
        items (list[str]): List of name of items to be classified.
@@ -25,6 +49,7 @@ async def generate_questions_and_estimate_probability(items : list[Item], ques_n
        max_item_size_at_once (int, optional): Maximum number of items to handle simultaneously. Defaults to 10.
        top_5_items (dict[str, float], optional): Top 5 items and their probabilities. Defaults to None.
        use_fast_mode (bool, optional): Whether to use fast mode for question generation. Defaults to False.
+       estimation_policy (EstimationPackingPolicy, optional): If given, probabilities are estimated in batched mode (several questions per call). Defaults to None.
 
    Returns:
        list: A list of dictionaries where each dictionary contains the classification results for a question.
@@ -52,24 +77,50 @@ async def generate_questions_and_estimate_probability(items : list[Item], ques_n
 
    generate_questions_chain = get_response_util("generate_questions_fast" if use_fast_mode else "generate_questions")
 
-   response = generate_questions_chain.invoke({
-       "item_name_list": [item.get_name() for item in items],
-       "history": historys_str,
-       "n": ques_num,
-       "one_divided_n": 1/ques_num if ques_num > 0 else 0,
-       "additional_context": additional_context_str,
-       "top_5_items": top_5_items,
-       "is_abstract": random.random() < 0.5
-   })
+   async with llm_slot():
+       response = await generate_questions_chain.ainvoke({
+           "item_name_list": [item.get_name() for item in items],
+           "history": historys_str,
+           "n": ques_num,
+           "one_divided_n": 1/ques_num if ques_num > 0 else 0,
+           "additional_context": additional_context_str,
+           "top_5_items": top_5_items,
+           "is_abstract": random.random() < 0.5
+       })
 
 
    gen_questions = [item["question"] for item in response["items"]]
 
    #print(f"questions: {gen_questions}")
 
-   probabilities = _estimate_probability_of_items(items, gen_questions, historys_str, max_item_size_at_once)
+   if estimation_policy is not None:
+       probabilities = await _estimate_probability_of_items_batched(items, gen_questions, historys_str, estimation_policy)
+   else:
+       probabilities = await _estimate_probability_of_items(items, gen_questions, historys_str, max_item_size_at_once)
    return probabilities
 
+def estimate_llm_calls(n_items: int, ques_num: int, max_item_size_at_once: int = 10, estimation_policy: Optional[EstimationPackingPolicy] = None) -> int:
+   """
+   Number of LLM calls one generate_questions_and_estimate_probability call makes
+   (question generation + probability estimation), without splits or retries.
+
+   Args:
+       n_items (int): Number of items.
+       ques_num (int): Number of questions to generate.
+       max_item_size_at_once (int, optional): Chunk size of the per-question estimation. Defaults to 10.
+       estimation_policy (EstimationPackingPolicy, optional): Packing policy of the batched estimation. Defaults to None.
+
+   Returns:
+       int: Estimated number of calls (0 when nothing would be generated).
+   """
+   if n_items <= 1:
+       return 0
+   if estimation_policy is not None:
+       question_slices = -(-ques_num // max(1, estimation_policy.questions_per_call))
+       item_slices = -(-n_items // max(1, estimation_policy.items_per_call))
+       return 1 + question_slices * item_slices
+   return 1 + ques_num * -(-n_items // max(1, max_item_size_at_once))
+
 def format_history(historys):
    """
    Formats the history into a string representation.
@@ -85,10 +136,10 @@ def format_history(historys):
    
    return '\n'.join([f"Question {i + 1}: {h['q']} -> Answer {i + 1} : {h['a']}" for i, h in enumerate(historys)])
 
-def _estimate_probability_of_items(items: List[Item], questions: List[str], history: str, max_item_size_at_once=10) -> List[Dict[str, Any]]:
+async def _estimate_probability_of_items(items: List[Item], questions: List[str], history: str, max_item_size_at_once=10) -> List[Dict[str, Any]]:
     """
     Estimates the probability that items are true based on provided questions and historical context.
-    Optimized for parallel API calls with synchronous completion.
+    All (question, chunk) calls are awaited concurrently.
 
     Args:
         items (List[Item]): List of Item to be classified.
@@ -106,17 +157,18 @@ def _estimate_probability_of_items(items: List[Item], questions: List[str], hist
     #print(f"Number of chunks: {len(items_chunks)}")
     #print(f"Number of questions: {len(questions)}")
 
-    def process_future(future: concurrent.futures.Future, chunk: List[Item], question: str) -> None:
+    def process_response(evaluated_result: Any, chunk: List[Item], question: str) -> None:
         """
-        Process the future result of a chunk of items.
+        Process the result of a chunk of items.
 
         Args:
-            future (concurrent.futures.Future): Future object representing the asynchronous execution.
+            evaluated_result (Any): Response of the chunk call, or the exception it raised.
             chunk (List[Item]): List of items in the chunk.
             question (str): The question used for classification.
         """
         try:
-            evaluated_result = future.result()
+            if isinstance(evaluated_result, BaseException):
+                raise evaluated_result
             evaluated_items = evaluated_result["items"]
             evaluated_items_buf = [
                 {
@@ -132,20 +184,13 @@ def _estimate_probability_of_items(items: List[Item], questions: List[str], hist
             print(f"Error processing chunk for question {question}: {e}")
 
     try:
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            # Submit all tasks at once
-            futures = [
-                executor.submit(_simulate_and_estimate_chunk, chunk, question, history)
-                for question in questions
-                for chunk in items_chunks
-            ]
-
-            # Wait for all futures to complete
-            concurrent.futures.wait(futures)
-
-            # Process all completed futures
-            for future, (chunk, question) in zip(futures, [(chunk, q) for q in questions for chunk in items_chunks]):
-                process_future(future, chunk, question)
+        pairs = [(chunk, question) for question in questions for chunk in items_chunks]
+        responses = await asyncio.gather(
+            *(_simulate_and_estimate_chunk(chunk, question, history) for chunk, question in pairs),
+            return_exceptions=True
+        )
+        for response, (chunk, question) in zip(responses, pairs):
+            process_response(response, chunk, question)
 
         # Verify all items are accounted for
         all_evaluated_items = set()
@@ -162,10 +207,10 @@ def _estimate_probability_of_items(items: List[Item], questions: List[str], hist
 
     except Exception as e:
         print(f"Error classifying items: {e}")
-        # Fallback to sequential processing if parallel processing fails
-        return _estimate_probability_of_items(items, questions, history, 1)
+        # Fallback to one item per call if the concurrent processing fails
+        return await _estimate_probability_of_items(items, questions, history, 1)
 
-def _simulate_and_estimate_chunk(chunk: List[Item], question: str, history: str) -> Dict[str, Any]:
+async def _simulate_and_estimate_chunk(chunk: List[Item], question: str, history: str) -> Dict[str, Any]:
     """
     Simulates and estimates the probability of a chunk of items based on a question and the history.
 
@@ -178,12 +223,167 @@ def _simulate_and_estimate_chunk(chunk: List[Item], question: str, history: str)
         Dict[str, Any]: A dictionary containing the classification results for the question.
     """
     estimate_probabilities_of_chunk_chain = get_response_util("evaluate_probabilities_of_chunk")
-    response = estimate_probabilities_of_chunk_chain.invoke({"item_name_list": [item.get_name() for item in chunk], "question": question, "history": history})
-    return response
+    async with llm_slot():
+        return await estimate_probabilities_of_chunk_chain.ainvoke({"item_name_list": [item.get_name() for item in chunk], "question": question, "history": history})
+
+async def _estimate_probability_of_items_batched(items: List[Item], questions: List[str], history: str, policy: EstimationPackingPolicy) -> List[Dict[str, Any]]:
+    """
+    Batched version of _estimate_probability_of_items.
+    Questions and items are packed into (question slice x item slice) batches according to the policy,
+    and each batch is scored by one "evaluate_probabilities_of_batch" call.
+
+    Args:
+        items (List[Item]): List of Item to be classified.
+        questions (List[str]): Questions used to estimate the truth probability of the items.
+        history (str): String representation of the interaction history.
+        policy (EstimationPackingPolicy): Packing policy.
+
+    Returns:
+        List[Dict[str, Any]]: Same format as _estimate_probability_of_items.
+    """
+    items_per_call = max(1, policy.items_per_call)
+    questions_per_call = max(1, policy.questions_per_call)
+    item_slices = [items[i:i + items_per_call] for i in range(0, len(items), items_per_call)]
+    question_slices = [questions[i:i + questions_per_call] for i in range(0, len(questions), questions_per_call)]
+    batches = [(question_slice, item_slice) for question_slice in question_slices for item_slice in item_slices]
+
+    results = defaultdict(dict)
+    responses = await asyncio.gather(
+        *(_estimate_batch(question_slice, item_slice, history, policy) for question_slice, item_slice in batches),
+        return_exceptions=True
+    )
+    for response, (question_slice, item_slice) in zip(responses, batches):
+        if isinstance(response, BaseException):
+            print(f"Error processing batch for questions {question_slice}: {response}")
+            continue
+        for question, evaluated_items in response.items():
+            for evaluated_item in evaluated_items:
+                results[question][evaluated_item["name"]] = evaluated_item
+
+    # 質問ごとに元の items の順序で並べ直す
+    formatted_results = []
+    for question in questions:
+        evaluated_items = [results[question][item.get_name()] for item in items if item.get_name() in results[question]]
+        if len(evaluated_items) < len(items):
+            print(f"Warning: Some items were not evaluated for question {question}: {set(item.get_name() for item in items) - set(results[question])}")
+        formatted_results.append({"question": question, "evaluated_items": evaluated_items})
+    return formatted_results
+
+def _estimate_batch_tokens(questions: List[str], items: List[Item], history: str, policy: EstimationPackingPolicy) -> int:
+    """
+    Estimates the tokens (prompt + output) of one batch call.
+    """
+    prompt_tokens = count_tokens(_format_numbered([item.get_name() for item in items])) + count_tokens(_format_numbered(questions)) + count_tokens(history)
+    return prompt_tokens + len(questions) * len(items) * policy.output_tokens_per_cell
+
+def _split_batch(questions: List[str], items: List[Item]) -> List[Tuple[List[str], List[Item]]]:
+    """
+    Splits a batch into two halves along the larger dimension.
+    """
+    if len(questions) > 1 and len(questions) >= len(items):
+        mid = len(questions) // 2
+        return [(questions[:mid], items), (questions[mid:], items)]
+    mid = len(items) // 2
+    return [(questions, items[:mid]), (questions, items[mid:])]
+
+async def _estimate_batch(questions: List[str], items: List[Item], history: str, policy: EstimationPackingPolicy) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Scores a batch of questions x items with one LLM call.
+
+    Oversized batches (token budget) are split before being sent. If the call fails or the result misses some cells,
+    the batch is split and retried, and a single question batch finally falls back to _simulate_and_estimate_chunk.
+
+    Args:
+        questions (List[str]): Questions of the batch.
+        items (List[Item]): Items of the batch.
+        history (str): String representation of the interaction history.
+        policy (EstimationPackingPolicy): Packing policy.
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: {question: evaluated_items}
+    """
+    is_splittable = len(questions) > 1 or len(items) > 1
+
+    if is_splittable and _estimate_batch_tokens(questions, items, history, policy) > policy.max_tokens_per_call:
+        return await _estimate_split_batch(questions, items, history, policy)
+
+    try:
+        async with llm_slot():
+            response = await get_response_util("evaluate_probabilities_of_batch").ainvoke({
+                "item_name_list": _format_numbered([item.get_name() for item in items]),
+                "question_list": _format_numbered(questions),
+                "history": history
+            })
+        results = _parse_batch_response(response, questions, items)
+    except Exception as e:
+        print(f"Error estimating batch ({len(questions)} questions x {len(items)} items): {e}")
+        results = {}
+
+    if all(len(results.get(question, [])) == len(items) for question in questions):
+        return results
+
+    # 欠けたセルがある場合は分割して再試行する
+    if len(questions) > 1:
+        return await _estimate_split_batch(questions, items, history, policy)
+
+    # 質問が1つの場合は従来のチャンク評価にフォールバック
+    question = questions[0]
+    try:
+        response = await _simulate_and_estimate_chunk(items, question, history)
+        return {question: [
+            {
+                "p_yes_given_item": max(min(evaluated_item["y_prob"], 1), 0),
+                "p_no_given_item": max(min(1 - evaluated_item["y_prob"], 1), 0),
+                "name": evaluated_item["name"],
+                "description": evaluated_item["description"]
+            }
+            for evaluated_item in response["items"]
+        ]}
+    except Exception as e:
+        print(f"Error in fallback chunk estimation for question {question}: {e}")
+        return results
+
+async def _estimate_split_batch(questions: List[str], items: List[Item], history: str, policy: EstimationPackingPolicy) -> Dict[str, List[Dict[str, Any]]]:
+    results = defaultdict(list)
+    halves = await asyncio.gather(*(_estimate_batch(sub_questions, sub_items, history, policy) for sub_questions, sub_items in _split_batch(questions, items)))
+    for half in halves:
+        for question, evaluated_items in half.items():
+            results[question].extend(evaluated_items)
+    return dict(results)
+
+def _parse_batch_response(response: Dict[str, Any], questions: List[str], items: List[Item]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Converts the question x item matrix returned by the LLM into {question: evaluated_items}.
+    Numbers out of range are ignored.
+    """
+    results = {}
+    for result in response["results"]:
+        question_number = result["question_number"]
+        if not 1 <= question_number <= len(questions):
+            continue
+        evaluated_items = {}
+        for evaluated_item in result["items"]:
+            item_number = evaluated_item["item_number"]
+            if not 1 <= item_number <= len(items):
+                continue
+            item = items[item_number - 1]
+            y_prob = max(min(float(evaluated_item["y_prob"]), 1), 0)
+            evaluated_items[item_number] = {
+                "p_yes_given_item": y_prob,
+                "p_no_given_item": 1 - y_prob,
+                "name": item.get_name(),
+                "description": item.description
+            }
+        results[questions[question_number - 1]] = [evaluated_items[number] for number in sorted(evaluated_items)]
+    return results
+
+def _format_numbered(values: List[str]) -> str:
+    return "\n".join(f"{i + 1}: {value}" for i, value in enumerate(values))
 
 async def check_open_answer(question: str, answer: str) -> Tuple[bool, str, float]:
     check_open_answer_chain = get_response_util("check_open_answer")
-    response = await asyncio.to_thread(check_open_answer_chain.invoke, {"question": question, "answer": answer})
+    async with llm_slot():
+        response = await check_open_answer_chain.ainvoke({"question": question, "answer": answer})
     
     is_answer_done = response["is_answer_done"]
     observed_prob_of_yes = response["observed_prob_of_yes"]
@@ -211,18 +411,16 @@ async def check_is_answered_to_question(responses: list[str], question: str, rea
             - observed_prob_of_yes: Probability of "yes"
 
     Note:
-        This function uses an asynchronous thread to invoke the chain for checking if the question is answered.
+        The chain is awaited with ainvoke under llm_slot.
     """
     check_is_answered_to_question_chain = get_response_util("check_is_answered_to_question")
-    result = await asyncio.to_thread(
-        check_is_answered_to_question_chain.invoke,
-        {
+    async with llm_slot():
+        result = await check_is_answered_to_question_chain.ainvoke({
             "responses": responses,
             "question": question,
             "real_asked_question": real_asked_question,
             "no_clear_answer_count": len(responses)
-        }
-    )
+        })
     
     is_answered = result["is_answered"]
     observed_prob_of_yes = result["observed_prob_of_yes"]
@@ -244,10 +442,32 @@ async def check_is_question_explained(response: str, question: str) -> bool:
         bool: True if the question is explained, False otherwise
 
     Note:
-        This function uses an asynchronous thread to invoke the chain for checking if the question is explained.
+        The chain is awaited with ainvoke under llm_slot.
     """
     check_is_question_explained_chain = get_response_util("check_is_question_explained")
 
-    result = await asyncio.to_thread(check_is_question_explained_chain.invoke, {"response": response, "question": question})
+    async with llm_slot():
+        result = await check_is_question_explained_chain.ainvoke({"response": response, "question": question})
     print(f"check_is_question_explained_chain response : (response: {response}, question: {question}, result: {result})")
-    return result["is_question_explained"]
\ No newline at end of file
+    return result["is_question_explained"]
+
+def summarize_conversation(summary: str, turns: list[str], max_characters: int = 400) -> str:
+    """
+    Folds the turns evicted from a conversation window into its running summary.
+
+    Args:
+        summary (str): The current summary (may be empty)
+        turns (list[str]): The evicted turns, oldest first
+        max_characters (int): The maximum length of the new summary
+
+    Returns:
+        str: The updated summary
+    """
+    summarize_conversation_chain = get_response_util("summarize_conversation")
+
+    result = summarize_conversation_chain.invoke({
+        "summary": summary or "(なし)",
+        "turns": "\n".join(turns),
+        "max_characters": max_characters
+    })
+    return result["summary"]
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import eventlet
+
+
+class GlobalLLMLimiter:
+    """
+    Process wide cap on in-flight LLM calls.
+
+    Every session runs its own event loop (LendingEarController starts one per session),
+    so the cap is a threading semaphore that coroutines acquire without blocking their loop.
+    """
+
+    def __init__(self, max_concurrency: int, poll_interval: float = 0.005, max_poll_interval: float = 0.1):
+        self.max_concurrency = max(1, max_concurrency)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self.stats = {"in_flight": 0, "peak": 0, "calls": 0, "waits": 0}
+
+    async def acquire(self) -> None:
+        delay = self.poll_interval
+        if not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.stats["waits"] += 1
+            # キャンセルされてもスロットを取りっぱなしにしないよう、ポーリングで待つ
+            while not self._semaphore.acquire(blocking=False):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+        with self._lock:
+            self.stats["in_flight"] += 1
+            self.stats["calls"] += 1
+            self.stats["peak"] = max(self.stats["peak"], self.stats["in_flight"])
+
+    def acquire_blocking(self) -> None:
+        """acquire() for synchronous callers (eventlet green threads, the enrichment pipeline)."""
+        delay = self.poll_interval
+        if not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.stats["waits"] += 1
+            # threading は monkey patch していないので、semaphore で待つとハブごと止まりスロットを返す側も動けなくなる
+            # eventlet.sleep でハブに制御を返しながらポーリングする
+            while not self._semaphore.acquire(blocking=False):
+                eventlet.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+        with self._lock:
+            self.stats["in_flight"] += 1
+            self.stats["calls"] += 1
+            self.stats["peak"] = max(self.stats["peak"], self.stats["in_flight"])
+
+    def release(self) -> None:
+        with self._lock:
+            self.stats["in_flight"] -= 1
+        self._semaphore.release()
+
+
+_global_limiter = GlobalLLMLimiter(int(os.getenv("LLM_MAX_CONCURRENCY", 16)))
+# セッション (UoTController.run のタスクと、そこから作られたタスク) ごとの上限
+_session_semaphore: ContextVar[Optional[asyncio.Semaphore]] = ContextVar("llm_session_semaphore", default=None)
+
+
+def get_global_limiter() -> GlobalLLMLimiter:
+    return _global_limiter
+
+
+def set_session_concurrency(limit: Optional[int] = None) -> asyncio.Semaphore:
+    """
+    Caps the LLM calls of the current task and of every task it creates afterwards
+    (environment variable UOT_SESSION_MAX_CONCURRENCY by default).
+    """
+    if limit is None:
+        limit = int(os.getenv("UOT_SESSION_MAX_CONCURRENCY", 4))
+    semaphore = asyncio.Semaphore(max(1, limit))
+    _session_semaphore.set(semaphore)
+    return semaphore
+
+
+@asynccontextmanager
+async def llm_slot():
+    """Waits for a free slot of the session limit and of the global limit around one LLM call."""
+    session = _session_semaphore.get()
+    if session is not None:
+        await session.acquire()
+    try:
+        await _global_limiter.acquire()
+        try:
+            yield
+        finally:
+            _global_limiter.release()
+    finally:
+        if session is not None:
+            session.release()
+
+
+def get_llm_concurrency_stats() -> Dict[str, int]:
+    with _global_limiter._lock:
+        stats = dict(_global_limiter.stats)
+    stats["max_concurrency"] = _global_limiter.max_concurrency
+    return stats
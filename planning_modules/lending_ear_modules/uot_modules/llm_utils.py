@@ -1,14 +1,15 @@
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
-from langchain_fireworks import ChatFireworks
 from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic.v1 import BaseModel, Field
 from typing import List, Callable
+from functools import lru_cache
 from enum import Enum
 import os
 from langchain_core.runnables.base import RunnableSequence
 
+from planning_modules.llm_cache import cached_chain
+from planning_modules.llm_registry import get_llm
+
 from .tasks.prompts.dementia_support import *
 
 from dotenv import load_dotenv
@@ -30,6 +31,26 @@ class _EvaluationProbabilityOfYesResult(BaseModel):
     question: str = Field(..., description="The question posed for evaluation of probability of yes option of situation with the item.")
     items: List[_EvaluationProbabilityOfYes] = Field(..., description="The list of evaluated items.")
 
+class _BatchEvaluationOfItem(BaseModel):
+    class Config:
+        allow_population_by_field_name = True
+
+    item_number: int = Field(..., description="The number of the item in the given item list.")
+    y_prob: float = Field(..., description="The probability of the item being yes. y_prob must be between 0 and 1. Around 0.5 means not related, both, or difficult. Please set the number as detailed as possible. (in English)")
+
+class _BatchEvaluationOfQuestion(BaseModel):
+    class Config:
+        allow_population_by_field_name = True
+
+    question_number: int = Field(..., description="The number of the question in the given question list.")
+    items: List[_BatchEvaluationOfItem] = Field(..., description="The list of evaluated items for the question. You must evaluate all items.")
+
+class _BatchEvaluationResult(BaseModel):
+    class Config:
+        allow_population_by_field_name = True
+
+    results: List[_BatchEvaluationOfQuestion] = Field(..., description="The list of evaluation results (questions x items matrix). You must evaluate all questions.")
+
 class _GenerateQuestionsItem(BaseModel):
     class Config:
         allow_population_by_field_name = True
@@ -95,25 +116,41 @@ def pydantic_to_dict(obj):
         return obj
 
 # Define the models
-gpt_4o_mini_model = ChatOpenAI(model="gpt-4o-mini", max_tokens=4096).bind(
-        response_format={"type": "json_object"}
-    )
-fireworks_llama70b = ChatFireworks(model="accounts/fireworks/models/llama-v3p2-90b-vision-instruct", max_tokens=4096).bind(
-        response_format={"type": "json_object"}
-    )
-claude_3_haiku_model = ChatAnthropic(model="claude-3-haiku-20240307", max_tokens=4096)
-claude_3_5_sonnet_model = ChatAnthropic(model="claude-3-5-sonnet-20241022", max_tokens=4096)
-fireworks_llama_v3p2_11b = ChatFireworks(model="accounts/fireworks/models/llama-v3p2-11b-vision-instruct", max_tokens=4096).bind(
-        response_format={"type": "json_object"}
-    )
-groq_llama_v3p2_90b = ChatOpenAI(model="llama-3.2-90b-text-preview", max_tokens=4096, api_key=os.getenv("GROQ_API_KEY"), base_url="https://api.groq.com/openai/v1").bind(
-        response_format={"type": "json_object"}
-    )
-
-smart_model = gpt_4o_mini_model
-fast_model = gpt_4o_mini_model
-fast_quasi_model = groq_llama_v3p2_90b
-quasi_model = claude_3_5_sonnet_model
+class _ConversationSummary(BaseModel):
+    class Config:
+        allow_population_by_field_name = True
+
+    summary: str = Field(..., description="The updated summary of the conversation. (in Japanese)")
+
+# 役割ごとのモデル。クライアントは初めて使うときに LLMRegistry で作り、プロセス内で使い回す
+MODEL_SPECS = {
+    "gpt_4o_mini_model": ("openai", "gpt-4o-mini", {"max_tokens": 4096, "json_mode": True}),
+    "fireworks_llama70b": ("fireworks", "accounts/fireworks/models/llama-v3p2-90b-vision-instruct", {"max_tokens": 4096, "json_mode": True}),
+    "claude_3_haiku_model": ("anthropic", "claude-3-haiku-20240307", {"max_tokens": 4096}),
+    "claude_3_5_sonnet_model": ("anthropic", "claude-3-5-sonnet-20241022", {"max_tokens": 4096}),
+    "fireworks_llama_v3p2_11b": ("fireworks", "accounts/fireworks/models/llama-v3p2-11b-vision-instruct", {"max_tokens": 4096, "json_mode": True}),
+    "groq_llama_v3p2_90b": ("groq", "llama-3.2-90b-text-preview", {"max_tokens": 4096, "json_mode": True}),
+}
+
+MODEL_ROLES = {
+    "smart_model": "gpt_4o_mini_model",
+    "fast_model": "gpt_4o_mini_model",
+    "fast_quasi_model": "groq_llama_v3p2_90b",
+    "quasi_model": "claude_3_5_sonnet_model",
+}
+
+def get_model(name: str):
+    """
+    Returns the shared client of a model (a key of MODEL_SPECS) or of a role (a key of MODEL_ROLES).
+    """
+    provider, model, params = MODEL_SPECS[MODEL_ROLES.get(name, name)]
+    return get_llm(provider, model, **params)
+
+def __getattr__(name: str):
+    # 以前のモジュール変数 (fast_model など) も、使われたときに作る
+    if name in MODEL_SPECS or name in MODEL_ROLES:
+        return get_model(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Define the prompts and output parsers for the "classify_chunk" usecase
 output_parser_evaluate_probabilities_of_chunk = JsonOutputParser(pydantic_object=_EvaluationProbabilityOfYesResult)
@@ -124,6 +161,15 @@ prompt_template_evaluate_probabilities_of_chunk = PromptTemplate.from_template(
         },
 )
 
+# Define the prompts and output parsers for the "evaluate_probabilities_of_batch" usecase
+output_parser_evaluate_probabilities_of_batch = JsonOutputParser(pydantic_object=_BatchEvaluationResult)
+prompt_template_evaluate_probabilities_of_batch = PromptTemplate.from_template(
+    evaluate_probabilities_of_batch_prompt,
+    partial_variables={
+            "format_instructions": output_parser_evaluate_probabilities_of_batch.get_format_instructions()
+        },
+)
+
 # Define the prompts and output parsers for the "generate_questions" usecase
 output_parser_generate_questions = JsonOutputParser(pydantic_object=_GenerateQuestionsResult)
 prompt_template_generate_questions = PromptTemplate.from_template(
@@ -157,6 +203,14 @@ prompt_template_check_is_question_explained = PromptTemplate.from_template(
     },
 )
 
+output_parser_summarize_conversation = JsonOutputParser(pydantic_object=_ConversationSummary)
+prompt_template_summarize_conversation = PromptTemplate.from_template(
+    summarize_conversation_prompt,
+    partial_variables={
+        "format_instructions": output_parser_summarize_conversation.get_format_instructions()
+    },
+)
+
 def get_response_util(usecase_name : str) -> RunnableSequence:
     """
     Returns a RunnableSequence object for the given usecase name.
@@ -167,17 +221,31 @@ def get_response_util(usecase_name : str) -> RunnableSequence:
     Returns:
         A RunnableSequence object for the given usecase name.
     """
+    # チェーン (テンプレート | 共有クライアント | パーサ) はユースケースごとに 1 度だけ組み立てる
+    chain = _usecase_chain(usecase_name)
+
+    # 同じテンプレート・モデル・入力の呼び出しはキャッシュから返す
+    return cached_chain(chain)
+
+@lru_cache(maxsize=None)
+def _usecase_chain(usecase_name: str) -> RunnableSequence:
+    fast_model = get_model("fast_model")
     if usecase_name == "evaluate_probabilities_of_chunk":
-        return prompt_template_evaluate_probabilities_of_chunk | fast_model | output_parser_evaluate_probabilities_of_chunk
+        chain = prompt_template_evaluate_probabilities_of_chunk | fast_model | output_parser_evaluate_probabilities_of_chunk
+    elif usecase_name == "evaluate_probabilities_of_batch":
+        chain = prompt_template_evaluate_probabilities_of_batch | fast_model | output_parser_evaluate_probabilities_of_batch
     elif usecase_name == "generate_questions":
-        return prompt_template_generate_questions | quasi_model | output_parser_generate_questions
+        chain = prompt_template_generate_questions | get_model("quasi_model") | output_parser_generate_questions
     elif usecase_name == "generate_questions_fast":
-        return prompt_template_generate_questions | fast_quasi_model | output_parser_generate_questions
+        chain = prompt_template_generate_questions | get_model("fast_quasi_model") | output_parser_generate_questions
     elif usecase_name == "check_open_answer":
-        return prompt_template_check_open_answer | fast_model | output_parser_check_open_answer
+        chain = prompt_template_check_open_answer | fast_model | output_parser_check_open_answer
     elif usecase_name == "check_is_answered_to_question":
-        return prompt_template_check_is_answered_to_question | fast_model | output_parser_check_is_answered_to_question
+        chain = prompt_template_check_is_answered_to_question | fast_model | output_parser_check_is_answered_to_question
     elif usecase_name == "check_is_question_explained":
-        return prompt_template_check_is_question_explained | fast_model | output_parser_check_is_question_explained
+        chain = prompt_template_check_is_question_explained | fast_model | output_parser_check_is_question_explained
+    elif usecase_name == "summarize_conversation":
+        chain = prompt_template_summarize_conversation | fast_model | output_parser_summarize_conversation
     else:
-        raise ValueError(f"Invalid usecase_name: {usecase_name}")
\ No newline at end of file
+        raise ValueError(f"Invalid usecase_name: {usecase_name}")
+    return chain
\ No newline at end of file
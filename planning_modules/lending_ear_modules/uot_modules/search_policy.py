@@ -0,0 +1,270 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from planning_modules.lending_ear_modules.uot_modules.chat_utils import EstimationPackingPolicy, estimate_llm_calls
+from planning_modules.lending_ear_modules.uot_modules.token_utils import count_tokens
+from planning_modules.lending_ear_modules.uot_modules.uot_node import UoTNode
+
+
+@dataclass
+class SearchBudget:
+    """
+    Hard limits of one background extension (i.e. per question asked). None means unlimited.
+
+    LLM calls and tokens are estimated before an expansion is started (estimate_llm_calls /
+    estimate_expansion_tokens), so an expansion that would not fit is never sent. The wall-clock
+    limit cancels the expansions still in flight when it expires.
+
+    Attributes:
+        max_llm_calls (Optional[int]): Number of LLM calls.
+        max_tokens (Optional[int]): Prompt + output tokens.
+        max_seconds (Optional[float]): Wall-clock seconds.
+    """
+    max_llm_calls: Optional[int] = None
+    max_tokens: Optional[int] = None
+    max_seconds: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> 'SearchBudget':
+        def read(name: str, cast):
+            value = os.getenv(name)
+            return cast(value) if value not in (None, "") else None
+        return cls(
+            max_llm_calls=read("UOT_SEARCH_MAX_CALLS", int),
+            max_tokens=read("UOT_SEARCH_MAX_TOKENS", int),
+            max_seconds=read("UOT_SEARCH_MAX_SECONDS", float)
+        )
+
+
+def estimate_expansion_tokens(node: UoTNode) -> int:
+    """
+    Estimates the tokens (prompt + output) spent by generate_children on node:
+    every call carries the item names and the history, and every (question, item) cell costs
+    output_tokens_per_cell of the estimation policy.
+    """
+    policy = node.estimation_policy or EstimationPackingPolicy()
+    calls = estimate_llm_calls(len(node.belief), node.n_question_candidates, node.max_item_size_at_once, node.estimation_policy)
+    prompt_tokens = count_tokens("\n".join(node.belief.index.names)) + count_tokens(json.dumps(node.history, ensure_ascii=False))
+    return calls * prompt_tokens + len(node.belief) * node.n_question_candidates * policy.output_tokens_per_cell
+
+
+class _Spend:
+    """Tracks what one extension run spent against its SearchBudget."""
+
+    def __init__(self, budget: SearchBudget):
+        self.budget = budget
+        self.started_at = time.monotonic()
+        self.llm_calls = 0
+        self.tokens = 0
+        self.expansions = 0
+
+    def fits(self, calls: int, tokens: int) -> bool:
+        if self.budget.max_llm_calls is not None and self.llm_calls + calls > self.budget.max_llm_calls:
+            return False
+        if self.budget.max_tokens is not None and self.tokens + tokens > self.budget.max_tokens:
+            return False
+        return True
+
+    def add(self, calls: int, tokens: int, expansions: int = 1) -> None:
+        self.llm_calls += calls
+        self.tokens += tokens
+        self.expansions += expansions
+
+    def remaining_seconds(self) -> Optional[float]:
+        if self.budget.max_seconds is None:
+            return None
+        return max(0.0, self.budget.max_seconds - (time.monotonic() - self.started_at))
+
+    def report(self, policy: str, stopped_by: str) -> Dict[str, Any]:
+        return {
+            "policy": policy,
+            "expansions": self.expansions,
+            "llm_calls": self.llm_calls,
+            "tokens": self.tokens,
+            "seconds": round(time.monotonic() - self.started_at, 3),
+            "stopped_by": stopped_by,
+        }
+
+
+class SearchPolicy(ABC):
+    """
+    Decides which nodes UoT expands in the background after the first layer.
+
+    extend() grows uot.root until the tree, the budget or uot.extension_stop_flag runs out, keeps
+    uot.best_question up to date while it runs (get_question always returns the current best), and
+    returns a report of what it spent.
+    """
+    name = "base"
+
+    def __init__(self, budget: Optional[SearchBudget] = None):
+        self.budget = budget or SearchBudget()
+
+    @abstractmethod
+    async def extend(self, uot) -> Dict[str, Any]:
+        ...
+
+    @staticmethod
+    def expansion_cost(node: UoTNode) -> Tuple[int, int]:
+        calls = estimate_llm_calls(len(node.belief), node.n_question_candidates, node.max_item_size_at_once, node.estimation_policy)
+        return calls, estimate_expansion_tokens(node)
+
+    @staticmethod
+    async def _run_until(tasks: List[asyncio.Task], timeout: Optional[float]) -> bool:
+        """Waits for tasks; cancels the ones still running after timeout. Returns False on timeout."""
+        if not tasks:
+            return True
+        try:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+        except asyncio.CancelledError:
+            # stop_extension で展開自体が止められた
+            for task in tasks:
+                task.cancel()
+            raise
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return not pending
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(budget={self.budget})"
+
+
+class BreadthFirstPolicy(SearchPolicy):
+    """
+    Expands every leaf of the tree one layer at a time up to n_extend_layers (the original UoT behaviour).
+    A layer is only started when the whole layer fits the remaining budget.
+    """
+    name = "breadth_first"
+
+    async def extend(self, uot) -> Dict[str, Any]:
+        spend = _Spend(self.budget)
+        stopped_by = "exhausted"
+        current_depth = uot.root.current_extended_depth + 1
+        while current_depth < uot.n_extend_layers:
+            if uot.extension_stop_flag.is_set():
+                stopped_by = "stopped"
+                break
+            frontier = [node for _, node in expandable_leaves(uot.root)]
+            if not frontier:
+                break
+            costs = [self.expansion_cost(node) for node in frontier]
+            calls, tokens = sum(cost[0] for cost in costs), sum(cost[1] for cost in costs)
+            if not spend.fits(calls, tokens):
+                stopped_by = "budget"
+                break
+
+            uot.debug_print(f"Extending layer {current_depth} in background ({len(frontier)} leaves)")
+            task = asyncio.create_task(uot.extend_single_layer(uot.root, current_depth))
+            finished = await self._run_until([task], spend.remaining_seconds())
+            spend.add(calls, tokens, len(frontier))
+            if not finished:
+                stopped_by = "deadline"
+                break
+
+            uot.update_best_question()
+            current_depth += 1
+        return spend.report(self.name, stopped_by)
+
+
+class BestFirstPolicy(SearchPolicy):
+    """
+    Expands the most promising leaf first, anywhere in the tree, until the budget runs out.
+
+    The priority of a leaf is its reward (information gain) weighted by the probability of the
+    answers leading to it from the root, so likely branches are explored deeper and unlikely ones
+    are left alone. Up to `parallelism` leaves are expanded concurrently per round; rewards and
+    the best question are refreshed after every round. n_extend_layers still caps the depth.
+    """
+    name = "best_first"
+
+    def __init__(self, budget: Optional[SearchBudget] = None, parallelism: int = 4):
+        super().__init__(budget)
+        self.parallelism = max(1, parallelism)
+
+    async def extend(self, uot) -> Dict[str, Any]:
+        spend = _Spend(self.budget)
+        stopped_by = "exhausted"
+        while True:
+            if uot.extension_stop_flag.is_set():
+                stopped_by = "stopped"
+                break
+            frontier = expandable_leaves(uot.root)
+            if not frontier:
+                break
+            queue = [(-weight * node.reward, -weight, i, node) for i, (weight, node) in enumerate(frontier)]
+            heapq.heapify(queue)
+
+            selected = []
+            while queue and len(selected) < self.parallelism:
+                node = heapq.heappop(queue)[3]
+                calls, tokens = self.expansion_cost(node)
+                if spend.fits(calls, tokens):
+                    spend.add(calls, tokens)
+                    selected.append(node)
+            if not selected:
+                stopped_by = "budget"
+                break
+
+            tasks = [asyncio.create_task(self._expand(uot, node)) for node in selected]
+            finished = await self._run_until(tasks, spend.remaining_seconds())
+            uot.update_best_question()
+            if not finished:
+                stopped_by = "deadline"
+                break
+            if not any(node.children for node in selected):
+                # どのノードも展開できなかった (LLM のエラーなど) ので同じノードを繰り返さない
+                stopped_by = "failed"
+                break
+        return spend.report(self.name, stopped_by)
+
+    @staticmethod
+    async def _expand(uot, node: UoTNode) -> None:
+        await node.generate_children(should_stop=uot.extension_stop_flag.is_set)
+        async with uot.lock:
+            await node.calculate_rewards()
+            node.prune_children()
+        # 祖先が何層先まで展開済みかを更新する
+        depth, ancestor = 1, node
+        while ancestor is not None and node.children:
+            ancestor.current_extended_depth = max(ancestor.current_extended_depth, depth)
+            depth, ancestor = depth + 1, ancestor.parent
+
+
+def expandable_leaves(root: UoTNode) -> List[Tuple[float, UoTNode]]:
+    """Non terminal leaves under root with the probability of reaching them from root."""
+    leaves = []
+    stack = [(1.0, root)]
+    while stack:
+        weight, node = stack.pop()
+        if node.children:
+            stack.extend((weight * (child.p_reply or 0.0), child) for child in node.children)
+        elif not node.is_terminal:
+            leaves.append((weight, node))
+    return leaves
+
+
+SEARCH_POLICIES = {
+    BreadthFirstPolicy.name: BreadthFirstPolicy,
+    BestFirstPolicy.name: BestFirstPolicy,
+}
+
+
+def get_search_policy(name: Optional[str] = None, budget: Optional[SearchBudget] = None) -> SearchPolicy:
+    """
+    Builds the search policy of a deployment (UOT_SEARCH_POLICY, default breadth_first) with
+    the budget from UOT_SEARCH_MAX_CALLS / UOT_SEARCH_MAX_TOKENS / UOT_SEARCH_MAX_SECONDS.
+
+    Raises:
+        ValueError: If the policy name is unknown.
+    """
+    name = name or os.getenv("UOT_SEARCH_POLICY", BreadthFirstPolicy.name)
+    if name not in SEARCH_POLICIES:
+        raise ValueError(f"Unknown UoT search policy: {name} (expected one of {', '.join(SEARCH_POLICIES)})")
+    return SEARCH_POLICIES[name](budget or SearchBudget.from_env())
@@ -0,0 +1,175 @@
+import asyncio
+import traceback
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from planning_modules.lending_ear_modules.uot_modules.chat_utils import generate_questions_and_estimate_probability, estimate_llm_calls
+from planning_modules.lending_ear_modules.uot_modules.uot_node import UoTNode
+
+
+class SpeculativeBranch:
+    """Speculative expansions scheduled under one answer (yes / no) of the question being asked."""
+
+    def __init__(self, node: UoTNode):
+        self.node = node
+        self.targets: List[UoTNode] = []
+        self.tasks: List[asyncio.Task] = []
+        self.cancelled = False
+        self.calls = 0
+
+    def cancel(self) -> int:
+        """Stops the branch. Waiting and in-flight expansions are cancelled (their LLM calls are abandoned)."""
+        self.cancelled = True
+        return sum(1 for task in self.tasks if task.cancel())
+
+
+class SpeculativeScheduler:
+    """
+    Expands the next layer under both answers of the question while it is being asked.
+
+    UoT only expands down to n_extend_layers, so the leaves under the yes / no children of the
+    current question are terminal until the answer elevates one of them. start() expands those
+    leaves ahead of time as tasks on the running event loop, most probable first, as long as the
+    estimated number of LLM calls stays within budget_calls. resolve() is called with the branch(es)
+    the answer selected: the tasks of the other branch are cancelled and the kept ones keep running.
+
+    Children are attached under lock (UoT.lock), which UoT.answer holds while it rewires the tree.
+    """
+
+    def __init__(self, budget_calls: int = 0, lock: Optional[asyncio.Lock] = None, is_debug: bool = False):
+        self.budget_calls = budget_calls
+        self.is_debug = is_debug
+        self.lock = lock or asyncio.Lock()
+        self._branches: List[SpeculativeBranch] = []
+        self.stats = {"rounds": 0, "scheduled": 0, "expanded": 0, "cancelled": 0, "discarded": 0, "errors": 0, "calls": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_calls > 0
+
+    def debug_print(self, message: str) -> None:
+        if self.is_debug:
+            print(f"[DEBUG] SpeculativeScheduler: {message}")
+
+    # ------------------------------------------------------------------
+    # 計画
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _frontier(branch: UoTNode) -> List[Tuple[float, UoTNode]]:
+        """
+        Leaves under branch that are terminal only because of their depth, i.e. the nodes the
+        regular extension would expand right after branch becomes the new root.
+        """
+        frontier = []
+        stack = [(1.0, branch)]
+        while stack:
+            weight, node = stack.pop()
+            if node.children:
+                stack.extend((weight * (child.p_reply or 0.0), child) for child in node.children)
+            elif node is not branch and node.is_terminal and len(node.belief) > 2 and node.depth - 1 < node.n_extend_layers - 1:
+                frontier.append((weight, node))
+        return frontier
+
+    def plan(self, root: UoTNode, question: Optional[str]) -> List[SpeculativeBranch]:
+        """Picks the expansions to run for question, most probable first, within the call budget."""
+        if not question:
+            return []
+        branches = [SpeculativeBranch(node) for node in root.get_yes_no_nodes(question) if node is not None]
+        candidates = [
+            ((branch.node.p_reply or 0.0) * weight, i, branch, node)
+            for branch in branches
+            for i, (weight, node) in enumerate(self._frontier(branch.node))
+        ]
+        candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+
+        remaining = self.budget_calls
+        for _, _, branch, node in candidates:
+            calls = estimate_llm_calls(len(node.belief), node.n_question_candidates, node.max_item_size_at_once, node.estimation_policy)
+            if calls == 0 or calls > remaining:
+                continue
+            remaining -= calls
+            branch.targets.append(node)
+            branch.calls += calls
+        return [branch for branch in branches if branch.targets]
+
+    # ------------------------------------------------------------------
+    # 実行
+    # ------------------------------------------------------------------
+    def start(self, root: UoTNode, question: Optional[str]) -> int:
+        """
+        Schedules the speculative expansions for question (cancelling the previous round).
+        Must be called from the event loop the tree is used on.
+
+        Returns:
+            int: Number of scheduled expansions.
+        """
+        self.cancel_all()
+        if not self.enabled:
+            return 0
+        branches = self.plan(root, question)
+        for branch in branches:
+            for node in branch.targets:
+                branch.tasks.append(asyncio.create_task(self._expand(branch, node)))
+            self.stats["calls"] += branch.calls
+        self._branches = branches
+        self.stats["rounds"] += 1
+        scheduled = sum(len(branch.targets) for branch in branches)
+        self.stats["scheduled"] += scheduled
+        self.debug_print(f"Scheduled {scheduled} expansions for '{question}' ({sum(branch.calls for branch in branches)} calls)")
+        return scheduled
+
+    async def _expand(self, branch: SpeculativeBranch, node: UoTNode) -> bool:
+        if branch.cancelled:
+            return False
+        try:
+            results = await generate_questions_and_estimate_probability(
+                node.items,
+                node.n_question_candidates,
+                node.history,
+                [node.get_grobal_context()] if node.get_grobal_context else None,
+                max_item_size_at_once=node.max_item_size_at_once,
+                top_5_items=node.get_top_5_items(),
+                estimation_policy=node.estimation_policy
+            )
+        except Exception as e:
+            print(f"[SpeculativeScheduler] Error expanding '{node.question}': {e}")
+            traceback.print_exc()
+            self.stats["errors"] += 1
+            return False
+
+        async with self.lock:
+            # 回答で選ばれなかった枝か、通常の展開が先に子ノードを作った場合は捨てる
+            if branch.cancelled or node.children or not results:
+                self.stats["discarded"] += 1
+                return False
+            node.adopt_results(results, "speculate")
+            await node.calculate_rewards()
+            node.prune_children()
+            self.stats["expanded"] += 1
+        self.debug_print(f"Expanded '{node.question}' ({len(node.children)} children)")
+        return True
+
+    def resolve(self, keep: Iterable[Optional[UoTNode]]) -> List[asyncio.Task]:
+        """
+        Called when the answer arrives: cancels the branches that were not selected.
+
+        Args:
+            keep (Iterable[Optional[UoTNode]]): Branch nodes selected by the answer (both for an undecided answer).
+
+        Returns:
+            List[asyncio.Task]: Tasks of the kept expansions still running.
+        """
+        keep_ids = {id(node) for node in keep if node is not None}
+        running = []
+        for branch in self._branches:
+            if id(branch.node) in keep_ids:
+                running.extend(task for task in branch.tasks if not task.done())
+            else:
+                self.stats["cancelled"] += branch.cancel()
+        self._branches = []
+        return running
+
+    def cancel_all(self) -> None:
+        self.resolve([])
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats)
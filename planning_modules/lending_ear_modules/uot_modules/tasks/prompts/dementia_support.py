@@ -45,6 +45,37 @@ In another case, A is not related to Q directly, but you are able to imagine ite
 you can expand this explae to "no" also!!!
 """
 
+evaluate_probabilities_of_batch_prompt = '''
+You need to evaluate probabilities of a yes option of the following incidents for EACH of the following questions based on the user's experience.
+
+Here are the incidents (number: name):
+{item_name_list}
+
+Here are the questions to address (number: question):
+{question_list}
+
+Follow these output format instructions:
+{format_instructions}
+
+Here is the Q&A history for context:
+{history}
+
+For each question and each incident, evaluate how likely it is that you can respond yes, taking into account the history of the case so far. Rate on a scale of 0~1, paying particular attention to the degree of discrepancy or agreement between the dimensions of the abstract phenomenon:
+- 0.8 ~ 1.0 <- Definitely yes (direct relationship)
+- 0.6 ~ 0.8 <- Approximately yes (slightly different layers, but generally correct)
+- 0.4 ~ 0.6 <- Difficult to determine because the layers are different, could be either, question is incomprehensible and unanswerable (0.5), difficult to understand, out of context, rude, etc.
+- 0.2 ~ 0.4 <- Approximately no (slightly different layers, but generally wrong)
+- 0.0 ~ 0.2 <- definitely no (direct relationship)
+
+Keep your intuition about how you would like to answer that question when you are in an ITEM situation! (especially yes)
+Do not write thoughts. Only output the numbers (question_number, item_number) and y_prob.
+
+Caution:
+You must evaluate all items under all questions. The result is a matrix of questions x items, so the number of results is the number of questions and each result has every item. NERVER MISTAKE. Be careful not to miss any item.
+you cannot write except json content even if just one word.
+SO, THE FIRST WORD OF THE OUTPUT YOU GENERATE MUST BE left curly bracket, MUST BE left curly bracket, MUST BE left curly bracket.
+'''
+
 generate_questions_prompt = """
 Your Task:
 You need generate a list of {n} closed questions to devide the items into each 'yes', 'no', and 'irrelevant' equally, with 'both' and 'difficult' being as close to zero as possible. 
@@ -337,3 +368,29 @@ Q_suggested : Are you feeling tired right now?
 Q_real : Is it okay if I ask a question?
 → is_question_explained is False because Q_real does not reflect the original question about feeling tired and instead shifts focus to asking permission for a question.
 """
+
+
+
+summarize_conversation_prompt = """
+Your Task:
+You are maintaining a running summary of a conversation between a person with dementia (user) and an AI assistant (assistant).
+Older turns have been removed from the conversation window. Update the summary so that it also covers the removed turns.
+You have to include summary : str in your output with json format.
+
+Here is the current summary (may be empty):
+{summary}
+
+Here are the removed turns (oldest first):
+{turns}
+
+Rules:
+- Keep facts that help to understand the user's situation: what the user is doing or trying to do, troubles, mood, places, times, objects and answers to questions.
+- Drop greetings, fillers and repeated content.
+- Write the summary in Japanese, within {max_characters} characters.
+
+Follow these output format instructions (100%, only json output):
+{format_instructions}
+
+Caution:
+You cannot output anything except json format, even if just one word!!! You cannot write except json content even if just one word.
+"""
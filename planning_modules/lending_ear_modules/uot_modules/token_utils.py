@@ -0,0 +1,31 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """Loads the tiktoken encoding once. Returns None when tiktoken is unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Warning: tiktoken is not available, falling back to approximate token counts: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text with the cl100k_base encoding.
+
+    Args:
+        text (str): Text to count.
+
+    Returns:
+        int: Number of tokens (approximated by characters when tiktoken is unavailable).
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        # Japanese text is roughly one token per character, English roughly four characters per token
+        return max(1, len(text) // 2)
+    return len(encoding.encode(text, disallowed_special=()))
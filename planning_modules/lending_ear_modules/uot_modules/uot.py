@@ -5,6 +5,10 @@ import re
 
 from planning_modules.lending_ear_modules.uot_modules.item import Item
 from planning_modules.lending_ear_modules.uot_modules.uot_node import UoTNode
+from planning_modules.lending_ear_modules.uot_modules.chat_utils import EstimationPackingPolicy
+from planning_modules.lending_ear_modules.uot_modules.uot_snapshot import dump_uot, load_uot
+from planning_modules.lending_ear_modules.uot_modules.speculation import SpeculativeScheduler
+from planning_modules.lending_ear_modules.uot_modules.search_policy import SearchPolicy, BreadthFirstPolicy
 
 def blocking_input(prompt: str) -> str:
     return input(prompt)
@@ -27,8 +31,10 @@ async def get_user_input() -> Tuple[str, float]:
 class UoT:
     def __init__(self, initial_items: List[Item], n_extend_layers: int,
                  n_question_candidates: int, n_max_pruning: int, lambda_: float,
-                 is_debug: bool = False, unknown_reward_prob_ratio: float = 0.1, get_grobal_context: Optional[Callable] = None):
-        self.root = UoTNode("root", initial_items, is_debug=is_debug, get_grobal_context=get_grobal_context)
+                 is_debug: bool = False, unknown_reward_prob_ratio: float = 0.1, get_grobal_context: Optional[Callable] = None,
+                 estimation_policy: Optional[EstimationPackingPolicy] = None, speculation_budget: int = 0,
+                 search_policy: Optional[SearchPolicy] = None):
+        self.root = UoTNode("root", initial_items, is_debug=is_debug, get_grobal_context=get_grobal_context, estimation_policy=estimation_policy)
         self.n_extend_layers = n_extend_layers
         self.n_question_candidates = n_question_candidates
         self.n_max_pruning = n_max_pruning
@@ -38,8 +44,13 @@ class UoT:
         self.lock = asyncio.Lock()
         self.unknown_reward_prob_ratio = unknown_reward_prob_ratio
         self.best_question = None
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
         self.extension_task = None
+        # 質問中に yes / no 両方の枝の次の層を先に展開する (speculation_budget は 1 質問あたりの LLM 呼び出し数、0 で無効)
+        self.speculation = SpeculativeScheduler(speculation_budget, lock=self.lock, is_debug=is_debug)
+        self._speculation_tasks = []
+        # 最初の層より先をどう展開するか (既定は n_extend_layers までの幅優先)
+        self.search_policy = search_policy or BreadthFirstPolicy()
+        self.search_report = None  # 直近の展開で使ったポリシーと消費量
 
         self.root.configure_node(
             n_extend_layers=n_extend_layers,
@@ -65,13 +76,20 @@ class UoT:
             self.debug_print("Background extension task created")
 
     async def extend_single_layer(self, node: UoTNode, depth: int) -> None:
+        """
+        Expands every leaf (the frontier) under node. Sibling subtrees are expanded concurrently on
+        this event loop; the number of LLM calls in flight is bounded by llm_concurrency.
+        """
         self.debug_print(f"Extending layer at depth {depth}")
         if node.is_terminal or depth > self.n_extend_layers:
             self.debug_print(f"Reached terminal node or max depth at {depth}")
             return
+        if self.extension_stop_flag.is_set():
+            self.debug_print(f"Extension stopped at depth {depth}")
+            return
 
         if not node.children:
-            await node.generate_children()
+            await node.generate_children(should_stop=self.extension_stop_flag.is_set)
             self.debug_print(f"Generated children for node at depth {depth}")
         else:
             extension_tasks = [self.extend_single_layer(child, depth+1) for child in node.children]
@@ -84,25 +102,32 @@ class UoT:
 
     async def _background_extend(self) -> None:
         self.debug_print("Starting background extension")
-        loop = asyncio.get_running_loop()
         try:
-            await loop.run_in_executor(self.executor, self._extend_in_thread)
+            # 選ばれた枝の先読みが終わるまで待つ (同じノードを二重に展開しない)
+            tasks, self._speculation_tasks = self._speculation_tasks, []
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            await self._extend_layers()
+        except asyncio.CancelledError:
+            self.debug_print("Background extension cancelled")
         except Exception as e:
             self.debug_print(f"Background extension error: {e}")
         finally:
-            self.extension_task = None
+            if self.extension_task is asyncio.current_task():
+                self.extension_task = None
             self.debug_print("Background extension complete")
 
-    def _extend_in_thread(self) -> None:
-        current_depth = self.root.current_extended_depth + 1
-        while current_depth < self.n_extend_layers and not self.extension_stop_flag.is_set():
-            self.debug_print(f"Extending layer {current_depth} in background")
-            asyncio.run(self.extend_single_layer(self.root, current_depth))
-            new_best_question = self.root.get_best_question()
-            if new_best_question != self.best_question:
-                self.debug_print(f"Updating best question: {new_best_question}")
-                self.best_question = new_best_question
-            current_depth += 1
+    async def _extend_layers(self) -> None:
+        self.search_report = await self.search_policy.extend(self)
+        self.debug_print(f"Search report: {self.search_report}")
+
+    def update_best_question(self) -> None:
+        """Refreshes the rewards and picks the best question of the tree as it is now (anytime)."""
+        self.root.refresh_rewards()
+        new_best_question = self.root.get_best_question()
+        if new_best_question != self.best_question:
+            self.debug_print(f"Updating best question: {new_best_question}")
+            self.best_question = new_best_question
 
     async def get_question(self) -> Optional[str]:
         if not self.root.children:
@@ -110,11 +135,25 @@ class UoT:
             await self.extend()
         return self.best_question
 
+    def speculate(self, question: Optional[str] = None) -> int:
+        """
+        Starts expanding the next layer under both answers of question (defaults to the best question)
+        while it is being asked. Returns the number of scheduled expansions.
+        """
+        if not self.speculation.enabled or not self.root.children:
+            return 0
+        return self.speculation.start(self.root, question or self.best_question)
+
     def stop_extension(self) -> None:
+        """
+        Stops the background extension: in-flight expansions see extension_stop_flag and drop their
+        results, and the task is cancelled so that pending LLM calls are abandoned.
+        """
         self.debug_print("Stopping extension")
         self.extension_stop_flag.set()
         if self.extension_task:
             self.extension_task.cancel()
+            self.extension_task = None
 
 
     async def answer(self, p_prime_y: float) -> None:
@@ -126,6 +165,9 @@ class UoT:
             best_question = self.root.get_best_question()
             yes_node, no_node = self.root.get_yes_no_nodes(best_question)
 
+            # 選ばれなかった枝の先読みは止め、選ばれた枝の先読みは続ける
+            self._speculation_tasks = self.speculation.resolve([yes_node, no_node] if p_prime_y == 0.5 else [yes_node if p_prime_y > 0.5 else no_node])
+
             if p_prime_y == 0.5:
                 self.root = await self.root.handle_equal_probability(yes_node, no_node, p_prime_y)
             else:
@@ -144,30 +186,28 @@ class UoT:
         await self.extend()
 
     def _reward_unknown_prob(self):
-        unknown_item = next((item for item in self.root.items if item.get_name() == "不明(その他)"), None)
-        if unknown_item:
-            max_prob = max(item.p_s for item in self.root.items)
-            unknown_item.p_s += max_prob * self.unknown_reward_prob_ratio
+        belief = self.root.belief
+        unknown_p_s = belief.probability_of("不明(その他)")
+        if unknown_p_s is not None:
+            max_prob = float(belief.probs.max())
+            belief = belief.with_probability_of("不明(その他)", unknown_p_s + max_prob * self.unknown_reward_prob_ratio)
         else:
-            unknown_item = Item("不明(その他)", "その他のアイテム", 1/(len(self.root.items)+1))
-            self.root.items.append(unknown_item)
+            belief = belief.with_item("不明(その他)", "その他のアイテム", 1/(len(belief)+1))
         
         # 正規化を確実に行う
-        total_prob = sum(item.p_s for item in self.root.items)
-        for item in self.root.items:
-            item.p_s /= total_prob
+        self.root.belief = belief.normalized()
         
         # 正規化後の確認
-        self.debug_print("Probabilities after normalization:")
-        for item in self.root.items:
-            self.debug_print(f"{item.get_name()}: {item.p_s:.4f}")
-        
-        # 合計が1になることを確認
-        total_after = sum(item.p_s for item in self.root.items)
-        self.debug_print(f"Total probability after normalization: {total_after:.4f}")
+        if self.is_debug:
+            self.debug_print("Probabilities after normalization:")
+            for name, p_s in self.root.belief.as_pairs():
+                self.debug_print(f"{name}: {p_s:.4f}")
+            
+            # 合計が1になることを確認
+            self.debug_print(f"Total probability after normalization: {self.root.belief.probs.sum():.4f}")
 
     async def get_current_probabilities(self) -> List[Tuple[str, float]]:
-        return [(item.get_name(), item.p_s) for item in self.root.items]
+        return self.root.belief.as_pairs()
 
     async def run(self) -> None:
         while True:
@@ -196,7 +236,7 @@ class UoT:
         self.debug_print(f"{indent}  Is Terminal: {node.is_terminal}")
         self.debug_print(f"{indent}  Reward: {node.reward:.4f}")
         self.debug_print(f"{indent}  Information Gain: {node.information_gain:.4f}")
-        self.debug_print(f"{indent}  Number of Items: {len(node.items)}")
+        self.debug_print(f"{indent}  Number of Items: {len(node.belief)}")
         self.debug_print(f"{indent}  Number of Children: {len(node.children)}")
         self.debug_print(f"{indent}  API Stats:")
         for line in node.get_api_stats().split('\n'):
@@ -245,9 +285,25 @@ class UoT:
             lambda_=data['lambda'],
             is_debug=True
         )
-        uot.root = UoTNode.create_from_data(data['root'])
+        uot.root = UoTNode.create_from_data(data['root'], is_debug=True)
+        nodes = [uot.root]
+        while nodes:
+            node = nodes.pop()
+            node.configure_node(uot.n_extend_layers, True, 'avg', uot.n_max_pruning, uot.lambda_, uot.n_question_candidates)
+            nodes.extend(node.children)
         return uot
 
+    def to_snapshot(self) -> bytes:
+        """Compact binary snapshot of the whole tree (see uot_snapshot)"""
+        return dump_uot(self)
+
+    @classmethod
+    def from_snapshot(cls, data: bytes, get_grobal_context: Optional[Callable] = None,
+                      estimation_policy: Optional[EstimationPackingPolicy] = None, is_debug: bool = False,
+                      speculation_budget: int = 0, search_policy: Optional[SearchPolicy] = None) -> 'UoT':
+        return load_uot(data, get_grobal_context=get_grobal_context, estimation_policy=estimation_policy, is_debug=is_debug,
+                        speculation_budget=speculation_budget, search_policy=search_policy)
+
     def print_detail_of_tree_DFS(self) -> None:
         def _dfs_print(node: UoTNode, depth: int = 0, yes_no: str = "") -> None:
             indent = "  " * depth
@@ -286,7 +342,7 @@ class UoT:
 
     async def __aexit__(self, exc_type, exc_value, traceback):
         self.stop_extension()
-        self.executor.shutdown(wait=True)
+        self.speculation.cancel_all()
 
     def debug_print(self, message: str) -> None:
         if self.is_debug:
@@ -1,33 +1,76 @@
-from typing import Callable
+import asyncio
+import os
+import traceback
+from typing import Callable, Optional
 
 
 from planning_modules.lending_ear_modules.uot_modules.item import Item
 from planning_modules.lending_ear_modules.uot_modules.uot import UoT
-from planning_modules.lending_ear_modules.uot_modules.chat_utils import check_is_question_explained, check_is_answered_to_question
+from planning_modules.lending_ear_modules.uot_modules.uot_snapshot import SnapshotError
+from planning_modules.lending_ear_modules.uot_modules.llm_concurrency import set_session_concurrency
+from planning_modules.lending_ear_modules.uot_modules.search_policy import get_search_policy
+from planning_modules.lending_ear_modules.uot_modules.chat_utils import check_is_question_explained, check_is_answered_to_question, EstimationPackingPolicy, summarize_conversation
+from planning_modules.conversation_window import ConversationWindow
 from neo4j_modules.care_kg_db import CareKgDB
 
 class UoTController:
-    def __init__(self, kg_db : CareKgDB, threshold : float = 0.7, is_debug : bool = False):
+    def __init__(self, kg_db : CareKgDB, threshold : float = 0.7, is_debug : bool = False, contexts : Optional[ConversationWindow] = None):
         self.kg = kg_db
-        self.contexts = []
+        # 質問生成のプロンプトに毎回入るので、トークン数で上限を決めたウィンドウで持つ
+        # BackEndProcess の会話履歴を渡された場合はそれを共有する (同じ発話を二重に持たず、二重に要約しない)
+        self.shares_contexts = contexts is not None
+        self.contexts = contexts if contexts is not None else ConversationWindow.from_env(summarizer=summarize_conversation)
         self.is_on = False
         self.threshold = threshold
         self.state = None
         self.is_asked_question = False
         self.responses_buffer = []
         self.is_debug = is_debug
+        self.initial_beliefs = None  # 引き継いだ信念 (item name -> p_s)
+        self.resume_snapshot = None  # 引き継いだ UoT の木のスナップショット (uot_snapshot)
+        self.snapshot_saver = None  # (bytes) -> None。answer() のたびに木を保存する
+        # 質問中に両方の回答の先を展開する LLM 呼び出し数の上限 (1 質問あたり、0 で無効)
+        self.speculation_budget = int(os.getenv("UOT_SPECULATION_BUDGET", 12))
+        # 展開ポリシーと 1 質問あたりの予算 (UOT_SEARCH_POLICY / UOT_SEARCH_MAX_CALLS / UOT_SEARCH_MAX_TOKENS / UOT_SEARCH_MAX_SECONDS)
+        self.search_policy = get_search_policy()
+        # wait_answer の間は回答 (__deal_user_response) か停止 (set_mode(False)) までここで待つ
+        self.loop = None
+        self.state_changed = None
 
     def set_callbacks(self, callback : Callable, direct_prompting_func : Callable):
         self.callback = callback
         self.direct_prompting_func = direct_prompting_func
 
+    def set_snapshot_saver(self, saver : Optional[Callable[[bytes], None]]):
+        self.snapshot_saver = saver
+
+    def set_resume_snapshot(self, snapshot : Optional[bytes]):
+        """前回のセッションで展開済みの木から再開する (initial_beliefs より優先)"""
+        self.resume_snapshot = snapshot
+
     def initialize_uot(self):
+        self.state = UoTControllerState()
+
+        if self.resume_snapshot:
+            snapshot, self.resume_snapshot = self.resume_snapshot, None
+            try:
+                self.uot = UoT.from_snapshot(
+                    snapshot,
+                    get_grobal_context=self.get_grobal_context_as_str,
+                    estimation_policy=EstimationPackingPolicy(),
+                    is_debug=self.is_debug,
+                    speculation_budget=self.speculation_budget,
+                    search_policy=self.search_policy
+                )
+                self.debug_print(f"<Initialize UoT> resumed from snapshot ({len(snapshot)} bytes)")
+                return
+            except SnapshotError as e:
+                print(f"<Initialize UoT> could not resume from snapshot: {e}")
+
         kg_nodes = self.kg.get_uot_nodes()
         items = [Item(x['name'], x['description'], 1/len(kg_nodes)) for x in kg_nodes]
         localized_items = self.__localize_probs_with_context(items)
 
-        self.state = UoTControllerState()
-
         self.uot = UoT(
             initial_items=localized_items,
             n_extend_layers=3,
@@ -36,29 +79,71 @@ class UoTController:
             lambda_=20,
             is_debug=self.is_debug,
             unknown_reward_prob_ratio=0.3,
-            get_grobal_context=self.get_grobal_context_as_str
+            get_grobal_context=self.get_grobal_context_as_str,
+            estimation_policy=EstimationPackingPolicy(),
+            speculation_budget=self.speculation_budget,
+            search_policy=self.search_policy
         )
 
+    def persist_tree(self):
+        """木のスナップショットを snapshot_saver に渡す (保存に失敗しても対話は続ける)"""
+        if not self.snapshot_saver or getattr(self, 'uot', None) is None:
+            return
+        try:
+            self.snapshot_saver(self.uot.to_snapshot())
+        except Exception as e:
+            print(f"<Persist tree> failed: {e}")
+            traceback.print_exc()
+
     def get_grobal_context_as_str(self) -> str:
-        return "\n".join(self.contexts)
+        return self.contexts.as_str()
+
+    def set_initial_beliefs(self, beliefs : dict[str, float]):
+        """前回のセッション (別のワーカーなど) の UoT の信念から再開する"""
+        self.initial_beliefs = beliefs
 
     def __localize_probs_with_context(self, items : list[Item]) -> list[Item]:
         #TODO: implement this
         # getGrobalContexts
         # estimateProbabilities
         # formatItems
+        if self.initial_beliefs:
+            # 引き継いだ信念がある item はその確率を使い、全体を正規化する
+            for item in items:
+                if item.name in self.initial_beliefs:
+                    item.p_s = self.initial_beliefs[item.name]
+            total = sum(item.p_s for item in items)
+            if total > 0:
+                for item in items:
+                    item.p_s = item.p_s / total
         return items
 
     def set_contexts(self, contexts : list[str]):
-        self.contexts.extend(contexts)
+        # 共有しているウィンドウには既に入っている (要約の行を発話としてコピーしない)
+        if not self.shares_contexts:
+            self.contexts.extend(contexts)
 
     async def set_context(self, context : str):
-        self.contexts.append(context)
+        if not self.shares_contexts:
+            self.contexts.append(context)
         self.debug_print(f"<Set context> : {context}")
         await self.__deal_user_response(context)
 
     def set_mode(self, mode : bool):
         self.is_on = mode
+        if not mode:
+            self.__notify_state_changed()
+
+    def __notify_state_changed(self):
+        """run() のループを起こす (LendingEarController.stop など別スレッドから呼ばれてもよい)"""
+        loop, event = self.loop, self.state_changed
+        if loop is None or event is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # ループが閉じられた直後
+            pass
 
     def get_mode(self):
         return self.is_on
@@ -101,6 +186,7 @@ class UoTController:
                 # Go to next state
                 self.observed_prob_of_yes = observed_prob_of_yes
                 self.state.next()
+                self.state_changed.set()
                 self.debug_print(f"<Deal user response> : Go to next state")
 
                 self.is_asked_question = False
@@ -120,16 +206,24 @@ class UoTController:
         self.is_on = True
         self.debug_print("<Run> called")
 
+        # このセッション (run と、そこから作られる展開・先読みのタスク) の LLM 同時呼び出し数の上限
+        set_session_concurrency()
+        self.loop = asyncio.get_running_loop()
+        self.state_changed = asyncio.Event()
+
         # Initialize UoT nodes
         self.initialize_uot()
         self.debug_print("<Run> initialized UoT")
 
         # Run main loop
         while self.is_on:
-            if self.uot.root.current_extended_depth == 0:
+            # 最初の層を展開してから質問を始める。スナップショットから再開した場合 (idle だが展開済み) も extend() を通るが、
+            # 最初の層は作り直さず、バックグラウンドの展開を始めるだけ
+            if self.uot.root.current_extended_depth == 0 or self.state.state == "idle":
                 self.debug_print("<Extending first layer>")
                 await self.uot.extend()
                 self.debug_print("<Extended first layer>")
+                self.persist_tree()
 
                 self.state.next()
             
@@ -145,15 +239,26 @@ class UoTController:
                 self.direct_prompting_func(question)
 
                 self.debug_print(f"<Sent question> : question : {question}")
+                if self.uot.search_report:
+                    self.debug_print(f"<Search> : {self.uot.search_report}")
+
+                # 回答を待つ間に yes / no 両方の先の層を展開しておく
+                scheduled = self.uot.speculate(question)
+                self.debug_print(f"<Speculating> : {scheduled} expansions")
 
                 # Update state
                 self.state.next()
-            #elif self.state.state == "wait_answer":
-                # pass
+            elif self.state.state == "wait_answer":
+                # 回答が来るまでイベントループを空ける (set_message や展開・先読みのタスクはこの間に進む)
+                self.debug_print("<Waiting answer>")
+                await self.state_changed.wait()
+                self.state_changed.clear()
+                continue
             elif self.state.state == "evaluate_answer":
                 self.debug_print("<Evaluating answer>")
                 # Tree update
                 await self.uot.answer(self.observed_prob_of_yes)
+                self.persist_tree()
 
                 self.__check_if_done(self.uot.root.get_best_prob_item())
 
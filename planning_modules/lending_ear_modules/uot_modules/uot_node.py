@@ -5,8 +5,9 @@ import traceback
 
 from typing import List, Dict, Tuple, Optional, Union, Callable
 
-from planning_modules.lending_ear_modules.uot_modules.chat_utils import generate_questions_and_estimate_probability
+from planning_modules.lending_ear_modules.uot_modules.chat_utils import generate_questions_and_estimate_probability, EstimationPackingPolicy
 from planning_modules.lending_ear_modules.uot_modules.item import Item
+from planning_modules.lending_ear_modules.uot_modules.belief_state import BeliefState
 
 
 class UoTNode:
@@ -16,19 +17,24 @@ class UoTNode:
         "update_probabilities": {"attempts": 0, "successes": 0, "total_time": 0},
         "custom_bayesian_update": {"attempts": 0, "successes": 0, "total_time": 0}
     }
+    # 報酬の差分再計算の統計 (recomputed: 子の報酬を計算し直したノード数, reused: 再計算を省いた部分木の数)
+    reward_stats = {"recomputed": 0, "reused": 0, "invalidations": 0}
 
-    def __init__(self, question: str, items: List[Item], parent: Optional['UoTNode'] = None, 
+    def __init__(self, question: str, items: Union[List[Item], BeliefState], parent: Optional['UoTNode'] = None, 
              reply: Optional[bool] = None, p_reply: Optional[float] = None, 
              history: Optional[List[Dict[str, Union[str, bool, float]]]] = None,
              is_debug: bool = False, is_terminal: bool = False, max_item_size_at_once: int = 3,
-             generated_info: Optional[List[Dict]] = None, get_grobal_context: Optional[Callable] = None):
+             generated_info: Optional[List[Dict]] = None, get_grobal_context: Optional[Callable] = None,
+             estimation_policy: Optional[EstimationPackingPolicy] = None):
+        # 新しいノードは報酬が未計算 (dirty)。belief / children の変更で自分と祖先が dirty になる
+        self._rewards_dirty = True
         self.question = question
-        self.items = items
         self.parent = parent
+        self._belief = items if isinstance(items, BeliefState) else BeliefState.from_items(items)
         self.reply = reply
         self.p_reply = p_reply
         self.history = history.copy() if history else []
-        self.children = []
+        self._children = []
         self.generated_info = generated_info
         self.depth = self.parent.depth + 1 if self.parent else 0
         self.n_extend_layers = -1
@@ -45,11 +51,44 @@ class UoTNode:
         self.current_extended_depth = 0
         self.max_item_size_at_once = max_item_size_at_once
         self.get_grobal_context = get_grobal_context
+        self.estimation_policy = estimation_policy
 
         if question != "root":
             self.history.append({"q": question, "a": reply, "p": p_reply})
+        if parent is not None:
+            parent.invalidate_rewards()
+
+        self.debug_print("__init__", f"Creating new node: question={self.question}, items={len(self.belief)}, depth={self.depth}, is_terminal={self.is_terminal}")
 
-        self.debug_print("__init__", f"Creating new node: question={self.question}, items={len(self.items)}, depth={self.depth}, is_terminal={self.is_terminal}")
+    @property
+    def belief(self) -> BeliefState:
+        return self._belief
+
+    @belief.setter
+    def belief(self, belief: BeliefState) -> None:
+        self._belief = belief
+        self.invalidate_rewards()
+
+    @property
+    def children(self) -> List['UoTNode']:
+        return self._children
+
+    @children.setter
+    def children(self, children: List['UoTNode']) -> None:
+        self._children = children
+        self.invalidate_rewards()
+
+    @property
+    def items(self) -> List[Item]:
+        """
+        Item view of the belief state. Materializes new Item objects on every access,
+        so use self.belief for any computation and keep this for API boundaries.
+        """
+        return self.belief.to_items()
+
+    @items.setter
+    def items(self, items: List[Item]) -> None:
+        self.belief = BeliefState.from_items(items)
 
     def debug_print(self, method: str, message: str) -> None:
         if self.is_debug:
@@ -62,6 +101,10 @@ class UoTNode:
             cls.api_stats[api_name]["successes"] += 1
         cls.api_stats[api_name]["total_time"] += duration
 
+    @classmethod
+    def get_reward_stats(cls) -> Dict[str, int]:
+        return dict(cls.reward_stats)
+
     @classmethod
     def get_api_stats(cls) -> str:
         stats = []
@@ -84,29 +127,70 @@ class UoTNode:
 
 
     
-    def _calculate_posterior_probabilities(self, item_probabilities: List[Dict], p_yes: float, p_no: float) -> Tuple[List[Item], List[Item], List[float], List[float]]:
+    def _calculate_posterior_probabilities(self, likelihood: np.ndarray, p_yes: float, p_no: float) -> Tuple[BeliefState, BeliefState, np.ndarray, np.ndarray]:
         self.debug_print("_calculate_posterior_probabilities", f"Calculating posterior probabilities: p_yes={p_yes}, p_no={p_no}")
 
-        omega_yes = []
-        omega_no = []
-        p_yes_given_items = []
-        p_no_given_items = []
-        for item_prob, item in zip(item_probabilities, self.items):
-            p_item = item.p_s
-            p_yes_given_item = item_prob["p_yes_given_item"]
-            p_no_given_item = 1 - p_yes_given_item
-            
-            p_item_given_yes = p_yes_given_item * p_item / p_yes if p_yes > 0 else 0
-            p_item_given_no = p_no_given_item * p_item / p_no if p_no > 0 else 0
-            
-            omega_yes.append(Item(item.get_name(), item.description, p_item_given_yes))
-            omega_no.append(Item(item.get_name(), item.description, p_item_given_no))
-            p_yes_given_items.append(p_yes_given_item)
-            p_no_given_items.append(p_no_given_item)
+        omega_yes, omega_no = self.belief.posterior(likelihood, p_yes, p_no)
 
         self.debug_print("_calculate_posterior_probabilities", f"Posterior probabilities calculated: omega_yes={len(omega_yes)}, omega_no={len(omega_no)}")
-        
-        return omega_yes, omega_no, p_yes_given_items, p_no_given_items
+
+        return omega_yes, omega_no, likelihood, 1 - likelihood
+
+    def _create_children_from_results(self, results: List[Dict], log_method: str) -> None:
+        """
+        Builds the yes/no child pairs for every generated question.
+        All children share this node's ItemIndex and only own a probability vector.
+        """
+        for question_data in results:
+            question = question_data["question"]
+            likelihood = self.belief.index.likelihoods(question_data["evaluated_items"])
+
+            p_yes = self.belief.p_yes(likelihood)
+            p_no = 1 - p_yes
+
+            omega_yes, omega_no, p_yes_given_items, p_no_given_items = self._calculate_posterior_probabilities(likelihood, p_yes, p_no)
+
+            information_gain = self._calculate_information_gain(omega_yes, omega_no, p_yes, p_no)
+
+            self.generated_info.append({
+                "question": question,
+                "p_yes": p_yes,
+                "p_no": p_no,
+                "p_yes_given_items": p_yes_given_items,
+                "p_no_given_items": p_no_given_items,
+                "omega_yes": omega_yes,
+                "omega_no": omega_no,
+                "information_gain": information_gain
+            })
+
+            is_terminal_yes = self.depth + 1 >= self.n_extend_layers - 1 or len(omega_yes) <= 2
+            is_terminal_no = self.depth + 1 >= self.n_extend_layers - 1 or len(omega_no) <= 2
+
+            yes_node = UoTNode(question, omega_yes, parent=self, reply=True, p_reply=p_yes, 
+                            history=self.history + [{"q": question, "a": True, "p": p_yes}], 
+                            is_debug=self.is_debug, is_terminal=is_terminal_yes, max_item_size_at_once=self.max_item_size_at_once,
+                            generated_info=self.generated_info, get_grobal_context=self.get_grobal_context,
+                            estimation_policy=self.estimation_policy)
+            no_node = UoTNode(question, omega_no, parent=self, reply=False, p_reply=p_no, 
+                            history=self.history + [{"q": question, "a": False, "p": p_no}], 
+                            is_debug=self.is_debug, is_terminal=is_terminal_no, max_item_size_at_once=self.max_item_size_at_once,
+                            generated_info=self.generated_info, get_grobal_context=self.get_grobal_context,
+                            estimation_policy=self.estimation_policy)
+
+            yes_node.configure_node(self.n_extend_layers, self.accumulation, self.expected_method, self.n_max_pruning, self.lambda_, self.n_question_candidates)
+            no_node.configure_node(self.n_extend_layers, self.accumulation, self.expected_method, self.n_max_pruning, self.lambda_, self.n_question_candidates)
+
+            self.children.extend([yes_node, no_node])
+
+            self.debug_print(log_method, f"Generated child nodes for question: {question}, p_yes={p_yes}, p_no={p_no}, information_gain={information_gain}")
+
+    def adopt_results(self, results: List[Dict], log_method: str) -> None:
+        """
+        Replaces the children with the ones built from generate_questions_and_estimate_probability results.
+        """
+        self.generated_info = []
+        self.children = []
+        self._create_children_from_results(results, log_method)
 
     async def extend_single_layer(self, root: 'UoTNode', depth: int) -> None:
         self.debug_print("extend_single_layer", f"Extending layer at depth {depth}")
@@ -120,8 +204,9 @@ class UoTNode:
                     self.n_question_candidates,
                     self.history,
                     [self.get_grobal_context()] if self.get_grobal_context else None,
-                    top_5_items=self._get_top_5_items(),
-                    use_fast_mode=use_fast_mode
+                    top_5_items=self.get_top_5_items(),
+                    use_fast_mode=use_fast_mode,
+                    estimation_policy=self.estimation_policy
                 )
             except Exception as e:
                 self.debug_print("extend_single_layer", f"API call failed: {str(e)}")
@@ -131,44 +216,7 @@ class UoTNode:
             if results:
                 self.generated_info = results
                 self.children = []
-                for question_data in results:
-                    question = question_data["question"]
-                    item_probabilities = question_data["evaluated_items"]
-
-                    p_yes = sum(item_prob["p_yes_given_item"] * item.p_s for item_prob, item in zip(item_probabilities, self.items))
-                    p_no = 1 - p_yes
-
-                    omega_yes, omega_no, p_yes_given_items, p_no_given_items = self._calculate_posterior_probabilities(item_probabilities, p_yes, p_no)
-
-                    information_gain = self._calculate_information_gain(omega_yes, omega_no, p_yes, p_no)
-
-                    self.generated_info.append({
-                        "question": question,
-                        "p_yes": p_yes,
-                        "p_no": p_no,
-                        "p_yes_given_items": p_yes_given_items,
-                        "p_no_given_items": p_no_given_items,
-                        "omega_yes": omega_yes,
-                        "omega_no": omega_no,
-                        "information_gain": information_gain
-                    })
-
-                    is_terminal_yes = self.depth + 1 >= self.n_extend_layers - 1 or len(omega_yes) <= 2
-                    is_terminal_no = self.depth + 1 >= self.n_extend_layers - 1 or len(omega_no) <= 2
-
-                    yes_node = UoTNode(question, omega_yes, parent=self, reply=True, p_reply=p_yes, 
-                                    history=self.history + [{"q": question, "a": True, "p": p_yes}], 
-                                    is_debug=self.is_debug, is_terminal=is_terminal_yes, generated_info=self.generated_info, get_grobal_context=self.get_grobal_context)
-                    no_node = UoTNode(question, omega_no, parent=self, reply=False, p_reply=p_no, 
-                                    history=self.history + [{"q": question, "a": False, "p": p_no}], 
-                                    is_debug=self.is_debug, is_terminal=is_terminal_no, generated_info=self.generated_info, get_grobal_context=self.get_grobal_context)
-
-                    yes_node.configure_node(self.n_extend_layers, self.accumulation, self.expected_method, self.n_max_pruning, self.lambda_, self.n_question_candidates)
-                    no_node.configure_node(self.n_extend_layers, self.accumulation, self.expected_method, self.n_max_pruning, self.lambda_, self.n_question_candidates)
-
-                    self.children.extend([yes_node, no_node])
-
-                    self.debug_print("extend_single_layer", f"Generated child nodes for question: {question}, p_yes={p_yes}, p_no={p_no}, information_gain={information_gain}")
+                self._create_children_from_results(results, "extend_single_layer")
 
                 self.debug_print("extend_single_layer", f"Total child nodes generated: {len(self.children)}")
             else:
@@ -182,13 +230,11 @@ class UoTNode:
 
     async def recalculate_rewards(self) -> None:
         self.debug_print("recalculate_rewards", "Recalculating rewards")
-        
-        self.reward = await self.calculate_reward(self)
-        self.information_gain = await self.calculate_information_gain(self)
 
-        if not self.is_terminal and self.children:
-            child_recalculations = [child.recalculate_rewards() for child in self.children]
-            await asyncio.gather(*child_recalculations)
+        self.refresh_rewards()
+        # ルートには比べる親がないので情報利得は 0
+        self.information_gain = 0.0
+        self.reward = self.expected_child_reward()
 
     async def elevate_layer(self) -> None:
         self.debug_print("elevate_layer", "Elevating layer and updating is_terminal status")
@@ -197,7 +243,7 @@ class UoTNode:
         else:
             self.depth = 0
         
-        self.is_terminal = self.depth >= self.n_extend_layers - 1 or len(self.items) <= 2
+        self.is_terminal = self.depth >= self.n_extend_layers - 1 or len(self.belief) <= 2
 
         elevate_tasks = [child.elevate_layer() for child in self.children]
         await asyncio.gather(*elevate_tasks)
@@ -206,27 +252,57 @@ class UoTNode:
 
     async def calculate_rewards(self) -> None:
         self.debug_print("calculate_rewards", "Calculating rewards for all children")
-        for child in self.children:
-            child.reward = await self.calculate_reward(child)
-            child.information_gain = await self.calculate_information_gain(child)
+        self.refresh_rewards()
 
     async def calculate_reward(self, child: 'UoTNode') -> float:
         self.debug_print("calculate_reward", "Calculating reward")
 
-        if not child.children:
-            child.reward = child.information_gain
-            self.debug_print("calculate_reward", f"Leaf node, reward=information_gain={child.reward}")
-            return child.reward
+        child.refresh_rewards()
+        child.reward = child.information_gain + child.expected_child_reward()
 
-        child_rewards = [await self.calculate_reward(grandchild) for grandchild in child.children]
-        expected_child_reward = sum(child_rewards) / len(child_rewards)
-        
-        child.reward = child.information_gain + expected_child_reward
-
-        self.debug_print("calculate_reward", f"Non-leaf node: information_gain={child.information_gain}, expected_child_reward={expected_child_reward}, total reward={child.reward}")
+        self.debug_print("calculate_reward", f"information_gain={child.information_gain}, total reward={child.reward}")
 
         return child.reward
 
+    def invalidate_rewards(self) -> None:
+        """
+        Marks this node and its ancestors for reward recomputation.
+        Ancestors of a dirty node are always dirty, so the walk stops at the first dirty one.
+        """
+        node = self
+        while node is not None and not node._rewards_dirty:
+            node._rewards_dirty = True
+            UoTNode.reward_stats["invalidations"] += 1
+            node = node.parent
+
+    def mark_rewards_clean(self) -> None:
+        """Used when the rewards are restored from a dump instead of being computed."""
+        self._rewards_dirty = False
+
+    def expected_child_reward(self) -> float:
+        if not self._children:
+            return 0.0
+        return sum(child.reward for child in self._children) / len(self._children)
+
+    def refresh_rewards(self) -> None:
+        """
+        Recomputes the information gain and reward of the children bottom-up:
+        information_gain = H(self) - H(child), reward = information_gain + mean reward of the child's children.
+        Only dirty subtrees are visited, clean children keep their cached rewards (entropies are cached by BeliefState).
+        """
+        if not self._rewards_dirty:
+            return
+        entropy = self._belief.entropy
+        for child in self._children:
+            if child._rewards_dirty:
+                child.refresh_rewards()
+            else:
+                UoTNode.reward_stats["reused"] += 1
+            child.information_gain = entropy - child._belief.entropy
+            child.reward = child.information_gain + child.expected_child_reward()
+        self._rewards_dirty = False
+        UoTNode.reward_stats["recomputed"] += 1
+
     async def calculate_information_gain(self, child: 'UoTNode') -> float:
         self.debug_print("calculate_information_gain", f"Calculating information gain for child: {child.question}")
 
@@ -243,19 +319,19 @@ class UoTNode:
     def calculate_entropy(self) -> float:
         self.debug_print("calculate_entropy", "Calculating entropy")
 
-        entropy = -sum(item.p_s * np.log2(item.p_s) for item in self.items if item.p_s > 0)
+        entropy = self.belief.entropy
 
         self.debug_print("calculate_entropy", f"Entropy calculated: {entropy}")
 
         return entropy
 
-    def _calculate_information_gain(self, omega_yes: List[Item], omega_no: List[Item], p_yes: float, p_no: float) -> float:
+    def _calculate_information_gain(self, omega_yes: BeliefState, omega_no: BeliefState, p_yes: float, p_no: float) -> float:
         self.debug_print("_calculate_information_gain", f"Calculating information gain: p_yes={p_yes}, p_no={p_no}")
 
         initial_entropy = self.calculate_entropy
-        entropy_yes = -sum(item.p_s * np.log2(item.p_s) for item in omega_yes if item.p_s > 0)
-        entropy_no = -sum(item.p_s * np.log2(item.p_s) for item in omega_no if item.p_s > 0)
-        information_gain = initial_entropy - (p_yes * entropy_yes + p_no * entropy_no)
+        entropy_yes = omega_yes.entropy
+        entropy_no = omega_no.entropy
+        information_gain = self.belief.information_gain(omega_yes, omega_no, p_yes, p_no)
 
         self.debug_print("_calculate_information_gain", f"Information gain calculated: initial_entropy={initial_entropy}, entropy_yes={entropy_yes}, entropy_no={entropy_no}, information_gain={information_gain}")
 
@@ -298,19 +374,16 @@ class UoTNode:
         Return these top 5 items as a dictionary.
         """
 
-        sorted_items = sorted(self.items, key=lambda x: x.p_s, reverse=True)
-        top_5_items = {}
-        for item in sorted_items:
-            if len(top_5_items) < 5 or item.p_s == list(top_5_items.values())[-1]:
-                top_5_items[item.get_name()] = item.p_s
-            if len(top_5_items) > 5 and item.p_s != list(top_5_items.values())[-1]:
-                break
-        return top_5_items
+        return self.belief.top_items(5)
     
     def get_best_prob_item(self) -> Item:
-        return max(self.items, key=lambda x: x.p_s)
+        return self.belief.best_item()
         
-    async def generate_children(self) -> None:
+    async def generate_children(self, should_stop: Optional[Callable[[], bool]] = None) -> None:
+        """
+        Generates the yes/no children with the LLM.
+        If should_stop() turns true while the calls are in flight, the results are dropped (cooperative cancellation).
+        """
         self.debug_print("generate_children", f"Generating child nodes: n_question_candidates={self.n_question_candidates}")
 
         if self.is_terminal:
@@ -320,7 +393,7 @@ class UoTNode:
         start_time = time.time()
         try:
             top_5_items = self.get_top_5_items()
-            raw_questions_and_probabilities = await generate_questions_and_estimate_probability(self.items, self.n_question_candidates, self.history, max_item_size_at_once=self.max_item_size_at_once, top_5_items=top_5_items, additional_context=(self.get_grobal_context() if self.get_grobal_context else None))
+            raw_questions_and_probabilities = await generate_questions_and_estimate_probability(self.items, self.n_question_candidates, self.history, max_item_size_at_once=self.max_item_size_at_once, top_5_items=top_5_items, additional_context=([self.get_grobal_context()] if self.get_grobal_context else None), estimation_policy=self.estimation_policy)
             success = True
         except Exception as e:
             self.debug_print("generate_children", f"API call failed: {str(e)}")
@@ -340,45 +413,11 @@ class UoTNode:
             self.debug_print("generate_children", "No questions generated")
             return
 
-        self.generated_info = []
-        for question_data in raw_questions_and_probabilities:
-            question = question_data["question"]
-            item_probabilities = question_data["evaluated_items"]
-
-            p_yes = sum(item_prob["p_yes_given_item"] * item.p_s for item_prob, item in zip(item_probabilities, self.items))
-            p_no = 1 - p_yes
-
-            omega_yes, omega_no, p_yes_given_items, p_no_given_items = self._calculate_posterior_probabilities(item_probabilities, p_yes, p_no)
-
-            information_gain = self._calculate_information_gain(omega_yes, omega_no, p_yes, p_no)
-
-            self.generated_info.append({
-                "question": question,
-                "p_yes": p_yes,
-                "p_no": p_no,
-                "p_yes_given_items": p_yes_given_items,
-                "p_no_given_items": p_no_given_items,
-                "omega_yes": omega_yes,
-                "omega_no": omega_no,
-                "information_gain": information_gain
-            })
-
-            is_terminal_yes = self.depth + 1 >= self.n_extend_layers - 1 or len(omega_yes) <= 2
-            is_terminal_no = self.depth + 1 >= self.n_extend_layers - 1 or len(omega_no) <= 2
-
-            yes_node = UoTNode(question, omega_yes, parent=self, reply=True, p_reply=p_yes, 
-                            history=self.history + [{"q": question, "a": True, "p": p_yes}], 
-                            is_debug=self.is_debug, is_terminal=is_terminal_yes, generated_info=self.generated_info, get_grobal_context=self.get_grobal_context)
-            no_node = UoTNode(question, omega_no, parent=self, reply=False, p_reply=p_no, 
-                            history=self.history + [{"q": question, "a": False, "p": p_no}], 
-                            is_debug=self.is_debug, is_terminal=is_terminal_no, generated_info=self.generated_info, get_grobal_context=self.get_grobal_context)
-
-            yes_node.configure_node(self.n_extend_layers, self.accumulation, self.expected_method, self.n_max_pruning, self.lambda_, self.n_question_candidates)
-            no_node.configure_node(self.n_extend_layers, self.accumulation, self.expected_method, self.n_max_pruning, self.lambda_, self.n_question_candidates)
-
-            self.children.extend([yes_node, no_node])
+        if should_stop is not None and should_stop():
+            self.debug_print("generate_children", "Extension stopped, results dropped")
+            return
 
-            self.debug_print("generate_children", f"Generated child nodes for question: {question}, p_yes={p_yes}, p_no={p_no}, information_gain={information_gain}")
+        self.adopt_results(raw_questions_and_probabilities, "generate_children")
 
         self.debug_print("generate_children", f"Total child nodes generated: {len(self.children)}")
 
@@ -386,56 +425,21 @@ class UoTNode:
         self.debug_print("custom_bayesian_update", f"\n[CUSTOM BAYESIAN UPDATE] Starting: p_prime_y={p_prime_y}")
         start_time = time.time()
         try:
-            p_s = [item.p_s for item in self.items]
+            p_s = self.belief.probs
             self.debug_print("custom_bayesian_update", f"[STEP 1] Initial p_s: {p_s}")
+            question_data = None
             if self.generated_info:
                 question_data = next((info for info in self.generated_info if info["question"] == self.question), None)
-                if question_data:
-                    p_y_given_s = question_data["p_yes_given_items"]
-                    p_n_given_s = question_data["p_no_given_items"]
-                    self.debug_print("custom_bayesian_update", f"[STEP 2] Using generated info: p_y_given_s={p_y_given_s}")
-                else:
-                    p_y_given_s = [0.5 for _ in self.items]
-                    p_n_given_s = [0.5 for _ in self.items]
-                    self.debug_print("custom_bayesian_update", f"[STEP 2] Using default probabilities: p_y_given_s=[0.5, ...]")
+
+            if question_data and len(question_data["p_yes_given_items"]) == len(p_s):
+                p_y_given_s = np.asarray(question_data["p_yes_given_items"], dtype=np.float64)
+                self.debug_print("custom_bayesian_update", f"[STEP 2] Using generated info: p_y_given_s={p_y_given_s}")
             else:
-                p_y_given_s = [0.5 for _ in self.items]
-                p_n_given_s = [0.5 for _ in self.items]
+                p_y_given_s = np.full(len(p_s), 0.5)
                 self.debug_print("custom_bayesian_update", f"[STEP 2] Using default probabilities: p_y_given_s=[0.5, ...]")
-            
-            p_prime_n = 1 - p_prime_y
-            self.debug_print("custom_bayesian_update", f"[STEP 3] p_prime_n: {p_prime_n}")
-
-            p_y = sum(p_y_given_s[i] * p_s[i] for i in range(len(p_s)))
-            p_n = 1 - p_y
-            self.debug_print("custom_bayesian_update", f"[STEP 4] Calculated p_y: {p_y}, p_n: {p_n}")
-
-            p_s_given_y = [p_y_given_s[i] * p_s[i] / p_y if p_y > 0 else 0 for i in range(len(p_s))]
-            p_s_given_n = [p_n_given_s[i] * p_s[i] / p_n if p_n > 0 else 0 for i in range(len(p_s))]
-            self.debug_print("custom_bayesian_update", f"[STEP 5] p_s_given_y: {p_s_given_y}")
-            self.debug_print("custom_bayesian_update", f"[STEP 5] p_s_given_n: {p_s_given_n}")
-
-            e_p_s = [p_prime_y * p_s_given_y[i] + p_prime_n * p_s_given_n[i] for i in range(len(p_s))]
-            self.debug_print("custom_bayesian_update", f"[STEP 6] e_p_s: {e_p_s}")
-
-            r_s = [1 / (1 + self.lambda_ * (p_y_given_s[i] - p_prime_y) ** 2) for i in range(len(p_s))]
-            self.debug_print("custom_bayesian_update", f"[STEP 7] r_s: {r_s}")
-
-            e_prime_p_s = [r_s[i] * e_p_s[i] for i in range(len(p_s))]
-            self.debug_print("custom_bayesian_update", f"[STEP 8] e_prime_p_s: {e_prime_p_s}")
-
-            sum_e_prime = sum(e_prime_p_s)
-            self.debug_print("custom_bayesian_update", f"[STEP 9] sum_e_prime: {sum_e_prime}")
-
-            p_s_new = [e_prime_p_s[i] / sum_e_prime for i in range(len(p_s))]
-            self.debug_print("custom_bayesian_update", f"[STEP 10] p_s_new (before update): {p_s_new}")
-            self.debug_print("custom_bayesian_update", f"sum_e_prime: {sum_e_prime}")
 
-            self.debug_print("custom_bayesian_update", f"[STEP 11] Updating individual item probabilities:")
-            for item, new_p_s in zip(self.items, p_s_new):
-                old_p_s = item.p_s
-                item.update_p_s(new_p_s)
-                print(f"  - Item {item.get_name()}: old p_s={old_p_s:.6f}, new p_s={item.p_s:.6f}")
+            self.belief = self.belief.custom_bayesian_update(p_y_given_s, p_prime_y, self.lambda_)
+            self.debug_print("custom_bayesian_update", f"[STEP 3] p_s_new: {self.belief.probs}")
 
             success = True
         except Exception as e:
@@ -486,15 +490,9 @@ class UoTNode:
     def create_merged_node(self, yes_node: 'UoTNode', no_node: 'UoTNode') -> 'UoTNode':
         self.debug_print("create_merged_node", "Creating merged node")
         
-        merged_items = []
-        for yes_item, no_item in zip(yes_node.items, no_node.items):
-            merged_p_s = (yes_item.p_s + no_item.p_s) / 2
-            merged_item = Item(yes_item.get_name(), yes_item.description, merged_p_s)
-            merged_items.append(merged_item)
-        
         merged_node = UoTNode(
             question="merged_root",
-            items=merged_items,
+            items=yes_node.belief.merged(no_node.belief),
             parent=None,
             reply=None,
             p_reply=0.5,
@@ -503,7 +501,8 @@ class UoTNode:
             is_terminal=self.is_terminal,
             max_item_size_at_once=self.max_item_size_at_once,
             generated_info=self.generated_info,
-            get_grobal_context=self.get_grobal_context
+            get_grobal_context=self.get_grobal_context,
+            estimation_policy=self.estimation_policy
         )
         merged_node.configure_node(
             n_extend_layers=self.n_extend_layers,
@@ -519,21 +518,16 @@ class UoTNode:
     async def handle_equal_probability(self, yes_node: 'UoTNode', no_node: 'UoTNode', p_prime_y: float) -> 'UoTNode':
         self.debug_print("handle_equal_probability", "Creating merged node")
         
-        merged_items = []
-        for yes_item, no_item in zip(yes_node.items, no_node.items):
-            merged_p_s = (yes_item.p_s + no_item.p_s) / 2
-            merged_item = Item(yes_item.get_name(), yes_item.description, merged_p_s)
-            merged_items.append(merged_item)
-
         merged_node = UoTNode(
             question=f"Merged: {yes_node.question}",
-            items=merged_items,
+            items=yes_node.belief.merged(no_node.belief),
             parent=None,
             reply=None,
             p_reply=p_prime_y,
             history=self.history + [{"q": yes_node.question, "a": None, "p": p_prime_y}],
             is_debug=self.is_debug,
-            get_grobal_context=self.get_grobal_context
+            get_grobal_context=self.get_grobal_context,
+            estimation_policy=self.estimation_policy
         )
 
         merged_node.configure_node(
@@ -547,6 +541,8 @@ class UoTNode:
 
         # Merge children from yes_node and no_node
         merged_node.children = yes_node.children + no_node.children
+        for child in merged_node.children:
+            child.parent = merged_node
 
         # Recalculate rewards for all children
         await merged_node.calculate_rewards()
@@ -557,36 +553,34 @@ class UoTNode:
         self.debug_print("handle_equal_probability", "Merged node created")
         return merged_node
 
-    async def update_probabilities(self, p_prime_y: float, is_root: bool = False, parent_items: Optional[List[Item]] = None) -> None:
+    async def update_probabilities(self, p_prime_y: float, is_root: bool = False, parent_belief: Optional[BeliefState] = None) -> None:
         self.debug_print("update_probabilities", f"Updating probabilities: p_prime_y={p_prime_y}, is_root={is_root}")
         
         if is_root:
             await self.custom_bayesian_update(p_prime_y)
             self.history.append({"q": self.question, "a": self.reply, "p": p_prime_y})
         else:
-            # parent_itemsからitem_probabilitiesを作成
-            item_probabilities = [{"p_yes_given_item": self.p_reply} for _ in parent_items]
-            omega_yes, omega_no, _, _ = self._calculate_posterior_probabilities(item_probabilities, p_prime_y, 1 - p_prime_y)
+            # parent_beliefから一様な尤度ベクトルを作成
+            likelihood = np.full(len(parent_belief), self.p_reply, dtype=np.float64)
+            omega_yes, omega_no = parent_belief.posterior(likelihood, p_prime_y, 1 - p_prime_y)
             
             # 現在のノードの返答に基づいて適切な確率を選択
-            self.items = omega_yes if self.reply else omega_no
+            self.belief = omega_yes if self.reply else omega_no
 
         # 正規化を確実に行う
-        total_prob = sum(item.p_s for item in self.items)
-        for item in self.items:
-            item.p_s /= total_prob
+        self.belief = self.belief.normalized()
 
         # 子ノードの確率を更新
         if not self.is_terminal and self.children:
-            child_updates = [child.update_probabilities(p_prime_y, is_root=False, parent_items=self.items) for child in self.children]
+            child_updates = [child.update_probabilities(p_prime_y, is_root=False, parent_belief=self.belief) for child in self.children]
             await asyncio.gather(*child_updates)
 
         # デバッグ出力
-        self.debug_print("update_probabilities", "Updated probabilities:")
-        for item in self.items:
-            self.debug_print("update_probabilities", f"{item.get_name()}: {item.p_s:.4f}")
-        total_after = sum(item.p_s for item in self.items)
-        self.debug_print("update_probabilities", f"Total probability after update: {total_after:.4f}")
+        if self.is_debug:
+            self.debug_print("update_probabilities", "Updated probabilities:")
+            for name, p_s in self.belief.as_pairs():
+                self.debug_print("update_probabilities", f"{name}: {p_s:.4f}")
+            self.debug_print("update_probabilities", f"Total probability after update: {self.belief.probs.sum():.4f}")
 
         
     async def handle_unequal_probability(self, yes_node: 'UoTNode', no_node: 'UoTNode', p_prime_y: float) -> 'UoTNode':
@@ -598,11 +592,45 @@ class UoTNode:
         self.debug_print("handle_unequal_probability", "Unequal probability case handled")
         return best_child
 
+    def store_results(self) -> Dict:
+        """JSON-friendly dump of this subtree (debug output, read back by create_from_data)."""
+        return {
+            "question": self.question,
+            "reply": self.reply,
+            "p_reply": self.p_reply,
+            "history": self.history,
+            "depth": self.depth,
+            "is_terminal": self.is_terminal,
+            "current_extended_depth": self.current_extended_depth,
+            "reward": float(self.reward),
+            "information_gain": float(self.information_gain),
+            "items": [{"name": name, "description": description, "p_s": float(p_s)}
+                      for name, description, p_s in zip(self.belief.index.names, self.belief.index.descriptions, self.belief.probs)],
+            "children": [child.store_results() for child in self.children]
+        }
+
+    @classmethod
+    def create_from_data(cls, data: Dict, parent: Optional['UoTNode'] = None, is_debug: bool = False) -> 'UoTNode':
+        """
+        Rebuilds a subtree from store_results(). Generated question info is not part of the
+        debug dump, so use uot_snapshot for a complete resume.
+        """
+        node = cls(data["question"], [Item(item["name"], item["description"], item["p_s"]) for item in data["items"]],
+                   parent=parent, reply=data["reply"], p_reply=data["p_reply"], is_debug=is_debug, is_terminal=data["is_terminal"])
+        node.history = list(data["history"])
+        node.depth = data["depth"]
+        node.current_extended_depth = data["current_extended_depth"]
+        node.reward = data["reward"]
+        node.information_gain = data["information_gain"]
+        node.children = [cls.create_from_data(child, parent=node, is_debug=is_debug) for child in data["children"]]
+        node.mark_rewards_clean()
+        return node
+
     def __str__(self) -> str:
-        return f"UoTNode(question='{self.question}', depth={self.depth}, items={len(self.items)}, is_terminal={self.is_terminal})"
+        return f"UoTNode(question='{self.question}', depth={self.depth}, items={len(self.belief)}, is_terminal={self.is_terminal})"
 
     def __repr__(self) -> str:
-        return f"UoTNode(question='{self.question}', depth={self.depth}, items={len(self.items)}, reward={self.reward:.4f}, information_gain={self.information_gain:.4f}, is_terminal={self.is_terminal})"
+        return f"UoTNode(question='{self.question}', depth={self.depth}, items={len(self.belief)}, reward={self.reward:.4f}, information_gain={self.information_gain:.4f}, is_terminal={self.is_terminal})"
 
     def print_node_info(self, indent: int = 0) -> str:
         indent_str = "  " * indent
@@ -614,7 +642,7 @@ class UoTNode:
         info += f"{indent_str}reward={self.reward:.4f},\n"
         info += f"{indent_str}information_gain={self.information_gain:.4f},\n"
         info += f"{indent_str}items=[\n"
-        for item in self.items:
-            info += f"{indent_str}    name={item.get_name()}, p_s={item.p_s:.4f}\n"
+        for name, p_s in self.belief.as_pairs():
+            info += f"{indent_str}    name={name}, p_s={p_s:.4f}\n"
         info += f"{indent_str}]"
         return info
\ No newline at end of file
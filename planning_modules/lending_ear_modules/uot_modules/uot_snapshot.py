@@ -0,0 +1,227 @@
+from typing import Any, Callable, Dict, List, Optional
+
+import msgpack
+import numpy as np
+
+from planning_modules.lending_ear_modules.uot_modules.belief_state import BeliefState, ItemIndex
+from planning_modules.lending_ear_modules.uot_modules.chat_utils import EstimationPackingPolicy
+from planning_modules.lending_ear_modules.uot_modules.uot_node import UoTNode
+
+SNAPSHOT_MAGIC = "uot-snapshot"
+SNAPSHOT_VERSION = 1
+
+# msgpack ext types used inside the snapshot body
+_EXT_FLOAT64_ARRAY = 1
+_EXT_BELIEF = 2
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot is broken or was written by an incompatible version."""
+
+
+class _Encoder:
+    """
+    Converts a UoT tree into plain msgpack values.
+
+    Item tables (ItemIndex) and generated_info lists are shared by many nodes,
+    so they are written once into tables and referenced by position.
+    """
+
+    def __init__(self):
+        self.indexes: List[List[List[str]]] = []
+        self._index_ids: Dict[int, int] = {}
+        self.infos: List[Any] = []
+        self._info_ids: Dict[int, int] = {}
+
+    def index_id(self, index: ItemIndex) -> int:
+        key = id(index)
+        if key not in self._index_ids:
+            self._index_ids[key] = len(self.indexes)
+            self.indexes.append([list(index.names), list(index.descriptions)])
+        return self._index_ids[key]
+
+    def info_id(self, generated_info: Optional[List[Dict]]) -> Optional[int]:
+        if generated_info is None:
+            return None
+        key = id(generated_info)
+        if key not in self._info_ids:
+            self._info_ids[key] = len(self.infos)
+            self.infos.append(self.value(list(generated_info)))
+        return self._info_ids[key]
+
+    def value(self, value: Any) -> Any:
+        if isinstance(value, BeliefState):
+            payload = msgpack.packb([self.index_id(value.index), _pack_probs(value.probs)], use_bin_type=True)
+            return msgpack.ExtType(_EXT_BELIEF, payload)
+        if isinstance(value, np.ndarray):
+            return msgpack.ExtType(_EXT_FLOAT64_ARRAY, _pack_probs(value))
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, dict):
+            return {key: self.value(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.value(item) for item in value]
+        return value
+
+    def node(self, node: UoTNode) -> Dict[str, Any]:
+        return {
+            "q": node.question,
+            "i": self.index_id(node.belief.index),
+            "p": _pack_probs(node.belief.probs),
+            "r": node.reply,
+            "pr": node.p_reply,
+            "h": self.value(node.history),
+            "d": node.depth,
+            "t": node.is_terminal,
+            "xd": node.current_extended_depth,
+            "ig": float(node.information_gain),
+            "rw": float(node.reward),
+            "b": node.best_question,
+            "g": self.info_id(node.generated_info),
+            # The background extension may be appending children while we encode
+            "c": [self.node(child) for child in list(node.children)],
+        }
+
+
+def _pack_probs(probs: np.ndarray) -> bytes:
+    return np.ascontiguousarray(probs, dtype="<f8").tobytes()
+
+
+def _unpack_probs(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<f8").astype(np.float64)
+
+
+def dump_uot(uot) -> bytes:
+    """
+    Serializes a UoT tree into a compact msgpack snapshot.
+
+    The snapshot holds the item tables, the probability vectors (float64 bytes),
+    questions, replies, rewards, generated question info and the child structure.
+    Callables (get_grobal_context) and the estimation policy are not stored and
+    have to be passed to load_uot again.
+
+    Args:
+        uot (UoT): Tree to serialize.
+
+    Returns:
+        bytes: Snapshot.
+    """
+    encoder = _Encoder()
+    root = encoder.node(uot.root)
+    body = msgpack.packb({"root": root, "infos": encoder.infos}, use_bin_type=True)
+    return msgpack.packb({
+        "magic": SNAPSHOT_MAGIC,
+        "version": SNAPSHOT_VERSION,
+        "config": {
+            "n_extend_layers": uot.n_extend_layers,
+            "n_question_candidates": uot.n_question_candidates,
+            "n_max_pruning": uot.n_max_pruning,
+            "lambda": uot.lambda_,
+            "unknown_reward_prob_ratio": uot.unknown_reward_prob_ratio,
+            "max_item_size_at_once": uot.root.max_item_size_at_once,
+            "best_question": uot.best_question,
+        },
+        "indexes": encoder.indexes,
+        "body": body,
+    }, use_bin_type=True)
+
+
+def read_header(data: bytes) -> Dict[str, Any]:
+    """
+    Unpacks and validates the snapshot envelope (the tree body is left packed).
+
+    Raises:
+        SnapshotError: If the data is not a snapshot or its version is not supported.
+    """
+    try:
+        header = msgpack.unpackb(data, raw=False)
+    except Exception as e:
+        raise SnapshotError(f"Broken UoT snapshot: {e}") from e
+    if not isinstance(header, dict) or header.get("magic") != SNAPSHOT_MAGIC:
+        raise SnapshotError("Not a UoT snapshot")
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported UoT snapshot version: {header.get('version')} (expected {SNAPSHOT_VERSION})")
+    return header
+
+
+def load_uot(data: bytes, get_grobal_context: Optional[Callable] = None,
+             estimation_policy: Optional[EstimationPackingPolicy] = None, is_debug: bool = False,
+             speculation_budget: int = 0, search_policy=None):
+    """
+    Restores a UoT tree written by dump_uot.
+
+    Args:
+        data (bytes): Snapshot.
+        get_grobal_context (Optional[Callable], optional): Context provider for the restored nodes.
+        estimation_policy (Optional[EstimationPackingPolicy], optional): Estimation policy for the restored nodes.
+        is_debug (bool, optional): Debug flag of the restored tree.
+        speculation_budget (int, optional): LLM call budget of the speculative expansion (0 disables it).
+        search_policy (Optional[SearchPolicy], optional): Expansion policy of the restored tree (breadth-first by default).
+
+    Returns:
+        UoT: Restored tree, ready for get_question() / answer().
+
+    Raises:
+        SnapshotError: If the snapshot is broken or has an unsupported version.
+    """
+    from planning_modules.lending_ear_modules.uot_modules.uot import UoT
+
+    header = read_header(data)
+    config = header["config"]
+    indexes = [ItemIndex(names, descriptions) for names, descriptions in header["indexes"]]
+
+    def ext_hook(code: int, payload: bytes):
+        if code == _EXT_FLOAT64_ARRAY:
+            return _unpack_probs(payload)
+        if code == _EXT_BELIEF:
+            index_id, probs = msgpack.unpackb(payload, raw=False)
+            return BeliefState(indexes[index_id], _unpack_probs(probs))
+        return msgpack.ExtType(code, payload)
+
+    try:
+        body = msgpack.unpackb(header["body"], raw=False, ext_hook=ext_hook)
+        infos = body["infos"]
+
+        def build(node_data: Dict[str, Any], parent: Optional[UoTNode]) -> UoTNode:
+            node = UoTNode(
+                node_data["q"], BeliefState(indexes[node_data["i"]], _unpack_probs(node_data["p"])),
+                parent=parent, reply=node_data["r"], p_reply=node_data["pr"],
+                is_debug=is_debug, is_terminal=node_data["t"],
+                max_item_size_at_once=config["max_item_size_at_once"],
+                generated_info=infos[node_data["g"]] if node_data["g"] is not None else None,
+                get_grobal_context=get_grobal_context, estimation_policy=estimation_policy
+            )
+            # __init__ appends the node's own question to the history, so overwrite it with the saved one
+            node.history = node_data["h"]
+            node.depth = node_data["d"]
+            node.current_extended_depth = node_data["xd"]
+            node.information_gain = node_data["ig"]
+            node.reward = node_data["rw"]
+            node.best_question = node_data["b"]
+            node.configure_node(config["n_extend_layers"], True, 'avg', config["n_max_pruning"], config["lambda"], config["n_question_candidates"])
+            node.children = [build(child, node) for child in node_data["c"]]
+            node.mark_rewards_clean()
+            return node
+
+        root = build(body["root"], None)
+    except SnapshotError:
+        raise
+    except Exception as e:
+        raise SnapshotError(f"Broken UoT snapshot: {e}") from e
+
+    uot = UoT(
+        initial_items=root.belief,
+        n_extend_layers=config["n_extend_layers"],
+        n_question_candidates=config["n_question_candidates"],
+        n_max_pruning=config["n_max_pruning"],
+        lambda_=config["lambda"],
+        is_debug=is_debug,
+        unknown_reward_prob_ratio=config["unknown_reward_prob_ratio"],
+        get_grobal_context=get_grobal_context,
+        estimation_policy=estimation_policy,
+        speculation_budget=speculation_budget,
+        search_policy=search_policy
+    )
+    uot.root = root
+    uot.best_question = config["best_question"]
+    return uot
@@ -0,0 +1,293 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Iterator
+
+from langchain_core.runnables import RunnableBinding, RunnableSequence
+
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "fast_and_slow_llm_cache.sqlite3")
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+class LLMCache:
+    """
+    Content-addressed cache for LLM chain results.
+
+    Two layers:
+        - in-process LRU (OrderedDict) bounded by max_memory_entries
+        - local SQLite store bounded by max_disk_entries (least recently used rows are evicted)
+
+    Values must be JSON serializable (the parsed output of JsonOutputParser).
+    Every entry expires after ttl_seconds. Expired rows are never returned; the SQLite store deletes
+    them in one indexed sweep every sweep_interval writes. The number of rows is counted in memory
+    (read once when the store is opened), so a write is a few index lookups, not a table scan.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_memory_entries: int = 2048, max_disk_entries: int = 50000, sweep_interval: int = 1000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.sweep_interval = sweep_interval
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_count = 0  # SQLite の行数 (COUNT(*) を毎回数えない)
+        self._writes_since_sweep = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+        if path:
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+                self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires_at ON llm_cache (expires_at)")
+                self._disk_count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            except Exception as e:
+                print(f"[LLM Cache] SQLite store is disabled: {e}")
+                self._conn = None
+
+    @staticmethod
+    def make_key(fingerprint: str, inputs: Dict[str, Any]) -> str:
+        """Hash of (chain fingerprint = prompt template + model, normalized inputs)."""
+        payload = json.dumps({"chain": fingerprint, "inputs": _normalize(inputs)}, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return json.loads(value)
+                del self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        value, expires_at = row
+                        if expires_at > now:
+                            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                            self._remember(key, expires_at, value)
+                            self._stats["disk_hits"] += 1
+                            return json.loads(value)
+                        self._disk_count -= self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,)).rowcount
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    print(f"[LLM Cache] Failed to read: {e}")
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        try:
+            serialized = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            # JSON にできない結果はキャッシュしない
+            return
+
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, serialized)
+            self._stats["writes"] += 1
+            if self._conn is not None:
+                try:
+                    exists = self._conn.execute("SELECT 1 FROM llm_cache WHERE key = ?", (key,)).fetchone() is not None
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                        (key, serialized, expires_at, now)
+                    )
+                    if not exists:
+                        self._disk_count += 1
+                    self._evict_disk(now)
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    print(f"[LLM Cache] Failed to write: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._disk_count = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._disk_count
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key: str, expires_at: float, serialized: str) -> None:
+        self._memory[key] = (expires_at, serialized)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_disk(self, now: float) -> None:
+        # 期限切れの行は sweep_interval 回の書き込みごとにまとめて消す (expires_at のインデックスを使う)
+        self._writes_since_sweep += 1
+        if self._writes_since_sweep >= self.sweep_interval:
+            self._writes_since_sweep = 0
+            self._disk_count -= self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+        overflow = self._disk_count - self.max_disk_entries
+        if overflow > 0:
+            deleted = self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            ).rowcount
+            self._disk_count -= deleted
+            self._stats["evictions"] += deleted
+
+
+class CachedChain:
+    """
+    Wraps a chain (prompt | model | parser) so that invoke / ainvoke / stream go through the LLMCache.
+    Any other attribute is delegated to the wrapped chain.
+    """
+
+    def __init__(self, chain, cache: LLMCache, fingerprint: Optional[str] = None):
+        self.chain = chain
+        self.cache = cache
+        self.fingerprint = fingerprint or chain_fingerprint(chain)
+
+    def invoke(self, inputs: Dict[str, Any], *args, **kwargs) -> Any:
+        key = self.cache.make_key(self.fingerprint, inputs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = self.chain.invoke(inputs, *args, **kwargs)
+        self._store(key, result)
+        return result
+
+    async def ainvoke(self, inputs: Dict[str, Any], *args, **kwargs) -> Any:
+        key = self.cache.make_key(self.fingerprint, inputs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = await self.chain.ainvoke(inputs, *args, **kwargs)
+        self._store(key, result)
+        return result
+
+    def stream(self, inputs: Dict[str, Any], *args, **kwargs) -> Iterator[Any]:
+        key = self.cache.make_key(self.fingerprint, inputs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        last = None
+        for chunk in self.chain.stream(inputs, *args, **kwargs):
+            # JsonOutputParser は累積した部分結果を流すので、最後のチャンクが最終結果
+            last = chunk
+            yield chunk
+        self._store(key, last)
+
+    def batch(self, inputs_list, *args, **kwargs):
+        return [self.invoke(inputs, *args, **kwargs) for inputs in inputs_list]
+
+    def _store(self, key: str, result: Any) -> None:
+        if result is None:
+            return
+        if hasattr(result, "dict"):
+            result = result.dict()
+        self.cache.set(key, result)
+
+    def __getattr__(self, name):
+        return getattr(self.chain, name)
+
+
+def chain_fingerprint(chain) -> str:
+    """
+    Describes a chain by its prompt templates, model names / bound kwargs and parser types,
+    so that a change of the template or of the model invalidates the cached entries.
+    """
+    steps = chain.steps if isinstance(chain, RunnableSequence) else [chain]
+    parts = []
+    for step in steps:
+        if hasattr(step, "template"):
+            partials = {k: v for k, v in getattr(step, "partial_variables", {}).items() if isinstance(v, str)}
+            parts.append({"template": step.template, "partial_variables": partials})
+        elif isinstance(step, RunnableBinding):
+            parts.append({"model": _model_name(step.bound), "kwargs": step.kwargs})
+        elif _model_name(step) is not None:
+            parts.append({"model": _model_name(step)})
+        else:
+            parts.append({"type": type(step).__name__})
+    return json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _model_name(model) -> Optional[str]:
+    for attribute in ("model_name", "model"):
+        value = getattr(model, attribute, None)
+        if isinstance(value, str):
+            return f"{type(model).__name__}:{value}"
+    return None
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.replace("\r\n", "\n").strip()
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if hasattr(value, "dict"):
+        return _normalize(value.dict())
+    return value
+
+
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """
+    Returns the process wide LLMCache configured by environment variables, or None if disabled.
+
+    LLM_CACHE_DISABLED: "1" / "true" to disable the cache
+    LLM_CACHE_PATH: SQLite file path ("" for memory only)
+    LLM_CACHE_TTL: TTL in seconds
+    LLM_CACHE_MAX_ENTRIES / LLM_CACHE_MAX_DISK_ENTRIES: size bounds
+    """
+    global _llm_cache
+    if os.getenv("LLM_CACHE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache(
+                path=os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH) or None,
+                ttl_seconds=float(os.getenv("LLM_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+                max_memory_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 2048)),
+                max_disk_entries=int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", 50000))
+            )
+        return _llm_cache
+
+
+def cached_chain(chain):
+    """Wraps the chain with the process wide cache (returns the chain as is when the cache is disabled)."""
+    cache = get_llm_cache()
+    if cache is None:
+        return chain
+    return CachedChain(chain, cache)
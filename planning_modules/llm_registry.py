@@ -0,0 +1,329 @@
+import asyncio
+import json
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, Iterator, AsyncIterator, Optional, Tuple
+
+import httpx
+from langchain_core.runnables import Runnable, RunnableBinding
+
+from planning_modules.lending_ear_modules.uot_modules.llm_concurrency import GlobalLLMLimiter
+
+
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+JSON_MODE = {"response_format": {"type": "json_object"}}
+
+
+class LimitedModel(RunnableBinding):
+    """
+    A chat model (optionally bound to kwargs such as JSON mode) whose calls wait for a slot of
+    the per-model limiter. It stays a RunnableBinding so that chain_fingerprint (and therefore
+    the LLM cache keys) is the same as for model.bind(**kwargs).
+
+    Async calls go to loop_bound(), the copy of the model owned by the running event loop
+    (httpx.AsyncClient connections cannot be shared between loops).
+    """
+    limiter: Optional[Any] = None
+    loop_bound: Optional[Any] = None  # () -> 実行中のイベントループ用のモデル (None なら bound)
+
+    def _async_bound(self):
+        return self.loop_bound() if self.loop_bound is not None else self.bound
+
+    def invoke(self, input, config=None, **kwargs):
+        if self.limiter is None:
+            return super().invoke(input, config, **kwargs)
+        self.limiter.acquire_blocking()
+        try:
+            return super().invoke(input, config, **kwargs)
+        finally:
+            self.limiter.release()
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        if self.limiter is None:
+            return await self._ainvoke_bound(input, config, **kwargs)
+        await self.limiter.acquire()
+        try:
+            return await self._ainvoke_bound(input, config, **kwargs)
+        finally:
+            self.limiter.release()
+
+    async def _ainvoke_bound(self, input, config, **kwargs):
+        return await self._async_bound().ainvoke(input, self._merge_configs(config), **{**self.kwargs, **kwargs})
+
+    def batch(self, inputs, config=None, *, return_exceptions=False, **kwargs):
+        # 1 入力ずつ invoke してスロットを取る
+        return Runnable.batch(self, inputs, config, return_exceptions=return_exceptions, **kwargs)
+
+    async def abatch(self, inputs, config=None, *, return_exceptions=False, **kwargs):
+        return await Runnable.abatch(self, inputs, config, return_exceptions=return_exceptions, **kwargs)
+
+    def stream(self, input, config=None, **kwargs) -> Iterator[Any]:
+        yield from self._limited_iter(super().stream, input, config, **kwargs)
+
+    def transform(self, input, config=None, **kwargs) -> Iterator[Any]:
+        # RunnableSequence.stream は各ステップの transform を呼ぶ
+        yield from self._limited_iter(super().transform, input, config, **kwargs)
+
+    async def astream(self, input, config=None, **kwargs) -> AsyncIterator[Any]:
+        async for chunk in self._limited_aiter("astream", input, config, **kwargs):
+            yield chunk
+
+    async def atransform(self, input, config=None, **kwargs) -> AsyncIterator[Any]:
+        async for chunk in self._limited_aiter("atransform", input, config, **kwargs):
+            yield chunk
+
+    def _limited_iter(self, method, input, config, **kwargs) -> Iterator[Any]:
+        if self.limiter is None:
+            yield from method(input, config, **kwargs)
+            return
+        self.limiter.acquire_blocking()
+        try:
+            yield from method(input, config, **kwargs)
+        finally:
+            self.limiter.release()
+
+    async def _limited_aiter(self, method_name, input, config, **kwargs) -> AsyncIterator[Any]:
+        method = getattr(self._async_bound(), method_name)
+        config, kwargs = self._merge_configs(config), {**self.kwargs, **kwargs}
+        if self.limiter is None:
+            async for chunk in method(input, config, **kwargs):
+                yield chunk
+            return
+        await self.limiter.acquire()
+        try:
+            async for chunk in method(input, config, **kwargs):
+                yield chunk
+        finally:
+            self.limiter.release()
+
+
+def _openai_factory(model: str, params: Dict[str, Any], http_client: Optional[httpx.Client]):
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model, http_client=http_client, **params)
+
+
+def _groq_factory(model: str, params: Dict[str, Any], http_client: Optional[httpx.Client]):
+    from langchain_openai import ChatOpenAI
+    params = {"api_key": os.getenv("GROQ_API_KEY"), "base_url": GROQ_BASE_URL, **params}
+    return ChatOpenAI(model=model, http_client=http_client, **params)
+
+
+def _anthropic_factory(model: str, params: Dict[str, Any], http_client: Optional[httpx.Client]):
+    # ChatAnthropic は HTTP クライアントを受け取らないので、インスタンスを使い回すことで接続を再利用する
+    from langchain_anthropic import ChatAnthropic
+    return ChatAnthropic(model=model, **params)
+
+
+def _fireworks_factory(model: str, params: Dict[str, Any], http_client: Optional[httpx.Client]):
+    from langchain_fireworks import ChatFireworks
+    return ChatFireworks(model=model, **params)
+
+
+class LLMRegistry:
+    """
+    Process wide registry of chat model clients.
+
+    A client is created lazily on first use and shared by every chain asking for the same
+    (provider, model, params). OpenAI compatible providers (openai, groq) also share one keep-alive
+    httpx connection pool per base URL for their synchronous calls.
+
+    Async connections are bound to the event loop that opened them, and every UoT session runs
+    its own loop, so async calls use a copy of the model made for the running loop. For openai / groq
+    the copy gets one httpx.AsyncClient per (loop, base URL). aclose_loop() closes the clients of
+    the running loop and has to be awaited before the loop is closed.
+
+    Calls of one model can be capped with a per-model concurrency limit
+    (LLM_MODEL_MAX_CONCURRENCY="gpt-4o-mini=8,claude-3-5-sonnet-20241022=4"), on top of the
+    global and per-session limits of llm_concurrency.
+    """
+
+    # provider -> (factory, shares the httpx pool)
+    PROVIDERS: Dict[str, Tuple[Callable, bool]] = {
+        "openai": (_openai_factory, True),
+        "groq": (_groq_factory, True),
+        "anthropic": (_anthropic_factory, False),
+        "fireworks": (_fireworks_factory, False),
+    }
+
+    def __init__(self, model_limits: Optional[Dict[str, int]] = None, max_connections: int = 100,
+                 max_keepalive_connections: int = 20, keepalive_expiry: float = 60.0):
+        self.model_limits = dict(model_limits or {})
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._providers = dict(self.PROVIDERS)
+        self._models: Dict[str, Any] = {}
+        self._http_clients: Dict[str, httpx.Client] = {}
+        self._limiters: Dict[str, GlobalLLMLimiter] = {}
+        # イベントループ -> {"models": {key: chat model}, "http_clients": {base_url: httpx.AsyncClient}}
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Dict[str, Any]]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.RLock()
+        self._stats = {"created": 0, "reused": 0}
+
+    def register_provider(self, name: str, factory: Callable, share_http_pool: bool = False) -> None:
+        """factory(model, params, http_client) -> chat model"""
+        with self._lock:
+            self._providers[name] = (factory, share_http_pool)
+
+    def get(self, provider: str, model: str, json_mode: bool = False, **params) -> Runnable:
+        """
+        Returns the shared client of (provider, model, params), bound to JSON mode if requested.
+
+        Raises:
+            ValueError: If the provider is unknown.
+        """
+        if provider not in self._providers:
+            raise ValueError(f"Unknown LLM provider: {provider} (expected one of {', '.join(self._providers)})")
+        key = self.make_key(provider, model, json_mode, params)
+        with self._lock:
+            client = self._models.get(key)
+            if client is not None:
+                self._stats["reused"] += 1
+                return client
+
+            factory, share_http_pool = self._providers[provider]
+            http_client = self._http_client(provider, params) if share_http_pool else None
+            chat_model = factory(model, params, http_client)
+            client = LimitedModel(
+                bound=chat_model,
+                kwargs=dict(JSON_MODE) if json_mode else {},
+                limiter=self.limiter(model),
+                loop_bound=lambda: self._loop_model(key, provider, model, params, chat_model)
+            )
+            self._models[key] = client
+            self._stats["created"] += 1
+            print(f"[LLM Registry] Created {provider} client: model={model}")
+            return client
+
+    @staticmethod
+    def make_key(provider: str, model: str, json_mode: bool, params: Dict[str, Any]) -> str:
+        return json.dumps([provider, model, json_mode, params], sort_keys=True, default=str)
+
+    def limiter(self, model: str) -> Optional[GlobalLLMLimiter]:
+        limit = self.model_limits.get(model)
+        if limit is None:
+            return None
+        with self._lock:
+            if model not in self._limiters:
+                self._limiters[model] = GlobalLLMLimiter(limit)
+            return self._limiters[model]
+
+    @staticmethod
+    def _base_url(provider: str, params: Dict[str, Any]) -> str:
+        return params.get("base_url") or (GROQ_BASE_URL if provider == "groq" else os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"))
+
+    def _http_client(self, provider: str, params: Dict[str, Any]) -> httpx.Client:
+        base_url = self._base_url(provider, params)
+        if base_url not in self._http_clients:
+            # openai SDK の既定に合わせてタイムアウトは長め
+            self._http_clients[base_url] = httpx.Client(limits=self.limits, timeout=httpx.Timeout(600.0, connect=5.0))
+        return self._http_clients[base_url]
+
+    def _loop_model(self, key: str, provider: str, model: str, params: Dict[str, Any], shared_model: Any) -> Any:
+        """The copy of the model for the running event loop (the shared model outside of a loop)."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return shared_model
+        with self._lock:
+            clients = self._loop_clients.get(loop)
+            if clients is None:
+                clients = {"models": {}, "http_clients": {}}
+                self._loop_clients[loop] = clients
+            chat_model = clients["models"].get(key)
+            if chat_model is None:
+                factory, share_http_pool = self._providers[provider]
+                if share_http_pool:
+                    base_url = self._base_url(provider, params)
+                    if base_url not in clients["http_clients"]:
+                        clients["http_clients"][base_url] = httpx.AsyncClient(limits=self.limits, timeout=httpx.Timeout(600.0, connect=5.0))
+                    # 同期側は共有のプールを使い続ける
+                    chat_model = factory(model, {**params, "http_async_client": clients["http_clients"][base_url]}, self._http_client(provider, params))
+                else:
+                    # HTTP クライアントを渡せないプロバイダはループごとにインスタンスを作る
+                    chat_model = factory(model, params, None)
+                clients["models"][key] = chat_model
+            return chat_model
+
+    async def aclose_loop(self) -> None:
+        """Closes the async clients made for the running event loop (await it before closing the loop)."""
+        with self._lock:
+            clients = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if clients is None:
+            return
+        for http_client in clients["http_clients"].values():
+            try:
+                await http_client.aclose()
+            except Exception as e:
+                print(f"[LLM Registry] Failed to close async client: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["models"] = len(self._models)
+            stats["http_pools"] = len(self._http_clients)
+            stats["event_loops"] = len(self._loop_clients)
+            stats["limiters"] = {model: {**limiter.stats, "max_concurrency": limiter.max_concurrency} for model, limiter in self._limiters.items()}
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            for client in self._http_clients.values():
+                client.close()
+            self._http_clients.clear()
+            self._models.clear()
+            # 非同期クライアントは自分のループでしか閉じられないので、ここでは手放すだけ
+            self._loop_clients.clear()
+
+
+def parse_model_limits(value: Optional[str]) -> Dict[str, int]:
+    """"gpt-4o-mini=8,claude-3-5-sonnet-20241022=4" -> {"gpt-4o-mini": 8, "claude-3-5-sonnet-20241022": 4}"""
+    limits = {}
+    for part in (value or "").split(","):
+        if "=" not in part:
+            continue
+        model, limit = part.rsplit("=", 1)
+        try:
+            limits[model.strip()] = int(limit)
+        except ValueError:
+            print(f"[LLM Registry] Invalid model limit ignored: {part}")
+    return limits
+
+
+_llm_registry: Optional[LLMRegistry] = None
+_llm_registry_lock = threading.Lock()
+
+
+def get_llm_registry() -> LLMRegistry:
+    """
+    Returns the process wide LLMRegistry configured by environment variables.
+
+    LLM_MODEL_MAX_CONCURRENCY: per-model concurrency limits ("model=limit,...")
+    LLM_HTTP_MAX_CONNECTIONS / LLM_HTTP_MAX_KEEPALIVE: size of each shared connection pool
+    LLM_HTTP_KEEPALIVE_EXPIRY: seconds an idle connection is kept open
+    """
+    global _llm_registry
+    with _llm_registry_lock:
+        if _llm_registry is None:
+            _llm_registry = LLMRegistry(
+                model_limits=parse_model_limits(os.getenv("LLM_MODEL_MAX_CONCURRENCY")),
+                max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", 100)),
+                max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", 20)),
+                keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", 60))
+            )
+        return _llm_registry
+
+
+def get_llm(provider: str, model: str, json_mode: bool = False, **params) -> Runnable:
+    """Shortcut for get_llm_registry().get(...)."""
+    return get_llm_registry().get(provider, model, json_mode=json_mode, **params)
+
+
+async def close_loop_llm_clients() -> None:
+    """Closes the async LLM clients of the running event loop (call at the end of a UoT session)."""
+    registry = _llm_registry
+    if registry is not None:
+        await registry.aclose_loop()
@@ -3,16 +3,17 @@
 import traceback
 from typing import Optional, List, Dict, Any, Callable
 import eventlet
-from datetime import datetime
-import os
+from eventlet.event import Event
 import json
 
 from planning_modules.lending_ear_modules.uot_modules.item import Item
 from planning_modules.state_machine_modules.context_info import ContextInfo
 from neo4j_modules.care_kg_db import CareKgDB
-from planning_modules.state_machine_modules.sort_utils import instruction_sort, instruction_sort_sync
+from planning_modules.state_machine_modules.sort_utils import instruction_sort, instruction_sort_sync, sort_inputs_from_subtree
 from planning_modules.state_machine_modules.socket_constants import SocketEventType
-from planning_modules.state_machine_modules.llm_enrichment import LLMEnrichment
+from planning_modules.state_machine_modules.llm_enrichment import LLMEnrichment, streaming_enabled
+from planning_modules.state_machine_modules.node_events import NodeEventQueue
+from planning_modules.state_machine_modules.debug_sink import get_debug_sink, build_state_record, build_tree_record, render_tree_record
 
 
 class BaseNode:
@@ -20,8 +21,9 @@ class BaseNode:
     完成版 BaseNode:
       - includes/followsによるサブツリー構築
       - go_detail 時は children をまとめて全部実行
+      - 遅延構築 (lazy=True) なら children は先読みか最初の go_detail で作る (materialize_children)
       - [フォロワーノード] は保持するが、自動実行はしない
-      - イベントフラグ方式で待機(go_next, go_detail, back_to_start)
+      - セッション共有のイベントキューで待機(go_next, go_detail, back_to_start)
       - 仮想ルート対応フラグ(is_virtual_root)は残してあるが必要に応じて使用
     """
 
@@ -63,6 +65,12 @@ class BaseNode:
         self.followers: List[BaseNode] = []
         self.any_tree: Dict[str, Any] = {}
 
+        # 遅延構築 (create_from_item_sync(lazy=True)) の子ノードは、最初の go_detail か先読みで materialize_children が作る
+        self._lazy_subtree: Optional[Dict[str, Any]] = None
+        self._lazy_path: set = set()
+        self._children_ready: Optional[Event] = None  # None なら子ノードは構築済み (一括構築)
+        self._children_building = False
+
         # 中心ノード関係
         self.global_center_name = center_name
         self.is_center = (self.name == center_name) if center_name else False
@@ -77,13 +85,8 @@ class BaseNode:
         # 日本語名
         self.name_jp = name_jp
 
-        # イベントフラグをeventletのEventに変更
-        self.event_flags = {
-            "go_next": eventlet.Event(),
-            "go_detail": eventlet.Event(),
-            "back_to_start": eventlet.Event(),
-            "back_previous": eventlet.Event()
-        }
+        # イベントキュー (親がいれば共有し、ツリー全体で1つにする)
+        self.event_queue = self.parent.event_queue if self.parent else NodeEventQueue()
 
         # 親コンテキストをローカルへ継承
         if self.parent and self.parent.context_info:
@@ -97,6 +100,10 @@ class BaseNode:
         self.enriched_info: Optional[Dict[str, Any]] = None
         self._is_enriching = False  # フラグを追加
         self._llm_enrichment = LLMEnrichment()
+        # 生成途中の拡充情報 (field -> ここまでのテキスト)。表示待ちの間だけクライアントに差分を送る
+        self._partial_enrichment: Dict[str, str] = {}
+        self._stream_to_client = False
+        self._delta_seq = 0
 
         self.__debug_print__(
             f"Initialized BaseNode => name={self.name}, center={self.is_center}, parent={(parent_node.name if parent_node else 'None')}, is_virtual={self.is_virtual_root}"
@@ -228,7 +235,8 @@ class BaseNode:
             sorted_names = await instruction_sort(
                 includes=includes_names,
                 adjacency_lists=adjacency_lists,
-                description_map=description_map
+                description_map=description_map,
+                parent=self.name
             )
             
             self.__debug_print__(f"[{self.name}] final sorted children => {sorted_names}")
@@ -283,6 +291,51 @@ class BaseNode:
         self.enriched_info = enriched_data
         self._is_enriching = False
 
+    def _on_enriched(self, enriched_data: Dict[str, Any]) -> None:
+        """LLMで生成した拡充情報を追加し、KGにも書き戻す (次回以降はLLM呼び出し不要)"""
+        self.add_enriched_info(enriched_data)
+        if self.kg_db:
+            self.kg_db.save_node_enrichment(self.name, enriched_data, description=self.basic_description)
+
+    def _load_stored_enrichment(self) -> Optional[Dict[str, Any]]:
+        """KGに保存済みの拡充情報を読み込む"""
+        if self.enriched_info is None and self.kg_db:
+            stored = self.kg_db.get_node_enrichment(self.name)
+            if stored:
+                self.enriched_info = stored
+        return self.enriched_info
+
+    def _start_enrichment(self) -> None:
+        """保存済みの拡充情報がない場合のみ、LLMでの生成を非同期で開始"""
+        if self.enriched_info is not None or self._is_enriching:
+            return
+        self._is_enriching = True
+        self._llm_enrichment.enrich_node_info(
+            self.name,
+            self.basic_description,
+            callback=self._on_enriched,
+            on_delta=self._on_enrichment_delta if streaming_enabled() else None
+        )
+
+    def _on_enrichment_delta(self, field: str, delta: str, text: str) -> None:
+        """拡充情報の生成途中のテキストを受け取り、このノードを表示待ちならクライアントに送る"""
+        self._partial_enrichment[field] = text
+        if self._stream_to_client:
+            self._send_enrichment_delta(field, delta, text)
+
+    def _send_enrichment_delta(self, field: str, delta: str, text: str) -> None:
+        if not self.send_socket:
+            return
+        self._delta_seq += 1
+        self.send_socket(SocketEventType.NEXT_STATE_INFO_DELTA.value, {
+            "current_state": self.name,
+            # next_state_info と同じキー名にする
+            "field": "title" if field == "jp_title" else field,
+            "delta": delta,
+            "text": text,
+            "seq": self._delta_seq
+        })
+
     async def __create_node__(self, node_name: str) -> Optional['BaseNode']:
         """
         includes 先のノード名から BaseNode を作成するヘルパー
@@ -301,13 +354,6 @@ class BaseNode:
                 self.__debug_print__(f"No info found for {node_name}")
                 return None
 
-            # LLM拡充を非同期で開始
-            self._llm_enrichment.enrich_node_info(
-                node_name=info['name'],
-                description=info['description'],
-                callback=self.add_enriched_info  # コールバックを渡す
-            )
-            
             # 新しいItemを作成（全ての情報を渡す）
             it = Item(
                 name=info['name'],
@@ -333,6 +379,11 @@ class BaseNode:
                 is_virtual_root=self.is_virtual_root
             )
             if node:
+                # 保存済みの拡充情報を使い、無い場合のみLLM拡充を非同期で開始
+                if info.get('enrichment'):
+                    node.add_enriched_info(info['enrichment'])
+                else:
+                    node._start_enrichment()
                 self.__debug_print__(f"Successfully created child node => {node.name}, parent={self.name}")
 
             return node
@@ -422,31 +473,41 @@ class BaseNode:
         node.set_event_flag(event_name)
         eventlet.sleep(0.05)
 
-    def wait_for_event(self) -> str:
-        """イベント待機（優先順位付き）"""
+    def wait_for_event(self, timeout: Optional[float] = None, on_idle: Optional[Callable[['BaseNode'], Any]] = None) -> Optional[str]:
+        """
+        イベント待機（優先順位付き）。イベントが届くまでブロックする。
+
+        Args:
+            timeout (float, optional): 待機秒数。None なら無期限
+            on_idle (Callable, optional): timeout ごとに呼ばれるコールバック。
+                指定した場合は呼び出し後に待機を続け、指定しない場合は None を返す
+        """
         while True:
-            # eventletのEventを使用
-            if self.event_flags["back_to_start"].ready():
-                self.event_flags["back_to_start"].reset()
-                return "back_to_start"
-            elif self.event_flags["back_previous"].ready():
-                self.event_flags["back_previous"].reset()
-                return "back_previous"
-            elif self.event_flags["go_detail"].ready() and self.children:
-                self.event_flags["go_detail"].reset()
-                return "go_detail"
-            elif self.event_flags["go_next"].ready():
-                self.event_flags["go_next"].reset()
-                return "go_next"
-            eventlet.sleep(0.1)  # CPU使用率を抑える
+            # 子ノードが無い場合の go_detail は捨てる
+            event_name = self.event_queue.get(
+                timeout=timeout,
+                can_deliver=lambda name: name != "go_detail" or self.has_detail()
+            )
+            if event_name is not None:
+                return event_name
+            if on_idle is None:
+                return None
+            on_idle(self)
 
     def set_event_flag(self, event_name: str):
-        """イベントフラグをセット"""
-        if event_name not in self.event_flags:
+        """イベントをセット"""
+        if not self.event_queue.put(event_name):
             self.__debug_print__(f"[WARN] Unknown event_name => {event_name}")
             return
         self.__debug_print__(f"set_event_flag => {event_name}")
-        self.event_flags[event_name].send()  # eventletのEventはsendを使用
+
+    def share_event_queue(self, event_queue: NodeEventQueue):
+        """サブツリー全体で event_queue を共有する"""
+        if self.event_queue is event_queue:
+            return
+        self.event_queue = event_queue
+        for node in self.children + self.followers:
+            node.share_event_queue(event_queue)
 
     def _standard_run(self):
         """標準的な実行フロー"""
@@ -454,6 +515,12 @@ class BaseNode:
         self.send_socket("custom_ping", "5")
         
         self.send_socket("next_state_info", self._create_state_info())
+
+        # 詳細 (子ノード) と、次の兄弟ノードの詳細を先読みしておく
+        self.prefetch_children()
+        sibling = self._next_sibling()
+        if sibling:
+            sibling.prefetch_children()
         
         self.debug_print(f"Loop: local_state={self.local_state}")
         while True:
@@ -465,6 +532,8 @@ class BaseNode:
             elif event_name == "back_previous":
                 return "previous"
             elif event_name == "go_detail":
+                # 子ノードが未構築の場合だけここで待つ (先読み済みなら待たない)
+                self.materialize_children()
                 if not self.children:
                     # pass
                     self.send_socket("next_state_info", self.create_error_state_info("detailはこれ以上ないので，現状のdescriptionをもとにできるだけUSERに寄り添って丁寧に説明してみてください。"))
@@ -490,34 +559,11 @@ class BaseNode:
 
     def _create_state_info(self, **additional_flags) -> Dict[str, Any]:
         """共通のstate_info生成ロジック"""
-        # 状態のスナップショットを保存
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        base_dir = "debug_logs/state_transitions"
-        os.makedirs(base_dir, exist_ok=True)
-        
-        # グラフの保存
-        dot = self.visualize_graph()
-        graph_path = f"{base_dir}/graph_{timestamp}.png"
-        dot.render(graph_path, format="png", cleanup=True)
-        
-        # 状態情報の保存
-        state_info = {
-            "timestamp": timestamp,
-            "node_name": self.name,
-            "local_state": self.local_state,
-            "children": [c.name for c in self.children],
-            "followers": [f.name for f in self.followers],
-            "description": self.basic_description
-        }
-        
-        state_path = f"{base_dir}/state_{timestamp}.json"
-        with open(state_path, "w", encoding="utf-8") as f:
-            json.dump(state_info, f, ensure_ascii=False, indent=2)
-            
-        print(f"[DEBUG] Saved state snapshot: {timestamp}")
+        # 状態のスナップショットを保存 (デバッグシンクが有効な場合のみ、書き出しはバックグラウンド)
+        self.save_state_snapshot()
 
         # 基本情報を構築
-        has_detail = len(self.children) > 0
+        has_detail = self.has_detail()
         is_last_top_node = (
             self.parent and 
             self.parent.is_virtual_root and 
@@ -537,25 +583,30 @@ class BaseNode:
             "has_next": has_next
         }
 
-        # 拡充情報がない場合は生成を待機
-        if self.enriched_info is None:
+        # 拡充情報がない場合は保存済みの情報を確認し、それも無ければ生成を待機
+        if self.enriched_info is None and self._load_stored_enrichment() is None:
             print(f"\n[State Info] {self.name}の拡充情報を待機中...")
-            self._is_enriching = True
-            
+
             # 非同期で生成開始（まだ開始されていない場合）
-            self._llm_enrichment.enrich_node_info(
-                self.name,
-                self.basic_description,
-                callback=self.add_enriched_info
-            )
-            
-            # 生成完了まで待機（最大10秒）
-            for _ in range(10):
-                if self.enriched_info is not None:
-                    break
-                eventlet.sleep(1)
-                print(".", end="", flush=True)
-            print()
+            self._start_enrichment()
+
+            # 待っている間は生成途中のテキストを next_state_info_delta で送る (TTS が先に読み始められる)
+            self._stream_to_client = True
+            for field, text in list(self._partial_enrichment.items()):
+                self._send_enrichment_delta(field, text, text)
+
+            # 生成完了まで待機（最大10秒）。完成したらすぐ確定版を送れるよう 0.1 秒ごとに確認する
+            try:
+                for i in range(100):
+                    if self.enriched_info is not None:
+                        break
+                    eventlet.sleep(0.1)
+                    if i % 10 == 9:
+                        print(".", end="", flush=True)
+                print()
+            finally:
+                # 確定した内容は呼び出し元が next_state_info で送る
+                self._stream_to_client = False
 
         # 拡充情報があれば適用
         if self.enriched_info:
@@ -650,186 +701,8 @@ class BaseNode:
     # Graphviz描画 (b階層ごとに枠線色を変え、fillは白、エッジラベルにinclude/follow)
     # ---------------------------------------------------------------------
     def visualize_graph(self):
-        """
-        1. __VROOT__ は描画スキップ（その子をトップ階層）
-        2. (START)/(END) とトップノードを同じrankに
-        3. BFSで node->depth
-        4. 同depthを rank="same" に
-        5. ノードは円形固定サイズ、階層ごとに枠線色 + 半透明で塗る
-        6. 子が複数 => (a->b: start, b->c: next, c->d: next, d->a: end)
-        """
-
-        import graphviz
-        from collections import deque
-
-        # -----------------------------
-        # 1) __VROOT__ スキップしてトップノード決定
-        # -----------------------------
-        if self.name == "__VROOT__":
-            real_tops = self.children
-        else:
-            real_tops = [self]
-
-        # -----------------------------
-        # 2) BFSで (node->depth) - 再帰的に全階層を取得
-        # -----------------------------
-        depth_map = {}
-        visited = set()
-        queue = deque()
-        
-        def add_node_and_children(node, depth):
-            if node in visited:
-                return
-            visited.add(node)
-            depth_map[node] = depth
-            
-            # 子ノードを深さ+1で追加
-            for child in node.children:
-                queue.append((child, depth + 1))
-            # フォロワーノードを同じ深さで追加
-            for follower in node.followers:
-                if follower not in visited:
-                    queue.append((follower, depth))
-                    
-        # トップノードから開始
-        for top_node in real_tops:
-            add_node_and_children(top_node, 0)
-            
-        # 残りのノードを処理
-        while queue:
-            node, d = queue.popleft()
-            add_node_and_children(node, d)
-
-        if not depth_map:
-            return graphviz.Digraph("empty")
-
-        # -----------------------------
-        # 3) Graphviz初期設定
-        # -----------------------------
-        dot = graphviz.Digraph("final_graph")
-        dot.attr("graph", rankdir="TB", ranksep="0.5", nodesep="0.5")
-        dot.attr("node",
-                shape="circle",
-                fixedsize="true",
-                width="2.5",
-                height="2",
-                style="filled",
-                fontname="MS Gothic",
-                fontweight="bold",
-                fontsize="15")
-        dot.attr("edge", fontname="MS Gothic")
-
-        # (START)/(END)は白背景・黒枠で固定
-        start_node = "(START)"
-        end_node   = "(END)"
-        dot.node(start_node, label="(START)", color="black", fillcolor="white", penwidth="2")
-        dot.node(end_node,   label="(END)",   color="black", fillcolor="white", penwidth="2")
-
-        # depthごとに仕分け
-        depth2nodes = {}
-        for nd, d in depth_map.items():
-            depth2nodes.setdefault(d, []).append(nd)
-
-        min_depth = min(depth2nodes.keys())
-        max_depth = max(depth2nodes.keys())
-
-        # 半透明用の色リスト
-        layer_colors = [
-            "#ff000030", "#ff800030", "#ffff0030", "#80ff0030", "#00ff0030",
-            "#00ff8030", "#00ffff30", "#0080ff30", "#0000ff30", "#8000ff30",
-            "#ff00ff30", "#ff008030"
-        ]
-
-        colors = [
-            "#ff0000", "#ff8000", "#ffff00", "#80ff00", "#00ff00",
-            "#00ff80", "#00ffff", "#0080ff", "#0000ff", "#8000ff",
-            "#ff00ff", "#ff0080"
-        ]
-
-        # -----------------------------
-        # 4) 同じdepthを rank="same" で横並び
-        # -----------------------------
-        for d, nodes_d in depth2nodes.items():
-            sub_name = f"depth_{d}"
-            with dot.subgraph(name=sub_name) as sub:
-                sub.attr(rank="same")
-                cidx = d % len(layer_colors)
-                fillcol = layer_colors[cidx]
-                edgecol = colors[cidx]
-
-                for n in nodes_d:
-                    sub.node(
-                        n.name,
-                        label=f"{n.name}\n({n.local_state})",
-                        color=edgecol,
-                        fillcolor=fillcol,
-                        penwidth="5"
-                    )
-
-        # (START)&(END) もトップ階層に rank="same" で配置
-        with dot.subgraph(name="rank_startend") as sub:
-            sub.attr(rank="same")
-            sub.node(start_node)
-            sub.node(end_node)
-
-        # -----------------------------
-        # 5) エッジの描画 - 階層構造を明確に
-        # -----------------------------
-        visited_edges = set()
-        
-        # トップノードと START/END の接続
-        top_depth_nodes = depth2nodes[min_depth]
-        for tnode in top_depth_nodes:
-            if ("(START)", tnode.name) not in visited_edges:
-                dot.edge("(START)", tnode.name, label="start", constraint="false", penwidth="5")
-                visited_edges.add(("(START)", tnode.name))
-            if (tnode.name, "(END)") not in visited_edges:
-                dot.edge(tnode.name, "(END)", label="end", constraint="false", penwidth="5")
-                visited_edges.add((tnode.name, "(END)"))
-
-        # 階層構造のエッジを描画
-        def add_edges(node):
-            if not node.children:
-                return
-                
-            # 子ノードへの接続
-            for i, child in enumerate(node.children):
-                # 親から最初の子へ
-                if i == 0:
-                    e_start = (node.name, child.name)
-                    if e_start not in visited_edges:
-                        dot.edge(node.name, child.name, label="detail", penwidth="5", color="#cccccc")
-                        visited_edges.add(e_start)
-                
-                # 子ノード間の接続
-                if i < len(node.children) - 1:
-                    e_next = (child.name, node.children[i+1].name)
-                    if e_next not in visited_edges:
-                        dot.edge(child.name, node.children[i+1].name, label="next", penwidth="5", color="black")
-                        visited_edges.add(e_next)
-                
-                # 最後の子から親への戻り
-                if i == len(node.children) - 1:
-                    e_back = (child.name, node.name)
-                    if e_back not in visited_edges:
-                        dot.edge(child.name, node.name, label="back", penwidth="5", color="#cccccc")
-                        visited_edges.add(e_back)
-                
-                # 再帰的に子ノードのエッジを追加
-                add_edges(child)
-            
-            # フォロワーノード間の接続
-            for i, follower in enumerate(node.followers):
-                e_follow = (node.name, follower.name)
-                if e_follow not in visited_edges:
-                    dot.edge(node.name, follower.name, label="followed_by", penwidth="3", style="dashed", color="#666666")
-                    visited_edges.add(e_follow)
-
-        # トップノードから開始してエッジを追加
-        for top_node in real_tops:
-            add_edges(top_node)
-
-        return dot
+        """サブツリーを Graphviz で描画 (描画処理は debug_sink.render_tree_record)"""
+        return render_tree_record(build_tree_record(self))
 
     @classmethod
     def create_virtual_root(cls) -> 'BaseNode':
@@ -847,13 +720,26 @@ class BaseNode:
         if child not in self.children:
             self.children.append(child)
             child.parent = self
+            child.share_event_queue(self.event_queue)
 
     @classmethod
-    def create_from_item_sync(cls, item_name: str, kg_db: CareKgDB, send_socket, is_debug: bool = False) -> 'BaseNode':
-        """アイテムからノードを作成する同期バージョン"""
+    def create_from_item_sync(cls, item_name: str, kg_db: CareKgDB, send_socket, is_debug: bool = False,
+                              subtree: Optional[Dict[str, Any]] = None, _path: Optional[set] = None,
+                              lazy: bool = False) -> 'BaseNode':
+        """
+        アイテムからノードを作成する同期バージョン
+        subtree (CareKgDB.get_subtree の結果) が無ければ1回のクエリでサブツリー全体を取得し、以降はそれを使う
+        lazy=True なら子ノードは作らず (KG からも 1 段分だけ取得)、materialize_children で必要になった時に作る
+        """
         try:
-            # アイテム情報を取得（既存の同期メソッドを使用）
-            item_info = kg_db.get_item_full_info(item_name)  # _syncを付けない
+            if subtree is None:
+                subtree = kg_db.get_subtree(item_name, max_depth=1) if lazy else kg_db.get_subtree(item_name)
+                if not subtree:
+                    print(f"[BaseNode] No info for item={item_name}")
+                    return None
+
+            # アイテム情報を取得
+            item_info = subtree['nodes'].get(item_name)
             if not item_info:
                 print(f"[BaseNode] No info for item={item_name}")
                 return None
@@ -871,8 +757,18 @@ class BaseNode:
                 japanese_name=item_info.get('name_jp')
             )
 
-            # 子ノードを構築
-            node.construct_children_subtree_sync()
+            # 保存済みの拡充情報を使い、無い場合のみLLM拡充を非同期で開始
+            if item_info.get('enrichment'):
+                node.add_enriched_info(item_info['enrichment'])
+            else:
+                node._start_enrichment()
+
+            # 子ノードを構築 (遅延構築なら materialize_children まで待つ)
+            path = (_path or set()) | {item_name}
+            if lazy:
+                node._defer_children(subtree, path)
+            else:
+                node.construct_children_subtree_sync(subtree=subtree, _path=path)
             return node
 
         except Exception as e:
@@ -880,34 +776,30 @@ class BaseNode:
             traceback.print_exc()
             return None
 
-    def construct_children_subtree_sync(self):
-        """子ノードのサブツリーを構築する同期バージョン"""
+    def construct_children_subtree_sync(self, subtree: Optional[Dict[str, Any]] = None, _path: Optional[set] = None,
+                                        lazy: bool = False):
+        """子ノードのサブツリーを構築する同期バージョン (subtree が無ければ取得する。lazy なら子ノードも遅延構築)"""
         if not self.kg_db:
             return
 
         try:
-            # includesを取得
-            includes_names = self.kg_db.get_children_sync(self.name)
+            if subtree is None:
+                subtree = self.kg_db.get_subtree(self.name)
+                if not subtree:
+                    return
+            nodes = subtree['nodes']
+            path = _path or {self.name}
+
+            # includes (循環は除外) / follows / description を取得
+            includes_names, adjacency_lists, description_map = sort_inputs_from_subtree(self.name, nodes, path)
             if not includes_names:
                 return
 
-            # followsを取得
-            adjacency_lists = {}
-            for inc_name in includes_names:
-                flist = self.kg_db.get_followers_sync(inc_name)
-                if flist:
-                    flist_in = [f for f in flist if f in includes_names and f != inc_name]
-                    if flist_in:
-                        adjacency_lists[inc_name] = flist_in
-
-            # descriptionを取得
-            description_map = {}
-            for inc_name in includes_names:
-                desc = self.kg_db.get_item_description_sync(inc_name)
-                description_map[inc_name] = desc or ""
-
-            # トポロジカルソート
-            sorted_names = instruction_sort_sync(includes_names, adjacency_lists, description_map)
+            # トポロジカルソート (並列があれば presort_pipeline で KG に保存した並び順を使う)
+            sorted_names = instruction_sort_sync(
+                includes_names, adjacency_lists, description_map,
+                parent=self.name, stored_order=nodes[self.name].get('child_order')
+            )
 
             # ノードを作成
             for name in sorted_names:
@@ -915,7 +807,10 @@ class BaseNode:
                     item_name=name,
                     kg_db=self.kg_db,
                     send_socket=self.send_socket,
-                    is_debug=self.is_debug
+                    is_debug=self.is_debug,
+                    subtree=subtree,
+                    _path=path,
+                    lazy=lazy
                 )
                 if child:
                     self.add_child(child)
@@ -924,40 +819,86 @@ class BaseNode:
             print(f"Error in construct_children_subtree_sync: {e}")
             traceback.print_exc()
 
+    def _defer_children(self, subtree: Dict[str, Any], path: set) -> None:
+        """子ノードの構築を materialize_children まで遅らせる"""
+        self._lazy_subtree = subtree
+        self._lazy_path = path
+        self._children_ready = Event()
+        self._children_building = False
+
+    @property
+    def children_ready(self) -> bool:
+        """子ノードが構築済みか (遅延構築でなければ常に True)"""
+        return self._children_ready is None or self._children_ready.ready()
+
+    def has_detail(self) -> bool:
+        """子ノードがあるか。未構築なら KG の情報から判断し、構築はしない"""
+        if self.children_ready:
+            return len(self.children) > 0
+        info = self._lazy_subtree['nodes'].get(self.name) or {}
+        return any(name not in self._lazy_path for name in info.get('children', []))
+
+    def materialize_children(self, timeout: Optional[float] = None) -> bool:
+        """
+        遅延構築の子ノードを作る (子ノード自身も遅延構築)。
+        別のグリーンスレッド (先読み) が構築中ならその完了を待つ。
+
+        Returns:
+            bool: 子ノードが構築済みなら True (timeout までに終わらなければ False)
+        """
+        if self.children_ready:
+            return True
+        if self._children_building:
+            self._children_ready.wait(timeout)
+            return self.children_ready
+
+        self._children_building = True
+        try:
+            subtree = self._lazy_subtree
+            child_names = (subtree['nodes'].get(self.name) or {}).get('children', [])
+            if self.kg_db and any(name not in subtree['nodes'] for name in child_names):
+                # 子ノードの説明・follows・孫の有無を 1 段分だけ取得する
+                subtree = self.kg_db.get_subtree(self.name, max_depth=1)
+            if subtree:
+                self.construct_children_subtree_sync(subtree=subtree, _path=self._lazy_path, lazy=True)
+            self.__debug_print__(f"materialized children of {self.name} => {[c.name for c in self.children]}")
+        except Exception as e:
+            print(f"Error in materialize_children: {e}")
+            traceback.print_exc()
+        finally:
+            self._lazy_subtree = None
+            self._children_building = False
+            self._children_ready.send(True)
+        return True
+
+    def prefetch_children(self) -> None:
+        """子ノードの構築をバックグラウンドで始める (go_detail で待たずに済むように)"""
+        if not self.children_ready and not self._children_building:
+            eventlet.spawn(self.materialize_children)
+
+    def _next_sibling(self) -> Optional['BaseNode']:
+        if not self.parent or self not in self.parent.children:
+            return None
+        siblings = self.parent.children
+        index = siblings.index(self)
+        return siblings[index + 1] if index + 1 < len(siblings) else None
+
     def get_enriched_info(self) -> Optional[Dict[str, Any]]:
         """
         非ブロッキングで拡充情報を取得
         """
-        if self.enriched_info is None:
-            self.enriched_info = self._llm_enrichment.get_enriched_info(self.name)
-        return self.enriched_info
+        return self._load_stored_enrichment()
 
     def save_state_snapshot(self):
-        """現在の状態をタイムスタンプ付きで保存"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        base_dir = "debug_logs/state_transitions"
-        os.makedirs(base_dir, exist_ok=True)
-        
-        # グラフの保存
-        dot = self.visualize_graph()
-        graph_path = f"{base_dir}/graph_{timestamp}.png"
-        dot.render(graph_path, format="png", cleanup=True)
-        
-        # 状態情報の保存
-        state_info = {
-            "timestamp": timestamp,
-            "node_name": self.name,
-            "local_state": self.local_state,
-            "children": [c.name for c in self.children],
-            "followers": [f.name for f in self.followers],
-            "description": self.basic_description
-        }
-        
-        state_path = f"{base_dir}/state_{timestamp}.json"
-        with open(state_path, "w", encoding="utf-8") as f:
-            json.dump(state_info, f, ensure_ascii=False, indent=2)
-            
-        print(f"[DEBUG] Saved state snapshot: {timestamp}")
+        """
+        現在の状態をタイムスタンプ付きで保存 (STATE_DEBUG_SINK=1 の場合のみ)
+        ここではレコードを作るだけで、グラフ描画・ファイル書き込みはデバッグシンクのワーカーが行う
+        """
+        sink = get_debug_sink()
+        if not sink.should_sample():
+            return
+        if sink.submit(build_state_record(self)):
+            self.__debug_print__(f"Queued state snapshot of {self.name}")
         
     def set_local_state(self, new_state: str):
         """状態を変更し、スナップショットを保存"""
@@ -0,0 +1,298 @@
+# state_machine_modules/debug_sink.py
+
+import json
+import os
+import queue
+import random
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+
+def build_tree_record(node) -> Dict[str, Any]:
+    """
+    BaseNode のサブツリーを描画用のシリアライズ可能な dict にする (Graphviz 不要、O(ノード数))
+
+    Returns:
+        Dict[str, Any]: {"tops": [name, ...], "nodes": {name: {"local_state", "children", "followers"}}}
+    """
+    tops = node.children if node.name == "__VROOT__" else [node]
+    nodes = {}
+    stack = list(tops)
+    while stack:
+        current = stack.pop()
+        if current.name in nodes:
+            continue
+        nodes[current.name] = {
+            "local_state": current.local_state,
+            "children": [c.name for c in current.children],
+            "followers": [f.name for f in current.followers],
+        }
+        stack.extend(current.children)
+        stack.extend(current.followers)
+    return {"tops": [t.name for t in tops], "nodes": nodes}
+
+
+def build_state_record(node) -> Dict[str, Any]:
+    """状態遷移時のスナップショット (JSON) とグラフ描画用の情報"""
+    return {
+        "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S_%f"),
+        "node_name": node.name,
+        "local_state": node.local_state,
+        "children": [c.name for c in node.children],
+        "followers": [f.name for f in node.followers],
+        "description": node.basic_description,
+        "graph": build_tree_record(node),
+    }
+
+
+def render_tree_record(graph: Dict[str, Any]):
+    """
+    build_tree_record の結果から Graphviz の Digraph を作る
+    1. __VROOT__ は描画スキップ（その子をトップ階層）
+    2. (START)/(END) とトップノードを同じrankに
+    3. BFSで node->depth
+    4. 同depthを rank="same" に
+    5. ノードは円形固定サイズ、階層ごとに枠線色 + 半透明で塗る
+    6. 子が複数 => (a->b: start, b->c: next, c->d: next, d->a: end)
+    """
+    import graphviz
+
+    nodes = graph["nodes"]
+    real_tops = [name for name in graph["tops"] if name in nodes]
+
+    # -----------------------------
+    # BFSで (node->depth) - 再帰的に全階層を取得
+    # -----------------------------
+    depth_map = {}
+    bfs_queue = deque((name, 0) for name in real_tops)
+    while bfs_queue:
+        name, depth = bfs_queue.popleft()
+        if name in depth_map or name not in nodes:
+            continue
+        depth_map[name] = depth
+        # 子ノードを深さ+1で、フォロワーノードを同じ深さで追加
+        for child in nodes[name]["children"]:
+            bfs_queue.append((child, depth + 1))
+        for follower in nodes[name]["followers"]:
+            bfs_queue.append((follower, depth))
+
+    if not depth_map:
+        return graphviz.Digraph("empty")
+
+    # -----------------------------
+    # Graphviz初期設定
+    # -----------------------------
+    dot = graphviz.Digraph("final_graph")
+    dot.attr("graph", rankdir="TB", ranksep="0.5", nodesep="0.5")
+    dot.attr("node",
+            shape="circle",
+            fixedsize="true",
+            width="2.5",
+            height="2",
+            style="filled",
+            fontname="MS Gothic",
+            fontweight="bold",
+            fontsize="15")
+    dot.attr("edge", fontname="MS Gothic")
+
+    # (START)/(END)は白背景・黒枠で固定
+    start_node = "(START)"
+    end_node   = "(END)"
+    dot.node(start_node, label="(START)", color="black", fillcolor="white", penwidth="2")
+    dot.node(end_node,   label="(END)",   color="black", fillcolor="white", penwidth="2")
+
+    # depthごとに仕分け
+    depth2nodes = {}
+    for name, d in depth_map.items():
+        depth2nodes.setdefault(d, []).append(name)
+    min_depth = min(depth2nodes.keys())
+
+    # 半透明用の色リスト
+    layer_colors = [
+        "#ff000030", "#ff800030", "#ffff0030", "#80ff0030", "#00ff0030",
+        "#00ff8030", "#00ffff30", "#0080ff30", "#0000ff30", "#8000ff30",
+        "#ff00ff30", "#ff008030"
+    ]
+
+    colors = [
+        "#ff0000", "#ff8000", "#ffff00", "#80ff00", "#00ff00",
+        "#00ff80", "#00ffff", "#0080ff", "#0000ff", "#8000ff",
+        "#ff00ff", "#ff0080"
+    ]
+
+    # 同じdepthを rank="same" で横並び
+    for d, names in depth2nodes.items():
+        with dot.subgraph(name=f"depth_{d}") as sub:
+            sub.attr(rank="same")
+            cidx = d % len(layer_colors)
+            for name in names:
+                sub.node(
+                    name,
+                    label=f"{name}\n({nodes[name]['local_state']})",
+                    color=colors[cidx],
+                    fillcolor=layer_colors[cidx],
+                    penwidth="5"
+                )
+
+    # (START)&(END) もトップ階層に rank="same" で配置
+    with dot.subgraph(name="rank_startend") as sub:
+        sub.attr(rank="same")
+        sub.node(start_node)
+        sub.node(end_node)
+
+    # -----------------------------
+    # エッジの描画 - 階層構造を明確に
+    # -----------------------------
+    visited_edges = set()
+
+    def add_edge(tail: str, head: str, **attrs):
+        if (tail, head) not in visited_edges:
+            dot.edge(tail, head, **attrs)
+            visited_edges.add((tail, head))
+
+    # トップノードと START/END の接続
+    for name in depth2nodes[min_depth]:
+        add_edge(start_node, name, label="start", constraint="false", penwidth="5")
+        add_edge(name, end_node, label="end", constraint="false", penwidth="5")
+
+    # 階層構造のエッジを描画
+    visited_nodes = set()
+
+    def add_edges(name: str):
+        if name in visited_nodes or name not in nodes:
+            return
+        visited_nodes.add(name)
+        children = nodes[name]["children"]
+        for i, child in enumerate(children):
+            if i == 0:
+                add_edge(name, child, label="detail", penwidth="5", color="#cccccc")
+            if i < len(children) - 1:
+                add_edge(child, children[i + 1], label="next", penwidth="5", color="black")
+            if i == len(children) - 1:
+                add_edge(child, name, label="back", penwidth="5", color="#cccccc")
+            add_edges(child)
+
+        for follower in nodes[name]["followers"]:
+            add_edge(name, follower, label="followed_by", penwidth="3", style="dashed", color="#666666")
+
+    for name in real_tops:
+        add_edges(name)
+
+    return dot
+
+
+class DebugSink:
+    """
+    状態遷移のスナップショット (JSON + グラフPNG) を書き出すデバッグ用シンク。
+
+    - 既定では無効 (STATE_DEBUG_SINK=1 で有効)
+    - submit() はレコードをキューに積むだけで、描画・書き込みはバックグラウンドスレッドで行う
+    - sample_rate でサンプリングし、キューが一杯なら捨てる
+    - 保存先のファイル数は max_snapshots 件に制限する (古いものから削除)
+    """
+
+    def __init__(self, enabled: bool = False, base_dir: str = "debug_logs/state_transitions",
+                 sample_rate: float = 1.0, max_snapshots: int = 200, render_graph: bool = True, max_queue_size: int = 100):
+        self.enabled = enabled
+        self.base_dir = base_dir
+        self.sample_rate = sample_rate
+        self.max_snapshots = max_snapshots
+        self.render_graph = render_graph
+        self.stats = {"submitted": 0, "sampled_out": 0, "dropped": 0, "written": 0, "errors": 0}
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_queue_size)
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'DebugSink':
+        return cls(
+            enabled=os.getenv("STATE_DEBUG_SINK", "").lower() in ("1", "true", "yes"),
+            base_dir=os.getenv("STATE_DEBUG_DIR", "debug_logs/state_transitions"),
+            sample_rate=float(os.getenv("STATE_DEBUG_SAMPLE_RATE", 1.0)),
+            max_snapshots=int(os.getenv("STATE_DEBUG_MAX_SNAPSHOTS", 200)),
+            render_graph=os.getenv("STATE_DEBUG_RENDER_GRAPH", "1").lower() in ("1", "true", "yes")
+        )
+
+    def should_sample(self) -> bool:
+        """有効かつサンプリングに当たった場合 True (レコード作成前に呼んで無駄な処理を避ける)"""
+        if not self.enabled:
+            return False
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.stats["sampled_out"] += 1
+            return False
+        return True
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """レコードを書き出しキューに積む (ブロックしない)"""
+        if not self.enabled:
+            return False
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(record)
+            self.stats["submitted"] += 1
+            return True
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+
+    def flush(self) -> None:
+        """キューに積まれたレコードの書き出しを待つ (テスト・終了処理用)"""
+        if self._worker is not None:
+            self._queue.join()
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="state-debug-sink", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            try:
+                self._write(record)
+                self.stats["written"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[DebugSink] Failed to write snapshot: {e}")
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        os.makedirs(self.base_dir, exist_ok=True)
+        timestamp = record["timestamp"]
+
+        if self.render_graph and record.get("graph"):
+            dot = render_tree_record(record["graph"])
+            dot.render(os.path.join(self.base_dir, f"graph_{timestamp}"), format="png", cleanup=True)
+
+        state_info = {k: v for k, v in record.items() if k != "graph"}
+        with open(os.path.join(self.base_dir, f"state_{timestamp}.json"), "w", encoding="utf-8") as f:
+            json.dump(state_info, f, ensure_ascii=False, indent=2)
+
+        self._apply_retention()
+
+    def _apply_retention(self) -> None:
+        """graph_* / state_* それぞれ新しい max_snapshots 件だけ残す (タイムスタンプ名順)"""
+        for prefix in ("graph_", "state_"):
+            files = sorted(f for f in os.listdir(self.base_dir) if f.startswith(prefix))
+            for f in files[:max(0, len(files) - self.max_snapshots)]:
+                try:
+                    os.remove(os.path.join(self.base_dir, f))
+                except OSError:
+                    pass
+
+
+_debug_sink: Optional[DebugSink] = None
+
+
+def get_debug_sink() -> DebugSink:
+    """環境変数で設定されたプロセス共通の DebugSink"""
+    global _debug_sink
+    if _debug_sink is None:
+        _debug_sink = DebugSink.from_env()
+    return _debug_sink
@@ -0,0 +1,98 @@
+# state_machine_modules/enrichment_pipeline.py
+
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Optional
+
+from dotenv import load_dotenv
+
+from neo4j_modules.care_kg_db import CareKgDB
+from planning_modules.state_machine_modules.llm_enrichment import LLMEnrichment
+
+
+def enrich_all_nodes(
+    kg_db: CareKgDB,
+    max_workers: int = 4,
+    force: bool = False,
+    limit: Optional[int] = None,
+    llm_enrichment: Optional[LLMEnrichment] = None
+) -> Dict[str, Any]:
+    """
+    全 instance ノードの detail_instruction / call_to_action / jp_title を生成し、
+    ノードのプロパティ (enriched_*) として保存するオフライン処理。
+
+    Args:
+        kg_db (CareKgDB): 対象のKG
+        max_workers (int): 同時に実行するLLM呼び出し数の上限
+        force (bool): True なら保存済みのノードも再生成する
+        limit (int, optional): 処理するノード数の上限
+        llm_enrichment (LLMEnrichment, optional): 使用するLLMEnrichment (省略時は新規作成)
+
+    Returns:
+        Dict[str, Any]: {"total": int, "enriched": int, "failed": [name, ...], "elapsed": float}
+    """
+    start = time.time()
+    nodes = kg_db.get_all_instance_nodes(only_missing_enrichment=not force)
+    if limit is not None:
+        nodes = nodes[:limit]
+
+    llm_enrichment = llm_enrichment or LLMEnrichment()
+    stats = {"total": len(nodes), "enriched": 0, "failed": [], "elapsed": 0.0}
+    print(f"[Enrichment Pipeline] {len(nodes)} nodes to enrich (workers={max_workers}, force={force})")
+
+    def _enrich(node: Dict[str, Any]) -> bool:
+        result = llm_enrichment._call_chain({
+            "node_name": node["name"],
+            "description": node["description"],
+        })
+        if not result:
+            return False
+        return kg_db.save_node_enrichment(node["name"], result, description=node["description"])
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(_enrich, node): node["name"] for node in nodes}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                if future.result():
+                    stats["enriched"] += 1
+                else:
+                    stats["failed"].append(name)
+            except Exception as e:
+                print(f"[Enrichment Pipeline] Error enriching {name}: {e}")
+                traceback.print_exc()
+                stats["failed"].append(name)
+
+    stats["elapsed"] = time.time() - start
+    print(f"[Enrichment Pipeline] done: {stats['enriched']}/{stats['total']} enriched, {len(stats['failed'])} failed, {stats['elapsed']:.1f}s")
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Precompute node enrichment for every instance node of the care KG.")
+    parser.add_argument("--workers", type=int, default=4, help="max concurrent LLM calls")
+    parser.add_argument("--force", action="store_true", help="regenerate nodes that are already enriched")
+    parser.add_argument("--limit", type=int, default=None, help="max number of nodes to process")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    kg_db = CareKgDB(
+        uri=os.getenv("NEO4J_URI"),
+        user=os.getenv("NEO4J_USERNAME"),
+        password=os.getenv("NEO4J_PASSWORD")
+    )
+    try:
+        kg_db.ensure_indexes()  # 名前検索用インデックスもここで作っておく
+        stats = enrich_all_nodes(kg_db, max_workers=args.workers, force=args.force, limit=args.limit)
+    finally:
+        kg_db.close()
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    # python -m planning_modules.state_machine_modules.enrichment_pipeline --workers 8
+    sys.exit(main())
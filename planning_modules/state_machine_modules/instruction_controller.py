@@ -211,15 +211,15 @@ class InstructionController:
             
         print(f"##### >>> [DEBUG:InstructionController] Current virtual_root children: {[node.name for node in self.instruction_graph.virtual_root.children]}")
         
-        # イベントをグラフの各ノードに伝播
-        for node in self.instruction_graph.virtual_root.children:
-            print(f"##### >>> [DEBUG:InstructionController] Setting event flag '{event_name}' for node: {node.name}")
-            if event_name == 'next_state':
-                node.set_event_flag('go_next')
-            elif event_name == 'go_detail':
-                node.set_event_flag('go_detail')
-            elif event_name == 'back_to_start':
-                node.set_event_flag('back_to_start')
+        # イベントはツリー全体で共有するキューに入れる (待機中のノードが受け取る)
+        node_event_name = {
+            'next_state': 'go_next',
+            'go_detail': 'go_detail',
+            'back_to_start': 'back_to_start'
+        }.get(event_name)
+        if node_event_name:
+            print(f"##### >>> [DEBUG:InstructionController] Setting event flag '{node_event_name}' for session")
+            self.instruction_graph.virtual_root.set_event_flag(node_event_name)
 
     def _send_instruction_candidates(self):
         """Activityクラスのトップノード候補を取得してクライアントに送信"""
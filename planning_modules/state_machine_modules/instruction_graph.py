@@ -1,6 +1,7 @@
 # planning_modules/state_machine_modules/instruction_graph.py
 
 from typing import List, Optional
+import os
 import traceback
 import eventlet
 
@@ -8,6 +9,14 @@ from neo4j_modules.care_kg_db import CareKgDB
 from planning_modules.lending_ear_modules.uot_modules.item import Item
 from planning_modules.state_machine_modules.base_node import BaseNode
 
+def lazy_tree_enabled() -> bool:
+    """
+    INSTRUCTION_LAZY_TREE=0 で従来どおりサブツリー全体を先に構築する。
+    既定では最初の状態をすぐ出せるよう、子ノードは先読みか最初の go_detail で構築する。
+    """
+    return os.getenv("INSTRUCTION_LAZY_TREE", "1").lower() not in ("0", "false", "no")
+
+
 class InstructionGraph:
     """
     複数トップノードを取得し、さらにトップノード間で follows 関係があればトポロジカルソート。
@@ -286,7 +295,8 @@ class InstructionGraph:
                 item_name=node_name,
                 kg_db=self.kg_db,
                 send_socket=self.send_socket,  # send_socket関数をそのまま渡す
-                is_debug=self.is_debug
+                is_debug=self.is_debug,
+                lazy=lazy_tree_enabled()
             )
             if node:
                 node.send_socket = self.send_socket  # インスタンス変数としても設定
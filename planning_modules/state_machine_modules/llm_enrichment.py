@@ -1,6 +1,6 @@
 from typing import Optional, Dict, Any, Callable
+from functools import lru_cache
 import eventlet
-from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.runnables import RunnableSequence
@@ -9,6 +9,9 @@ import json
 import os
 from dotenv import load_dotenv
 
+from planning_modules.llm_cache import cached_chain
+from planning_modules.llm_registry import get_llm
+
 load_dotenv()
 
 class _NodeEnrichmentResult(BaseModel):
@@ -27,21 +30,16 @@ class _NodeEnrichmentResult(BaseModel):
     )
 
 def get_enrichment_chain():
-    """意味的な順序付けのためのLLMチェーン"""
+    """ノード情報拡充のためのLLMチェーン (クライアントとチェーンはプロセスで1つだけ作る)"""
+    return cached_chain(_build_enrichment_chain())
+
+@lru_cache(maxsize=1)
+def _build_enrichment_chain():
     load_dotenv()
-    print("[DEBUG] Starting get_enrichment_chain...")
     model_name = os.getenv("OPENAI_MIDDLE_MODEL", "gpt-4o")
-    print(f"[DEBUG] Using model: {model_name}")
-        
-    llm = ChatOpenAI(
-        model=model_name,
-        api_key=os.getenv("OPENAI_API_KEY")
-    ).bind(
-        response_format={"type": "json_object"}
-    )
+    print(f"[DEBUG] Creating enrichment chain: model={model_name}")
+    llm = get_llm("openai", model_name, json_mode=True)
 
-    print("[DEBUG] Created ChatOpenAI instance")
-    
     # 出力パーサー
     output_parser = JsonOutputParser(pydantic_object=_NodeEnrichmentResult)
     
@@ -51,22 +49,44 @@ def get_enrichment_chain():
         partial_variables={"format_instructions": output_parser.get_format_instructions()}
     )
     
-    chain = prompt | llm | output_parser
-    print("[DEBUG] Created chain")
-    
-    return chain
+    return prompt | llm | output_parser
+
+# ストリーミングで差分を送るフィールド
+STREAMED_FIELDS = ("call_to_action", "detail_instruction", "jp_title")
+
+def streaming_enabled() -> bool:
+    """INSTRUCTION_STREAMING=0 で生成途中のテキストの送信を止める"""
+    return os.getenv("INSTRUCTION_STREAMING", "1").lower() not in ("0", "false", "no")
 
 class LLMEnrichment:
     def __init__(self):
-        self.chain = get_enrichment_chain()
-        
+        # チェーン (OpenAI のクライアント) は最初に生成するときに作る。ノードを組み立てるだけなら API キーは要らない
+        self._chain = None
+
+    @property
+    def chain(self):
+        if self._chain is None:
+            self._chain = get_enrichment_chain()
+        return self._chain
+
+    @chain.setter
+    def chain(self, chain):
+        self._chain = chain
+
     def enrich_node_info(
         self,
         node_name: str,
         description: str,
-        callback: Callable[[Dict[str, Any]], None]
+        callback: Callable[[Dict[str, Any]], None],
+        on_delta: Optional[Callable[[str, str, str], None]] = None
     ) -> None:
-        """ノード情報を拡充（非同期実行）"""
+        """
+        ノード情報を拡充（非同期実行）
+
+        on_delta を渡すとストリーミングで生成し、STREAMED_FIELDS のテキストが伸びるたびに
+        on_delta(field, delta, text) を呼ぶ (text はそのフィールドのここまでの全文)。
+        callback には従来どおり完成した結果を渡す。
+        """
         try:
             input_data = {
                 "node_name": node_name,
@@ -75,7 +95,10 @@ class LLMEnrichment:
             
             # 非同期で生成開始、完了時にコールバックを呼び出す
             def _enrich_and_callback():
-                result = self._call_chain(input_data)
+                if on_delta is not None:
+                    result = self._stream_chain(input_data, on_delta)
+                else:
+                    result = self._call_chain(input_data)
                 if result:
                     callback(result)
             
@@ -96,6 +119,40 @@ class LLMEnrichment:
             print(f"[LLM Enrichment] エラー発生: {e}")
             return None
 
+    def _stream_chain(self, input_data: Dict[str, Any], on_delta: Callable[[str, str, str], None]) -> Optional[Dict[str, Any]]:
+        """
+        チェーンをストリーミングで実行する同期メソッド。
+        JsonOutputParser は途中までの JSON を dict にして流すので、フィールドごとに前回からの差分を取り出す。
+        """
+        try:
+            print(f"\n[LLM Enrichment] 入力データ (stream): {json.dumps(input_data, ensure_ascii=False, indent=2)}")
+            texts: Dict[str, str] = {}
+            result = None
+            for partial in self.chain.stream(input_data):
+                if not isinstance(partial, dict):
+                    continue
+                result = partial
+                for field in STREAMED_FIELDS:
+                    text = partial.get(field)
+                    previous = texts.get(field, "")
+                    if not isinstance(text, str) or text == previous:
+                        continue
+                    # 途中で書き直された場合は全文を差分として送る
+                    delta = text[len(previous):] if text.startswith(previous) else text
+                    texts[field] = text
+                    try:
+                        on_delta(field, delta, text)
+                    except Exception as e:
+                        print(f"[LLM Enrichment] on_delta エラー: {e}")
+            if result is None:
+                return None
+            enriched_data = result.dict() if hasattr(result, 'dict') else result
+            print(f"\n[LLM Enrichment] 生成結果: {json.dumps(enriched_data, ensure_ascii=False, indent=2)}")
+            return enriched_data
+        except Exception as e:
+            print(f"[LLM Enrichment] エラー発生: {e}")
+            return None
+
 PROMPT = """
 認知症の方をサポートするための情報を拡充します。以下の情報を元に、分かりやすく具体的な説明を生成してください。
 
@@ -0,0 +1,83 @@
+# state_machine_modules/node_events.py
+
+import time
+from typing import Optional, Callable, Set
+
+import eventlet
+from eventlet.event import Event
+
+
+# 優先順位 (先頭ほど優先)
+EVENT_PRIORITY = ("back_to_start", "back_previous", "go_detail", "go_next")
+
+
+class NodeEventQueue:
+    """
+    インストラクションセッション単位のイベントキュー。
+
+    - 同名イベントは1つにまとめる (以前のフラグと同じ扱い)
+    - get() はイベントが届くまでブロックし、ポーリングしない
+    - 複数のイベントが溜まっている場合は EVENT_PRIORITY の順で返す
+    """
+
+    def __init__(self):
+        self._pending: Set[str] = set()
+        self._waiter: Optional[Event] = None
+
+    def put(self, event_name: str) -> bool:
+        """イベントを追加して待機中のノードを起こす。未知のイベントは False"""
+        if event_name not in EVENT_PRIORITY:
+            return False
+        self._pending.add(event_name)
+        waiter = self._waiter
+        if waiter is not None and not waiter.ready():
+            waiter.send(True)
+        return True
+
+    def is_pending(self, event_name: str) -> bool:
+        return event_name in self._pending
+
+    def discard(self, event_name: str) -> None:
+        self._pending.discard(event_name)
+
+    def clear(self) -> None:
+        self._pending.clear()
+
+    def get(self, timeout: Optional[float] = None, can_deliver: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        """
+        最優先のイベントを取り出す。届くまでブロックする。
+
+        Args:
+            timeout (float, optional): 最大待機秒数。None なら無期限
+            can_deliver (Callable[[str], bool], optional): False を返したイベントは捨てる (例: 子ノードが無い時の go_detail)
+
+        Returns:
+            Optional[str]: イベント名。timeout した場合は None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            event_name = self._pop(can_deliver)
+            if event_name is not None:
+                return event_name
+
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+
+            self._waiter = Event()
+            try:
+                with eventlet.Timeout(remaining, False):
+                    self._waiter.wait()
+            finally:
+                self._waiter = None
+
+    def _pop(self, can_deliver: Optional[Callable[[str], bool]]) -> Optional[str]:
+        for event_name in EVENT_PRIORITY:
+            if event_name not in self._pending:
+                continue
+            self._pending.discard(event_name)
+            if can_deliver is None or can_deliver(event_name):
+                return event_name
+        return None
@@ -0,0 +1,119 @@
+# presort_pipeline.py
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import traceback
+from typing import Dict, Any, Optional
+
+from dotenv import load_dotenv
+
+from neo4j_modules.care_kg_db import CareKgDB
+from planning_modules.state_machine_modules.sort_utils import (
+    is_valid_order, ordering_key, semantic_order, sort_inputs_from_subtree, topo_sort_with_parallel_check
+)
+
+
+def presort_all_parents(
+    kg_db: CareKgDB,
+    max_workers: int = 4,
+    force: bool = False,
+    limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    子ノードを持つ全ノードについて、子ノードの意味的な並び順を LLM で生成し、
+    親ノードのプロパティ (child_order / child_order_key) として保存するオフライン処理。
+    実行時のツリー構築 (instruction_sort_sync) は保存済みの並び順を使うので LLM を呼ばない。
+
+    Args:
+        kg_db (CareKgDB): 対象のKG
+        max_workers (int): 同時に実行するLLM呼び出し数の上限
+        force (bool): True なら保存済みで有効な並び順も再生成する
+        limit (int, optional): 処理する親ノード数の上限
+
+    Returns:
+        Dict[str, Any]: {"total": int, "sorted": int, "cached": int, "no_parallel": int, "failed": [name, ...], "elapsed": float}
+    """
+    start = time.time()
+    parents = kg_db.get_parent_names()
+    if limit is not None:
+        parents = parents[:limit]
+
+    stats = {"total": len(parents), "sorted": 0, "cached": 0, "no_parallel": 0, "failed": [], "elapsed": 0.0}
+    print(f"[Presort Pipeline] {len(parents)} parents to sort (workers={max_workers}, force={force})")
+
+    # KG からの読み込みは先にまとめて行い、LLM 呼び出しだけを並行させる
+    jobs = []
+    for parent in parents:
+        subtree = kg_db.get_subtree(parent)
+        if not subtree:
+            stats["failed"].append(parent)
+            continue
+        nodes = subtree['nodes']
+        includes, adjacency_lists, description_map = sort_inputs_from_subtree(parent, nodes)
+        _, has_parallel = topo_sort_with_parallel_check(includes, adjacency_lists)
+        if not has_parallel:
+            stats["no_parallel"] += 1
+            continue
+
+        key = ordering_key(parent, includes, adjacency_lists, description_map)
+        stored = nodes[parent].get('child_order')
+        if not force and stored and stored.get("key") == key and is_valid_order(stored.get("order"), includes, adjacency_lists):
+            stats["cached"] += 1
+            continue
+        jobs.append((parent, key, includes, adjacency_lists, description_map))
+
+    async def _sort_all():
+        semaphore = asyncio.Semaphore(max(1, max_workers))
+
+        async def _sort(parent, key, includes, adjacency_lists, description_map):
+            async with semaphore:
+                try:
+                    order, source = await semantic_order(includes, adjacency_lists, description_map, parent=parent, use_cache=False)
+                except Exception as e:
+                    print(f"[Presort Pipeline] Error sorting {parent}: {e}")
+                    traceback.print_exc()
+                    return parent, False
+            if source != "llm":
+                return parent, False
+            return parent, kg_db.save_child_order(parent, key, order)
+
+        return await asyncio.gather(*(_sort(*job) for job in jobs))
+
+    for parent, saved in asyncio.run(_sort_all()):
+        if saved:
+            stats["sorted"] += 1
+        else:
+            stats["failed"].append(parent)
+
+    stats["elapsed"] = time.time() - start
+    print(f"[Presort Pipeline] done: {stats['sorted']} sorted, {stats['cached']} already sorted, "
+          f"{stats['no_parallel']} without parallel children, {len(stats['failed'])} failed, {stats['elapsed']:.1f}s")
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Precompute the semantic order of the children of every parent node of the care KG.")
+    parser.add_argument("--workers", type=int, default=4, help="max concurrent LLM calls")
+    parser.add_argument("--force", action="store_true", help="re-sort parents that already have a valid order")
+    parser.add_argument("--limit", type=int, default=None, help="max number of parents to process")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    kg_db = CareKgDB(
+        uri=os.getenv("NEO4J_URI"),
+        user=os.getenv("NEO4J_USERNAME"),
+        password=os.getenv("NEO4J_PASSWORD")
+    )
+    try:
+        stats = presort_all_parents(kg_db, max_workers=args.workers, force=args.force, limit=args.limit)
+    finally:
+        kg_db.close()
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    # python -m planning_modules.state_machine_modules.presort_pipeline --workers 8
+    sys.exit(main())
@@ -2,6 +2,7 @@ from enum import Enum
 
 class SocketEventType(Enum):
     NEXT_STATE_INFO = "next_state_info"
+    NEXT_STATE_INFO_DELTA = "next_state_info_delta"  # 生成途中の call_to_action / detail_instruction (最後に next_state_info で確定)
     INSTRUCTION = "instruction"
     TELLUSER = "telluser"
     CALL_TO_ACTION = "call_to_action"
@@ -1,9 +1,12 @@
 # sorting_utils.py
 
 import asyncio
-from typing import List, Dict, Tuple
-from collections import deque
+import hashlib
+from typing import Any, List, Dict, Optional, Tuple
+from collections import OrderedDict, deque
+from functools import lru_cache
 import json
+import threading
 import traceback
 import os
 from dotenv import load_dotenv
@@ -12,13 +15,13 @@ from dotenv import load_dotenv
 from langchain.prompts import PromptTemplate, ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from langchain_core.runnables.base import RunnableSequence
-# モデル例: ChatOpenAI
-
-from langchain_openai import ChatOpenAI
 
 # Pydantic
 from pydantic import BaseModel, Field
 
+from planning_modules.llm_cache import cached_chain
+from planning_modules.llm_registry import get_llm
+
 
 
 class _SemanticSortResult(BaseModel):
@@ -63,27 +66,145 @@ prompt_template_semantic_sort = PromptTemplate.from_template(
 )
 
 
+@lru_cache(maxsize=1)
 def get_semantic_sort_chain():
-    """意味的な順序付けのためのLLMチェーン"""
+    """意味的な順序付けのためのLLMチェーン (プロセスで1つだけ作り、共有クライアントを使う)"""
     load_dotenv()
-    print("[DEBUG] Starting get_semantic_sort_chain...")
     model_name = os.getenv("OPENAI_LIGHT_MODEL", "chatgpt-4o-latest")
-    print(f"[DEBUG] Using model: {model_name}")
-        
-    llm = ChatOpenAI(
-        model=model_name,
-        api_key=os.getenv("OPENAI_API_KEY")
-    ).bind(
-        response_format={"type": "json_object"}
-    )
-
-    print("[DEBUG] Created ChatOpenAI instance")
-    
+    print(f"[DEBUG] Creating semantic sort chain: model={model_name}")
 
+    llm = get_llm("openai", model_name, json_mode=True)
     chain = prompt_template_semantic_sort | llm | output_parser_semantic_sort
-    print("[DEBUG] Created chain")
-    
-    return chain
+    return cached_chain(chain)
+
+
+class OrderingCache:
+    """
+    意味的な並び順 (ordering_key -> 子ノード名のリスト) のプロセス内キャッシュ。
+
+    プロセスをまたいで使う並び順は KG の親ノードのプロパティ (child_order / child_order_key) に保存する
+    (presort_pipeline で一括生成し、オントロジーのスナップショット経由で読む)。
+    キャッシュから取り出した並び順は、毎回 FOLLOWS の制約を満たすか確認してから使う。
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._orders: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "stored_hits": 0, "misses": 0, "invalid": 0, "llm_calls": 0, "llm_failures": 0}
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            order = self._orders.get(key)
+            if order is not None:
+                self._orders.move_to_end(key)
+            return list(order) if order is not None else None
+
+    def set(self, key: str, order: List[str]) -> None:
+        with self._lock:
+            self._orders[key] = list(order)
+            self._orders.move_to_end(key)
+            while len(self._orders) > self.max_entries:
+                self._orders.popitem(last=False)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._orders.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._orders)
+        return stats
+
+
+_ordering_cache: Optional[OrderingCache] = None
+_ordering_cache_lock = threading.Lock()
+
+
+def get_ordering_cache() -> OrderingCache:
+    global _ordering_cache
+    with _ordering_cache_lock:
+        if _ordering_cache is None:
+            _ordering_cache = OrderingCache(max_entries=int(os.getenv("ORDERING_CACHE_MAX_ENTRIES", 4096)))
+        return _ordering_cache
+
+
+def _constraint_pairs(includes: List[str], adjacency_lists: Dict[str, List[str]]) -> List[Tuple[str, str]]:
+    """includes 内の (src, dst) の組 (src follows dst => dst が先)"""
+    members = set(includes)
+    return sorted({
+        (src, dst)
+        for src, follows in adjacency_lists.items()
+        for dst in follows
+        if src in members and dst in members and src != dst
+    })
+
+
+def ordering_key(
+    parent: Optional[str],
+    includes: List[str],
+    adjacency_lists: Dict[str, List[str]],
+    description_map: Dict[str, str]
+) -> str:
+    """
+    並び順のキャッシュキー: (親, 子ノードの集合, 順序制約, description のハッシュ)
+    KG の取得順や description の変更以外の違いでは変わらない
+    """
+    descriptions = json.dumps({nm: description_map.get(nm, "") for nm in sorted(includes)}, ensure_ascii=False, sort_keys=True)
+    payload = json.dumps({
+        "parent": parent,
+        "children": sorted(includes),
+        "constraints": _constraint_pairs(includes, adjacency_lists),
+        "descriptions": hashlib.sha256(descriptions.encode("utf-8")).hexdigest(),
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_valid_order(order: Optional[List[str]], includes: List[str], adjacency_lists: Dict[str, List[str]]) -> bool:
+    """order が includes の並べ替え (過不足・重複なし) で、FOLLOWS の制約 (dst が src より先) を満たすか"""
+    if not order or len(order) != len(includes) or set(order) != set(includes):
+        return False
+    position = {nm: i for i, nm in enumerate(order)}
+    if len(position) != len(order):
+        return False
+    return all(position[dst] < position[src] for src, dst in _constraint_pairs(includes, adjacency_lists))
+
+
+def lookup_semantic_order(
+    key: str,
+    includes: List[str],
+    adjacency_lists: Dict[str, List[str]],
+    stored_order: Optional[Dict[str, Any]] = None
+) -> Optional[List[str]]:
+    """
+    LLM を呼ばずに使える並び順を探す (プロセス内キャッシュ → KG に保存済みの並び順)
+
+    Args:
+        stored_order (Optional[Dict[str, Any]]): KG の親ノードに保存された {"key": str, "order": [str]}
+    """
+    cache = get_ordering_cache()
+    order = cache.get(key)
+    if order is not None:
+        if is_valid_order(order, includes, adjacency_lists):
+            cache.count("memory_hits")
+            return order
+        cache.count("invalid")
+
+    if stored_order and stored_order.get("key") == key:
+        order = list(stored_order.get("order") or [])
+        if is_valid_order(order, includes, adjacency_lists):
+            cache.count("stored_hits")
+            cache.set(key, order)
+            return order
+        cache.count("invalid")
+
+    cache.count("misses")
+    return None
 
 
 
@@ -124,10 +245,9 @@ async def run_semantic_sort(
             print("[ERROR] Failed to get semantic sort chain")
             return []
 
-        # asyncでainvoke
         print("[DEBUG] Invoking chain with inputs...")
-
-        result_obj = chain.invoke({
+        get_ordering_cache().count("llm_calls")
+        result_obj = await chain.ainvoke({
             "item_list": items_str,
             "constraints": constraints_str,
         })
@@ -196,15 +316,17 @@ def topo_sort_with_parallel_check(
     return result, has_parallel
 
 
-async def instruction_sort(
+async def semantic_order(
     includes: List[str],
     adjacency_lists: Dict[str, List[str]],
-    description_map: Dict[str, str]
-) -> List[str]:
+    description_map: Dict[str, str],
+    parent: Optional[str] = None,
+    stored_order: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True
+) -> Tuple[List[str], str]:
     """
-    - トポロジカルソートで最低限の依存関係を確定
-    - 並列があれば run_semantic_sort
-    - 失敗時はフォールバック (topo結果)
+    子ノードの並び順と、その出どころを返す
+    ("topo": 並列なし / 失敗時のフォールバック, "cache": キャッシュ・KG に保存済み, "llm": 新たに LLM で並べ替えた)
     """
     topo_result, has_parallel = topo_sort_with_parallel_check(includes, adjacency_lists)
     print(f"[INFO] topo_result={topo_result}, has_parallel={has_parallel}")
@@ -212,28 +334,55 @@ async def instruction_sort(
     if not has_parallel:
         # 並列が無い => そのまま返す
         print("[INFO] No parallel => skip semantic sort.")
-        return topo_result
+        return topo_result, "topo"
+
+    key = ordering_key(parent, includes, adjacency_lists, description_map)
+    if use_cache:
+        cached = lookup_semantic_order(key, includes, adjacency_lists, stored_order)
+        if cached is not None:
+            print(f"[INFO] Cached order => {cached}")
+            return cached, "cache"
 
     # 並列がある => LLMで並び替え
     new_order = await run_semantic_sort(topo_result, adjacency_lists, description_map)
-    if not new_order:
-        print("[WARN] LLM reorder failed => fallback to topo_result.")
-        return topo_result
-    else:
-        print(f"[INFO] LLM reorder success => {new_order}")
-        return new_order
+    if not is_valid_order(new_order, includes, adjacency_lists):
+        print(f"[WARN] LLM reorder failed or broke the constraints ({new_order}) => fallback to topo_result.")
+        get_ordering_cache().count("llm_failures")
+        return topo_result, "topo"
+
+    print(f"[INFO] LLM reorder success => {new_order}")
+    get_ordering_cache().set(key, new_order)
+    return new_order, "llm"
+
+
+async def instruction_sort(
+    includes: List[str],
+    adjacency_lists: Dict[str, List[str]],
+    description_map: Dict[str, str],
+    parent: Optional[str] = None,
+    stored_order: Optional[Dict[str, Any]] = None
+) -> List[str]:
+    """
+    - トポロジカルソートで最低限の依存関係を確定
+    - 並列があればキャッシュ済みの並び順、無ければ run_semantic_sort
+    - 失敗時はフォールバック (topo結果)
+    """
+    order, _ = await semantic_order(includes, adjacency_lists, description_map, parent=parent, stored_order=stored_order)
+    return order
 
 
 def instruction_sort_sync(
     includes: List[str],
     adjacency_lists: Dict[str, List[str]],
-    description_map: Dict[str, str]
+    description_map: Dict[str, str],
+    parent: Optional[str] = None,
+    stored_order: Optional[Dict[str, Any]] = None
 ) -> List[str]:
     """
     同期バージョンのinstruction_sort
     - トポロジカルソートで最低限の依存関係を確定
-    - 並列があれば run_semantic_sort
-    - 失敗時はフォールバック (topo結果)
+    - 並列があればキャッシュ・KG に保存済みの並び順を使う (LLM は呼ばない)
+    - 無ければトポロジカルソートの結果
     """
     topo_result, has_parallel = topo_sort_with_parallel_check(includes, adjacency_lists)
     print(f"[INFO] topo_result={topo_result}, has_parallel={has_parallel}")
@@ -243,8 +392,33 @@ def instruction_sort_sync(
         print("[INFO] No parallel => skip semantic sort.")
         return topo_result
 
-    # 並列がある場合も、とりあえずトポロジカルソートの結果を返す
-    # LLMによる並び替えは非同期版のみで実装
-    print("[INFO] Has parallel but sync version => use topo_result")
+    cached = lookup_semantic_order(ordering_key(parent, includes, adjacency_lists, description_map), includes, adjacency_lists, stored_order)
+    if cached is not None:
+        print(f"[INFO] Cached order => {cached}")
+        return cached
+
+    # LLMによる並び替えは非同期版と presort_pipeline で行う
+    print("[INFO] Has parallel but no cached order => use topo_result")
     return topo_result
 
+
+def sort_inputs_from_subtree(parent: str, nodes: Dict[str, Dict[str, Any]], path: Optional[set] = None) -> Tuple[List[str], Dict[str, List[str]], Dict[str, str]]:
+    """
+    CareKgDB.get_subtree の nodes から parent の子ノードの並べ替えに使う (includes, adjacency_lists, description_map) を作る
+    path (祖先) に含まれる子ノードは循環になるので除外する
+    """
+    path = path or {parent}
+    includes_names = [nm for nm in nodes.get(parent, {}).get('children', []) if nm in nodes and nm not in path]
+
+    # followsを取得
+    adjacency_lists = {}
+    for inc_name in includes_names:
+        flist = nodes[inc_name]['followers']
+        flist_in = [f for f in flist if f in includes_names and f != inc_name]
+        if flist_in:
+            adjacency_lists[inc_name] = flist_in
+
+    # descriptionを取得
+    description_map = {inc_name: nodes[inc_name]['description'] or "" for inc_name in includes_names}
+    return includes_names, adjacency_lists, description_map
+
@@ -0,0 +1,34 @@
+import sys
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from neo4j_modules import care_kg_db
+from neo4j_modules.care_kg_db import CareKgDB, close_all_drivers, get_pool_metrics
+
+
+def test_views_share_one_driver():
+    # ドライバーは遅延接続なので、サーバーが無くても作成できる
+    close_all_drivers()
+    created = get_pool_metrics()["drivers_created"]
+
+    db_a = CareKgDB("bolt://localhost:7687", "neo4j", "password", user_uuid="a")
+    db_b = CareKgDB("localhost:7687", "neo4j", "password", user_uuid="b")
+    db_c = CareKgDB("bolt://localhost:7687", "neo4j", "password", user_uuid="c")
+
+    assert db_a.driver is db_c.driver
+    assert db_a.driver is not db_b.driver  # URI が異なる (neo4j+s://)
+    assert get_pool_metrics()["drivers_created"] == created + 2
+    assert get_pool_metrics()["active_drivers"] == 2
+
+    # close() は共有ドライバーを閉じない
+    driver = db_a.driver
+    db_a.close()
+    assert db_c.driver is driver
+    assert CareKgDB("bolt://localhost:7687", "neo4j", "password").driver is driver
+
+    close_all_drivers()
+    assert get_pool_metrics()["active_drivers"] == 0
+
+
+def test_pool_config_from_env(monkeypatch):
+    monkeypatch.setenv("NEO4J_MAX_POOL_SIZE", "7")
+    assert care_kg_db.get_pool_config()["max_connection_pool_size"] == 7
@@ -0,0 +1,40 @@
+import sys
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from neo4j_modules.care_kg_db import lucene_query, relation_type
+from neo4j_modules.ontology_cache import OntologySnapshot
+
+
+def make_snapshot():
+    names = ["wash_face", "Wash_Hands", "change_clothes", "brush_teeth"]
+    nodes = {
+        name: {
+            "name": name, "description": None, "detail_description": None, "time_to_achieve": 1, "name_jp": None,
+            "labels": ["Action"], "enrichment": None, "children": [], "followers": []
+        }
+        for name in names
+    }
+    return OntologySnapshot(nodes, version=1)
+
+
+def test_exact_and_case_folded_lookup():
+    snapshot = make_snapshot()
+    assert snapshot.find("wash_face") == ["wash_face"]
+    assert snapshot.find("WASH_HANDS") == ["Wash_Hands"]
+    assert snapshot.find("wash") == []  # 完全一致モードでは部分一致しない
+
+
+def test_fuzzy_lookup_is_ranked():
+    snapshot = make_snapshot()
+    assert snapshot.find("wash", fuzzy=True) == ["wash_face", "Wash_Hands"]  # 短い名前ほど類似度が高い
+    assert snapshot.find("wash_fase", fuzzy=True)[0] == "wash_face"
+    assert snapshot.find("wash_face", fuzzy=True, limit=1) == ["wash_face"]
+    assert snapshot.find("zzz", fuzzy=True) == []
+
+
+def test_relation_type_and_lucene_escape():
+    assert relation_type("usesObject") == "USES_OBJECT"
+    assert relation_type("includes") == "INCLUDES"
+    assert relation_type("causesTrouble") == "CAUSES_TROUBLE"
+    # 正規表現や Lucene の特殊文字がそのままクエリに入らない
+    assert lucene_query("a.*(b") == r"(a.\*\(b^3 OR a.\*\(b*^2 OR a.\*\(b~)"
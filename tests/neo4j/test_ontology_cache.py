@@ -0,0 +1,129 @@
+import sys
+import time
+
+import eventlet
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from neo4j_modules.ontology_cache import OntologyCache, OntologySnapshot
+
+
+def make_node(name, labels=("Activity",), children=(), followers=(), detail_description=None):
+    return {
+        "name": name, "description": f"{name}の説明", "detail_description": detail_description,
+        "time_to_achieve": 5, "name_jp": f"{name}_jp", "labels": list(labels), "enrichment": None,
+        "children": list(children), "followers": list(followers)
+    }
+
+
+def make_nodes():
+    return {
+        "morning": make_node("morning", children=["wash_face", "change_clothes"]),
+        "wash_face": make_node("wash_face", labels=("Action",), children=["rinse"], detail_description="顔を洗う"),
+        "change_clothes": make_node("change_clothes", labels=("Action",), followers=["wash_face"]),
+        "rinse": make_node("rinse", labels=("Object",)),
+        "evening": make_node("evening", labels=("Task",)),
+    }
+
+
+def test_snapshot_queries():
+    snapshot = OntologySnapshot(make_nodes(), version=1)
+    assert snapshot.top_names == ["morning", "evening"]
+    assert [n["name"] for n in snapshot.top_nodes_with_label("Activity")] == ["morning"]
+    assert snapshot.children("morning") == ["wash_face", "change_clothes"]
+    assert snapshot.followers("change_clothes") == ["wash_face"]
+    assert snapshot.top_node("rinse") == "morning"
+    assert snapshot.top_node("morning") is None
+    assert snapshot.description("wash_face") == "顔を洗う"
+    assert snapshot.full_info("rinse")["description"] == "rinseの説明"
+    assert {n["name"] for n in snapshot.uot_nodes()} == {"morning", "wash_face", "change_clothes", "evening"}
+    assert set(snapshot.subtree("wash_face")["nodes"]) == {"wash_face", "rinse"}
+    # 1 段分だけでも、各ノードの children は全件
+    shallow = snapshot.subtree("morning", max_depth=1)["nodes"]
+    assert set(shallow) == {"morning", "wash_face", "change_clothes"}
+    assert shallow["wash_face"]["children"] == ["rinse"]
+    assert set(snapshot.subtree("morning", max_depth=0)["nodes"]) == {"morning"}
+
+
+def test_cache_loads_once_and_invalidates():
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return make_nodes()
+
+    cache = OntologyCache(loader, refresh_interval=600)
+    first = cache.get()
+    assert cache.get() is first
+    assert len(loads) == 1
+
+    cache.invalidate()
+    assert cache.get() is first  # 古いスナップショットを返しつつバックグラウンドで再読み込み
+    for _ in range(100):
+        if cache.version == 2:
+            break
+        time.sleep(0.01)
+    assert cache.version == 2
+    assert cache.get() is not first
+
+
+def test_failed_load_keeps_previous_snapshot():
+    results = [make_nodes()]
+
+    def loader():
+        if not results:
+            raise RuntimeError("neo4j unavailable")
+        return results.pop()
+
+    cache = OntologyCache(loader, refresh_interval=600)
+    first = cache.get()
+    cache.invalidate()
+    assert cache.refresh() is first
+    assert OntologyCache(loader).get() is None
+
+
+def test_concurrent_first_load_runs_loader_once_without_blocking_the_hub():
+    loads = []
+
+    def loader():
+        loads.append(1)
+        eventlet.sleep(0.05)  # Neo4j の応答待ちの間に他のグリーンレットが動く
+        return make_nodes()
+
+    cache = OntologyCache(loader, poll_interval=0.005)
+    ticks = []
+
+    def ticker():
+        for _ in range(3):
+            ticks.append(1)
+            eventlet.sleep(0.01)
+
+    readers = [eventlet.spawn(cache.get) for _ in range(3)]
+    other = eventlet.spawn(ticker)
+    snapshots = [reader.wait() for reader in readers]
+    other.wait()
+    assert len(loads) == 1
+    assert snapshots[0] is not None and all(snapshot is snapshots[0] for snapshot in snapshots)
+    assert len(ticks) == 3
+
+
+def test_stale_snapshot_is_served_while_reloading():
+    loads = []
+
+    def loader():
+        loads.append(1)
+        if len(loads) > 1:
+            eventlet.sleep(0.05)
+        return make_nodes()
+
+    cache = OntologyCache(loader, refresh_interval=600)
+    first = cache.get()
+    cache.invalidate()
+    reloading = eventlet.spawn(cache.refresh)
+    eventlet.sleep(0)
+
+    # 読み込み中は待たずに古いスナップショットを返し、二重に読み込まない
+    assert cache.refresh() is first
+    assert cache.get() is first
+    second = reloading.wait()
+    assert second is not first and cache.get() is second
+    assert len(loads) == 2 and cache.version == 2
@@ -0,0 +1,78 @@
+import sys
+
+import eventlet
+import pytest
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.state_machine_modules import base_node
+
+ENRICHMENT = {"detail_instruction": "", "call_to_action": "", "jp_title": ""}
+
+
+class OfflineEnrichment:
+    """LLMEnrichment の代わり。LLM を呼ばずに (OPENAI_API_KEY なしで) 空の説明文を返す"""
+    def enrich_node_info(self, node_name, description, callback, on_delta=None):
+        callback(dict(ENRICHMENT))
+
+
+@pytest.fixture(autouse=True)
+def offline_enrichment(monkeypatch):
+    # ストリーミングを確かめるテストなどは、テストの中でさらに上書きする
+    monkeypatch.setattr(base_node, "LLMEnrichment", OfflineEnrichment)
+
+
+class FakeKgDb:
+    """
+    CareKgDB の代わり。nodes ({name: make_node(...)}) から get_subtree と同じく max_depth 段下までを返す。
+    ここに無いクエリは失敗させる (N+1 クエリが無いことの確認)。
+    """
+    def __init__(self, nodes, delay=0.0):
+        self.nodes = nodes
+        self.delay = delay
+        self.calls = []  # get_subtree の (root_name, max_depth)
+        self.saved = {}  # save_child_order で保存した (key, order)
+
+    def get_subtree(self, root_name, max_depth=None):
+        self.calls.append((root_name, max_depth))
+        eventlet.sleep(self.delay)
+        if root_name not in self.nodes:
+            return None
+        result, frontier, depth = {}, [root_name], 0
+        while frontier:
+            next_frontier = []
+            for name in frontier:
+                if name in result or name not in self.nodes:
+                    continue
+                result[name] = dict(self.nodes[name])
+                if max_depth is None or depth < max_depth:
+                    next_frontier.extend(self.nodes[name]["children"])
+            frontier, depth = next_frontier, depth + 1
+        return {"root": root_name, "nodes": result}
+
+    def get_parent_names(self):
+        return sorted(name for name, node in self.nodes.items() if node["children"])
+
+    def save_child_order(self, item_name, key, order):
+        self.saved[item_name] = (key, order)
+        self.nodes[item_name] = {**self.nodes[item_name], "child_order": {"key": key, "order": order}}
+        return True
+
+    def __getattr__(self, name):
+        raise AssertionError(f"unexpected query: {name}")
+
+
+@pytest.fixture
+def make_node():
+    """make_node(name, children=(), followers=(), child_order=None) -> get_subtree の 1 ノード分"""
+    def make(name, children=(), followers=(), child_order=None):
+        return {
+            "name": name, "description": f"{name}の説明", "time_to_achieve": 1, "name_jp": None,
+            "enrichment": ENRICHMENT, "child_order": child_order, "children": list(children), "followers": list(followers)
+        }
+    return make
+
+
+@pytest.fixture
+def fake_kg_db():
+    """fake_kg_db(nodes, delay=0.0) -> FakeKgDb"""
+    return FakeKgDb
@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.state_machine_modules.base_node import BaseNode
+from planning_modules.state_machine_modules.debug_sink import DebugSink, build_state_record, build_tree_record, render_tree_record
+
+
+def make_tree() -> BaseNode:
+    vroot = BaseNode("__VROOT__", "root", 1.0, is_virtual_root=True)
+    top = BaseNode("prepare", "準備", 1.0)
+    for name in ["wash_face", "change_clothes"]:
+        top.add_child(BaseNode(name, name, 1.0))
+    vroot.add_child(top)
+    return vroot
+
+
+def test_tree_record_skips_virtual_root():
+    graph = build_tree_record(make_tree())
+    assert graph["tops"] == ["prepare"]
+    assert graph["nodes"]["prepare"]["children"] == ["wash_face", "change_clothes"]
+    assert "__VROOT__" not in graph["nodes"]
+    json.dumps(graph)
+
+    pytest.importorskip("graphviz")
+    dot = render_tree_record(graph)
+    assert "wash_face -> change_clothes" in dot.source
+
+
+def test_disabled_sink_does_nothing(tmp_path):
+    sink = DebugSink(enabled=False, base_dir=str(tmp_path))
+    assert not sink.should_sample()
+    assert not sink.submit(build_state_record(make_tree()))
+    assert os.listdir(tmp_path) == []
+
+
+def test_sink_writes_in_background_with_retention(tmp_path):
+    sink = DebugSink(enabled=True, base_dir=str(tmp_path), max_snapshots=2, render_graph=False)
+    top = make_tree().children[0]
+    for i in range(4):
+        record = build_state_record(top)
+        record["timestamp"] = f"20250101_000000_00000{i}"
+        assert sink.submit(record)
+    sink.flush()
+
+    assert sorted(os.listdir(tmp_path)) == ["state_20250101_000000_000002.json", "state_20250101_000000_000003.json"]
+    with open(tmp_path / "state_20250101_000000_000003.json", encoding="utf-8") as f:
+        assert json.load(f)["node_name"] == "prepare"
+    assert sink.stats["written"] == 4
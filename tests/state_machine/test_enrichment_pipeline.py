@@ -0,0 +1,56 @@
+import sys
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from neo4j_modules.care_kg_db import CareKgDB
+from planning_modules.state_machine_modules.enrichment_pipeline import enrich_all_nodes
+
+
+class _FakeKgDb:
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.saved = {}
+
+    def get_all_instance_nodes(self, only_missing_enrichment=False):
+        return [node for node in self.nodes if not (only_missing_enrichment and node.get("enrichment"))]
+
+    def save_node_enrichment(self, item_name, enrichment, description=None):
+        self.saved[item_name] = (enrichment, description)
+        return True
+
+
+class _FakeEnrichment:
+    def _call_chain(self, input_data):
+        if input_data["node_name"] == "broken":
+            return None
+        return {"detail_instruction": input_data["description"], "call_to_action": "しましょう", "jp_title": input_data["node_name"]}
+
+
+def test_enrich_all_nodes_skips_enriched_nodes():
+    kg_db = _FakeKgDb([
+        {"name": "go_get_clothes", "description": "服を取りに行く", "enrichment": None},
+        {"name": "wash_face", "description": "顔を洗う", "enrichment": {"jp_title": "顔を洗う"}},
+        {"name": "broken", "description": "", "enrichment": None},
+    ])
+    stats = enrich_all_nodes(kg_db, max_workers=2, llm_enrichment=_FakeEnrichment())
+
+    assert stats["total"] == 2
+    assert stats["enriched"] == 1
+    assert stats["failed"] == ["broken"]
+    assert kg_db.saved["go_get_clothes"] == ({"detail_instruction": "服を取りに行く", "call_to_action": "しましょう", "jp_title": "go_get_clothes"}, "服を取りに行く")
+
+    stats = enrich_all_nodes(kg_db, force=True, llm_enrichment=_FakeEnrichment())
+    assert stats["total"] == 3
+
+
+def test_enrichment_from_record_detects_stale_description():
+    db = CareKgDB.__new__(CareKgDB)
+    record = {
+        "description": "服を取りに行く",
+        "enriched_detail_instruction": "奥の部屋に行きます",
+        "enriched_call_to_action": "行きましょう",
+        "enriched_jp_title": "服を取りに行く",
+        "enriched_source_hash": CareKgDB.enrichment_source_hash("服を取りに行く"),
+    }
+    assert db._enrichment_from_record(record) == {"detail_instruction": "奥の部屋に行きます", "call_to_action": "行きましょう", "jp_title": "服を取りに行く"}
+    assert db._enrichment_from_record({**record, "description": "別の説明"}) is None
+    assert db._enrichment_from_record({**record, "enriched_jp_title": None}) is None
@@ -0,0 +1,100 @@
+import sys
+
+import eventlet
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.state_machine_modules.base_node import BaseNode
+from planning_modules.state_machine_modules.llm_enrichment import LLMEnrichment
+from planning_modules.state_machine_modules.socket_constants import SocketEventType
+
+# JsonOutputParser と同じく、途中までの JSON を累積した dict で流す
+PARTIALS = [
+    {},
+    {"detail_instruction": "洗面所で"},
+    {"detail_instruction": "洗面所で顔を洗います"},
+    {"detail_instruction": "洗面所で顔を洗います", "call_to_action": "顔を"},
+    {"detail_instruction": "洗面所で顔を洗います", "call_to_action": "顔を洗いましょう"},
+    {"detail_instruction": "洗面所で顔を洗います", "call_to_action": "顔を洗いましょう", "jp_title": "洗顔"},
+]
+
+
+class _StreamingChain:
+    def __init__(self, partials, delay=0.0):
+        self.partials = partials
+        self.delay = delay
+        self.invoked = 0
+
+    def stream(self, inputs):
+        for partial in self.partials:
+            eventlet.sleep(self.delay)
+            yield dict(partial)
+
+    def invoke(self, inputs):
+        self.invoked += 1
+        return dict(self.partials[-1])
+
+
+def make_enrichment(delay=0.0) -> LLMEnrichment:
+    enrichment = LLMEnrichment.__new__(LLMEnrichment)
+    enrichment.chain = _StreamingChain(PARTIALS, delay)
+    return enrichment
+
+
+def test_stream_chain_reports_deltas_per_field():
+    deltas = []
+    result = make_enrichment()._stream_chain({"node_name": "wash_face", "description": ""}, lambda *args: deltas.append(args))
+
+    assert result == PARTIALS[-1]
+    assert deltas == [
+        ("detail_instruction", "洗面所で", "洗面所で"),
+        ("detail_instruction", "顔を洗います", "洗面所で顔を洗います"),
+        ("call_to_action", "顔を", "顔を"),
+        ("call_to_action", "洗いましょう", "顔を洗いましょう"),
+        ("jp_title", "洗顔", "洗顔"),
+    ]
+
+
+def make_node(monkeypatch, sent, delay=0.02) -> BaseNode:
+    monkeypatch.setattr("planning_modules.state_machine_modules.base_node.LLMEnrichment", lambda: make_enrichment(delay))
+    return BaseNode("wash_face", "顔を洗う", 1.0, send_socket_func=lambda event, data: sent.append((event, data)))
+
+
+def test_state_info_streams_deltas_then_full_payload(monkeypatch):
+    sent = []
+    node = make_node(monkeypatch, sent)
+    state_info = node._create_state_info()
+
+    deltas = [data for event, data in sent if event == SocketEventType.NEXT_STATE_INFO_DELTA.value]
+    assert [delta["seq"] for delta in deltas] == list(range(1, len(deltas) + 1))
+    assert all(delta["current_state"] == "wash_face" for delta in deltas)
+    assert "".join(delta["delta"] for delta in deltas if delta["field"] == "call_to_action") == "顔を洗いましょう"
+    assert deltas[-1] == {"current_state": "wash_face", "field": "title", "delta": "洗顔", "text": "洗顔", "seq": len(deltas)}
+
+    # 確定版は従来どおり完全な state_info
+    assert state_info["call_to_action"] == "顔を洗いましょう"
+    assert state_info["detail_instruction"] == "洗面所で顔を洗います"
+    assert state_info["title"] == "洗顔"
+
+
+def test_background_enrichment_is_not_streamed_until_shown(monkeypatch):
+    sent = []
+    node = make_node(monkeypatch, sent, delay=0.05)
+    node._start_enrichment()
+    eventlet.sleep(0.12)
+    assert sent == []
+
+    # 表示した時点で、それまでに生成された分をまとめて送ってから続きを流す
+    node._create_state_info()
+    deltas = [data for event, data in sent if event == SocketEventType.NEXT_STATE_INFO_DELTA.value]
+    assert deltas[0]["text"] == deltas[0]["delta"] and deltas[0]["field"] == "detail_instruction"
+    assert {delta["field"] for delta in deltas} == {"detail_instruction", "call_to_action", "title"}
+
+
+def test_streaming_can_be_disabled(monkeypatch):
+    monkeypatch.setenv("INSTRUCTION_STREAMING", "0")
+    sent = []
+    node = make_node(monkeypatch, sent, delay=0.0)
+    state_info = node._create_state_info()
+    assert sent == []
+    assert node._llm_enrichment.chain.invoked == 1
+    assert state_info["call_to_action"] == "顔を洗いましょう"
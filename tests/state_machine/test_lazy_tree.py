@@ -0,0 +1,125 @@
+import sys
+
+import eventlet
+import pytest
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.state_machine_modules.base_node import BaseNode
+from planning_modules.state_machine_modules.instruction_graph import InstructionGraph
+
+
+@pytest.fixture
+def tree(make_node):
+    # prepare -> (wash_face -> rinse, change_clothes -> loop -> change_clothes (循環)), change_clothes は wash_face の後
+    return {
+        "prepare": make_node("prepare", ["change_clothes", "wash_face"]),
+        "wash_face": make_node("wash_face", ["rinse"]),
+        "change_clothes": make_node("change_clothes", ["loop"], followers=["wash_face"]),
+        "rinse": make_node("rinse"),
+        "loop": make_node("loop", ["change_clothes"]),
+    }
+
+
+@pytest.fixture
+def wide_tree(make_node, width=30, depth=3):
+    nodes = {}
+
+    def add(name, level):
+        children = [f"{name}.{i}" for i in range(width)] if level < depth else []
+        nodes[name] = make_node(name, children)
+        for child in children:
+            add(child, level + 1)
+    add("root", 0)
+    return nodes
+
+
+def test_lazy_top_node_reads_one_level_and_builds_no_children(wide_tree, fake_kg_db):
+    kg_db = fake_kg_db(wide_tree)
+    node = BaseNode.create_from_item_sync("root", kg_db, send_socket=None, lazy=True)
+
+    # 最初の状態を出すまでの仕事はサブツリーの大きさに比例しない
+    assert kg_db.calls == [("root", 1)]
+    assert node.children == []
+    assert not node.children_ready
+    assert node.has_detail()
+    assert node._create_state_info()["has_detail"] is True
+
+
+def test_materialize_children_builds_one_level_at_a_time(tree, fake_kg_db):
+    kg_db = fake_kg_db(tree)
+    node = BaseNode.create_from_item_sync("prepare", kg_db, send_socket=None, lazy=True)
+
+    assert node.materialize_children()
+    assert [c.name for c in node.children] == ["wash_face", "change_clothes"]
+    assert all(not c.children_ready for c in node.children)
+    # 子ノードの情報は最初の取得に含まれているので、追加のクエリは無い
+    assert kg_db.calls == [("prepare", 1)]
+    assert node.materialize_children() and len(node.children) == 2
+
+    change_clothes = node.children[1]
+    assert change_clothes.materialize_children()
+    assert kg_db.calls[-1] == ("change_clothes", 1)
+    loop = change_clothes.children[0]
+    # 循環 (loop -> change_clothes) は展開しない
+    assert not loop.has_detail()
+    loop.materialize_children()
+    assert loop.children == []
+
+
+def test_lazy_build_matches_eager_build(tree, fake_kg_db):
+    eager = BaseNode.create_from_item_sync("prepare", fake_kg_db(tree), send_socket=None)
+    lazy = BaseNode.create_from_item_sync("prepare", fake_kg_db(tree), send_socket=None, lazy=True)
+
+    def shape(node):
+        node.materialize_children()
+        return (node.name, [shape(child) for child in node.children])
+    assert shape(lazy) == shape(eager)
+
+
+def test_go_detail_waits_for_in_flight_prefetch_only_once(tree, fake_kg_db):
+    kg_db = fake_kg_db(tree, delay=0.05)
+    node = BaseNode.create_from_item_sync("wash_face", kg_db, send_socket=None, lazy=True)
+    node._lazy_subtree["nodes"].pop("rinse")  # 子ノードの情報を取りに行かせる
+    calls = len(kg_db.calls)
+
+    node.prefetch_children()
+    eventlet.sleep(0)
+    assert node._children_building and not node.children_ready
+    waiter = eventlet.spawn(node.materialize_children)
+    assert waiter.wait() is True
+    assert [c.name for c in node.children] == ["rinse"]
+    assert len(kg_db.calls) == calls + 1
+
+
+def test_standard_run_prefetches_children_and_next_sibling(tree, fake_kg_db):
+    sent = []
+    kg_db = fake_kg_db(tree)
+    root = BaseNode.create_from_item_sync("prepare", kg_db, send_socket=lambda event, data: sent.append((event, data)), lazy=True)
+    runner = eventlet.spawn(root._standard_run)
+    eventlet.sleep(0.05)
+
+    assert sent[1] == ("next_state_info", root._create_state_info())
+    assert root.children_ready  # go_detail の前に先読み済み
+
+    root.set_event_flag("go_detail")
+    eventlet.sleep(0.05)
+    wash_face, change_clothes = root.children
+    assert sent[-1][1]["current_state"] == "wash_face"
+    assert wash_face.children_ready and change_clothes.children_ready  # 次の兄弟も先読み
+
+    for _ in range(2):
+        root.set_event_flag("go_next")
+        eventlet.sleep(0.05)
+    assert runner.wait() == "next"
+    assert ("detail_finished", {}) in sent
+
+
+def test_instruction_graph_builds_lazily_unless_disabled(monkeypatch, tree, fake_kg_db):
+    graph = InstructionGraph(fake_kg_db(tree))
+    graph.construct_graph_sync("prepare")
+    assert graph.top_nodes[0].children == []
+
+    monkeypatch.setenv("INSTRUCTION_LAZY_TREE", "0")
+    graph = InstructionGraph(fake_kg_db(tree))
+    graph.construct_graph_sync("prepare")
+    assert [c.name for c in graph.top_nodes[0].children] == ["wash_face", "change_clothes"]
@@ -0,0 +1,42 @@
+import sys
+import time
+
+import eventlet
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.state_machine_modules.node_events import NodeEventQueue
+
+
+def test_priority_and_deduplication():
+    queue = NodeEventQueue()
+    for event_name in ["go_next", "go_detail", "go_next", "back_to_start"]:
+        assert queue.put(event_name)
+    assert not queue.put("unknown")
+
+    assert queue.get() == "back_to_start"
+    assert queue.get() == "go_detail"
+    assert queue.get() == "go_next"
+    assert queue.get(timeout=0.01) is None
+
+
+def test_undeliverable_events_are_dropped():
+    queue = NodeEventQueue()
+    queue.put("go_detail")
+    queue.put("go_next")
+    assert queue.get(can_deliver=lambda name: name != "go_detail") == "go_next"
+    assert not queue.is_pending("go_detail")
+
+
+def test_get_blocks_until_put():
+    queue = NodeEventQueue()
+    received = []
+
+    waiter = eventlet.spawn(lambda: received.append(queue.get(timeout=5)))
+    eventlet.sleep(0.05)
+    assert received == []
+
+    start = time.monotonic()
+    queue.put("go_next")
+    waiter.wait()
+    assert received == ["go_next"]
+    assert time.monotonic() - start < 0.05
@@ -0,0 +1,127 @@
+import asyncio
+import sys
+
+import pytest
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.state_machine_modules import sort_utils
+from planning_modules.state_machine_modules.base_node import BaseNode
+from planning_modules.state_machine_modules.presort_pipeline import presort_all_parents
+from planning_modules.state_machine_modules.sort_utils import (
+    OrderingCache, instruction_sort, instruction_sort_sync, is_valid_order, ordering_key
+)
+
+
+@pytest.fixture
+def make_nodes(make_node):
+    """prepare -> (brush_teeth, wash_face, change_clothes), change_clothes は wash_face の後 (follows)"""
+    def make(child_order=None):
+        return {
+            "prepare": make_node("prepare", ["brush_teeth", "wash_face", "change_clothes"], child_order=child_order),
+            "brush_teeth": make_node("brush_teeth"),
+            "wash_face": make_node("wash_face"),
+            "change_clothes": make_node("change_clothes", followers=["wash_face"]),
+        }
+    return make
+
+
+INCLUDES = ["brush_teeth", "wash_face", "change_clothes"]
+ADJACENCY = {"change_clothes": ["wash_face"]}
+DESCRIPTIONS = {name: f"{name}の説明" for name in INCLUDES}
+SEMANTIC_ORDER = ["wash_face", "brush_teeth", "change_clothes"]
+
+
+class _FakeChain:
+    def __init__(self, sorted_list):
+        self.sorted_list = sorted_list
+        self.calls = 0
+
+    async def ainvoke(self, inputs):
+        self.calls += 1
+        return {"thoughts": "", "sorted_list": self.sorted_list}
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    chain = _FakeChain(SEMANTIC_ORDER)
+    monkeypatch.setattr(sort_utils, "get_semantic_sort_chain", lambda: chain)
+    monkeypatch.setattr(sort_utils, "_ordering_cache", OrderingCache())
+    return chain
+
+
+def test_ordering_key_ignores_kg_order_but_not_content():
+    key = ordering_key("prepare", INCLUDES, ADJACENCY, DESCRIPTIONS)
+    assert key == ordering_key("prepare", list(reversed(INCLUDES)), {"change_clothes": ["wash_face"], "brush_teeth": []}, DESCRIPTIONS)
+    assert key != ordering_key("morning", INCLUDES, ADJACENCY, DESCRIPTIONS)
+    assert key != ordering_key("prepare", INCLUDES, {}, DESCRIPTIONS)
+    assert key != ordering_key("prepare", INCLUDES, ADJACENCY, {**DESCRIPTIONS, "wash_face": "顔を洗う"})
+
+
+def test_is_valid_order_checks_follows_constraints():
+    assert is_valid_order(SEMANTIC_ORDER, INCLUDES, ADJACENCY)
+    assert not is_valid_order(["change_clothes", "wash_face", "brush_teeth"], INCLUDES, ADJACENCY)
+    assert not is_valid_order(["wash_face", "change_clothes"], INCLUDES, ADJACENCY)
+    assert not is_valid_order(["wash_face", "wash_face", "change_clothes"], INCLUDES, ADJACENCY)
+    assert not is_valid_order(["wash_face", "brush_teeth", "change_clothes", "extra"], INCLUDES, ADJACENCY)
+
+
+def test_llm_order_is_memoized(chain):
+    assert asyncio.run(instruction_sort(INCLUDES, ADJACENCY, DESCRIPTIONS, parent="prepare")) == SEMANTIC_ORDER
+    assert asyncio.run(instruction_sort(list(reversed(INCLUDES)), ADJACENCY, DESCRIPTIONS, parent="prepare")) == SEMANTIC_ORDER
+    assert chain.calls == 1
+    # 同期版もプロセス内キャッシュを使う
+    assert instruction_sort_sync(INCLUDES, ADJACENCY, DESCRIPTIONS, parent="prepare") == SEMANTIC_ORDER
+    stats = sort_utils.get_ordering_cache().stats()
+    assert stats["llm_calls"] == 1 and stats["memory_hits"] == 2
+
+
+def test_llm_order_breaking_constraints_falls_back_to_topo(chain):
+    chain.sorted_list = ["change_clothes", "wash_face", "brush_teeth"]
+    order = asyncio.run(instruction_sort(INCLUDES, ADJACENCY, DESCRIPTIONS, parent="prepare"))
+    assert order == ["brush_teeth", "wash_face", "change_clothes"]
+    assert sort_utils.get_ordering_cache().stats()["llm_failures"] == 1
+    assert sort_utils.get_ordering_cache().stats()["entries"] == 0
+
+
+def test_sync_build_uses_stored_order_without_llm(chain, make_nodes, fake_kg_db):
+    key = ordering_key("prepare", INCLUDES, ADJACENCY, DESCRIPTIONS)
+    nodes = make_nodes(child_order={"key": key, "order": SEMANTIC_ORDER})
+
+    node = BaseNode.create_from_item_sync("prepare", fake_kg_db(nodes), send_socket=None)
+    assert [c.name for c in node.children] == SEMANTIC_ORDER
+    assert chain.calls == 0
+    assert sort_utils.get_ordering_cache().stats()["stored_hits"] == 1
+
+
+def test_stale_or_invalid_stored_order_is_ignored(chain, make_nodes, fake_kg_db):
+    stale = make_nodes(child_order={"key": "old-key", "order": SEMANTIC_ORDER})
+    node = BaseNode.create_from_item_sync("prepare", fake_kg_db(stale), send_socket=None)
+    assert [c.name for c in node.children] == ["brush_teeth", "wash_face", "change_clothes"]
+
+    key = ordering_key("prepare", INCLUDES, ADJACENCY, DESCRIPTIONS)
+    broken = make_nodes(child_order={"key": key, "order": ["change_clothes", "wash_face", "brush_teeth"]})
+    node = BaseNode.create_from_item_sync("prepare", fake_kg_db(broken), send_socket=None)
+    assert [c.name for c in node.children] == ["brush_teeth", "wash_face", "change_clothes"]
+    assert sort_utils.get_ordering_cache().stats()["invalid"] == 1
+
+
+def test_presort_all_parents_saves_orders_once(chain, make_node, make_nodes, fake_kg_db):
+    nodes = make_nodes()
+    nodes["wash_face"] = make_node("wash_face", ["rinse"])
+    nodes["rinse"] = make_node("rinse")
+    kg_db = fake_kg_db(nodes)
+
+    stats = presort_all_parents(kg_db, max_workers=2)
+    assert stats["total"] == 2
+    assert stats["sorted"] == 1
+    assert stats["no_parallel"] == 1  # wash_face の子は 1 つだけ
+    assert kg_db.saved["prepare"] == (ordering_key("prepare", INCLUDES, ADJACENCY, DESCRIPTIONS), SEMANTIC_ORDER)
+    assert chain.calls == 1
+
+    # 保存済みで有効な並び順は再生成しない
+    stats = presort_all_parents(kg_db)
+    assert stats["cached"] == 1 and stats["sorted"] == 0
+    assert chain.calls == 1
+    stats = presort_all_parents(kg_db, force=True)
+    assert stats["sorted"] == 1
+    assert chain.calls == 2
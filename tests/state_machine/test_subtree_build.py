@@ -0,0 +1,27 @@
+import sys
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.state_machine_modules.base_node import BaseNode
+
+
+def test_create_from_item_sync_uses_single_subtree_query(make_node, fake_kg_db):
+    # prepare -> (wash_face, change_clothes, brush_teeth), change_clothes は wash_face の後 (follows), loop は循環
+    kg_db = fake_kg_db({
+        "prepare": make_node("prepare", ["change_clothes", "wash_face", "unknown"]),
+        "wash_face": make_node("wash_face", ["rinse"]),
+        "change_clothes": make_node("change_clothes", ["loop"], followers=["wash_face"]),
+        "rinse": make_node("rinse"),
+        "loop": make_node("loop", ["change_clothes"]),
+    })
+
+    node = BaseNode.create_from_item_sync("prepare", kg_db, send_socket=None)
+
+    # get_subtree 以外の呼び出しは FakeKgDb が失敗させる
+    assert kg_db.calls == [("prepare", None)]
+    assert [c.name for c in node.children] == ["wash_face", "change_clothes"]
+    assert [c.name for c in node.children[0].children] == ["rinse"]
+    # 循環 (loop -> change_clothes) は展開しない
+    assert [c.name for c in node.children[1].children] == ["loop"]
+    assert node.children[1].children[0].children == []
+    assert node.children[0].basic_description == "wash_faceの説明"
+    assert node.enriched_info == {"detail_instruction": "", "call_to_action": "", "jp_title": ""}
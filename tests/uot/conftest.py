@@ -0,0 +1,122 @@
+import asyncio
+import sys
+from contextlib import nullcontext
+
+import pytest
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.lending_ear_modules.uot_modules.item import Item
+from planning_modules.lending_ear_modules.uot_modules.llm_concurrency import llm_slot
+from planning_modules.lending_ear_modules.uot_modules.uot import UoT
+
+# UoT の木を LLM を呼ばずに組み立てるための共通のヘルパー
+# アイテムや確率の作り方を変えたいテストは、モジュール内で item_names / p_yes フィクスチャを上書きする
+ITEM_NAMES = ["腹痛がある", "靴下を探している", "服を探している", "不安", "怒り", "デイサービスの準備"]
+ROOT_QUESTIONS = ["お腹は痛いですか?", "何か探していますか?"]
+
+
+@pytest.fixture
+def item_names():
+    return list(ITEM_NAMES)
+
+
+@pytest.fixture
+def p_yes():
+    """(アイテムの番号, 質問の番号, seed) -> p_yes_given_item"""
+    return lambda i, q, seed: (i * 0.15 + q * 0.1 + 0.05) % 1.0
+
+
+@pytest.fixture
+def make_results(item_names, p_yes):
+    """generate_questions_and_estimate_probability と同じ形の結果を作る"""
+    def make(questions, seed=0):
+        return [
+            {
+                "question": question,
+                "evaluated_items": [{"name": name, "p_yes_given_item": p_yes(i, q, seed)} for i, name in enumerate(item_names)]
+            }
+            for q, question in enumerate(questions)
+        ]
+    return make
+
+
+@pytest.fixture
+def make_uot(item_names, make_results):
+    """
+    make_uot(layers=1, grown=None, n_extend_layers=3, **kwargs) -> UoT
+
+    layers: 組み立てる層の数 (0 は根だけ、2 は根の子のうち先頭 grown 個 (None は全部) の下にもう 1 層)
+    kwargs: UoT にそのまま渡す (search_policy, speculation_budget など)
+    """
+    def make(layers=1, grown=None, n_extend_layers=3, **kwargs) -> UoT:
+        items = [Item(name, f"{name}の説明", 1 / len(item_names)) for name in item_names]
+        uot = UoT(initial_items=items, n_extend_layers=n_extend_layers, n_question_candidates=2, n_max_pruning=2, lambda_=20, **kwargs)
+        if layers == 0:
+            return uot
+
+        root = uot.root
+        root.adopt_results(make_results(ROOT_QUESTIONS), "test")
+        if layers >= 2:
+            for child in root.children[:grown]:
+                child.adopt_results(make_results([f"{child.question}/{child.reply}: 服ですか?"]), "test")
+                asyncio.run(child.calculate_rewards())
+        asyncio.run(root.calculate_rewards())
+        root.current_extended_depth = layers
+        uot.best_question = root.get_best_question()
+        return uot
+    return make
+
+
+class FakeGenerator:
+    """
+    generate_questions_and_estimate_probability の代わり。
+
+    delay: 1 回の呼び出しにかかる時間
+    n_questions: 返す質問の数 (None は ques_num のとおり)
+    block_prefix: この文字列で始まる質問のノードは release まで待たせる
+    on_call: 呼び出しのたびに on_call(generator) を呼ぶ
+    limited: llm_slot (セッションと全体の同時実行数の上限) の中で呼ばれたことにする
+    """
+
+    def __init__(self, make_results, delay=0.0, n_questions=None, block_prefix=None, on_call=None, limited=False):
+        self.make_results = make_results
+        self.delay = delay
+        self.n_questions = n_questions
+        self.block_prefix = block_prefix
+        self.on_call = on_call
+        self.limited = limited
+        self.release = asyncio.Event()
+        self.started = asyncio.Event()
+        self.calls = []  # 展開したノードの質問
+        self.expanded = []  # 展開したノードの質問 + 回答
+        self.cancelled = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, items, ques_num, historys=None, additional_context=None, **kwargs):
+        question = historys[-1]["q"] if historys else "root"
+        async with (llm_slot() if self.limited else nullcontext()):
+            self.calls.append(question)
+            self.expanded.append(question + str(historys[-1]["a"] if historys else ""))
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            try:
+                if self.on_call:
+                    self.on_call(self)
+                if self.block_prefix and question.startswith(self.block_prefix):
+                    self.started.set()
+                    await self.release.wait()
+                await asyncio.sleep(self.delay)
+            except asyncio.CancelledError:
+                self.cancelled.append(question)
+                raise
+            finally:
+                self.in_flight -= 1
+        n_questions = ques_num if self.n_questions is None else self.n_questions
+        return self.make_results([f"{question} の次の質問 {i}" for i in range(n_questions)])
+
+
+@pytest.fixture
+def fake_generator(make_results):
+    """fake_generator(**options) -> FakeGenerator (options は FakeGenerator を参照)"""
+    return lambda **options: FakeGenerator(make_results, **options)
@@ -0,0 +1,83 @@
+import asyncio
+import sys
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.lending_ear_modules.uot_modules import llm_concurrency, uot_node
+from planning_modules.lending_ear_modules.uot_modules.llm_concurrency import GlobalLLMLimiter, set_session_concurrency
+
+
+def test_frontier_is_expanded_concurrently(monkeypatch, make_uot, fake_generator):
+    generator = fake_generator(delay=0.02, limited=True)
+    monkeypatch.setattr(uot_node, "generate_questions_and_estimate_probability", generator)
+    monkeypatch.setattr(llm_concurrency, "_global_limiter", GlobalLLMLimiter(16))
+    uot = make_uot()
+
+    async def scenario():
+        set_session_concurrency(16)
+        await uot.extend_single_layer(uot.root, 2)
+
+    asyncio.run(scenario())
+    # 枝刈り後の 4 つの葉が 1 つのイベントループ上で同時に展開される
+    assert len(generator.calls) == 4
+    assert generator.peak == 4
+    assert all(child.children for child in uot.root.children)
+    assert uot.root.current_extended_depth == 2
+
+
+def test_session_and_global_limits_are_respected(monkeypatch, make_uot, fake_generator):
+    generator = fake_generator(delay=0.02, limited=True)
+    monkeypatch.setattr(uot_node, "generate_questions_and_estimate_probability", generator)
+
+    async def scenario(uot, session_limit):
+        set_session_concurrency(session_limit)
+        await uot.extend_single_layer(uot.root, 2)
+
+    monkeypatch.setattr(llm_concurrency, "_global_limiter", GlobalLLMLimiter(16))
+    asyncio.run(scenario(make_uot(), 2))
+    assert len(generator.calls) == 4 and generator.peak == 2
+
+    limiter = GlobalLLMLimiter(1)
+    monkeypatch.setattr(llm_concurrency, "_global_limiter", limiter)
+    generator.peak = 0
+    asyncio.run(scenario(make_uot(), 4))
+    assert generator.peak == 1
+    assert limiter.stats["calls"] == 4
+    assert limiter.stats["waits"] > 0
+    assert limiter.stats["in_flight"] == 0
+
+
+def test_stop_extension_cancels_in_flight_calls(monkeypatch, make_uot, fake_generator):
+    monkeypatch.setattr(llm_concurrency, "_global_limiter", GlobalLLMLimiter(16))
+    uot = make_uot(n_extend_layers=4)
+    generator = fake_generator(delay=5, limited=True)
+    monkeypatch.setattr(uot_node, "generate_questions_and_estimate_probability", generator)
+
+    async def scenario():
+        set_session_concurrency(16)
+        await uot.extend()
+        while generator.in_flight < 4:
+            await asyncio.sleep(0.01)
+        task = uot.extension_task
+        uot.stop_extension()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert len(generator.cancelled) == 4
+    assert uot.extension_task is None
+    assert not any(child.children for child in uot.root.children)
+    assert llm_concurrency.get_llm_concurrency_stats()["in_flight"] == 0
+
+
+def test_results_arriving_after_stop_are_dropped(monkeypatch, make_uot, fake_generator):
+    monkeypatch.setattr(llm_concurrency, "_global_limiter", GlobalLLMLimiter(16))
+    uot = make_uot()
+    # 呼び出し中に停止フラグが立った場合 (キャンセルが間に合わなかった呼び出し) は結果を木に入れない
+    generator = fake_generator(delay=0.02, on_call=lambda _: uot.extension_stop_flag.set(), limited=True)
+    monkeypatch.setattr(uot_node, "generate_questions_and_estimate_probability", generator)
+
+    async def scenario():
+        await uot.root.children[0].generate_children(should_stop=uot.extension_stop_flag.is_set)
+
+    asyncio.run(scenario())
+    assert len(generator.calls) == 1
+    assert uot.root.children[0].children == []
@@ -0,0 +1,71 @@
+import asyncio
+import sys
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.lending_ear_modules.uot_modules import chat_utils
+from planning_modules.lending_ear_modules.uot_modules.chat_utils import EstimationPackingPolicy, _estimate_probability_of_items_batched, _parse_batch_response
+from planning_modules.lending_ear_modules.uot_modules.item import Item
+
+item_names = ["腹痛がある", "不明", "靴下を探している", "服を探している", "不安"]
+items = [Item(name, f"{name}の説明", 1/len(item_names)) for name in item_names]
+questions = ["お腹は痛いですか?", "何か探していますか?", "不安ですか?"]
+
+
+class _FakeBatchChain:
+    """Scores every cell with 0.1 * item_number, and refuses batches larger than max_cells."""
+    def __init__(self, max_cells: int):
+        self.max_cells = max_cells
+        self.calls = []
+
+    def invoke(self, inputs):
+        question_lines = inputs["question_list"].split("\n")
+        item_lines = inputs["item_name_list"].split("\n")
+        self.calls.append((len(question_lines), len(item_lines)))
+        if len(question_lines) * len(item_lines) > self.max_cells:
+            raise ValueError("output truncated")
+        return {"results": [
+            {"question_number": q + 1, "items": [{"item_number": i + 1, "y_prob": 0.1 * (i + 1)} for i in range(len(item_lines))]}
+            for q in range(len(question_lines))
+        ]}
+
+    async def ainvoke(self, inputs):
+        return self.invoke(inputs)
+
+
+def test_parse_batch_response_ignores_out_of_range_numbers():
+    response = {"results": [
+        {"question_number": 2, "items": [{"item_number": 2, "y_prob": 1.3}, {"item_number": 9, "y_prob": 0.4}, {"item_number": 1, "y_prob": 0.2}]},
+        {"question_number": 7, "items": []}
+    ]}
+    results = _parse_batch_response(response, questions, items)
+    assert list(results.keys()) == [questions[1]]
+    assert [x["name"] for x in results[questions[1]]] == [item_names[0], item_names[1]]
+    assert results[questions[1]][1]["p_yes_given_item"] == 1
+    assert results[questions[1]][1]["p_no_given_item"] == 0
+
+
+def test_batched_estimation_splits_failed_batches(monkeypatch):
+    chain = _FakeBatchChain(max_cells=5)
+    monkeypatch.setattr(chat_utils, "get_response_util", lambda usecase_name: chain)
+
+    policy = EstimationPackingPolicy(items_per_call=5, questions_per_call=3)
+    results = asyncio.run(_estimate_probability_of_items_batched(items, questions, "no history", policy))
+
+    assert [result["question"] for result in results] == questions
+    for result in results:
+        assert [x["name"] for x in result["evaluated_items"]] == item_names
+        assert [x["description"] for x in result["evaluated_items"]] == [item.description for item in items]
+    # 最初のバッチ(3x5)は失敗し、分割されたバッチで評価される
+    assert chain.calls[0] == (3, 5)
+    assert sum(q * i for q, i in chain.calls if q * i <= 5) == len(questions) * len(items)
+
+
+def test_oversized_batches_are_split_before_the_call(monkeypatch):
+    chain = _FakeBatchChain(max_cells=100)
+    monkeypatch.setattr(chat_utils, "get_response_util", lambda usecase_name: chain)
+
+    policy = EstimationPackingPolicy(items_per_call=5, questions_per_call=3, max_tokens_per_call=200, output_tokens_per_cell=20)
+    results = asyncio.run(_estimate_probability_of_items_batched(items, questions, "no history", policy))
+
+    assert all(len(result["evaluated_items"]) == len(items) for result in results)
+    assert (3, 5) not in chain.calls
@@ -0,0 +1,80 @@
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.lending_ear_modules.uot_modules.item import Item
+from planning_modules.lending_ear_modules.uot_modules.belief_state import BeliefState, ItemIndex, entropy_of
+
+item_names = ["腹痛がある", "不明(その他)", "靴下を探している", "服を探している", "不安", "怒り", "デイサービスの準備"]
+p_s_sample = [0.3, 0.05, 0.2, 0.15, 0.1, 0.1, 0.1]
+likelihood_sample = [0.9, 0.5, 0.8, 0.7, 0.2, 0.1, 0.6]
+
+
+def make_belief() -> BeliefState:
+    return BeliefState.from_items([Item(name, "", p) for name, p in zip(item_names, p_s_sample)])
+
+
+def reference_entropy(probs):
+    return -sum(p * np.log2(p) for p in probs if p > 0)
+
+
+def test_entropy():
+    belief = make_belief()
+    assert belief.entropy == pytest.approx(reference_entropy(p_s_sample))
+    assert entropy_of(np.array([1.0, 0.0])) == 0.0
+
+
+def test_posterior_and_information_gain():
+    belief = make_belief()
+    likelihood = np.array(likelihood_sample)
+    p_yes = belief.p_yes(likelihood)
+    p_no = 1 - p_yes
+    assert p_yes == pytest.approx(sum(l * p for l, p in zip(likelihood_sample, p_s_sample)))
+
+    omega_yes, omega_no = belief.posterior(likelihood, p_yes, p_no)
+    expected_yes = [l * p / p_yes for l, p in zip(likelihood_sample, p_s_sample)]
+    expected_no = [(1 - l) * p / p_no for l, p in zip(likelihood_sample, p_s_sample)]
+    assert omega_yes.probs == pytest.approx(expected_yes)
+    assert omega_no.probs == pytest.approx(expected_no)
+    assert omega_yes.index is belief.index
+
+    expected_gain = reference_entropy(p_s_sample) - (p_yes * reference_entropy(expected_yes) + p_no * reference_entropy(expected_no))
+    assert belief.information_gain(omega_yes, omega_no, p_yes, p_no) == pytest.approx(expected_gain)
+
+
+def test_custom_bayesian_update():
+    belief = make_belief()
+    p_prime_y, lambda_ = 0.8, 20
+    updated = belief.custom_bayesian_update(np.array(likelihood_sample), p_prime_y, lambda_)
+
+    p_y = sum(l * p for l, p in zip(likelihood_sample, p_s_sample))
+    e_p_s = [p_prime_y * l * p / p_y + (1 - p_prime_y) * (1 - l) * p / (1 - p_y) for l, p in zip(likelihood_sample, p_s_sample)]
+    e_prime = [e / (1 + lambda_ * (l - p_prime_y) ** 2) for e, l in zip(e_p_s, likelihood_sample)]
+    assert updated.probs == pytest.approx([e / sum(e_prime) for e in e_prime])
+    assert updated.probs.sum() == pytest.approx(1.0)
+
+
+def test_likelihoods_are_aligned_by_name():
+    index = ItemIndex(["a", "b", "c"], ["", "", ""])
+    evaluated = [{"name": "c", "p_yes_given_item": 0.9}, {"name": "a", "p_yes_given_item": 1.2}, {"name": "x", "p_yes_given_item": 0.1}]
+    assert index.likelihoods(evaluated) == pytest.approx([1.0, 0.5, 0.9])
+
+
+def test_top_items_includes_ties():
+    index = ItemIndex([f"item{i}" for i in range(8)], [""] * 8)
+    belief = BeliefState(index, [0.3, 0.2, 0.1, 0.1, 0.05, 0.05, 0.05, 0.15])
+    top = belief.top_items(5)
+    assert list(top.keys()) == ["item0", "item1", "item7", "item2", "item3"]
+
+    belief = BeliefState(index, [0.3, 0.2, 0.1, 0.1, 0.1, 0.1, 0.05, 0.05])
+    assert len(belief.top_items(5)) == 6
+
+
+def test_with_item_keeps_original_index():
+    belief = make_belief()
+    extended = belief.with_item("new", "desc", 0.1)
+    assert len(extended) == len(belief) + 1
+    assert len(belief.index) == len(item_names)
+    assert extended.probability_of("new") == pytest.approx(0.1)
+    assert extended.best_item().get_name() == "腹痛がある"
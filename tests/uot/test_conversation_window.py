@@ -0,0 +1,61 @@
+import sys
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.conversation_window import ConversationWindow, SUMMARY_PREFIX
+from planning_modules.lending_ear_modules.uot_modules.token_utils import count_tokens
+
+
+def turn(i):
+    return f"user : 発話{i:03d} " + "あ" * 40
+
+
+def test_window_is_bounded_by_tokens_and_turns():
+    window = ConversationWindow(max_tokens=100, max_turns=3, summary_max_tokens=60)
+    for i in range(50):
+        window.append(turn(i))
+
+    assert window.turns[-1] == turn(49)
+    assert len(window) <= 3
+    assert sum(count_tokens(t) for t in window.turns) <= 100
+    # 追い出した発話は要約に入るが、要約も上限内に収まる (古いものから捨てる)
+    assert window.token_count <= 100 + 60
+    assert turn(0) not in window.summary
+    assert window.as_list()[0].startswith(SUMMARY_PREFIX)
+    assert window.stats["evicted"] == 50 - len(window)
+
+
+def test_evicted_turns_are_summarized_incrementally():
+    calls = []
+
+    def summarizer(summary, turns):
+        calls.append((summary, list(turns)))
+        return f"要約{len(calls)}"
+
+    tokens = count_tokens(turn(0))  # 直近2発話が入り、2発話追い出すごとに要約する
+    window = ConversationWindow(
+        max_tokens=2 * tokens, max_turns=100, summary_max_tokens=10 * tokens, summarize_min_tokens=2 * tokens,
+        summarizer=summarizer, summarize_in_background=False
+    )
+    for i in range(6):
+        window.append(turn(i))
+
+    # 溜まった分だけまとめて要約し、前回の要約を引き継ぐ
+    assert calls[0] == ("", [turn(0), turn(1)])
+    assert calls[1][0] == "要約1"
+    assert window.summary.startswith(f"要約{len(calls)}")
+    assert window.as_str().endswith(turn(5))
+
+
+def test_summarizer_failure_keeps_raw_turns():
+    def summarizer(summary, turns):
+        raise RuntimeError("llm unavailable")
+
+    tokens = count_tokens(turn(0))
+    window = ConversationWindow(
+        max_tokens=tokens, summary_max_tokens=10 * tokens, summarize_min_tokens=1,
+        summarizer=summarizer, summarize_in_background=False
+    )
+    for i in range(3):
+        window.append(turn(i))
+    assert turn(0) in window.summary
+    assert window.stats["summary_errors"] >= 1
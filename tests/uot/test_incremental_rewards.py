@@ -0,0 +1,113 @@
+import asyncio
+import sys
+
+import pytest
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.lending_ear_modules.uot_modules.uot_node import UoTNode
+from planning_modules.lending_ear_modules.uot_modules.uot_snapshot import dump_uot, load_uot
+
+@pytest.fixture
+def item_names(item_names):
+    return item_names + ["トイレに行きたい", "眠い"]
+
+
+@pytest.fixture
+def p_yes():
+    return lambda i, q, seed: ((i + 1) * 0.13 + q * 0.21 + seed * 0.07) % 1.0
+
+
+@pytest.fixture
+def uot(make_uot, make_results):
+    """LLM を呼ばずに 3 層分の木を組み立てる (報酬は未計算)"""
+    def expand(node, depth):
+        if depth == 0:
+            return
+        node.adopt_results(make_results([f"{node.question}/{node.reply}/{q}" for q in range(2)], seed=node.depth), "test")
+        for child in node.children:
+            expand(child, depth - 1)
+
+    uot = make_uot(layers=0, n_extend_layers=6)
+    expand(uot.root, 3)
+    return uot
+
+
+def nodes(node):
+    yield node
+    for child in node.children:
+        yield from nodes(child)
+
+
+def reference_reward(parent, child):
+    """差分計算を使わない、定義どおりの再帰計算"""
+    information_gain = parent.belief.entropy - child.belief.entropy
+    if not child.children:
+        return information_gain
+    return information_gain + sum(reference_reward(child, grandchild) for grandchild in child.children) / len(child.children)
+
+
+def reset_stats():
+    for key in UoTNode.reward_stats:
+        UoTNode.reward_stats[key] = 0
+
+
+def test_rewards_match_full_recursion(uot):
+    asyncio.run(uot.root.calculate_rewards())
+    for node in nodes(uot.root):
+        for child in node.children:
+            assert child.reward == pytest.approx(reference_reward(node, child))
+            assert child.information_gain == pytest.approx(node.belief.entropy - child.belief.entropy)
+
+
+def test_clean_tree_is_not_recomputed(uot):
+    asyncio.run(uot.root.calculate_rewards())
+    reset_stats()
+    asyncio.run(uot.root.calculate_rewards())
+    asyncio.run(uot.root.recalculate_rewards())
+    assert UoTNode.reward_stats["recomputed"] == 0
+
+
+def test_changed_node_only_invalidates_its_ancestors(uot):
+    asyncio.run(uot.root.calculate_rewards())
+    leaf = uot.root.children[0].children[0].children[0]
+    path = [leaf.parent, leaf.parent.parent, uot.root]
+
+    reset_stats()
+    leaf.belief = leaf.belief.with_probs(leaf.belief.probs[::-1].copy())
+    assert [node._rewards_dirty for node in path] == [True, True, True]
+    assert UoTNode.reward_stats["invalidations"] == 4  # 葉自身と 3 つの祖先
+
+    asyncio.run(uot.root.calculate_rewards())
+    # 変わった葉の祖先だけを計算し直し、兄弟の部分木は使い回す
+    assert UoTNode.reward_stats["recomputed"] == 4
+    assert UoTNode.reward_stats["reused"] == (len(uot.root.children) - 1) + (len(path[1].children) - 1) + (len(path[0].children) - 1)
+    for node in nodes(uot.root):
+        for child in node.children:
+            assert child.reward == pytest.approx(reference_reward(node, child))
+
+
+def test_answer_keeps_rewards_consistent(uot):
+    asyncio.run(uot.root.calculate_rewards())
+    uot.best_question = uot.root.get_best_question()
+
+    async def answer():
+        async def no_extension():
+            return None
+        uot.extend = no_extension
+        await uot.answer(0.8)
+        await uot.root.calculate_rewards()
+
+    asyncio.run(answer())
+    for node in nodes(uot.root):
+        assert not node._rewards_dirty
+        for child in node.children:
+            assert child.reward == pytest.approx(reference_reward(node, child))
+
+
+def test_restored_tree_is_clean(uot):
+    asyncio.run(uot.root.calculate_rewards())
+    restored = load_uot(dump_uot(uot))
+    assert not any(node._rewards_dirty for node in nodes(restored.root))
+    reset_stats()
+    asyncio.run(restored.root.calculate_rewards())
+    assert UoTNode.reward_stats["recomputed"] == 0
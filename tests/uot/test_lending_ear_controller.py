@@ -0,0 +1,174 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules import llm_registry
+from planning_modules.conversation_window import ConversationWindow
+from planning_modules.lending_ear_modules.lend_main import LendingEarController
+from planning_modules.lending_ear_modules.uot_modules import speculation, uot_node
+from planning_modules.lending_ear_modules.uot_modules.uot_controller import controller as uot_controller
+
+
+class _FakeKgDb:
+    def __init__(self, item_names):
+        self.item_names = item_names
+
+    def get_uot_nodes(self):
+        return [{"name": name, "description": f"{name}の説明"} for name in self.item_names]
+
+
+@pytest.fixture
+def lending_ear(monkeypatch, item_names, fake_generator):
+    generator = fake_generator()
+    monkeypatch.setattr(uot_node, "generate_questions_and_estimate_probability", generator)
+    monkeypatch.setattr(speculation, "generate_questions_and_estimate_probability", generator)
+
+    async def question_explained(response, question):
+        return True
+
+    async def answered(responses, question, real_question):
+        return True, "yes", 0.9
+    monkeypatch.setattr(uot_controller, "check_is_question_explained", question_explained)
+    monkeypatch.setattr(uot_controller, "check_is_answered_to_question", answered)
+
+    lending_ear = LendingEarController(_FakeKgDb(item_names))
+    lending_ear.generator = generator
+    lending_ear.uot_controller.threshold = 1.0  # 回答 1 回では終わらせない
+    lending_ear.sent = []
+    yield lending_ear
+    lending_ear.stop()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def questions(sent):
+    return [data["detail"] for event, data in sent if event == "telluser" and "質問 :" not in data["detail"]]
+
+
+def test_answer_posted_from_another_thread_brings_the_next_question(lending_ear):
+    lending_ear.main(lambda event, data: lending_ear.sent.append((event, data)), lambda: [])
+
+    assert wait_for(lambda: len(questions(lending_ear.sent)) == 1)
+    first = questions(lending_ear.sent)[0]
+    assert lending_ear.uot_controller.state.state == "wait_answer"
+
+    # 質問を待っている間もイベントループが空いているので、別スレッドからのメッセージが処理される
+    lending_ear.post_message(f"assistant : {first}").result(timeout=5)
+    lending_ear.post_message("user : はい").result(timeout=5)
+
+    assert wait_for(lambda: len(questions(lending_ear.sent)) == 2)
+    assert questions(lending_ear.sent)[1] != first
+    assert wait_for(lambda: lending_ear.uot_controller.state.state == "wait_answer")
+
+    # 回答待ちのまま止めてもスレッドが終わる
+    lending_ear.stop()
+    assert lending_ear.thread is None
+
+
+def test_resumed_tree_asks_its_best_question_without_rebuilding(lending_ear, make_uot):
+    tree = make_uot(layers=2)
+    lending_ear.uot_controller.set_resume_snapshot(tree.to_snapshot())
+    lending_ear.main(lambda event, data: lending_ear.sent.append((event, data)), lambda: [])
+
+    assert wait_for(lambda: len(questions(lending_ear.sent)) == 1)
+    assert questions(lending_ear.sent)[0] == tree.best_question
+    # 最初の層は作り直さない (バックグラウンドの展開は葉の先だけ)
+    assert "root" not in lending_ear.generator.calls
+
+
+def test_uot_shares_the_backend_conversation_window(item_names):
+    # BackEndProcess と同じく、発話はウィンドウに追加してからコントローラーに渡す
+    conversation = ConversationWindow(max_turns=2)
+    for message in ["user : おはよう", "assistant : おはようございます", "user : 靴下がない"]:
+        conversation.append(message)
+    assert conversation.summary  # 最初の発話は要約に入っている
+
+    lending_ear = LendingEarController(_FakeKgDb(item_names), conversation=conversation)
+    uot_controller = lending_ear.uot_controller
+    assert uot_controller.contexts is conversation
+
+    # 要約の行を発話としてコピーせず、同じ発話を二重に追加しない
+    uot_controller.set_contexts(conversation.as_list())
+    asyncio.run(uot_controller.set_context("user : 靴下がない"))
+    assert conversation.turns == ["assistant : おはようございます", "user : 靴下がない"]
+    assert uot_controller.get_grobal_context_as_str() == conversation.as_str()
+
+
+class _ChatCompletionHandler(BaseHTTPRequestHandler):
+    """OpenAI 互換の /chat/completions を返す keep-alive のサーバー"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.connections.add(self.client_address)
+        body = json.dumps({
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "はい"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def chat_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ChatCompletionHandler)
+    server.connections = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class _OneCallSession:
+    """UoTController.run の代わりに、共有のチェーンを 1 回呼ぶ"""
+    def __init__(self, chain):
+        self.chain = chain
+        self.answers = []
+
+    async def run(self, is_debug=False):
+        self.answers.append(await self.chain.ainvoke({"question": "お腹は痛いですか?"}))
+
+
+def test_sessions_on_successive_loops_share_one_chain(monkeypatch, chat_server, item_names):
+    monkeypatch.setattr(llm_registry, "_llm_registry", None)
+    # リトライすると前のループの接続のエラーが隠れるので 0 回にする
+    model = llm_registry.get_llm("openai", "gpt-4o-mini", base_url=f"http://127.0.0.1:{chat_server.server_port}/v1", api_key="x", max_retries=0)
+    chain = PromptTemplate.from_template("{question}") | model | StrOutputParser()
+    lending_ear = LendingEarController(_FakeKgDb(item_names))
+
+    # main() と同じく、セッションごとに新しいループを別スレッドで回す
+    for _ in range(2):
+        session, loop = _OneCallSession(chain), asyncio.new_event_loop()
+        thread = threading.Thread(target=lending_ear.run_controller, args=(loop, session))
+        thread.start()
+        thread.join()
+        assert session.answers == ["はい"]
+        assert loop.is_closed()
+
+    # 前のループの keep-alive 接続は使い回さない
+    assert len(chat_server.connections) == 2
+    assert llm_registry.get_llm_registry().stats()["event_loops"] == 0
+    llm_registry.get_llm_registry().close()
@@ -0,0 +1,81 @@
+import sys
+import time
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from langchain.prompts import PromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from planning_modules.llm_cache import LLMCache, CachedChain, chain_fingerprint
+
+
+class _CountingChain:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, inputs, *args, **kwargs):
+        self.calls += 1
+        return {"answer": inputs["question"].upper()}
+
+
+def test_cached_chain_hits_memory_and_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    chain = _CountingChain()
+    cached = CachedChain(chain, LLMCache(path=path), fingerprint="chain")
+
+    assert cached.invoke({"question": "yes?"}) == {"answer": "YES?"}
+    # 前後の空白は正規化される
+    assert cached.invoke({"question": " yes?\n"}) == {"answer": "YES?"}
+    assert chain.calls == 1
+    assert cached.cache.stats()["memory_hits"] == 1
+
+    # 別プロセス相当: メモリは空で SQLite から読む
+    reloaded = CachedChain(chain, LLMCache(path=path), fingerprint="chain")
+    assert reloaded.invoke({"question": "yes?"}) == {"answer": "YES?"}
+    assert chain.calls == 1
+    assert reloaded.cache.stats()["disk_hits"] == 1
+
+    # fingerprint (テンプレート/モデル) が変わればミス
+    other = CachedChain(chain, LLMCache(path=path), fingerprint="other chain")
+    other.invoke({"question": "yes?"})
+    assert chain.calls == 2
+
+
+def test_ttl_and_lru_eviction(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite3"), ttl_seconds=0.05, max_memory_entries=2, max_disk_entries=2)
+    for i in range(3):
+        cache.set(f"key{i}", {"i": i})
+    assert len(cache._memory) == 2
+    assert cache._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 2
+    assert cache.get("key0") is None
+    assert cache.get("key2") == {"i": 2}
+
+    time.sleep(0.1)
+    assert cache.get("key2") is None
+    assert cache.stats()["misses"] == 2
+
+
+
+def test_expired_rows_are_swept_every_n_writes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = LLMCache(path=path, ttl_seconds=0.05, max_disk_entries=10, sweep_interval=3)
+    cache.set("key0", {"i": 0})
+    cache.set("key0", {"i": 0})  # 同じキーの上書きは行数を増やさない
+    assert cache.stats()["disk_entries"] == 1
+
+    time.sleep(0.1)
+    cache.set("key1", {"i": 1})
+    # 3 回目の書き込みで期限切れの key0 を消す
+    assert cache.stats()["disk_entries"] == 1
+    assert cache._conn.execute("SELECT key FROM llm_cache").fetchall() == [("key1",)]
+    # 行数は開いたときに 1 度だけ数える
+    assert LLMCache(path=path).stats()["disk_entries"] == 1
+
+    plan = cache._conn.execute("EXPLAIN QUERY PLAN DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),)).fetchall()
+    assert "llm_cache_expires_at" in str(plan)
+
+def test_fingerprint_depends_on_template():
+    model = RunnableLambda(lambda x: x)
+    chain_a = PromptTemplate.from_template("Q: {question}") | model
+    chain_b = PromptTemplate.from_template("Question: {question}") | model
+    assert chain_fingerprint(chain_a) != chain_fingerprint(chain_b)
+    assert chain_fingerprint(chain_a) == chain_fingerprint(PromptTemplate.from_template("Q: {question}") | model)
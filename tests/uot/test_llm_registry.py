@@ -0,0 +1,171 @@
+import asyncio
+import sys
+import threading
+import time
+from typing import Any
+
+import eventlet
+import pytest
+from langchain.prompts import PromptTemplate
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_openai import ChatOpenAI
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules import llm_registry
+from planning_modules.llm_cache import chain_fingerprint
+from planning_modules.llm_registry import LLMRegistry, parse_model_limits
+from planning_modules.lending_ear_modules.uot_modules.llm_concurrency import GlobalLLMLimiter
+
+
+class _SlowChatModel(FakeListChatModel):
+    """呼び出し中の数を数える偽モデル"""
+    delay: float = 0.05
+    state: Any = None
+
+    def _call(self, *args, **kwargs):
+        self._enter()
+        time.sleep(self.delay)
+        self._exit()
+        return "ok"
+
+    async def _acall(self, *args, **kwargs):
+        self._enter()
+        await asyncio.sleep(self.delay)
+        self._exit()
+        return "ok"
+
+    def _enter(self):
+        with self.state["lock"]:
+            self.state["in_flight"] += 1
+            self.state["peak"] = max(self.state["peak"], self.state["in_flight"])
+
+    def _exit(self):
+        with self.state["lock"]:
+            self.state["in_flight"] -= 1
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "x")
+    registry = LLMRegistry(model_limits={"slow": 2})
+    state = {"lock": threading.Lock(), "in_flight": 0, "peak": 0}
+    registry.register_provider("fake", lambda model, params, http_client: _SlowChatModel(responses=["ok"], state=state))
+    registry.state = state
+    yield registry
+    registry.close()
+
+
+def test_same_spec_returns_one_shared_client(registry):
+    first = registry.get("openai", "gpt-4o-mini", json_mode=True, max_tokens=4096)
+    assert registry.get("openai", "gpt-4o-mini", json_mode=True, max_tokens=4096) is first
+    assert registry.get("openai", "gpt-4o-mini", max_tokens=4096) is not first
+    assert registry.get("openai", "gpt-4o-mini", json_mode=True, max_tokens=1024) is not first
+    assert registry.stats()["created"] == 3 and registry.stats()["reused"] == 1
+    with pytest.raises(ValueError):
+        registry.get("unknown", "model")
+
+
+def test_openai_clients_share_one_keepalive_pool(registry):
+    mini = registry.get("openai", "gpt-4o-mini").bound
+    large = registry.get("openai", "gpt-4o").bound
+    assert mini.http_client is large.http_client
+    assert mini.root_client._client is large.root_client._client
+    assert registry.stats()["http_pools"] == 1
+    groq = registry.get("groq", "llama-3.2-90b-text-preview", api_key="x").bound
+    assert groq.http_client is not mini.http_client
+
+
+
+def test_each_event_loop_gets_its_own_async_client(registry):
+    model = registry.get("openai", "gpt-4o-mini")
+    seen = []
+
+    async def use():
+        bound = model._async_bound()
+        assert model._async_bound() is bound
+        seen.append(bound)
+        await registry.aclose_loop()
+
+    asyncio.run(use())
+    asyncio.run(use())
+    first, second = seen
+    assert first.http_async_client is not second.http_async_client
+    assert first.root_async_client._client is first.http_async_client
+    # 同期呼び出しは共有のプールのまま、ループの終わりに非同期クライアントは閉じている
+    assert first.http_client is model.bound.http_client
+    assert first.http_async_client.is_closed and second.http_async_client.is_closed
+    assert registry.stats()["event_loops"] == 0
+    # ループの外では共有のモデルを使う
+    assert model._async_bound() is model.bound
+
+def test_cache_fingerprint_is_unchanged(registry):
+    prompt = PromptTemplate.from_template("{question}")
+    shared = registry.get("openai", "gpt-4o-mini", json_mode=True)
+    legacy = ChatOpenAI(model="gpt-4o-mini").bind(response_format={"type": "json_object"})
+    assert chain_fingerprint(prompt | shared) == chain_fingerprint(prompt | legacy)
+
+
+def test_per_model_concurrency_limit(registry):
+    model = registry.get("fake", "slow")
+    threads = [threading.Thread(target=model.invoke, args=("hi",)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert registry.state["peak"] == 2
+
+    async def run_async():
+        await asyncio.gather(*(model.ainvoke("hi") for _ in range(6)))
+    registry.state["peak"] = 0
+    asyncio.run(run_async())
+    assert registry.state["peak"] == 2
+    assert registry.stats()["limiters"]["slow"]["calls"] == 12
+
+    # 上限が設定されていないモデルは制限しない
+    unlimited = registry.get("fake", "other")
+    registry.state["peak"] = 0
+    unlimited.batch(["hi"] * 4, config={"max_concurrency": 4})
+    assert registry.state["peak"] == 4
+
+
+def test_blocking_acquire_yields_to_other_green_threads():
+    # 待っている間もハブが回るので、スロットを持っているグリーンレットが返せる
+    limiter = GlobalLLMLimiter(1, poll_interval=0.001)
+    order = []
+
+    def hold():
+        limiter.acquire_blocking()
+        order.append("held")
+        eventlet.sleep(0.05)
+        order.append("released")
+        limiter.release()
+
+    def wait():
+        limiter.acquire_blocking()
+        order.append("acquired")
+        limiter.release()
+
+    holder = eventlet.spawn(hold)
+    eventlet.sleep(0)
+    waiter = eventlet.spawn(wait)
+    waiter.wait()
+    holder.wait()
+    assert order == ["held", "released", "acquired"]
+    assert limiter.stats["waits"] == 1 and limiter.stats["in_flight"] == 0
+
+
+def test_tree_nodes_share_the_enrichment_client(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "x")
+    monkeypatch.setattr(llm_registry, "_llm_registry", None)
+    from planning_modules.state_machine_modules import llm_enrichment
+    llm_enrichment._build_enrichment_chain.cache_clear()
+
+    models = {id(llm_enrichment.LLMEnrichment().chain.steps[1]) for _ in range(40)}
+    assert len(models) == 1
+    assert llm_registry.get_llm_registry().stats()["created"] == 1
+    llm_enrichment._build_enrichment_chain.cache_clear()
+
+
+def test_parse_model_limits():
+    assert parse_model_limits("gpt-4o-mini=8, claude-3-5-sonnet-20241022=4,broken") == {"gpt-4o-mini": 8, "claude-3-5-sonnet-20241022": 4}
+    assert parse_model_limits(None) == {}
@@ -0,0 +1,92 @@
+import asyncio
+import sys
+
+import pytest
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.lending_ear_modules.uot_modules import uot_node
+from planning_modules.lending_ear_modules.uot_modules.search_policy import (
+    BestFirstPolicy, BreadthFirstPolicy, SearchBudget, SearchPolicy, expandable_leaves, get_search_policy
+)
+
+
+@pytest.fixture
+def p_yes():
+    return lambda i, q, seed: ((i + 1) * 0.15 + q * 0.1) % 1.0
+
+
+def calls_per_expansion(uot) -> int:
+    return SearchPolicy.expansion_cost(uot.root.children[0])[0]
+
+
+def test_breadth_first_is_the_default_and_expands_every_leaf(monkeypatch, make_uot, fake_generator):
+    generator = fake_generator()
+    monkeypatch.setattr(uot_node, "generate_questions_and_estimate_probability", generator)
+    uot = make_uot(n_extend_layers=3)
+    assert isinstance(uot.search_policy, BreadthFirstPolicy)
+
+    asyncio.run(uot._extend_layers())
+    assert all(child.children for child in uot.root.children)
+    assert uot.search_report["policy"] == "breadth_first"
+    assert uot.search_report["stopped_by"] == "exhausted"
+    assert uot.search_report["expansions"] == 4
+    assert uot.search_report["llm_calls"] == 4 * calls_per_expansion(uot)
+
+
+def test_best_first_expands_most_promising_leaf_within_budget(monkeypatch, make_uot, fake_generator):
+    generator = fake_generator()
+    monkeypatch.setattr(uot_node, "generate_questions_and_estimate_probability", generator)
+    uot = make_uot(n_extend_layers=4)
+    budget_calls = calls_per_expansion(uot) * 2
+    uot.search_policy = BestFirstPolicy(SearchBudget(max_llm_calls=budget_calls), parallelism=1)
+
+    best = max(expandable_leaves(uot.root), key=lambda leaf: (leaf[0] * leaf[1].reward, leaf[0]))[1]
+    asyncio.run(uot._extend_layers())
+
+    report = uot.search_report
+    assert report["policy"] == "best_first"
+    assert report["stopped_by"] == "budget"
+    assert report["expansions"] == 2
+    assert report["llm_calls"] <= budget_calls
+    assert generator.expanded[0] == best.question + str(best.reply)
+    # 展開のたびに報酬と最良の質問が更新される
+    assert uot.best_question == uot.root.get_best_question()
+    assert uot.root.current_extended_depth >= 2
+
+
+def test_best_first_respects_token_budget(monkeypatch, make_uot, fake_generator):
+    monkeypatch.setattr(uot_node, "generate_questions_and_estimate_probability", fake_generator())
+    uot = make_uot(n_extend_layers=4)
+    uot.search_policy = BestFirstPolicy(SearchBudget(max_tokens=1))
+    asyncio.run(uot._extend_layers())
+    assert uot.search_report["expansions"] == 0
+    assert uot.search_report["stopped_by"] == "budget"
+    assert not any(child.children for child in uot.root.children)
+
+
+def test_deadline_cancels_in_flight_expansions(monkeypatch, make_uot, fake_generator):
+    monkeypatch.setattr(uot_node, "generate_questions_and_estimate_probability", fake_generator(delay=5))
+    uot = make_uot(n_extend_layers=4)
+    uot.search_policy = BestFirstPolicy(SearchBudget(max_seconds=0.05))
+    asyncio.run(asyncio.wait_for(uot._extend_layers(), 2))
+    assert uot.search_report["stopped_by"] == "deadline"
+    assert uot.search_report["seconds"] < 1
+    assert not any(child.children for child in uot.root.children)
+    # 途中で止まっても、その時点の最良の質問は使える
+    assert uot.best_question == uot.root.get_best_question()
+
+
+def test_search_policy_requires_extend():
+    with pytest.raises(TypeError):
+        SearchPolicy()
+
+
+def test_get_search_policy_from_env(monkeypatch):
+    monkeypatch.setenv("UOT_SEARCH_POLICY", "best_first")
+    monkeypatch.setenv("UOT_SEARCH_MAX_CALLS", "30")
+    monkeypatch.setenv("UOT_SEARCH_MAX_SECONDS", "2.5")
+    policy = get_search_policy()
+    assert isinstance(policy, BestFirstPolicy)
+    assert policy.budget == SearchBudget(max_llm_calls=30, max_tokens=None, max_seconds=2.5)
+    with pytest.raises(ValueError):
+        get_search_policy("depth_first")
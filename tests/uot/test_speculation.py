@@ -0,0 +1,109 @@
+import asyncio
+import sys
+
+import pytest
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.lending_ear_modules.uot_modules import speculation
+from planning_modules.lending_ear_modules.uot_modules.chat_utils import EstimationPackingPolicy, estimate_llm_calls
+
+
+@pytest.fixture
+def calls_per_expansion(item_names) -> int:
+    return estimate_llm_calls(len(item_names), 2, 3, None)
+
+
+def test_estimate_llm_calls():
+    assert estimate_llm_calls(1, 4) == 0
+    assert estimate_llm_calls(25, 4, max_item_size_at_once=10) == 1 + 4 * 3
+    assert estimate_llm_calls(25, 4, estimation_policy=EstimationPackingPolicy(items_per_call=30, questions_per_call=4)) == 2
+    assert estimate_llm_calls(25, 5, estimation_policy=EstimationPackingPolicy(items_per_call=10, questions_per_call=4)) == 1 + 2 * 3
+
+
+def test_plan_targets_leaves_under_both_answers_within_budget(make_uot, calls_per_expansion):
+    uot = make_uot(layers=2, speculation_budget=calls_per_expansion * 3)
+    yes_node, no_node = uot.root.get_yes_no_nodes(uot.best_question)
+    branches = uot.speculation.plan(uot.root, uot.best_question)
+
+    targets = [node for branch in branches for node in branch.targets]
+    assert len(targets) == 3
+    assert all(node.is_terminal and not node.children for node in targets)
+    assert {branch.node for branch in branches} <= {yes_node, no_node}
+    assert all(node.parent is branch.node for branch in branches for node in branch.targets)
+    assert sum(branch.calls for branch in branches) <= uot.speculation.budget_calls
+
+    # 確率の高い枝の葉から順に選ばれる
+    weights = sorted(((node.parent.p_reply * node.p_reply, node) for node in yes_node.children + no_node.children), key=lambda x: -x[0])
+    assert set(targets) == {node for _, node in weights[:3]}
+
+
+def test_disabled_without_budget(monkeypatch, make_uot, fake_generator):
+    generator = fake_generator()
+    monkeypatch.setattr(speculation, "generate_questions_and_estimate_probability", generator)
+    uot = make_uot(layers=2, speculation_budget=0)
+    assert uot.speculate() == 0
+    assert generator.calls == []
+
+
+def test_answer_cancels_losing_branch_and_keeps_winner(monkeypatch, make_uot, fake_generator, calls_per_expansion):
+    uot = make_uot(layers=2, speculation_budget=calls_per_expansion * 8)
+    yes_node, no_node = uot.root.get_yes_no_nodes(uot.best_question)
+    generator = fake_generator(n_questions=1, block_prefix=f"{no_node.question}/False")
+    monkeypatch.setattr(speculation, "generate_questions_and_estimate_probability", generator)
+
+    async def scenario():
+        async def no_extension():
+            return None
+        uot.extend = no_extension
+
+        assert uot.speculate() == 4
+        await asyncio.wait_for(generator.started.wait(), 5)
+        # yes の枝の先読みが終わってから回答が届く
+        for branch in uot.speculation._branches:
+            if branch.node is yes_node:
+                await asyncio.gather(*branch.tasks)
+        assert all(child.children for child in yes_node.children)
+
+        await uot.answer(0.9)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+
+    # 次の質問はすぐに使え、先読みした層は新しい木に残る
+    assert uot.root is yes_node
+    assert uot.best_question is not None
+    assert all(child.children for child in uot.root.children)
+    assert all(child.depth == 1 and not child.is_terminal for child in uot.root.children)
+    assert all(grandchild.is_terminal for child in uot.root.children for grandchild in child.children)
+    # 選ばれなかった枝の LLM 呼び出しはキャンセルされ、結果は木に入らない
+    assert len(generator.cancelled) == 2
+    assert not any(child.children for child in no_node.children)
+    stats = uot.speculation.get_stats()
+    assert stats["expanded"] == 2
+    assert stats["cancelled"] == 2
+
+
+def test_answer_waits_for_running_winner_before_background_extension(monkeypatch, make_uot, fake_generator, calls_per_expansion):
+    uot = make_uot(layers=2, speculation_budget=calls_per_expansion * 8)
+    yes_node, _ = uot.root.get_yes_no_nodes(uot.best_question)
+    generator = fake_generator(n_questions=1, block_prefix=f"{yes_node.question}/True")
+    monkeypatch.setattr(speculation, "generate_questions_and_estimate_probability", generator)
+
+    order = []
+
+    async def extend_layers():
+        order.append(("extend", all(child.children for child in uot.root.children)))
+    uot._extend_layers = extend_layers
+
+    async def scenario():
+        uot.speculate()
+        await asyncio.wait_for(generator.started.wait(), 5)
+        await uot.answer(0.9)
+        assert uot.best_question is not None  # 先読みを待たずに次の質問が決まる
+        order.append("answered")
+        generator.release.set()
+        while uot.extension_task is not None:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert order == ["answered", ("extend", True)]
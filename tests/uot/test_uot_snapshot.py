@@ -0,0 +1,127 @@
+import asyncio
+import json
+import sys
+
+import msgpack
+import numpy as np
+import pytest
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from planning_modules.lending_ear_modules.uot_modules.uot import UoT
+from planning_modules.lending_ear_modules.uot_modules.uot_snapshot import SNAPSHOT_VERSION, SnapshotError, dump_uot, load_uot, read_header
+from utils.state_store import InMemoryRedis, SessionStateStore
+
+@pytest.fixture
+def p_yes():
+    return lambda i, q, seed: (i * 0.15 + q * 0.1) % 1.0
+
+
+@pytest.fixture
+def uot(make_uot):
+    """2 層分の木 (根の子のうち 2 つだけ展開済み)"""
+    return make_uot(layers=2, grown=2, unknown_reward_prob_ratio=0.3)
+
+
+def flatten(node, depth=0):
+    yield depth, node
+    for child in node.children:
+        yield from flatten(child, depth + 1)
+
+
+def test_round_trip_preserves_tree(uot):
+    restored = load_uot(dump_uot(uot))
+
+    original_nodes = list(flatten(uot.root))
+    restored_nodes = list(flatten(restored.root))
+    assert len(restored_nodes) == len(original_nodes) == 1 + 4 + 4
+    for (depth_a, a), (depth_b, b) in zip(original_nodes, restored_nodes):
+        assert depth_a == depth_b
+        assert a.question == b.question
+        assert a.reply == b.reply
+        assert a.p_reply == b.p_reply
+        assert a.history == b.history
+        assert a.depth == b.depth
+        assert a.is_terminal == b.is_terminal
+        assert a.reward == b.reward
+        assert a.information_gain == b.information_gain
+        assert a.belief.index.names == b.belief.index.names
+        assert a.belief.index.descriptions == b.belief.index.descriptions
+        np.testing.assert_array_equal(a.belief.probs, b.belief.probs)
+        assert b.n_extend_layers == 3 and b.lambda_ == 20
+        if b.parent is not None:
+            assert b in b.parent.children
+
+    assert restored.best_question == uot.best_question
+    assert restored.root.get_best_question() == uot.root.get_best_question()
+    assert restored.root.current_extended_depth == 2
+    assert restored.unknown_reward_prob_ratio == 0.3
+
+
+def test_round_trip_shares_item_tables_and_generated_info(uot):
+    restored = load_uot(dump_uot(uot))
+
+    # 全ノードで同じ ItemIndex を共有していれば、保存時もテーブルは 1 つだけ
+    assert len(read_header(dump_uot(uot))["indexes"]) == 1
+    indexes = {id(node.belief.index) for _, node in flatten(restored.root)}
+    assert len(indexes) == 1
+
+    # 展開していない子ノードは親と同じ generated_info のリストを共有している
+    yes_node, no_node = restored.root.children[2:4]
+    assert yes_node.generated_info is no_node.generated_info
+    info = yes_node.generated_info[0]
+    original_info = uot.root.children[2].generated_info[0]
+    assert info["question"] == original_info["question"]
+    np.testing.assert_array_equal(info["p_yes_given_items"], original_info["p_yes_given_items"])
+    np.testing.assert_array_equal(info["omega_yes"].probs, original_info["omega_yes"].probs)
+    assert info["omega_yes"].index is restored.root.belief.index
+
+
+def test_restored_tree_can_answer(uot):
+    restored = load_uot(dump_uot(uot))
+    best_question = restored.root.get_best_question()
+    yes_node, _ = restored.root.get_yes_no_nodes(best_question)
+
+    async def answer():
+        async def no_extension():
+            return None
+        restored.extend = no_extension
+        await restored.answer(0.9)
+
+    asyncio.run(answer())
+    assert restored.root.question == best_question
+    assert restored.root.parent is None
+    assert restored.root.belief.probs.sum() == pytest.approx(1.0)
+
+
+def test_snapshot_is_smaller_than_debug_json(uot):
+    assert len(dump_uot(uot)) < len(json.dumps(uot.store_results(), ensure_ascii=False).encode("utf-8"))
+
+
+def test_rejects_other_versions_and_broken_data(uot):
+    snapshot = msgpack.unpackb(dump_uot(uot), raw=False)
+    snapshot["version"] = SNAPSHOT_VERSION + 1
+    with pytest.raises(SnapshotError, match="version"):
+        load_uot(msgpack.packb(snapshot, use_bin_type=True))
+    with pytest.raises(SnapshotError):
+        load_uot(b"not a snapshot")
+    with pytest.raises(SnapshotError):
+        load_uot(msgpack.packb({"magic": "something else"}))
+
+
+def test_debug_json_round_trip(tmp_path, uot):
+    filename = tmp_path / "uot_results.json"
+    uot.save_results_to_file(str(filename))
+    loaded = UoT.load_results_from_file(str(filename))
+    assert [node.question for _, node in flatten(loaded.root)] == [node.question for _, node in flatten(uot.root)]
+    assert loaded.root.children[0].reward == pytest.approx(uot.root.children[0].reward)
+
+
+def test_state_store_keeps_snapshot_next_to_state(uot):
+    store = SessionStateStore(InMemoryRedis(), ttl=60)
+    snapshot = uot.to_snapshot()
+    store.save("u1", {"dialogue_id": "d1"})
+    assert store.save_snapshot("u1", snapshot)
+    assert UoT.from_snapshot(store.load_snapshot("u1")).best_question is not None
+    store.delete("u1")
+    assert store.load_snapshot("u1") is None
+    assert store.load("u1") is None
@@ -0,0 +1,61 @@
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from utils.auth_session import SocketAuthSessions, UserCache
+
+
+def make_sessions(users, exp=None):
+    calls = {"decode": 0, "load": 0}
+
+    def decode_token(token):
+        calls["decode"] += 1
+        if not token.startswith("valid:"):
+            raise ValueError("invalid token")
+        return {"user_id": token.split(":", 1)[1], "exp": exp or time.time() + 3600}
+
+    def load_user(user_id):
+        calls["load"] += 1
+        return users.get(user_id)
+
+    return SocketAuthSessions(decode_token, UserCache(load_user, ttl=300)), calls
+
+
+def test_events_reuse_session_established_at_connect():
+    sessions, calls = make_sessions({"u1": SimpleNamespace(id="u1", name="Alice", fcm_token=None)})
+
+    is_valid, user, _ = sessions.establish("sid-1", "valid:u1")
+    assert is_valid and user.id == "u1"
+    for _ in range(5):
+        assert sessions.check("sid-1", "valid:u1") == (True, user, None)
+    assert calls == {"decode": 1, "load": 1}
+
+    # 別の接続でも UserAuth はキャッシュから引く
+    sessions.establish("sid-2", "valid:u1")
+    assert calls == {"decode": 2, "load": 1}
+
+
+def test_invalid_or_expired_tokens_are_rejected():
+    sessions, calls = make_sessions({"u1": SimpleNamespace(id="u1", name="Alice", fcm_token=None)}, exp=time.time() - 1)
+    assert sessions.check("sid-1", None) == (False, None, 'Token is missing!')
+    assert sessions.check("sid-1", "broken") == (False, None, 'Token is invalid!')
+    assert sessions.check("sid-1", "valid:unknown") == (False, None, 'User not found!')
+
+    # 期限切れのセッションは使わず、毎回検証し直す
+    sessions.establish("sid-1", "valid:u1")
+    sessions.check("sid-1", "valid:u1")
+    assert calls["decode"] == 4
+    assert sessions.purge_expired() == 1
+    assert len(sessions) == 0
+
+
+def test_user_cache_invalidate():
+    users = {"u1": SimpleNamespace(id="u1", name="Alice", fcm_token=None)}
+    cache = UserCache(users.get, ttl=300)
+    assert cache.get("u1").fcm_token is None
+    users["u1"] = SimpleNamespace(id="u1", name="Alice", fcm_token="fcm")
+    assert cache.get("u1").fcm_token is None
+    cache.invalidate("u1")
+    assert cache.get("u1").fcm_token == "fcm"
+    assert cache.stats()["hits"] == 1
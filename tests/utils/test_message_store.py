@@ -0,0 +1,56 @@
+import sys
+
+from flask import Flask
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from utils.models import db, UserAuth
+from utils.message_store import MessageStore
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(UserAuth(id="u1", name="Alice", api_key="key"))
+        db.session.commit()
+    return app
+
+
+def test_write_behind_batches_inserts():
+    app = make_app()
+    scheduled = []
+    store = MessageStore(db, flush_interval=1.0, max_batch=3, schedule=lambda delay, fn: scheduled.append(fn))
+    with app.app_context():
+        store.add("u1", "d1", "hello")
+        store.add("u1", "d1", "world")
+        assert store.pending_count() == 2
+        assert len(scheduled) == 1  # 1回だけスケジュールされる
+
+        store.add("u1", "d1", "!")  # max_batch に達したらすぐ書き込む
+        assert store.pending_count() == 0
+        assert store.stats["flushes"] == 1
+
+        store.add("u1", "d2", "later")
+    scheduled[-1]()  # アプリケーションコンテキスト外のタイマーからでも書き込める
+    assert store.stats["flushed"] == 4
+
+
+def test_history_keyset_pagination_reads_own_writes():
+    app = make_app()
+    store = MessageStore(db, max_batch=100, schedule=lambda delay, fn: None)
+    with app.app_context():
+        for i in range(5):
+            store.add("u1", "d1" if i < 4 else "d2", f"m{i}")
+
+        page, cursor = store.get_history("u1", limit=2)
+        assert [m.content for m in page] == ["m4", "m3"]
+        page, cursor = store.get_history("u1", limit=2, before=cursor)
+        assert [m.content for m in page] == ["m2", "m1"]
+        page, cursor = store.get_history("u1", limit=2, before=cursor)
+        assert [m.content for m in page] == ["m0"] and cursor is None
+
+        page, _ = store.get_history("u1", dialogue_id="d1", limit=10)
+        assert [m.content for m in page] == ["m3", "m2", "m1", "m0"]
+        assert store.get_last_message("u1").dialogue_id == "d2"
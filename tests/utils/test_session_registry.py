@@ -0,0 +1,63 @@
+import sys
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from utils.session_registry import SessionRegistry, count_tree_nodes
+
+
+class _FakeNode:
+    def __init__(self, *children):
+        self.children = list(children)
+
+
+class _FakeBackend:
+    def __init__(self, expired=False):
+        self.expired = expired
+        self.stopped = False
+
+    def is_expired(self):
+        return self.expired
+
+    def force_stop(self):
+        self.stopped = True
+
+    def memory_stats(self):
+        return {"active": not self.stopped, "message_count": 3, "uot_nodes": 5}
+
+
+def test_lru_cap_evicts_least_recently_used():
+    registry = SessionRegistry(max_sessions=2)
+    a, b, c = _FakeBackend(), _FakeBackend(), _FakeBackend()
+    registry["a"] = a
+    registry["b"] = b
+    assert registry["a"] is a  # a を使ったので b が最も古い
+    registry["c"] = c
+
+    assert "b" not in registry and b.stopped
+    assert registry.keys() == ["a", "c"]
+    assert registry.stats["evicted_lru"] == 1
+
+
+def test_reaper_evicts_idle_sessions():
+    registry = SessionRegistry()
+    idle, busy = _FakeBackend(expired=True), _FakeBackend()
+    registry["idle"] = idle
+    registry["busy"] = busy
+
+    loops = []
+    registry.start_reaper(spawn=lambda fn: loops.append(fn) or "greenlet", sleep=lambda _: None)
+    assert registry.start_reaper() == "greenlet"  # 二重起動しない
+
+    assert registry.reap() == ["idle"]
+    assert idle.stopped and not busy.stopped
+    assert registry.pop("idle") is None
+
+
+def test_memory_stats_totals():
+    registry = SessionRegistry()
+    registry["a"] = _FakeBackend()
+    registry["b"] = _FakeBackend()
+    stats = registry.memory_stats()
+    assert stats["session_count"] == 2
+    assert stats["totals"] == {"message_count": 6, "uot_nodes": 10}
+    assert count_tree_nodes(_FakeNode(_FakeNode(), _FakeNode(_FakeNode()))) == 4
+    assert count_tree_nodes(None) == 0
@@ -0,0 +1,33 @@
+import os
+import sys
+
+sys.path.insert(0, './')  # プロジェクトのルートディレクトリをパスに追加
+from utils.import_profile import format_report, parse_importtime, profile_imports
+
+# app.py は Firebase / DB の設定がないと import できないので、その依存モジュール全体 (utils) で測る
+STARTUP_MODULE = "utils"
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_IMPORT_BUDGET_SECONDS", 2.5))
+
+
+def test_web_process_import_skips_heavy_subsystems():
+    profile = profile_imports(STARTUP_MODULE)
+    assert profile["ok"], profile["error"]
+    assert profile["heavy_loaded"] == []
+
+
+def test_web_process_import_within_budget():
+    profile = profile_imports(STARTUP_MODULE)
+    assert profile["ok"], profile["error"]
+    assert profile["total_seconds"] < STARTUP_BUDGET_SECONDS, format_report(profile)
+
+
+def test_parse_importtime():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       120 |        120 |     json.decoder",
+        "import time:       300 |        420 |   json",
+        "import time:        50 |        470 | mymodule",
+    ])
+    entries = parse_importtime(stderr)
+    assert [(entry["name"], entry["depth"]) for entry in entries] == [("json.decoder", 2), ("json", 1), ("mymodule", 0)]
+    assert entries[-1]["cumulative_us"] == 470
@@ -1,4 +1,8 @@
 from .models import db, UserAuth, Message
 from .backend_process import BackEndProcess
+from .message_store import MessageStore, get_message_store
+from .session_registry import SessionRegistry
+from .state_store import SessionStateStore, get_redis_url, get_state_store
+from .auth_session import CachedUser, SocketAuthSessions, UserCache, get_user_cache_config
 
 from .langchain4j2langchain import parse_to_langchain_message_str
\ No newline at end of file
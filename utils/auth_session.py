@@ -0,0 +1,161 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """
+    ソケットイベント用に保持する UserAuth の読み取り専用コピー
+    (ORM インスタンスは DB セッションをまたいで使えないため、必要な列だけを持つ)
+    """
+    id: str
+    name: str
+    fcm_token: Optional[str] = None
+
+    @classmethod
+    def from_model(cls, user) -> "CachedUser":
+        return cls(id=user.id, name=user.name, fcm_token=user.fcm_token)
+
+
+class UserCache:
+    """
+    user_id -> CachedUser の TTL 付き LRU キャッシュ
+    loader (user_id -> UserAuth or None) の結果を ttl 秒保持する。存在しないユーザーはキャッシュしない
+    """
+
+    def __init__(self, loader: Callable[[str], Any], ttl: float = 300, max_entries: int = 1000):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, CachedUser]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[CachedUser]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        user = self.loader(user_id)
+        if user is None:
+            return None
+        cached = CachedUser.from_model(user)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, cached)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cached
+
+    def invalidate(self, user_id: str) -> None:
+        """ユーザー情報を更新した後に呼ぶ"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+@dataclass
+class AuthSession:
+    """1つのソケット接続 (sid) の認証済みセッション。トークンの有効期限で失効する"""
+    sid: str
+    user: CachedUser
+    token_hash: str
+    expires_at: float
+
+    def is_valid_for(self, token_hash: str, now: Optional[float] = None) -> bool:
+        return self.token_hash == token_hash and (now if now is not None else time.time()) < self.expires_at
+
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class SocketAuthSessions:
+    """
+    connect 時に一度だけ JWT を検証し、以降のイベントは request.sid で認証済みセッションを引く
+
+    decode_token: token -> payload (user_id, exp)。不正なトークンは例外を投げる
+    user_cache: user_id -> CachedUser
+    戻り値は従来の check_token と同じ (is_valid, current_user, error_message)
+    """
+
+    def __init__(self, decode_token: Callable[[str], Dict[str, Any]], user_cache: UserCache, default_ttl: float = 3600):
+        self.decode_token = decode_token
+        self.user_cache = user_cache
+        self.default_ttl = default_ttl
+        self._sessions: Dict[str, AuthSession] = {}
+        self._lock = threading.Lock()
+
+    def verify(self, token: Optional[str]) -> Tuple[bool, Optional[CachedUser], Optional[str], Optional[float]]:
+        """トークンを検証してユーザーを取得 (セッションは作らない)"""
+        if not token:
+            return (False, None, 'Token is missing!', None)
+        try:
+            data = self.decode_token(token)
+            user = self.user_cache.get(data['user_id'])
+        except Exception:
+            return (False, None, 'Token is invalid!', None)
+        if user is None:
+            return (False, None, 'User not found!', None)
+        expires_at = float(data['exp']) if data.get('exp') else time.time() + self.default_ttl
+        return (True, user, None, expires_at)
+
+    def establish(self, sid: str, token: Optional[str]) -> Tuple[bool, Optional[CachedUser], Optional[str]]:
+        """connect 時にトークンを検証し、sid の認証済みセッションを作る"""
+        is_valid, user, error_message, expires_at = self.verify(token)
+        if not is_valid:
+            self.discard(sid)
+            return (False, None, error_message)
+        with self._lock:
+            self._sessions[sid] = AuthSession(sid=sid, user=user, token_hash=_hash_token(token), expires_at=expires_at)
+        return (True, user, None)
+
+    def check(self, sid: str, token: Optional[str]) -> Tuple[bool, Optional[CachedUser], Optional[str]]:
+        """
+        イベントごとの認証
+        同じトークンの有効なセッションがあれば JWT のデコードも DB 参照もしない。無ければ (失効・別トークン) 検証し直す
+        """
+        if not token:
+            return (False, None, 'Token is missing!')
+        with self._lock:
+            session = self._sessions.get(sid)
+        if session is not None and session.is_valid_for(_hash_token(token)):
+            return (True, session.user, None)
+        return self.establish(sid, token)
+
+    def discard(self, sid: str) -> None:
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items() if session.expires_at <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+def get_user_cache_config() -> Dict[str, float]:
+    """ユーザーキャッシュの設定 (環境変数で調整可能)"""
+    return {
+        "ttl": float(os.getenv("AUTH_USER_CACHE_TTL", 300)),
+        "max_entries": int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", 1000)),
+    }
@@ -4,19 +4,30 @@ import uuid
 import traceback
 from typing import Any
 
-from .models import Message
-from planning_modules.lending_ear_modules.lend_main import LendingEarController
-from planning_modules.state_machine_modules.instruction_controller import InstructionController
-from planning_modules.demo_module.st import LinearConversationController
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, BaseMessage
-from langchain_fireworks import ChatFireworks
+from .message_store import get_message_store
+from .session_registry import count_tree_nodes
+from .state_store import get_state_store
+from planning_modules.conversation_window import ConversationWindow
+# LLM・KG まわりのモジュール (langchain, 各社の SDK, neo4j) は重いので、
+# Web プロセスの起動時ではなく最初のセッションで読み込む (controller_classes / summarize_conversation)
 
 from flask_socketio import disconnect
-from neo4j import AsyncGraphDatabase  # 同期版からAsyncGraphDatabaseに変更
 
 from eventlet.green import threading
 import eventlet
 
+def controller_classes():
+    """Imports the dialogue controllers on first use (keeps `import app` free of langchain / provider SDKs)."""
+    from planning_modules.lending_ear_modules.lend_main import LendingEarController
+    from planning_modules.state_machine_modules.instruction_controller import InstructionController
+    return LendingEarController, InstructionController
+
+
+def summarize_conversation(*args, **kwargs):
+    from planning_modules.lending_ear_modules.uot_modules.chat_utils import summarize_conversation
+    return summarize_conversation(*args, **kwargs)
+
+
 class BackEndProcess:
     """
     Class representing the backend process for handling socket connections.
@@ -40,16 +51,26 @@ class BackEndProcess:
         self.client_data = client_data
         self.active = True
         self.is_debug = True  # デバッグモードを有効化
-        self.dialogue_id = self.get_or_create_dialogue_id()
         self.db = db
+        self.message_store = get_message_store(db)
+        # 会話履歴はトークン数で上限を決めたウィンドウで持つ (追い出した発話は要約に畳み込む)
+        self.conversation = ConversationWindow.from_env(summarizer=summarize_conversation)
+        self.dialogue_id = self.get_or_create_dialogue_id()
         self.kg_db = kg_db
         self.lending_ear_controller = None
         self.conversation_controller = None
         self._ping_greenlet = None
         self.current_thread = None  # スレッド管理用の変数を追加
         self._current_instruction = None  # 現在のインストラクション状態を保持
+        self.mode = None  # "lending_ear" / "instruction"
+        self._last_state_info = None  # 最後に送った next_state_info (インストラクションのカーソル)
+        self._restored_beliefs = None  # 再接続時に引き継いだ UoT の信念 (item name -> p_s)
+        self._resume_instruction = False
+        self._resume_uot = False  # 再接続時に保存済みの UoT の木から再開するか
+        self.state_store = get_state_store()
         
 
+        _, InstructionController = controller_classes()
         self.conversation_controller = InstructionController(
             send_socket=self.send_socket,
             kg_db=self.kg_db,
@@ -78,6 +99,22 @@ class BackEndProcess:
         """タイムアウトしているかチェック"""
         return (datetime.datetime.utcnow() - self.last_activity).total_seconds() > self.INACTIVE_TIMEOUT
 
+    def memory_stats(self) -> dict:
+        """このセッションが保持しているもの (木のノード数・メッセージ数など) の集計"""
+        uot_controller = getattr(self.lending_ear_controller, 'uot_controller', None)
+        uot = getattr(uot_controller, 'uot', None)
+        instruction_graph = getattr(self.conversation_controller, 'instruction_graph', None)
+        return {
+            "active": self.active,
+            "is_running": self.is_running,
+            "idle_seconds": int((datetime.datetime.utcnow() - self.last_activity).total_seconds()),
+            "message_count": len(self.conversation),
+            "conversation_tokens": self.conversation.token_count,
+            "uot_nodes": count_tree_nodes(uot.root) if uot else 0,
+            "uot_context_tokens": uot_controller.contexts.token_count if uot_controller else 0,
+            "instruction_nodes": count_tree_nodes(getattr(instruction_graph, 'virtual_root', None)),
+        }
+
     def lending_ear_run(self):
         """傾聴モードの実行"""
         if self.is_running:
@@ -86,14 +123,26 @@ class BackEndProcess:
             
         self.is_running = True
         self.active = True
+        self.mode = "lending_ear"
         self.update_activity()
+        self.save_state()
         
         print(f"run lending ear: {self.room}")
         self.socketio.emit('announce', {'announce': 'Hello, LendingEar Started!'}, room=self.room)
      
         # コントローラーを初期化（既存のものがあれば再利用）
         if not self.lending_ear_controller:
-            self.lending_ear_controller = LendingEarController(self.kg_db)
+            LendingEarController, _ = controller_classes()
+            self.lending_ear_controller = LendingEarController(self.kg_db, conversation=self.conversation)
+            uot_controller = self.lending_ear_controller.uot_controller
+            if self._restored_beliefs:
+                uot_controller.set_initial_beliefs(self._restored_beliefs)
+                self._restored_beliefs = None
+            if self._resume_uot:
+                # 展開済みの木があればそこから再開する (LLM 呼び出しをやり直さない)
+                uot_controller.set_resume_snapshot(self.state_store.load_snapshot(self.client_data.id))
+                self._resume_uot = False
+            uot_controller.set_snapshot_saver(lambda snapshot: self.state_store.save_snapshot(self.client_data.id, snapshot))
         self.conversation_controller = None
         
         self.send_socket("instruction", {
@@ -120,7 +169,9 @@ class BackEndProcess:
             
         self.is_running = True
         self.active = True
+        self.mode = "instruction"
         self.update_activity()
+        self.save_state()
         
         self.debug_print(f"指示モードを開始します - Room: {self.room}")
         self.socketio.emit('announce', {'announce': 'Hello, Instruction Started!'}, room=self.room)
@@ -128,6 +179,7 @@ class BackEndProcess:
         
         if not self.conversation_controller:
             self.debug_print("新しい指示コントローラーを作成します")
+            _, InstructionController = controller_classes()
             self.conversation_controller = InstructionController(
                 send_socket=self.send_socket,
                 kg_db=self.kg_db,
@@ -170,18 +222,24 @@ class BackEndProcess:
             print(f"##### >>> [DEBUG:BackendProcess] Skipping socket event {event} - process not active")
             return
         
-        print(f"##### >>> [DEBUG:BackendProcess] Sending socket event: {event}, data: {data}")
+        # トークンごとに届く差分イベントはログに出さない
+        verbose = event != "next_state_info_delta"
+        if verbose:
+            print(f"##### >>> [DEBUG:BackendProcess] Sending socket event: {event}, data: {data}")
+        if event == "next_state_info" and isinstance(data, dict):
+            self._last_state_info = {"current_state": data.get("current_state"), "title": data.get("title")}
         try:
             # 直接emit（eventletコンテキスト内で実行されているため）
             self.socketio.emit(event, data, room=self.room)
-            print(f"##### >>> [DEBUG:BackendProcess] Successfully emitted {event}")
+            if verbose:
+                print(f"##### >>> [DEBUG:BackendProcess] Successfully emitted {event}")
         except Exception as e:
             print(f"##### >>> [ERROR:BackendProcess] Error in socket emission: {e}")
             traceback.print_exc()
 
     def get_messages(self):
-        """ Get the message list. """
-        return self.messages
+        """ Get the message list (summary of older turns + recent turns). """
+        return self.conversation.as_list()
 
     def set_room(self, room):
         """ルームの更新時にアクティビティも更新"""
@@ -195,13 +253,13 @@ class BackEndProcess:
     
     def get_or_create_dialogue_id(self):
         """ Check if the last message was sent within the timeout to detect same context or not."""
-        last_message = Message.query.filter_by(user_id=self.client_data.id).order_by(Message.timestamp.desc()).first()
+        last_message = self.message_store.get_last_message(self.client_data.id)
         if last_message and (datetime.datetime.utcnow() - last_message.timestamp).total_seconds() < self.DIALOGUE_ID_TIMEOUT:
             # Regard it as the same conversation if the last message was sent within the timeout 
             
             # Add the message to the conversation (Previous entries for the number of LIMITS, starting from the oldest to the newest)
             same_context_messages = self.get_same_context_messages_desc(self.client_data.id, last_message.dialogue_id)
-            self.messages = same_context_messages[::-1]
+            self.conversation.extend(same_context_messages[::-1])
             return last_message.dialogue_id
         else:
             return str(uuid.uuid4())
@@ -209,11 +267,9 @@ class BackEndProcess:
     def set_messages(self, message_content: str):
         """メッセージ設定時にアクティビティを更新"""
         self.update_activity()
-        # メッセージをデータベースに保存
-        new_message = Message(user_id=self.client_data.id, dialogue_id=self.dialogue_id, content=message_content)
-        self.db.session.add(new_message)
-        self.db.session.commit()
-        self.messages.append(message_content)
+        # メッセージをデータベースに保存 (まとめて書き込むので、ここではコミットを待たない)
+        self.message_store.add(self.client_data.id, self.dialogue_id, message_content)
+        self.conversation.append(message_content)
 
         # 現在アクティブなコントローラーにのみメッセージを送信
         def process_message():
@@ -221,7 +277,7 @@ class BackEndProcess:
                 print("Processing message...")
                 if self.lending_ear_controller:
                     print("Using lending ear controller")
-                    self.lending_ear_controller.set_message(message_content)
+                    self.lending_ear_controller.post_message(message_content)
                     print("Message set, requesting next question...")
                     self.lending_ear_controller.request_next_question()
                     print("Next question requested")
@@ -239,13 +295,58 @@ class BackEndProcess:
             print(f"Error processing message: {e}")
 
     def get_recent_messages_desc(self, user_id, limit=50) -> list[str]:
-        messages = Message.query.filter_by(user_id=user_id).order_by(Message.timestamp.desc()).limit(limit).all()
+        messages, _ = self.message_store.get_history(user_id, limit=limit)
         return [message.content for message in messages]
     
     def get_same_context_messages_desc(self, user_id, dialogue_id, limit=50) -> list[str]:
-        messages = Message.query.filter_by(user_id=user_id, dialogue_id=dialogue_id).order_by(Message.timestamp.desc()).limit(limit).all()
+        messages, _ = self.message_store.get_history(user_id, dialogue_id=dialogue_id, limit=limit)
         return [message.content for message in messages]
     
+    # ------------------------------------------------------------------
+    # 外部に保存するセッション状態 (別のワーカー・ノードへの再接続用)
+    # ------------------------------------------------------------------
+    def export_state(self) -> dict:
+        """JSON にできるセッション状態 (対話ID・モード・インストラクションのカーソル・UoT の信念)"""
+        uot = getattr(getattr(self.lending_ear_controller, 'uot_controller', None), 'uot', None)
+        selected_candidate = self._current_instruction or getattr(self.conversation_controller, '_selected_candidate', None)
+        return {
+            "version": 1,
+            "dialogue_id": self.dialogue_id,
+            "mode": self.mode,
+            "selected_candidate": selected_candidate,
+            "instruction_cursor": self._last_state_info,
+            "uot_beliefs": {name: float(p) for name, p in uot.root.belief.as_pairs()} if uot else self._restored_beliefs,
+            "saved_at": datetime.datetime.utcnow().isoformat()
+        }
+
+    def restore_state(self, state: dict) -> bool:
+        """
+        export_state の内容を引き継ぐ (同じ対話が続いている場合のみ)
+        インストラクションは選択されていた候補から、UoT は保存された信念から再開する
+        """
+        if not state or state.get("dialogue_id") != self.dialogue_id:
+            self.debug_print("保存された状態は別の対話のものなので引き継ぎません")
+            return False
+        self.mode = state.get("mode")
+        self._current_instruction = state.get("selected_candidate")
+        self._last_state_info = state.get("instruction_cursor")
+        self._restored_beliefs = state.get("uot_beliefs")
+        self._resume_instruction = self.mode == "instruction" and bool(self._current_instruction)
+        self._resume_uot = self.mode == "lending_ear"
+        self.debug_print(f"状態を引き継ぎました: mode={self.mode}, candidate={self._current_instruction}, cursor={self._last_state_info}")
+        return True
+
+    def save_state(self) -> bool:
+        return self.state_store.save(self.client_data.id, self.export_state())
+
+    def on_client_connect(self, sid=None):
+        """WebSocket の準備完了時: 引き継いだインストラクションがあれば再開する (候補は get_candidates で送る)"""
+        self.update_activity()
+        if self._resume_instruction:
+            self._resume_instruction = False
+            self.debug_print(f"引き継いだインストラクションを再開します: {self._current_instruction}")
+            eventlet.spawn(self.instruction_run, self._current_instruction)
+
     def stop(self):
         """停止処理"""
         print("Pausing backend process...")
@@ -256,6 +357,7 @@ class BackEndProcess:
             self.lending_ear_controller.stop()
         if self.conversation_controller:
             self.conversation_controller.stop()
+        self.save_state()
         
         self.socketio.emit('announce', {'announce': 'Process Paused!'}, room=self.room)
 
@@ -266,6 +368,8 @@ class BackEndProcess:
         print("Force stopping backend process...")
         self.is_running = False
         self.active = False
+        self.message_store.flush()
+        self.save_state()
         
         if self.lending_ear_controller:
             self.lending_ear_controller.stop()
@@ -279,6 +383,11 @@ class BackEndProcess:
         except Exception as e:
             print(f"Error during disconnect: {e}")
 
+        # 追い出されたセッションが木や履歴を保持し続けないように解放する
+        self.conversation.clear()
+        if self.kg_db:
+            self.kg_db.close()
+
     def handle_go_next_state(self):
         """go_next_stateイベントの処理"""
         print("\n##### >>> [DEBUG:BackendProcess] handle_go_next_state called")
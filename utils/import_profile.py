@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# Web プロセスの起動時に読み込まれてほしくない重いパッケージ (最初のセッション / 管理画面で読み込む)
+HEAVY_MODULES = (
+    "langchain",
+    "langchain_core",
+    "langchain_openai",
+    "langchain_anthropic",
+    "langchain_fireworks",
+    "openai",
+    "anthropic",
+    "fireworks",
+    "groq",
+    "neo4j",
+    "numpy",
+    "pandas",
+    "graphviz",
+    "tiktoken",
+    "firebase_admin.messaging",
+)
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """
+    Parses the output of `python -X importtime` into
+    [{"name": str, "self_us": int, "cumulative_us": int, "depth": int}, ...] (in import order).
+    """
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        entries.append({
+            "name": name,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            # 出力は 1 段ごとに 2 文字ずつ字下げされる
+            "depth": max(0, (len(indent) - 1) // 2),
+        })
+    return entries
+
+
+def profile_imports(module: str = "app", env: Optional[Dict[str, str]] = None, timeout: float = 120) -> Dict[str, Any]:
+    """
+    Imports module in a fresh interpreter with -X importtime and reports where the time goes.
+
+    Returns:
+        Dict[str, Any]: {"module", "ok", "error", "total_seconds", "entries", "packages", "heavy_loaded"}
+            packages: self time (seconds) summed per top level package, largest first
+            heavy_loaded: the HEAVY_MODULES that the import pulled in
+    """
+    code = (
+        "import sys, json\n"
+        f"import {module}\n"
+        f"print(json.dumps(sorted(m for m in {list(HEAVY_MODULES)!r} if m in sys.modules)))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, timeout=timeout,
+        env={**os.environ, **(env or {})}, cwd=os.getcwd()
+    )
+    entries = parse_importtime(result.stderr)
+
+    packages = defaultdict(int)
+    for entry in entries:
+        packages[entry["name"].split(".")[0]] += entry["self_us"]
+
+    heavy_loaded = []
+    error = None
+    if result.returncode == 0:
+        heavy_loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    else:
+        lines = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        error = lines[-1] if lines else f"exit status {result.returncode}"
+
+    target = next((entry for entry in entries if entry["name"] == module and entry["depth"] == 0), None)
+    total_us = target["cumulative_us"] if target else sum(entry["self_us"] for entry in entries)
+    return {
+        "module": module,
+        "ok": result.returncode == 0,
+        "error": error,
+        "total_seconds": total_us / 1e6,
+        "entries": entries,
+        "packages": sorted(((name, us / 1e6) for name, us in packages.items()), key=lambda item: -item[1]),
+        "heavy_loaded": heavy_loaded,
+    }
+
+
+def format_report(profile: Dict[str, Any], top: int = 20) -> str:
+    lines = [f"[Import Profile] import {profile['module']}: {profile['total_seconds']:.3f}s"]
+    if not profile["ok"]:
+        lines.append(f"  import failed: {profile['error']}")
+
+    lines.append(f"  slowest modules (cumulative):")
+    slowest = sorted(profile["entries"], key=lambda entry: -entry["cumulative_us"])[:top]
+    for entry in slowest:
+        lines.append(f"    {entry['cumulative_us'] / 1e6:8.3f}s  {'  ' * entry['depth']}{entry['name']}")
+
+    lines.append(f"  packages (self time):")
+    for name, seconds in profile["packages"][:top]:
+        lines.append(f"    {seconds:8.3f}s  {name}")
+
+    heavy = ", ".join(profile["heavy_loaded"]) or "none"
+    lines.append(f"  heavy modules loaded at import: {heavy}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Report the import time of a module (the web process by default).")
+    parser.add_argument("module", nargs="?", default="app", help="module to import (default: app)")
+    parser.add_argument("--top", type=int, default=20, help="number of modules / packages to list")
+    parser.add_argument("--budget", type=float, default=None, help="exit with 1 if the import takes longer (seconds)")
+    parser.add_argument("--json", action="store_true", help="print the raw profile as JSON")
+    args = parser.parse_args(argv)
+
+    profile = profile_imports(args.module)
+    if args.json:
+        print(json.dumps({key: value for key, value in profile.items() if key != "entries"}, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(profile, top=args.top))
+
+    if not profile["ok"]:
+        return 1
+    if args.budget is not None and profile["total_seconds"] > args.budget:
+        print(f"[Import Profile] over budget: {profile['total_seconds']:.3f}s > {args.budget:.3f}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    # python -m utils.import_profile app --budget 3
+    sys.exit(main())
@@ -1,5 +1,4 @@
 import re
-from langchain.schema import HumanMessage, AIMessage
 
 def parse_to_langchain_message_str(raw_message : str):
     user_message_pattern = r'UserMessage\s*\{\s*name\s*=\s*(\w+|\w+)?\s*contents\s*=\s*\[TextContent\s*\{\s*text\s*=\s*"(.+?)"\s*}\]\s*}'
@@ -0,0 +1,153 @@
+import atexit
+import datetime
+import os
+import threading
+import traceback
+from typing import Callable, List, Optional, Tuple
+
+import eventlet
+from flask import current_app, has_app_context
+from sqlalchemy import and_, or_
+
+from .models import Message
+
+
+def encode_cursor(message: Message) -> str:
+    """キーセットページネーション用のカーソル (timestamp, id)"""
+    return f"{message.timestamp.isoformat()}|{message.id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    timestamp, message_id = cursor.rsplit("|", 1)
+    return datetime.datetime.fromisoformat(timestamp), int(message_id)
+
+
+class MessageStore:
+    """
+    message テーブルの読み書き
+
+    - 書き込みはバッファに溜め、max_batch 件に達するか flush_interval 秒経過したらまとめて INSERT する (write-behind)
+    - 履歴は (timestamp, id) の降順でキーセットページネーションする
+      (ix_message_user_id_timestamp / ix_message_user_id_dialogue_id_timestamp を使う)
+    - 読み込み前には未書き込みのメッセージを flush するので、書いた直後の読み込みでも欠けない
+    """
+
+    def __init__(self, db, flush_interval: float = 1.0, max_batch: int = 50,
+                 schedule: Callable[[float, Callable[[], None]], object] = eventlet.spawn_after):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.schedule = schedule
+        self.app = None
+        self._pending: List[Message] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_scheduled = False
+        self.stats = {"queued": 0, "flushed": 0, "flushes": 0, "errors": 0}
+
+    def add(self, user_id: str, dialogue_id: str, content: str) -> Message:
+        """メッセージを書き込みバッファに追加 (timestamp は追加時点で確定させ、順序を保つ)"""
+        if self.app is None and has_app_context():
+            self.app = current_app._get_current_object()
+        message = Message(user_id=user_id, dialogue_id=dialogue_id, content=content, timestamp=datetime.datetime.utcnow())
+        with self._lock:
+            self._pending.append(message)
+            self.stats["queued"] += 1
+            flush_now = len(self._pending) >= self.max_batch
+            schedule_flush = not flush_now and not self._flush_scheduled
+            if schedule_flush:
+                self._flush_scheduled = True
+        if flush_now:
+            self.flush()
+        elif schedule_flush:
+            self.schedule(self.flush_interval, self._scheduled_flush)
+        return message
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def _scheduled_flush(self):
+        with self._lock:
+            self._flush_scheduled = False
+        self.flush()
+
+    def flush(self) -> int:
+        """バッファのメッセージをまとめて INSERT (失敗した場合はバッファに戻して次回に再試行)"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                if has_app_context() or self.app is None:
+                    self._insert(batch)
+                else:
+                    with self.app.app_context():
+                        self._insert(batch)
+                self.stats["flushed"] += len(batch)
+                self.stats["flushes"] += 1
+                return len(batch)
+            except Exception as e:
+                print(f"[MessageStore] Error flushing {len(batch)} messages: {e}")
+                traceback.print_exc()
+                self.stats["errors"] += 1
+                with self._lock:
+                    self._pending = batch + self._pending
+                    reschedule = not self._flush_scheduled
+                    self._flush_scheduled = True
+                if reschedule:
+                    self.schedule(self.flush_interval, self._scheduled_flush)
+                return 0
+
+    def _insert(self, batch: List[Message]):
+        try:
+            self.db.session.add_all(batch)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+
+    def get_history(self, user_id: str, dialogue_id: Optional[str] = None, limit: int = 50,
+                    before: Optional[str] = None) -> Tuple[List[Message], Optional[str]]:
+        """
+        新しい順にメッセージを取得
+        before: 前のページの next_cursor。戻り値は (messages, next_cursor)。最後のページでは next_cursor は None
+        """
+        if self._pending:
+            self.flush()
+
+        query = Message.query.filter(Message.user_id == user_id)
+        if dialogue_id is not None:
+            query = query.filter(Message.dialogue_id == dialogue_id)
+        if before:
+            timestamp, message_id = decode_cursor(before)
+            query = query.filter(or_(
+                Message.timestamp < timestamp,
+                and_(Message.timestamp == timestamp, Message.id < message_id)
+            ))
+        messages = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+
+        next_cursor = encode_cursor(messages[limit - 1]) if len(messages) > limit else None
+        return messages[:limit], next_cursor
+
+    def get_last_message(self, user_id: str) -> Optional[Message]:
+        messages, _ = self.get_history(user_id, limit=1)
+        return messages[0] if messages else None
+
+
+_message_store: Optional[MessageStore] = None
+_message_store_lock = threading.Lock()
+
+
+def get_message_store(db) -> MessageStore:
+    """プロセス共通の MessageStore (環境変数 MESSAGE_FLUSH_INTERVAL / MESSAGE_FLUSH_MAX_BATCH で調整)"""
+    global _message_store
+    with _message_store_lock:
+        if _message_store is None:
+            _message_store = MessageStore(
+                db,
+                flush_interval=float(os.getenv("MESSAGE_FLUSH_INTERVAL", 1.0)),
+                max_batch=int(os.getenv("MESSAGE_FLUSH_MAX_BATCH", 50))
+            )
+            atexit.register(_message_store.flush)  # 終了時に未書き込みのメッセージを残さない
+        return _message_store
@@ -27,6 +27,10 @@ class UserAuth(db.Model):
 
 class Message(db.Model):
     __tablename__ = 'message'
+    __table_args__ = (
+        db.Index('ix_message_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_message_user_id_dialogue_id_timestamp', 'user_id', 'dialogue_id', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String, db.ForeignKey('user_auth.id'), nullable=False)
@@ -34,10 +38,12 @@ class Message(db.Model):
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
-    def __init__(self, user_id, dialogue_id, content):
+    def __init__(self, user_id, dialogue_id, content, timestamp=None):
         self.user_id = user_id
         self.dialogue_id = dialogue_id
         self.content = content
+        if timestamp is not None:
+            self.timestamp = timestamp
 
     def __repr__(self):
         return f"<Message {self.content}>"
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List
+
+import eventlet
+
+
+def count_tree_nodes(root: Any) -> int:
+    """.children を持つ木 (UoTNode / BaseNode) のノード数"""
+    if root is None:
+        return 0
+    count = 0
+    visited = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in visited:
+            continue
+        visited.add(id(node))
+        count += 1
+        stack.extend(getattr(node, "children", None) or [])
+    return count
+
+
+class SessionRegistry:
+    """
+    user_id -> BackEndProcess のレジストリ (従来の backend_instances dict の置き換え)
+
+    - 参照 (registry[user_id]) されるたびに最近使ったものとして並べ替える
+    - max_sessions を超えたら最も長く使われていないセッションを force_stop して追い出す (LRU)
+    - start_reaper() でバックグラウンドのグリーンレットを起動し、
+      reap_interval 秒ごとに is_expired() (INACTIVE_TIMEOUT 超過) のセッションを force_stop して追い出す
+    - memory_stats() でセッションごとの木のノード数・メッセージ数などを集計する
+    """
+
+    def __init__(self, max_sessions: int = 100, reap_interval: float = 60):
+        self.max_sessions = max_sessions
+        self.reap_interval = reap_interval
+        self._sessions: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._reaper = None
+        self.stats = {"created": 0, "evicted_idle": 0, "evicted_lru": 0, "removed": 0, "reap_runs": 0}
+
+    @classmethod
+    def from_env(cls) -> "SessionRegistry":
+        """環境変数 MAX_BACKEND_SESSIONS / SESSION_REAP_INTERVAL で調整"""
+        return cls(
+            max_sessions=int(os.getenv("MAX_BACKEND_SESSIONS", 100)),
+            reap_interval=float(os.getenv("SESSION_REAP_INTERVAL", 60))
+        )
+
+    # ------------------------------------------------------------------
+    # dict 互換のインターフェース
+    # ------------------------------------------------------------------
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._sessions
+
+    def __getitem__(self, user_id: str):
+        with self._lock:
+            bp = self._sessions[user_id]
+            self._sessions.move_to_end(user_id)
+            return bp
+
+    def get(self, user_id: str, default=None):
+        try:
+            return self[user_id]
+        except KeyError:
+            return default
+
+    def __setitem__(self, user_id: str, bp) -> None:
+        with self._lock:
+            if user_id not in self._sessions:
+                self.stats["created"] += 1
+            self._sessions[user_id] = bp
+            self._sessions.move_to_end(user_id)
+            evicted = []
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False))
+        for evicted_user_id, evicted_bp in evicted:
+            self.stats["evicted_lru"] += 1
+            self._stop(evicted_user_id, evicted_bp, "lru")
+
+    def __delitem__(self, user_id: str) -> None:
+        with self._lock:
+            del self._sessions[user_id]
+            self.stats["removed"] += 1
+
+    def pop(self, user_id: str, default=None):
+        with self._lock:
+            if user_id not in self._sessions:
+                return default
+            self.stats["removed"] += 1
+            return self._sessions.pop(user_id)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._sessions.keys())
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def items(self) -> List[Any]:
+        with self._lock:
+            return list(self._sessions.items())
+
+    # ------------------------------------------------------------------
+    # 追い出し
+    # ------------------------------------------------------------------
+    def _stop(self, user_id: str, bp, reason: str) -> None:
+        print(f"[SessionRegistry] Evicting session of {user_id} ({reason})")
+        try:
+            bp.force_stop()
+        except Exception as e:
+            print(f"[SessionRegistry] Error stopping session of {user_id}: {e}")
+            traceback.print_exc()
+
+    def reap(self) -> List[str]:
+        """INACTIVE_TIMEOUT を過ぎたセッションを force_stop して追い出す"""
+        self.stats["reap_runs"] += 1
+        with self._lock:
+            expired = [(user_id, bp) for user_id, bp in self._sessions.items() if bp.is_expired()]
+            for user_id, _ in expired:
+                del self._sessions[user_id]
+        for user_id, bp in expired:
+            self.stats["evicted_idle"] += 1
+            self._stop(user_id, bp, "idle")
+        return [user_id for user_id, _ in expired]
+
+    def start_reaper(self, spawn: Callable = eventlet.spawn, sleep: Callable[[float], None] = eventlet.sleep):
+        """reap() を定期的に実行するグリーンレットを起動 (起動済みなら何もしない)"""
+        if self._reaper is not None:
+            return self._reaper
+
+        def _loop():
+            while True:
+                sleep(self.reap_interval)
+                try:
+                    self.reap()
+                except Exception as e:
+                    print(f"[SessionRegistry] Error in reaper: {e}")
+                    traceback.print_exc()
+
+        self._reaper = spawn(_loop)
+        return self._reaper
+
+    # ------------------------------------------------------------------
+    # メモリの集計
+    # ------------------------------------------------------------------
+    def memory_stats(self) -> Dict[str, Any]:
+        sessions = {}
+        totals: Dict[str, int] = {}
+        for user_id, bp in self.items():
+            try:
+                session_stats = bp.memory_stats()
+            except Exception as e:
+                session_stats = {"error": str(e)}
+            sessions[user_id] = session_stats
+            for key, value in session_stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        return {
+            "session_count": len(sessions),
+            "max_sessions": self.max_sessions,
+            "reaper_running": self._reaper is not None,
+            "registry": dict(self.stats),
+            "totals": totals,
+            "sessions": sessions,
+            "generated_at": time.time()
+        }
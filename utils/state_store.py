@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+import time
+import traceback
+from typing import Any, Dict, Optional
+
+# セッション状態のキー (ユーザーごと)
+SESSION_STATE_PREFIX = "fast_and_slow:session:"
+
+
+class InMemoryRedis:
+    """
+    Redis の get / set / delete / ping のローカル代替 (テストと単一ワーカー用)
+    値は bytes で保持し、ex (秒) の有効期限に対応する
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def ping(self) -> bool:
+        return True
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name: str, value, ex: Optional[int] = None) -> bool:
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        with self._lock:
+            self._data[name] = (value, time.time() + ex if ex else None)
+        return True
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            return sum(1 for name in names if self._data.pop(name, None) is not None)
+
+
+def get_redis_url() -> Optional[str]:
+    """Socket.IO のメッセージキューとセッション状態の保存先 (未設定ならプロセス内で完結)"""
+    return os.getenv("SOCKETIO_MESSAGE_QUEUE") or os.getenv("REDIS_URL")
+
+
+def create_redis_client(url: Optional[str]):
+    """url があれば Redis クライアント、無ければ (または redis が未インストールなら) InMemoryRedis"""
+    if not url:
+        return InMemoryRedis()
+    try:
+        import redis
+    except ImportError:
+        print("[StateStore] Warning: redis is not installed, session state is kept in this process only")
+        return InMemoryRedis()
+    options = {}
+    if url.startswith("rediss://"):
+        # Heroku Redis は自己署名証明書を使う
+        options["ssl_cert_reqs"] = None
+    return redis.Redis.from_url(url, **options)
+
+
+class SessionStateStore:
+    """
+    BackEndProcess の状態 (export_state) をユーザーごとに外部に保存する
+    どのワーカー・ノードに再接続しても restore_state で同じ状態から再開できる
+    """
+
+    def __init__(self, client, ttl: int = 86400, prefix: str = SESSION_STATE_PREFIX):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.prefix}{user_id}"
+
+    def save(self, user_id: str, state: Dict[str, Any]) -> bool:
+        try:
+            self.client.set(self._key(user_id), json.dumps(state, ensure_ascii=False), ex=self.ttl)
+            return True
+        except Exception as e:
+            print(f"[StateStore] Error saving state of {user_id}: {e}")
+            traceback.print_exc()
+            return False
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = self.client.get(self._key(user_id))
+        except Exception as e:
+            print(f"[StateStore] Error loading state of {user_id}: {e}")
+            traceback.print_exc()
+            return None
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError as e:
+            print(f"[StateStore] Broken state of {user_id}: {e}")
+            return None
+
+    def _snapshot_key(self, user_id: str) -> str:
+        return f"{self.prefix}{user_id}:uot"
+
+    def save_snapshot(self, user_id: str, data: bytes) -> bool:
+        """UoT の木のスナップショット (uot_snapshot のバイナリ) を状態とは別のキーに保存する"""
+        try:
+            self.client.set(self._snapshot_key(user_id), data, ex=self.ttl)
+            return True
+        except Exception as e:
+            print(f"[StateStore] Error saving UoT snapshot of {user_id}: {e}")
+            traceback.print_exc()
+            return False
+
+    def load_snapshot(self, user_id: str) -> Optional[bytes]:
+        try:
+            return self.client.get(self._snapshot_key(user_id))
+        except Exception as e:
+            print(f"[StateStore] Error loading UoT snapshot of {user_id}: {e}")
+            traceback.print_exc()
+            return None
+
+    def delete(self, user_id: str) -> None:
+        try:
+            self.client.delete(self._key(user_id), self._snapshot_key(user_id))
+        except Exception as e:
+            print(f"[StateStore] Error deleting state of {user_id}: {e}")
+
+
+_state_store: Optional[SessionStateStore] = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store() -> SessionStateStore:
+    """プロセス共通の SessionStateStore (環境変数 REDIS_URL / SESSION_STATE_TTL)"""
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            _state_store = SessionStateStore(
+                create_redis_client(get_redis_url()),
+                ttl=int(os.getenv("SESSION_STATE_TTL", 86400))
+            )
+        return _state_store